@@ -11,6 +11,13 @@ import logging
 import sqlite3
 import uuid
 import secrets
+import atexit
+import queue
+import time
+import threading
+import functools
+from contextlib import contextmanager
+from urllib.request import pathname2url
 from datetime import datetime, timedelta
 from typing import Dict, List, Tuple, Optional
 from dataclasses import dataclass, asdict
@@ -18,6 +25,9 @@ from enum import Enum
 from io import BytesIO
 import base64
 
+from migrations import MigrationRunner
+from sqlite_writer import SingleWriter
+
 try:
     from flask import Flask, jsonify, request, session, send_file, render_template_string
     from flask_cors import CORS
@@ -75,19 +85,253 @@ if not os.path.exists(UPLOAD_FOLDER):
 # ==================== DATABASE ====================
 
 
+class ReadOnlyPool:
+    """Bounded pool of read-only connections (file:...?mode=ro plus query_only)"""
+
+    def __init__(self, db_path, size=4, timeout=30.0, cached_statements=512, busy_timeout=30.0):
+        self.uri = f"file:{pathname2url(os.path.abspath(db_path))}?mode=ro"
+        self.size = size
+        self.timeout = timeout
+        # Seconds a read waits on a locked database (e.g. a WAL checkpoint or recovery)
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._stats = {'opened': 0, 'in_use': 0, 'checkouts': 0, 'waits': 0}
+
+    def _open(self):
+        conn = sqlite3.connect(self.uri, uri=True, check_same_thread=False,
+                               timeout=self.busy_timeout,
+                               cached_statements=self.cached_statements)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA query_only = ON")
+        with self._lock:
+            self._stats['opened'] += 1
+        return conn
+
+    def acquire(self):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats['waits'] += 1
+            if not self._slots.acquire(timeout=self.timeout):
+                raise TimeoutError(f"No read-only connection free within {self.timeout}s")
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            try:
+                conn = self._open()
+            except Exception:
+                self._slots.release()
+                raise
+        with self._lock:
+            self._stats['checkouts'] += 1
+            self._stats['in_use'] += 1
+        return conn
+
+    def release(self, conn, discard=False):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            discard = True
+        if discard:
+            conn.close()
+            with self._lock:
+                self._stats['opened'] -= 1
+        else:
+            self._idle.put(conn)
+        with self._lock:
+            self._stats['in_use'] -= 1
+        self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, size=self.size, idle=self._idle.qsize())
+
+
 class Database:
-    def __init__(self, db_path="aml_multi_user.db"):
+    def __init__(self, db_path="aml_multi_user.db", cached_statements=512,
+                 background_migrations=False, read_pool_size=4, read_pool_timeout=30.0,
+                 busy_timeout=30.0, write_timeout=None, idle_connections=8):
         self.db_path = db_path
+        self.cached_statements = cached_statements
+        self.busy_timeout = busy_timeout
+        self.write_timeout = write_timeout
+        # One read connection per thread while it serves a request; between
+        # requests it waits in _idle_conns, statement cache and all, so
+        # servers that start a thread per request do not open one each time
+        self._local = threading.local()
+        self._idle_conns = queue.LifoQueue(maxsize=idle_connections)
+        self._connections = []
+        self._connections_lock = threading.Lock()
         self.init_schema()
+        # Analytics and search reads; see read_only()
+        self.read_pool = ReadOnlyPool(db_path, read_pool_size, read_pool_timeout,
+                                      cached_statements, busy_timeout)
+        self.migrations = MigrationRunner(db_path, 'v9', busy_timeout=busy_timeout)
+        self.migrations.run(background=background_migrations)
+        # Every write goes through this thread's connection; see execute()
+        self.writer = SingleWriter(self._write_conn, busy_timeout=busy_timeout,
+                                   name='aml-v9-writer')
+
+    def _write_conn(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        conn.row_factory = sqlite3.Row
+        return conn
 
     def get_conn(self):
         conn = sqlite3.connect(self.db_path)
         conn.row_factory = sqlite3.Row
         return conn
 
+    def thread_conn(self):
+        """Return this thread's connection: an idle one if any, else a new one"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            try:
+                conn = self._idle_conns.get_nowait()
+            except queue.Empty:
+                conn = sqlite3.connect(self.db_path, check_same_thread=False,
+                                       timeout=self.busy_timeout,
+                                       cached_statements=self.cached_statements)
+                conn.row_factory = sqlite3.Row
+                with self._connections_lock:
+                    self._connections.append(conn)
+            self._local.conn = conn
+        return conn
+
+    def release_thread_conn(self, discard=False):
+        """Hand this thread's connection back for the next request; closed
+        instead if `discard` or enough connections are idle already
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+        self._local.conn = None
+        if not discard:
+            try:
+                self._idle_conns.put_nowait(conn)
+                return
+            except queue.Full:
+                pass
+        with self._connections_lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+        conn.close()
+
+    def close_thread_conn(self):
+        self.release_thread_conn(discard=True)
+
+    def close_all(self):
+        """Close every thread's connection (shutdown)"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        while True:
+            try:
+                self._idle_conns.get_nowait()
+            except queue.Empty:
+                break
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self.read_pool.close()
+        self.writer.close()
+
+    def init_app(self, app):
+        """Tie connection state to the Flask app context"""
+        app.teardown_appcontext(self.teardown)
+        atexit.register(self.close_all)
+
+    def teardown(self, exc=None):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+        discard = isinstance(exc, sqlite3.DatabaseError)
+        try:
+            if conn.in_transaction:
+                # A request must never leak an open transaction to the next one
+                conn.rollback()
+        except sqlite3.Error:
+            discard = True
+        self.release_thread_conn(discard)
+
+    @contextmanager
+    def transaction(self):
+        """Group several execute() calls into a single commit.
+
+        Leases the writer's connection for the block, so reads inside it see
+        the block's own writes; other writers queue until it commits.
+        """
+        if self.in_transaction():
+            self._local.depth += 1
+            try:
+                yield self._local.write_conn
+            finally:
+                self._local.depth -= 1
+            return
+        with self.writer.lease(self.write_timeout) as conn:
+            self._local.write_conn = conn
+            self._local.depth = 1
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                self._local.depth = 0
+                self._local.write_conn = None
+
+    def in_transaction(self):
+        return bool(getattr(self._local, 'depth', 0))
+
+    @contextmanager
+    def read_only(self):
+        """Route this thread's query() calls to a pooled read-only connection.
+
+        execute() and anything inside transaction() keep using the
+        read-write connection, so a read-only scope may still write.
+        """
+        if getattr(self._local, 'read_conn', None) is not None:
+            yield self._local.read_conn
+            return
+        conn = self.read_pool.acquire()
+        self._local.read_conn = conn
+        failed = False
+        try:
+            yield conn
+        except sqlite3.DatabaseError:
+            failed = True
+            raise
+        finally:
+            self._local.read_conn = None
+            self.read_pool.release(conn, discard=failed)
+
+    def read_only_route(self, view):
+        """Decorator declaring a Flask view read-only"""
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            with self.read_only():
+                return view(*args, **kwargs)
+        return wrapper
+
     def init_schema(self):
         conn = self.get_conn()
         c = conn.cursor()
+        # Readers never block the writer (and vice versa) under WAL
+        c.execute("PRAGMA journal_mode=WAL")
 
         # AUDIT TRAIL TABLE - COMPREHENSIVE TRACKING
         c.execute("""CREATE TABLE IF NOT EXISTS audit_trail (
@@ -231,19 +475,18 @@ class Database:
         logger.info("✅ Database initialized")
 
     def query(self, sql, params=()):
-        conn = self.get_conn()
-        c = conn.cursor()
-        c.execute(sql, params)
-        results = c.fetchall()
-        conn.close()
-        return results
+        if self.in_transaction():
+            conn = self._local.write_conn
+        else:
+            conn = getattr(self._local, 'read_conn', None) or self.thread_conn()
+        return conn.execute(sql, params).fetchall()
 
     def execute(self, sql, params=()):
-        conn = self.get_conn()
-        c = conn.cursor()
-        c.execute(sql, params)
-        conn.commit()
-        conn.close()
+        """Write through the single writer (group-committed); raises on failure"""
+        if self.in_transaction():
+            self._local.write_conn.execute(sql, params)
+        else:
+            self.writer.execute(sql, params, self.write_timeout)
         return True
 
 
@@ -647,25 +890,215 @@ GENERATED: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 
 
 # ==================== AUDIT TRAIL MANAGER ====================
+class AuditWriter:
+    """Write-behind audit records: a bounded queue drained by one background thread.
+
+    Producers block for up to `put_timeout` seconds when the queue is full
+    (backpressure) and then write synchronously rather than drop a record.
+    The writer thread hands up to `batch_size` records per executemany to
+    the database's SingleWriter; close() writes whatever it left queued.
+    """
+
+    INSERT = """INSERT INTO audit_trail (id, user_id, action, entity_type, entity_id, old_value,
+                                         new_value, ip_address, details, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+
+    def __init__(self, writer, max_queue=10000, batch_size=500, flush_interval=0.2,
+                 put_timeout=5.0):
+        self.writer = writer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        # Producers between the stop check and their put; the thread outlives them
+        self._submit_lock = threading.Lock()
+        self._submitting = 0
+        self._metrics_lock = threading.Lock()
+        self._metrics = {'enqueued': 0, 'written': 0, 'batches': 0, 'errors': 0,
+                         'backpressure_waits': 0, 'sync_fallbacks': 0,
+                         'last_flush_ms': 0.0, 'max_flush_ms': 0.0, 'total_flush_ms': 0.0}
+        self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, record):
+        with self._submit_lock:
+            queued = not self._stop.is_set() and self._thread.is_alive()
+            if queued:
+                self._submitting += 1
+        if not queued:
+            self._write_direct([record])
+            return
+        try:
+            try:
+                self._queue.put_nowait(record)
+            except queue.Full:
+                self._count('backpressure_waits')
+                try:
+                    self._queue.put(record, timeout=self.put_timeout)
+                except queue.Full:
+                    logger.warning("Audit queue still full, writing record synchronously")
+                    self._count('sync_fallbacks')
+                    self._write_direct([record])
+                    return
+            self._count('enqueued')
+        finally:
+            with self._submit_lock:
+                self._submitting -= 1
+
+    def flush(self, timeout=5.0):
+        """Block until everything queued before this call is committed"""
+        if self._stop.is_set() or not self._thread.is_alive():
+            return False
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self, timeout=10.0):
+        """Drain the queue and stop the writer thread (shutdown)"""
+        if self._stop.is_set():
+            return
+        self.flush(timeout)
+        with self._submit_lock:
+            self._stop.set()
+        self._thread.join(timeout)
+        # Write what the thread has not reached here, then wait out its last batch
+        self._drain()
+        self._thread.join()
+
+    def metrics(self):
+        with self._metrics_lock:
+            m = dict(self._metrics)
+        total_ms = m.pop('total_flush_ms')
+        m.update({
+            'queue_depth': self._queue.qsize(),
+            'max_queue': self._queue.maxsize,
+            'avg_flush_ms': round(total_ms / m['batches'], 2) if m['batches'] else 0.0,
+            'last_flush_ms': round(m['last_flush_ms'], 2),
+            'max_flush_ms': round(m['max_flush_ms'], 2),
+            'running': self._thread.is_alive() and not self._stop.is_set(),
+        })
+        return m
+
+    def _count(self, key, n=1):
+        with self._metrics_lock:
+            self._metrics[key] += n
+
+    def _run(self):
+        while True:
+            if self._stop.is_set() and self._queue.empty():
+                with self._submit_lock:
+                    if not self._submitting and self._queue.empty():
+                        break
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            records, waiters = [], []
+            while True:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    records.append(item)
+                if len(records) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if records:
+                self._write_batch(records)
+            for waiter in waiters:
+                waiter.set()
+
+    def _write_batch(self, records):
+        started = time.perf_counter()
+        for attempt in range(5):
+            try:
+                self.writer.executemany(self.INSERT, records)
+                break
+            except sqlite3.Error as e:
+                self._count('errors')
+                logger.error(f"Audit flush failed (attempt {attempt + 1}): {e}")
+                time.sleep(0.1 * 2 ** attempt)
+        else:
+            logger.error(f"Dropped {len(records)} audit records after repeated failures")
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._metrics_lock:
+            self._metrics['written'] += len(records)
+            self._metrics['batches'] += 1
+            self._metrics['last_flush_ms'] = elapsed_ms
+            self._metrics['max_flush_ms'] = max(self._metrics['max_flush_ms'], elapsed_ms)
+            self._metrics['total_flush_ms'] += elapsed_ms
+
+    def _write_direct(self, records):
+        self.writer.executemany(self.INSERT, records)
+
+    def _drain(self):
+        """Write everything still queued on the calling thread"""
+        records, waiters = [], []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            (waiters if isinstance(item, threading.Event) else records).append(item)
+        for start in range(0, len(records), self.batch_size):
+            self._write_batch(records[start:start + self.batch_size])
+        for waiter in waiters:
+            waiter.set()
+
+
 class AuditTrail:
-    """Comprehensive audit trail and trace management system"""
+    """Comprehensive audit trail and trace management system
 
-    def __init__(self, db):
+    mode='sync' inserts every record on the caller's connection.
+    mode='write_behind' hands records to an AuditWriter instead, except for
+    actions in `sync_actions`, calls with sync=True, and calls made inside
+    Database.transaction(), where the insert shares the caller's commit
+    and rolls back with it.
+    """
+
+    def __init__(self, db, mode='sync', sync_actions=(), **writer_options):
         self.db = db
+        self.mode = mode
+        self.sync_actions = set(sync_actions)
+        self.writer = AuditWriter(db.writer, **writer_options) if mode == 'write_behind' else None
 
-    def log_action(self, user_id, action, entity_type, entity_id, old_value=None, new_value=None, ip_address="", details=None):
+    def log_action(self, user_id, action, entity_type, entity_id, old_value=None, new_value=None, ip_address="", details=None, sync=None):
         """Log every action for compliance and tracing"""
         audit_id = str(uuid.uuid4())
-        self.db.execute(
-            """INSERT INTO audit_trail (id, user_id, action, entity_type, entity_id, old_value, new_value, ip_address, details)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (audit_id, user_id, action, entity_type, entity_id,
-             str(old_value)[:500], str(new_value)[:500], ip_address, str(details)[:1000])
-        )
+        # Stamped now, not at flush time; same format as CURRENT_TIMESTAMP
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+        record = (audit_id, user_id, action, entity_type, entity_id,
+                  str(old_value)[:500], str(new_value)[:500], ip_address, str(details)[:1000],
+                  timestamp)
+        if sync is None:
+            sync = (self.writer is None or action in self.sync_actions
+                    or self.db.in_transaction())
+        if sync:
+            self.db.execute(AuditWriter.INSERT, record)
+        else:
+            self.writer.submit(record)
         return audit_id
 
+    def flush(self, timeout=5.0):
+        return self.writer.flush(timeout) if self.writer else True
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+
+    def metrics(self):
+        return self.writer.metrics() if self.writer else {'mode': self.mode}
+
     def get_audit_trail(self, entity_id=None, user_id=None, action=None, limit=100):
         """Retrieve audit trail records"""
+        self.flush()
         query = "SELECT * FROM audit_trail WHERE 1=1"
         params = []
         if entity_id:
@@ -683,6 +1116,7 @@ class AuditTrail:
 
     def get_trace_history(self, entity_id, entity_type):
         """Get complete trace history of an entity"""
+        self.flush()
         results = self.db.query(
             """SELECT * FROM audit_trail WHERE entity_id = ? AND entity_type = ? 
                ORDER BY timestamp ASC""", (entity_id, entity_type)
@@ -771,42 +1205,44 @@ class BulkOperations:
     def bulk_update_cases(self, user_id, case_ids, updates, ip_address=""):
         """Update multiple cases at once"""
         results = []
-        for case_id in case_ids:
-            try:
-                old_case = self.db.query(
-                    "SELECT * FROM cases WHERE id = ?", (case_id,))
-                if not old_case:
-                    continue
-
-                update_fields = ", ".join([f"{k} = ?" for k in updates.keys()])
-                params = list(updates.values()) + [case_id]
-                self.db.execute(
-                    f"UPDATE cases SET {update_fields} WHERE id = ?", tuple(params))
-
-                self.audit.log_action(user_id, "BULK_UPDATE", "CASE", case_id,
-                                      dict(old_case[0]), updates, ip_address)
-                results.append({'case_id': case_id, 'status': 'updated'})
-            except Exception as e:
-                results.append(
-                    {'case_id': case_id, 'status': 'error', 'error': str(e)})
+        with self.db.transaction():
+            for case_id in case_ids:
+                try:
+                    old_case = self.db.query(
+                        "SELECT * FROM cases WHERE id = ?", (case_id,))
+                    if not old_case:
+                        continue
+
+                    update_fields = ", ".join([f"{k} = ?" for k in updates.keys()])
+                    params = list(updates.values()) + [case_id]
+                    self.db.execute(
+                        f"UPDATE cases SET {update_fields} WHERE id = ?", tuple(params))
+
+                    self.audit.log_action(user_id, "BULK_UPDATE", "CASE", case_id,
+                                          dict(old_case[0]), updates, ip_address)
+                    results.append({'case_id': case_id, 'status': 'updated'})
+                except Exception as e:
+                    results.append(
+                        {'case_id': case_id, 'status': 'error', 'error': str(e)})
         return results
 
     def bulk_delete_cases(self, user_id, case_ids, ip_address=""):
         """Delete multiple cases at once"""
         results = []
-        for case_id in case_ids:
-            try:
-                case = self.db.query(
-                    "SELECT * FROM cases WHERE id = ?", (case_id,))
-                if case:
-                    self.db.execute(
-                        "DELETE FROM cases WHERE id = ?", (case_id,))
-                    self.audit.log_action(user_id, "BULK_DELETE", "CASE", case_id,
-                                          dict(case[0]), None, ip_address, "Bulk delete operation")
-                    results.append({'case_id': case_id, 'status': 'deleted'})
-            except Exception as e:
-                results.append(
-                    {'case_id': case_id, 'status': 'error', 'error': str(e)})
+        with self.db.transaction():
+            for case_id in case_ids:
+                try:
+                    case = self.db.query(
+                        "SELECT * FROM cases WHERE id = ?", (case_id,))
+                    if case:
+                        self.db.execute(
+                            "DELETE FROM cases WHERE id = ?", (case_id,))
+                        self.audit.log_action(user_id, "BULK_DELETE", "CASE", case_id,
+                                              dict(case[0]), None, ip_address, "Bulk delete operation")
+                        results.append({'case_id': case_id, 'status': 'deleted'})
+                except Exception as e:
+                    results.append(
+                        {'case_id': case_id, 'status': 'error', 'error': str(e)})
         return results
 
 
@@ -1085,7 +1521,10 @@ def create_app():
     app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
     app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024
 
-    db = Database()
+    db = Database(background_migrations=True,
+                  read_pool_size=int(os.environ.get('AML_READ_POOL_SIZE', 4)),
+                  busy_timeout=float(os.environ.get('AML_DB_BUSY_TIMEOUT', 30)))
+    db.init_app(app)
     user_mgr = UserManager(db)
     case_mgr = CaseManager(db)
 
@@ -1175,6 +1614,7 @@ def create_app():
         return jsonify({'success': False, 'message': msg}), 400
 
     @app.route('/api/cases', methods=['GET'])
+    @db.read_only_route
     def list_cases():
         if 'user_id' not in session:
             return jsonify({'error': 'Not authenticated'}), 401
@@ -1183,6 +1623,7 @@ def create_app():
         return jsonify({'cases': cases, 'count': len(cases)}), 200
 
     @app.route('/api/cases/<case_id>', methods=['GET'])
+    @db.read_only_route
     def get_case(case_id):
         case = case_mgr.get_case(case_id)
         if case:
@@ -1372,6 +1813,7 @@ def create_app():
         return jsonify({'success': True, 'compliance_id': compliance_id}), 201
 
     @app.route('/api/compliance/<case_id>', methods=['GET'])
+    @db.read_only_route
     def get_compliance(case_id):
         results = db.query(
             "SELECT * FROM compliance WHERE case_id = ?", (case_id,))
@@ -1396,6 +1838,7 @@ def create_app():
     # ========== STATISTICS ==========
 
     @app.route('/api/stats', methods=['GET'])
+    @db.read_only_route
     def get_stats():
         if 'user_id' not in session:
             return jsonify({'error': 'Not authenticated'}), 401
@@ -1409,11 +1852,21 @@ def create_app():
 
     # ========== AUDIT TRAIL & TRACING ===========
 
-    audit_trail = AuditTrail(db)
+    audit_trail = AuditTrail(
+        db,
+        # Synchronous unless write-behind is opted into with AML_AUDIT_MODE=write_behind
+        mode=os.environ.get('AML_AUDIT_MODE', 'sync'),
+        sync_actions=[a for a in os.environ.get(
+            'AML_AUDIT_SYNC_ACTIONS',
+            'CASE_DELETE,TRANSACTION_DELETE,ENQUIRY_DELETE,BULK_DELETE').split(',') if a],
+        max_queue=int(os.environ.get('AML_AUDIT_QUEUE_SIZE', 10000)),
+        batch_size=int(os.environ.get('AML_AUDIT_BATCH_SIZE', 500)))
+    atexit.register(audit_trail.close)
     search_engine = SearchEngine(db)
     bulk_ops = BulkOperations(db, audit_trail)
 
     @app.route('/api/audit/trail', methods=['GET'])
+    @db.read_only_route
     def get_audit_trail():
         if 'user_id' not in session:
             return jsonify({'error': 'Not authenticated'}), 401
@@ -1426,7 +1879,14 @@ def create_app():
             entity_id, session['user_id'], action, limit)
         return jsonify([dict(r) for r in results]), 200
 
+    @app.route('/api/audit/metrics', methods=['GET'])
+    def get_audit_metrics():
+        if 'user_id' not in session:
+            return jsonify({'error': 'Not authenticated'}), 401
+        return jsonify(audit_trail.metrics()), 200
+
     @app.route('/api/audit/trace/<entity_id>', methods=['GET'])
+    @db.read_only_route
     def get_trace_history(entity_id):
         if 'user_id' not in session:
             return jsonify({'error': 'Not authenticated'}), 401
@@ -1438,6 +1898,7 @@ def create_app():
     # ========== ADVANCED SEARCH ===========
 
     @app.route('/api/search', methods=['POST'])
+    @db.read_only_route
     def search():
         if 'user_id' not in session:
             return jsonify({'error': 'Not authenticated'}), 401
@@ -1465,6 +1926,7 @@ def create_app():
         return jsonify([dict(r) for r in results]), 200
 
     @app.route('/api/search/transactions/<case_id>', methods=['POST'])
+    @db.read_only_route
     def search_transactions(case_id):
         if 'user_id' not in session:
             return jsonify({'error': 'Not authenticated'}), 401
@@ -1646,6 +2108,7 @@ def create_app():
         return jsonify({'success': True, 'transaction_id': txn_id}), 200
 
     @app.route('/api/transactions/<case_id>/list', methods=['GET'])
+    @db.read_only_route
     def list_transactions(case_id):
         if 'user_id' not in session:
             return jsonify({'error': 'Not authenticated'}), 401
@@ -1659,6 +2122,7 @@ def create_app():
     # ========== ADVANCED ANALYTICS ===========
 
     @app.route('/api/analytics/dashboard', methods=['GET'])
+    @db.read_only_route
     def analytics_dashboard():
         if 'user_id' not in session:
             return jsonify({'error': 'Not authenticated'}), 401
@@ -1696,6 +2160,7 @@ def create_app():
         }), 200
 
     @app.route('/api/analytics/comparison', methods=['POST'])
+    @db.read_only_route
     def case_comparison():
         if 'user_id' not in session:
             return jsonify({'error': 'Not authenticated'}), 401
@@ -1738,6 +2203,7 @@ def create_app():
         return jsonify({'success': False, 'message': msg}), 400
 
     @app.route('/api/enquiries', methods=['GET'])
+    @db.read_only_route
     def list_enquiries():
         if 'user_id' not in session:
             return jsonify({'error': 'Not authenticated'}), 401
@@ -1747,6 +2213,7 @@ def create_app():
         return jsonify({'enquiries': enquiries, 'count': len(enquiries)}), 200
 
     @app.route('/api/enquiries/<enquiry_id>', methods=['GET'])
+    @db.read_only_route
     def get_enquiry(enquiry_id):
         if 'user_id' not in session:
             return jsonify({'error': 'Not authenticated'}), 401
@@ -1854,6 +2321,7 @@ def create_app():
         return jsonify({'success': False, 'message': msg}), 400
 
     @app.route('/api/enquiries/search', methods=['POST'])
+    @db.read_only_route
     def search_enquiries():
         if 'user_id' not in session:
             return jsonify({'error': 'Not authenticated'}), 401
@@ -1867,6 +2335,7 @@ def create_app():
         return jsonify({'results': results, 'count': len(results)}), 200
 
     @app.route('/api/enquiries/<enquiry_id>/history', methods=['GET'])
+    @db.read_only_route
     def get_enquiry_history(enquiry_id):
         if 'user_id' not in session:
             return jsonify({'error': 'Not authenticated'}), 401
@@ -1887,6 +2356,7 @@ def create_app():
         return jsonify({'results': results}), 200
 
     @app.route('/api/enquiries/statistics', methods=['GET'])
+    @db.read_only_route
     def enquiry_statistics():
         if 'user_id' not in session:
             return jsonify({'error': 'Not authenticated'}), 401
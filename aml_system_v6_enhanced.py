@@ -14,21 +14,43 @@ import uuid
 import hashlib
 import numpy as np
 from datetime import datetime, timedelta
-from typing import Dict, List, Tuple, Optional, Set, Any
+from typing import Dict, Iterator, List, Tuple, Optional, Set, Any
 from dataclasses import dataclass, asdict, field
 from enum import Enum
 from collections import defaultdict, deque
+from bisect import bisect_left, insort
 import threading
+import time
+import multiprocessing
+from concurrent.futures import Future, CancelledError, InvalidStateError, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
 from functools import lru_cache
-import pickle
+
+from aml_time import to_epoch, window_start, local_hour, SECONDS_PER_DAY
+from migrations import MigrationRunner
+from sqlite_writer import SingleWriter
+import entity_stats
+import network_edges
+import daily_rollups
+import entity_clusters
+from entity_stats import EntityStats
+from rule_engine import RuleEngine, DEFAULT_RULES_PATH
+from velocity import VelocityMonitor, parse_windows, DEFAULT_WINDOWS
+import anomaly_model
+from anomaly_model import AnomalyModel
+from transaction_graph import TransactionGraph
+import graph_snapshot
+import subgraph
+from subgraph import SubgraphLimits
 
 try:
-    from flask import Flask, jsonify, request, session
+    from flask import Flask, Response, jsonify, request, session, stream_with_context
     from flask_cors import CORS
     from werkzeug.security import generate_password_hash, check_password_hash
 except ImportError:
     os.system("pip install -q flask flask-cors werkzeug")
-    from flask import Flask, jsonify, request, session
+    from flask import Flask, Response, jsonify, request, session, stream_with_context
     from flask_cors import CORS
     from werkzeug.security import generate_password_hash, check_password_hash
 
@@ -178,21 +200,210 @@ class AnomalyScore:
 # ======================== DATABASE MANAGER (Enhanced) ========================
 
 
+class ConnectionPool:
+    """Bounded, thread-aware pool of SQLite connections with checkout/checkin"""
+
+    def __init__(self, factory, max_size: int = 8, timeout: float = 30.0,
+                 health_check_interval: float = 60.0):
+        self._factory = factory
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        # Idle connections as (conn, owner_thread_ident, last_used)
+        self._idle = deque()
+        self._created = 0
+        self._closed = False
+        self._cond = threading.Condition(threading.Lock())
+
+        # Metrics
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+        self._health_failures = 0
+
+    def _take_idle(self):
+        """Prefer the connection last used by the calling thread"""
+        ident = threading.get_ident()
+        for i, item in enumerate(self._idle):
+            if item[1] == ident:
+                del self._idle[i]
+                return item
+        return self._idle.pop()
+
+    def checkout(self) -> sqlite3.Connection:
+        """Borrow a connection, waiting up to `timeout` seconds if the pool is exhausted"""
+        start = time.monotonic()
+        waited = False
+        item = None
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed")
+                if self._idle:
+                    item = self._take_idle()
+                    break
+                if self._created < self.max_size:
+                    self._created += 1
+                    break
+                remaining = self.timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    raise TimeoutError(
+                        f"No database connection available after {self.timeout}s")
+                waited = True
+                self._cond.wait(remaining)
+
+            wait_time = time.monotonic() - start
+            self._checkouts += 1
+            if waited:
+                self._waits += 1
+                self._wait_time_total += wait_time
+                self._wait_time_max = max(self._wait_time_max, wait_time)
+
+        if item is None:
+            return self._create()
+
+        conn, _, last_used = item
+        if time.monotonic() - last_used > self.health_check_interval:
+            try:
+                conn.execute("SELECT 1").fetchone()
+            except sqlite3.Error:
+                logger.warning("Discarding unhealthy pooled connection")
+                with self._cond:
+                    self._health_failures += 1
+                self._close_quietly(conn)
+                return self._create()
+        return conn
+
+    def _create(self) -> sqlite3.Connection:
+        """Open a new connection for a slot already reserved in `_created`"""
+        try:
+            return self._factory()
+        except Exception:
+            with self._cond:
+                self._created -= 1
+                self._cond.notify()
+            raise
+
+    def checkin(self, conn: sqlite3.Connection, discard: bool = False):
+        """Return a borrowed connection to the pool"""
+        if not discard and conn.in_transaction:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                discard = True
+
+        with self._cond:
+            if discard or self._closed:
+                self._created -= 1
+            else:
+                self._idle.append(
+                    (conn, threading.get_ident(), time.monotonic()))
+            self._cond.notify()
+
+        if discard or self._closed:
+            self._close_quietly(conn)
+
+    @contextmanager
+    def connection(self):
+        """Context manager wrapping checkout/checkin"""
+        conn = self.checkout()
+        try:
+            yield conn
+        finally:
+            # checkin() rolls back anything left open by a failed statement
+            self.checkin(conn)
+
+    def close(self):
+        """Close idle connections and refuse further checkouts"""
+        with self._cond:
+            self._closed = True
+            idle = [item[0] for item in self._idle]
+            self._idle.clear()
+            self._created -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            self._close_quietly(conn)
+
+    @staticmethod
+    def _close_quietly(conn: sqlite3.Connection):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def stats(self) -> Dict:
+        """Pool size and wait-time metrics"""
+        with self._cond:
+            return {
+                'max_size': self.max_size,
+                'size': self._created,
+                'in_use': self._created - len(self._idle),
+                'idle': len(self._idle),
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'avg_wait_ms': round(self._wait_time_total / self._waits * 1000, 3) if self._waits else 0.0,
+                'max_wait_ms': round(self._wait_time_max * 1000, 3),
+                'health_check_failures': self._health_failures
+            }
+
+
 class DatabaseManager:
-    def __init__(self, db_path: str = "aml_system.db"):
+    def __init__(self, db_path: str = "aml_system.db", pool_size: int = 8,
+                 pool_timeout: float = 30.0, background_migrations: bool = False,
+                 busy_timeout: float = 30.0):
         self.db_path = db_path
-        self.connection_pool = []
-        self._lock = threading.Lock()
+        self.busy_timeout = busy_timeout
+        self.connection_pool = ConnectionPool(
+            self.get_connection, max_size=pool_size, timeout=pool_timeout)
         self.init_database()
+        # Indexes, columns and derived tables added after the baseline schema
+        self.migrations = MigrationRunner(db_path, 'v6', busy_timeout=busy_timeout)
+        self.migrations.run(background=background_migrations)
+        self._applied: Set[int] = set()
+        # All writes go through one connection owned by one thread
+        self.writer = SingleWriter(self.get_connection, busy_timeout=busy_timeout,
+                                   name='aml-v6-writer')
+
+    def migration_applied(self, version: int) -> bool:
+        """Whether a v6 migration has finished; heavy ones may still be running in the background"""
+        if version not in self._applied and self.migrations.is_applied(version):
+            self._applied.add(version)
+        return version in self._applied
 
     def get_connection(self):
-        conn = sqlite3.connect(self.db_path)
+        """Open a new connection with per-connection PRAGMAs applied"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False,
+                               timeout=self.busy_timeout)
         conn.row_factory = sqlite3.Row
         conn.execute("PRAGMA foreign_keys = ON")
         # Write-ahead logging for performance
         conn.execute("PRAGMA journal_mode = WAL")
         return conn
 
+    def connection(self):
+        """Borrow a pooled connection: `with db.connection() as conn: ...`"""
+        return self.connection_pool.connection()
+
+    @contextmanager
+    def write_transaction(self):
+        """Lease the writer's connection for a multi-statement transaction.
+
+        Commits when the block exits normally, rolls back otherwise.
+        """
+        with self.writer.lease() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def pool_stats(self) -> Dict:
+        return self.connection_pool.stats()
+
     def init_database(self):
         """Initialize enhanced AML database schema with indexing"""
         conn = self.get_connection()
@@ -263,6 +474,7 @@ class DatabaseManager:
                 amount REAL NOT NULL,
                 currency TEXT DEFAULT 'PKR',
                 transaction_date TIMESTAMP,
+                transaction_ts INTEGER,
                 status TEXT DEFAULT 'pending',
                 transaction_type TEXT DEFAULT 'transfer',
                 channels TEXT,
@@ -388,8 +600,6 @@ class DatabaseManager:
             "CREATE INDEX IF NOT EXISTS idx_entities_name ON entities(name)")
         cursor.execute(
             "CREATE INDEX IF NOT EXISTS idx_entities_risk ON entities(risk_score)")
-        cursor.execute(
-            "CREATE INDEX IF NOT EXISTS idx_network_edges ON network_edges(source_entity, destination_entity)")
 
         conn.commit()
         conn.close()
@@ -398,37 +608,25 @@ class DatabaseManager:
     def execute_query(self, query: str, params: tuple = ()) -> list:
         """Execute SELECT query"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute(query, params)
-            results = cursor.fetchall()
-            conn.close()
-            return results
+            with self.connection() as conn:
+                return conn.execute(query, params).fetchall()
         except Exception as e:
             logger.error(f"Query error: {e}")
             return []
 
     def execute_update(self, query: str, params: tuple = ()) -> bool:
-        """Execute INSERT/UPDATE/DELETE"""
+        """Execute INSERT/UPDATE/DELETE through the single writer"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute(query, params)
-            conn.commit()
-            conn.close()
+            self.writer.execute(query, params)
             return True
         except Exception as e:
             logger.error(f"Update error: {e}")
             return False
 
     def execute_many(self, query: str, params_list: list) -> bool:
-        """Execute multiple INSERT/UPDATE/DELETE"""
+        """Execute multiple INSERT/UPDATE/DELETE through the single writer"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.executemany(query, params_list)
-            conn.commit()
-            conn.close()
+            self.writer.executemany(query, params_list)
             return True
         except Exception as e:
             logger.error(f"Batch update error: {e}")
@@ -438,11 +636,37 @@ class DatabaseManager:
 # ======================== DETECTION ALGORITHMS (ML & Pattern-Based) ========================
 
 
+def _prior_sums(x: np.ndarray, k: np.ndarray) -> np.ndarray:
+    """Sum of the values before each one in its group (k = position in the
+    group, groups contiguous). A doubling scan that never adds across groups:
+    one cumsum over all of them would carry other entities' totals and their
+    rounding error into every later group.
+    """
+    total = x.astype(np.float64, copy=True)
+    step, longest = 1, int(k.max()) + 1 if len(k) else 0
+    while step < longest:
+        at = np.flatnonzero(k >= step)
+        total[at] += total[at - step]
+        step *= 2
+    return np.where(k > 0, np.r_[0.0, total[:-1]], 0.0)
+
+
 class AnomalyDetector:
     """Advanced anomaly detection using statistical methods"""
 
-    def __init__(self):
+    # Reason bits returned by score_batch
+    FLAG_AMOUNT = 1
+    FLAG_FREQUENCY = 2
+    FLAG_HOUR = 4
+    FLAG_COUNTERPARTY = 8
+
+    def __init__(self, zscore_threshold: float = 2.0, min_daily_frequency: float = 1.0,
+                 night_start: int = 22, night_end: int = 4):
         self.baseline_stats = {}
+        self.zscore_threshold = zscore_threshold
+        self.min_daily_frequency = min_daily_frequency
+        self.night_start = night_start
+        self.night_end = night_end
 
     def calculate_zscore(self, value: float, mean: float, std: float) -> float:
         """Calculate Z-score for anomaly detection"""
@@ -467,10 +691,10 @@ class AnomalyDetector:
         mean_amount = np.mean(amounts)
         std_amount = np.std(amounts)
 
-        # 1. Amount anomaly (Z-score > 2)
+        # 1. Amount anomaly (Z-score above threshold)
         amount_zscore = self.calculate_zscore(
             transaction.get('amount', 0), mean_amount, std_amount)
-        if amount_zscore > 2:
+        if amount_zscore > self.zscore_threshold:
             scores.append(min(amount_zscore * 10, 100))
             reasons.append(
                 f"Unusual transaction amount (Z-score: {amount_zscore:.2f})")
@@ -480,14 +704,12 @@ class AnomalyDetector:
         avg_frequency = transaction_count / max(1, (datetime.now() - datetime.fromisoformat(
             entity_history[0].get('created_at', datetime.now().isoformat()))).days + 1)
 
-        if avg_frequency < 1 and transaction_count > 0:  # Rarely transacts
+        if avg_frequency < self.min_daily_frequency and transaction_count > 0:  # Rarely transacts
             scores.append(50)
             reasons.append("Entity with low transaction frequency")
 
-        # 3. Time-of-day anomaly
-        txn_hour = datetime.fromisoformat(transaction.get(
-            'transaction_date', datetime.now().isoformat())).hour
-        if txn_hour >= 22 or txn_hour <= 4:
+        # 3. Time-of-day anomaly (in AML_TIMEZONE)
+        if self._unusual_hour(transaction):
             scores.append(30)
             reasons.append("Transaction at unusual hour")
 
@@ -506,10 +728,251 @@ class AnomalyDetector:
         final_score = np.mean(scores) if scores else 0.0
         return min(final_score, 100.0), reasons
 
+    def score_with_stats(self, transaction: Dict, stats: Optional[EntityStats]) -> Tuple[float, List[str]]:
+        """The same checks against the source entity's entity_stats row: no history query"""
+        reasons = []
+        scores = []
+
+        if stats is None or not stats.txn_count:
+            return 0.0, reasons
+
+        # 1. Amount anomaly (Z-score above threshold) against the running mean/std
+        amount_zscore = self.calculate_zscore(
+            transaction.get('amount', 0), stats.amount_mean, stats.amount_std)
+        if amount_zscore > self.zscore_threshold:
+            scores.append(min(amount_zscore * 10, 100))
+            reasons.append(
+                f"Unusual transaction amount (Z-score: {amount_zscore:.2f})")
+
+        # 2. Frequency anomaly: transactions per day since first seen
+        days = 1
+        if stats.first_seen is not None:
+            days = max(0, int(time.time()) - stats.first_seen) // SECONDS_PER_DAY + 1
+        if stats.txn_count / days < self.min_daily_frequency:
+            scores.append(50)
+            reasons.append("Entity with low transaction frequency")
+
+        # 3. Time-of-day anomaly (in AML_TIMEZONE)
+        if self._unusual_hour(transaction):
+            scores.append(30)
+            reasons.append("Transaction at unusual hour")
+
+        # 4. Counterparty change anomaly
+        current_counterparty = transaction.get(
+            'destination_entity') or transaction.get('source_entity', '')
+        if stats.counterparty_count and not stats.knows(current_counterparty):
+            scores.append(20)
+            reasons.append("New counterparty entity")
+
+        final_score = np.mean(scores) if scores else 0.0
+        return min(final_score, 100.0), reasons
+
+    def _unusual_hour(self, transaction: Dict) -> bool:
+        txn_ts = transaction.get('transaction_ts')
+        if txn_ts is None:
+            txn_ts = to_epoch(transaction.get('transaction_date')) or int(time.time())
+        txn_hour = local_hour(txn_ts)
+        return txn_hour >= self.night_start or txn_hour <= self.night_end
+
+    def score_batch(self, amounts, timestamps, sources, destinations,
+                    now=None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        score_with_stats for many transactions at once, from columnar arrays in
+        insertion order. Each row is scored against the rows before it, as its
+        entity_stats row stood when it was inserted; counterparties are an exact
+        set here rather than the Bloom filter. `timestamps` may hold NaN, `now`
+        is a scalar or per-row epoch. Returns (scores, flags, zscores); see
+        batch_reasons().
+        """
+        if len(amounts) == 0:
+            return np.zeros(0), np.zeros(0, dtype=np.uint8), np.zeros(0)
+        ctx = self.batch_context(amounts, timestamps, sources, destinations, now)
+        history, zscores, days, hours = ctx['history'], ctx['zscores'], ctx['days'], ctx['hours']
+
+        has_history = history > 0
+        amount_hit = has_history & (zscores > self.zscore_threshold)
+        frequency_hit = has_history & (history / days < self.min_daily_frequency)
+        hour_hit = has_history & ((hours >= self.night_start) | (hours <= self.night_end))
+        party_hit = has_history & ctx['new_party']
+
+        total = (np.where(amount_hit, np.minimum(zscores * 10, 100), 0.0)
+                 + 50 * frequency_hit + 30 * hour_hit + 20 * party_hit)
+        fired = amount_hit.astype(np.int64) + frequency_hit + hour_hit + party_hit
+        scores = np.where(fired > 0, np.minimum(total / np.maximum(fired, 1), 100.0), 0.0)
+        flags = (amount_hit * self.FLAG_AMOUNT | frequency_hit * self.FLAG_FREQUENCY |
+                 hour_hit * self.FLAG_HOUR | party_hit * self.FLAG_COUNTERPARTY).astype(np.uint8)
+        return scores, flags, zscores
+
+    def batch_context(self, amounts, timestamps, sources, destinations, now=None) -> Dict[str, np.ndarray]:
+        """
+        Per-row state score_batch scores from (same arguments): the source's
+        prior transaction count, amount mean/std and signed z-score, days since
+        its first transaction, the local hour, whether the counterparty is new
+        to the source, and the destination's prior transaction count.
+        """
+        amounts = np.asarray(amounts, dtype=np.float64)
+        n = len(amounts)
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        now = np.broadcast_to(np.asarray(time.time() if now is None else now, dtype=np.float64), (n,))
+        sources, destinations = np.asarray(sources), np.asarray(destinations)
+        if sources.dtype.kind not in 'iu':
+            _, codes = np.unique(np.concatenate([sources, destinations]), return_inverse=True)
+            sources, destinations = codes[:n], codes[n:]
+
+        # One event per (entity, transaction) side; a self-transfer is one event
+        rows = np.arange(n)
+        other = destinations != sources
+        ev_entity = np.concatenate([sources, destinations[other]])
+        ev_party = np.concatenate([destinations, sources[other]])
+        ev_row = np.concatenate([rows, rows[other]])
+        ev_source = np.r_[np.ones(n, dtype=bool), np.zeros(int(other.sum()), dtype=bool)]
+
+        # Group events by entity in insertion order; k = events before this one
+        order = np.lexsort((ev_row, ev_entity))
+        entity, row = ev_entity[order], ev_row[order]
+        starts_mask = np.r_[True, entity[1:] != entity[:-1]]
+        group = np.cumsum(starts_mask) - 1
+        starts = np.flatnonzero(starts_mask)
+        k = np.arange(len(order)) - starts[group]
+
+        # Exclusive prefix sums per group, shifted by the group's first amount
+        x = amounts[row]
+        base = x[starts][group]
+        shifted = x - base
+        s1 = _prior_sums(shifted, k)
+        s2 = _prior_sums(shifted * shifted, k)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_shift = np.where(k > 0, s1 / k, 0.0)
+            std = np.sqrt(np.maximum(np.where(k > 0, s2 / k, 0.0) - mean_shift ** 2, 0.0))
+
+        # Earliest prior timestamp: segmented running minimum via a per-group offset
+        big = 1 << 34
+        t = timestamps[row]
+        t = np.where(np.isnan(t), big - 1, np.clip(t, 0, big - 2)).astype(np.int64)
+        offset = group.astype(np.int64) * big
+        first = offset - np.maximum.accumulate(offset - t)
+        prior_first = np.r_[big - 1, first[:-1]]
+
+        # First event of each (entity, counterparty) pair
+        pair_order = np.lexsort((ev_row, ev_party, ev_entity))
+        pair_entity, pair_party = ev_entity[pair_order], ev_party[pair_order]
+        pair_start = np.r_[True, (pair_entity[1:] != pair_entity[:-1]) |
+                           (pair_party[1:] != pair_party[:-1])]
+        new_party = np.empty(len(order), dtype=bool)
+        new_party[pair_order] = pair_start
+        new_party = new_party[order]
+
+        # Back to one value per transaction, from its source-side event
+        src = ev_source[order]
+        at = row[src]
+        history = np.zeros(n, dtype=np.int64)
+        history[at] = k[src]
+        mean = np.zeros(n)
+        mean[at] = (base + mean_shift)[src]
+        sd = np.zeros(n)
+        sd[at] = std[src]
+        seen = np.full(n, big - 1, dtype=np.int64)
+        seen[at] = np.where(k[src] > 0, prior_first[src], big - 1)
+        is_new = np.zeros(n, dtype=bool)
+        is_new[at] = new_party[src]
+        # A self-transfer has no destination-side event: its source's count stands in
+        destination_history = history.copy()
+        destination_history[row[~src]] = k[~src]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            signed = np.where(sd > 0, (amounts - mean) / sd, 0.0)
+        days = np.where(seen < big - 1,
+                        np.maximum(0, np.floor(now) - seen) // SECONDS_PER_DAY + 1, 1)
+        at_ts = np.where(np.isnan(timestamps), np.floor(now), timestamps)
+
+        # Zone offsets are whole quarter hours: one local_hour() per 15 minutes
+        buckets, inverse = np.unique((at_ts // 900).astype(np.int64), return_inverse=True)
+        hours = np.array([local_hour(int(b) * 900) for b in buckets])[inverse.ravel()]
+
+        return {
+            'amounts': amounts,
+            'history': history,
+            'mean': mean,
+            'std': sd,
+            'signed_zscores': signed,
+            'zscores': np.abs(signed),
+            'days': days,
+            'hours': hours,
+            'new_party': is_new,
+            'destination_history': destination_history
+        }
+
+    def batch_reasons(self, flag: int, zscore: float) -> List[str]:
+        """The reasons score_with_stats gives, from a score_batch flag"""
+        reasons = []
+        if flag & self.FLAG_AMOUNT:
+            reasons.append(f"Unusual transaction amount (Z-score: {zscore:.2f})")
+        if flag & self.FLAG_FREQUENCY:
+            reasons.append("Entity with low transaction frequency")
+        if flag & self.FLAG_HOUR:
+            reasons.append("Transaction at unusual hour")
+        if flag & self.FLAG_COUNTERPARTY:
+            reasons.append("New counterparty entity")
+        return reasons
+
+
+class _Interner(dict):
+    """Maps each new key to the next integer code on first lookup"""
+
+    def __missing__(self, key):
+        code = self[key] = len(self)
+        return code
+
+
+def load_transaction_columns(db: 'DatabaseManager', target_sql: str = "1", params: tuple = (),
+                             chunk_size: int = 50000) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Every transaction as columnar arrays in insertion (rowid) order, the input
+    of AnomalyDetector.score_batch: rowid, interned src/dst, amount (NULL as
+    0), transaction_ts (NULL as NaN), `now` (the created_at clock each row was
+    scored at) and `target`, the value of `target_sql` per row. None when the
+    table is empty.
+    """
+    entity_index = _Interner()
+    columns = {'rowid': [], 'src': [], 'dst': [], 'amount': [], 'ts': [],
+               'created': [], 'target': []}
+    with db.connection() as conn:
+        cursor = conn.execute(f"""
+            SELECT rowid, source_entity, destination_entity, amount, transaction_ts,
+                   created_at, {target_sql}
+            FROM transactions ORDER BY rowid
+        """, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            rowid, src, dst, amount, ts, created, target = zip(*rows)
+            columns['rowid'].append(np.asarray(rowid, dtype=np.int64))
+            columns['src'].append(np.fromiter(map(entity_index.__getitem__, src),
+                                              dtype=np.int64, count=len(rows)))
+            columns['dst'].append(np.fromiter(map(entity_index.__getitem__, dst),
+                                              dtype=np.int64, count=len(rows)))
+            columns['amount'].append(np.asarray(amount, dtype=np.float64))
+            columns['ts'].append(np.asarray(ts, dtype=np.float64))
+            # created_at is CURRENT_TIMESTAMP (UTC): the clock the row was scored at
+            columns['created'].append(np.asarray(created, dtype='datetime64[s]'))
+            columns['target'].append(np.asarray(target, dtype=bool))
+
+    if not columns['rowid']:
+        return None
+    columns = {k: np.concatenate(v) for k, v in columns.items()}
+    created = columns.pop('created')
+    columns['now'] = np.where(np.isnat(created), time.time(), created.astype(np.int64))
+    columns['amount'] = np.nan_to_num(columns['amount'])
+    return columns
+
 
 class PatternDetector:
     """Detect suspicious transaction patterns (Structuring, Round-tripping, etc.)"""
 
+    # Description prefix of the patterns rows owned by detect_structuring_batch
+    STRUCTURING_SWEEP = "Structuring sweep"
+
     def __init__(self, db: 'DatabaseManager'):
         self.db = db
 
@@ -518,30 +981,38 @@ class PatternDetector:
         """
         Detect structuring pattern (multiple small transfers to avoid reporting threshold)
         Returns: (is_structuring, pattern_details)
-        """
-        query = """
-            SELECT amount, transaction_date FROM transactions 
-            WHERE (source_entity = ? OR destination_entity = ?)
-            AND datetime(transaction_date) >= datetime('now', '-' || ? || ' days')
-            ORDER BY transaction_date
-        """
 
-        results = self.db.execute_query(
-            query, (entity_id, entity_id, threshold_days))
+        At the rollups' threshold (daily_rollups.SUB_THRESHOLD_AMOUNT) the
+        window is summed from entity_daily_stats, one row per day, once the
+        rollups backfill (migration 12) has finished.
+        """
+        since = window_start(threshold_days)
+        if threshold_amount == daily_rollups.SUB_THRESHOLD_AMOUNT and self.db.migration_applied(12):
+            result = self.db.execute_query(*daily_rollups.window_query(entity_id, since))
+            if not result:
+                return False, {}
+            window = dict(zip(daily_rollups.WINDOW_FIELDS, result[0]))
+            count, total = window['txn_count'], window['total_amount']
+            below_threshold_count = window['sub_threshold_count']
+        else:
+            query = """
+                SELECT amount FROM transactions
+                WHERE (source_entity = ? OR destination_entity = ?)
+                AND transaction_ts >= ?
+            """
+            amounts = [row[0] or 0.0 for row in self.db.execute_query(
+                query, (entity_id, entity_id, since))]
+            count, total = len(amounts), sum(amounts)
+            # Check if amounts are just below threshold
+            below_threshold_count = sum(1 for a in amounts if a < threshold_amount)
 
-        if len(results) < transaction_count:
+        if count < transaction_count:
             return False, {}
 
-        amounts = [row[0] for row in results]
-
-        # Check if amounts are just below threshold
-        below_threshold_count = sum(1 for a in amounts if a < threshold_amount)
-
         if below_threshold_count >= transaction_count:
-            total = sum(amounts)
             return True, {
                 'pattern': 'structuring',
-                'confidence': min(0.95, below_threshold_count / len(amounts)),
+                'confidence': min(0.95, below_threshold_count / count),
                 'total_amount': total,
                 'transaction_count': below_threshold_count,
                 'period_days': threshold_days
@@ -549,6 +1020,122 @@ class PatternDetector:
 
         return False, {}
 
+    def detect_structuring_batch(self, entity_ids: Optional[List[str]] = None, threshold_days: int = 30,
+                                 threshold_amount: float = 50000, transaction_count: int = 5,
+                                 persist: bool = True, chunk_size: int = 200000) -> Dict[str, Dict]:
+        """
+        detect_structuring for every entity (or `entity_ids`) from one scan of the window.
+        Returns {entity_id: pattern_details} for the entities flagged, with the same
+        verdicts and details as the per-entity method. With persist=True the flagged
+        entities replace the previous sweep's rows in the patterns table, filed under
+        the case of each entity's latest transaction in the window.
+        """
+        since = window_start(threshold_days)
+        entity_index = _Interner()
+        parts = {'src': [], 'dst': [], 'amount': [], 'ts': [], 'rowid': []}
+
+        def codes(values, index):
+            return np.fromiter(map(index.__getitem__, values), dtype=np.int64, count=len(values))
+
+        with self.db.connection() as conn:
+            cursor = conn.execute("""
+                SELECT source_entity, destination_entity, amount, transaction_ts, rowid
+                FROM transactions WHERE transaction_ts >= ?
+            """, (since,))
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                src, dst, amount, ts, rowid = zip(*rows)
+                parts['src'].append(codes(src, entity_index))
+                parts['dst'].append(codes(dst, entity_index))
+                parts['amount'].append(np.asarray(amount, dtype=np.float64))
+                parts['ts'].append(np.asarray(ts, dtype=np.int64))
+                parts['rowid'].append(np.asarray(rowid, dtype=np.int64))
+
+        if not entity_index:
+            return {}
+        src, dst, amount, ts, rowid = (np.concatenate(parts[k])
+                                       for k in ('src', 'dst', 'amount', 'ts', 'rowid'))
+
+        # A transaction counts once for each entity it touches
+        other = dst != src
+        entity = np.concatenate([src, dst[other]])
+        amount = np.concatenate([amount, amount[other]])
+
+        n = len(entity_index)
+        totals = np.bincount(entity, minlength=n)
+        below = np.bincount(entity, weights=amount < threshold_amount, minlength=n).astype(np.int64)
+        sums = np.bincount(entity, weights=amount, minlength=n)
+
+        # totals >= transaction_count is implied, as in the per-entity method
+        flagged = below >= transaction_count
+        if entity_ids is not None:
+            wanted = np.zeros(n, dtype=bool)
+            wanted[[entity_index[e] for e in entity_ids if e in entity_index]] = True
+            flagged &= wanted
+
+        entity_names = np.array(list(entity_index), dtype=object)
+        flagged_codes = np.flatnonzero(flagged)
+        latest_case = {}
+        if persist and len(flagged_codes):
+            # Latest transaction per entity: last row of each entity sorted by (entity, ts)
+            ts, rowid = np.concatenate([ts, ts[other]]), np.concatenate([rowid, rowid[other]])
+            order = np.lexsort((ts, entity))
+            ends = np.r_[np.flatnonzero(np.diff(entity[order])), len(order) - 1]
+            latest_row = np.empty(n, dtype=np.int64)
+            latest_row[entity[order[ends]]] = rowid[order[ends]]
+            wanted_rows = latest_row[flagged_codes].tolist()
+            case_by_row = {}
+            with self.db.connection() as conn:
+                for i in range(0, len(wanted_rows), 500):
+                    chunk = wanted_rows[i:i + 500]
+                    case_by_row.update(conn.execute(
+                        f"SELECT rowid, case_id FROM transactions WHERE rowid IN "
+                        f"({','.join('?' * len(chunk))})", chunk).fetchall())
+            latest_case = {code: case_by_row[row] for code, row in zip(flagged_codes, wanted_rows)}
+
+        results, pattern_rows = {}, []
+        for code in flagged_codes:
+            details = {
+                'pattern': 'structuring',
+                'confidence': min(0.95, int(below[code]) / int(totals[code])),
+                'total_amount': float(sums[code]),
+                'transaction_count': int(below[code]),
+                'period_days': threshold_days
+            }
+            entity_id = entity_names[code]
+            results[entity_id] = details
+            if persist:
+                pattern_rows.append((
+                    str(uuid.uuid4()), latest_case[code], 'structuring',
+                    json.dumps([entity_id]), None, details['confidence'],
+                    f"{self.STRUCTURING_SWEEP}: {details['transaction_count']} transactions "
+                    f"below {threshold_amount:,.0f} in {threshold_days} days"))
+
+        if persist:
+            def write(conn):
+                if entity_ids is None:
+                    conn.execute("DELETE FROM patterns WHERE pattern_type = 'structuring' "
+                                 "AND description LIKE ?", (f"{self.STRUCTURING_SWEEP}%",))
+                else:
+                    conn.executemany(
+                        "DELETE FROM patterns WHERE pattern_type = 'structuring' "
+                        "AND entities_involved = ? AND description LIKE ?",
+                        [(json.dumps([e]), f"{self.STRUCTURING_SWEEP}%") for e in entity_ids])
+                conn.executemany("""
+                    INSERT INTO patterns (pattern_id, case_id, pattern_type, entities_involved,
+                                          transactions_involved, confidence_score, description)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, pattern_rows)
+
+            try:
+                self.db.writer.submit(write).result()
+                logger.info(f"Structuring sweep flagged {len(results)} of {n} entities")
+            except Exception as e:
+                logger.error(f"Error saving structuring sweep: {e}")
+        return results
+
     def detect_round_tripping(self, entity_id: str, time_window_days: int = 30) -> Tuple[bool, Dict]:
         """
         Detect round-tripping pattern (funds flowing out and back quickly)
@@ -557,56 +1144,107 @@ class PatternDetector:
             SELECT source_entity, destination_entity, amount, transaction_date 
             FROM transactions 
             WHERE (source_entity = ? OR destination_entity = ?)
-            AND datetime(transaction_date) >= datetime('now', '-' || ? || ' days')
-            ORDER BY transaction_date
+            AND transaction_ts >= ?
+            ORDER BY transaction_ts, transaction_date
         """
 
         results = self.db.execute_query(
-            query, (entity_id, entity_id, time_window_days))
+            query, (entity_id, entity_id, window_start(time_window_days)))
 
-        round_trips = []
+        return self.match_round_trips(entity_id, results)
 
-        for i, result in enumerate(results):
-            source, dest, amount, date = result
+    @staticmethod
+    def match_round_trips(entity_id: str, results: List[Tuple]) -> Tuple[bool, Dict]:
+        """
+        Pair each transaction with every later payment from entity_id back to the same
+        counterparty, made within 3 days and within 10% of its amount.
+        `results` are time-ordered (source, destination, amount, date) rows. Rows are
+        bucketed by counterparty and each bucket is swept with two pointers, keeping
+        the outgoing amounts inside the 3-day window sorted: O(n log n) overall.
+        """
+        buckets = defaultdict(list)
+        for position, (source, dest, amount, date) in enumerate(results):
             counterparty = dest if source == entity_id else source
+            outgoing = source == entity_id and dest != entity_id
+            buckets[counterparty].append((position, datetime.fromisoformat(date), amount, outgoing))
+
+        # (later - earlier).days <= 3
+        span = timedelta(days=4)
+
+        def in_band(amount, amount2):
+            return abs(amount - amount2) / amount < 0.1
+
+        total = 0
+        matched = []  # (position, counterparty, rows, index) of rows with at least one match
+        for counterparty, rows in buckets.items():
+            if counterparty == entity_id:
+                continue  # a self-transfer is never paid back
+            window = []  # sorted amounts of the outgoing rows in (i, hi)
+            hi = 0
+            for i, (position, date, amount, _) in enumerate(rows):
+                if hi > i and rows[i][3]:
+                    del window[bisect_left(window, rows[i][2])]
+                hi = max(hi, i + 1)
+                while hi < len(rows) and rows[hi][1] - date < span:
+                    if rows[hi][3]:
+                        insort(window, rows[hi][2])
+                    hi += 1
+                if not window or amount <= 0:
+                    continue
+                # The band is contiguous in sorted order: binary-search both edges
+                low = bisect_left(window, True, key=lambda a: a >= amount or in_band(amount, a))
+                high = bisect_left(window, True, key=lambda a: a > amount and not in_band(amount, a))
+                if high > low:
+                    total += high - low
+                    matched.append((position, counterparty, rows, i))
+
+        if not total:
+            return False, {}
 
-            # Look for reverse transaction
-            for j in range(i + 1, len(results)):
-                source2, dest2, amount2, date2 = results[j]
-                counterparty2 = dest2 if source2 == entity_id else source2
-
-                if counterparty == counterparty2 and source2 == entity_id and dest2 != entity_id:
-                    time_diff = (datetime.fromisoformat(date2) -
-                                 datetime.fromisoformat(date)).days
-                    # Same amount, quick turnaround
-                    if time_diff <= 3 and abs(amount - amount2) / amount < 0.1:
-                        round_trips.append({
-                            'counterparty': counterparty,
-                            'amount': amount,
-                            'days_between': time_diff
-                        })
-
-        if round_trips:
-            return True, {
-                'pattern': 'round_tripping',
-                'confidence': min(0.9, len(round_trips) / max(1, len(results) / 2)),
-                'round_trip_count': len(round_trips),
-                'examples': round_trips[:3]
-            }
-
-        return False, {}
+        examples = []
+        for _, counterparty, rows, i in sorted(matched, key=lambda m: m[0]):
+            _, date, amount, _ = rows[i]
+            for _, date2, amount2, outgoing in rows[i + 1:]:
+                if date2 - date >= span or len(examples) == 3:
+                    break
+                if outgoing and in_band(amount, amount2):
+                    examples.append({
+                        'counterparty': counterparty,
+                        'amount': amount,
+                        'days_between': (date2 - date).days
+                    })
+            if len(examples) == 3:
+                break
+
+        return True, {
+            'pattern': 'round_tripping',
+            'confidence': min(0.9, total / max(1, len(results) / 2)),
+            'round_trip_count': total,
+            'examples': examples
+        }
 
     def detect_fan_in_fan_out(self, entity_id: str) -> Dict:
         """Detect fan-in (many→one) and fan-out (one→many) patterns"""
-        query_in = """
-            SELECT COUNT(DISTINCT source_entity), SUM(amount) 
-            FROM transactions WHERE destination_entity = ?
-        """
-
-        query_out = """
-            SELECT COUNT(DISTINCT destination_entity), SUM(amount) 
-            FROM transactions WHERE source_entity = ?
-        """
+        if self.db.migration_applied(8):
+            # One network_edges row per counterparty: no scan of the entity's transactions
+            query_in = """
+                SELECT COUNT(*), SUM(total_amount)
+                FROM network_edges WHERE destination_entity = ?
+            """
+            query_out = """
+                SELECT COUNT(*), SUM(total_amount)
+                FROM network_edges WHERE source_entity = ?
+            """
+        else:
+            # network_edges is still being backfilled
+            query_in = """
+                SELECT COUNT(DISTINCT source_entity), SUM(amount)
+                FROM transactions WHERE destination_entity = ? AND source_entity IS NOT NULL
+            """
+            query_out = """
+                SELECT COUNT(DISTINCT destination_entity), SUM(amount)
+                FROM transactions WHERE source_entity = ? AND destination_entity IS NOT NULL
+            """
 
         result_in = self.db.execute_query(query_in, (entity_id,))
         result_out = self.db.execute_query(query_out, (entity_id,))
@@ -636,78 +1274,117 @@ class PatternDetector:
 
 
 class NetworkAnalyzer:
-    """Analyze transaction networks for money laundering patterns"""
+    """Analyze transaction networks for money laundering patterns.
 
-    def __init__(self, db: 'DatabaseManager'):
-        self.db = db
-        self.graph = defaultdict(list)
-        self.nodes = {}
+    Holds no graph of its own: build_network() returns a fresh immutable
+    TransactionGraph per analysis, so concurrent requests never share or
+    grow one another's edges. With a snapshot path the graph is cut from
+    the memory-mapped snapshot plus the transactions inserted since it,
+    instead of being read from network_edges.
+    """
 
-    def build_network(self, entity_ids: List[str]):
-        """Build transaction network from entities"""
-        query = """
-            SELECT source_entity, destination_entity, amount, COUNT(*) as txn_count
-            FROM transactions
-            WHERE source_entity IN ({}) OR destination_entity IN ({})
-            GROUP BY source_entity, destination_entity
-        """.format(','.join(['?'] * len(entity_ids)), ','.join(['?'] * len(entity_ids)))
-
-        results = self.db.execute_query(query, entity_ids + entity_ids)
-
-        for source, dest, amount, count in results:
-            self.graph[source].append((dest, amount, count))
-            if source not in self.nodes:
-                self.nodes[source] = NetworkNode(
-                    str(uuid.uuid4()), source, 'source')
-            if dest not in self.nodes:
-                self.nodes[dest] = NetworkNode(
-                    str(uuid.uuid4()), dest, 'destination')
-
-            self.nodes[source].out_degree += 1
-            self.nodes[dest].in_degree += 1
-
-    def calculate_centrality(self) -> Dict[str, float]:
-        """Calculate node centrality scores"""
-        centrality = {}
-
-        for node_id, node in self.nodes.items():
-            # Weighted degree centrality
-            total_weight = sum(amount for _, amount, _ in self.graph[node_id])
-            centrality[node_id] = (
-                node.in_degree + node.out_degree) * (1 + np.log1p(total_weight))
-
-        return centrality
-
-    def find_suspicious_chains(self, min_chain_length: int = 3) -> List[List[str]]:
+    def __init__(self, db: 'DatabaseManager', snapshot_path: Optional[str] = None):
+        self.db = db
+        self.snapshot_path = snapshot_path
+        self.snapshot: Optional[graph_snapshot.GraphSnapshot] = None
+        self._snapshot_lock = threading.Lock()
+        self._unreadable = None  # identity of a snapshot file that failed to open
+
+    def _current_snapshot(self) -> Optional['graph_snapshot.GraphSnapshot']:
+        """The open snapshot, reopened once the snapshot job has replaced the file"""
+        if self.snapshot_path is None:
+            return None
+        identity = graph_snapshot.file_identity(self.snapshot_path)
+        snapshot = self.snapshot
+        if identity is None or (snapshot is not None and snapshot.identity == identity) \
+                or identity == self._unreadable:
+            return snapshot if identity is not None else None
+        with self._snapshot_lock:
+            if self.snapshot is None or self.snapshot.identity != identity:
+                opened = graph_snapshot.open_snapshot(self.snapshot_path)
+                if opened is None:
+                    self._unreadable = identity
+                else:
+                    self.snapshot = opened
+                    logger.info(f"Opened graph snapshot {self.snapshot_path} "
+                                f"(watermark {opened.watermark}, {opened.graph.edge_count:,} edges)")
+            return self.snapshot
+
+    def snapshot_info(self) -> Dict:
+        """Snapshot header and how many transactions the overlay adds to it"""
+        snapshot = self._current_snapshot()
+        if snapshot is None:
+            return {'enabled': self.snapshot_path is not None, 'loaded': False,
+                    'path': self.snapshot_path}
+        return dict(snapshot.describe(), enabled=True, loaded=True,
+                    pending_transactions=snapshot.pending_transactions(self.db))
+
+    def build_network(self, entity_ids: List[str]) -> TransactionGraph:
+        """Build the transaction network around entities.
+
+        Holds the network_edges aggregates touching any of the entities; an
+        edge's amount is the total of its transactions.
+        """
+        snapshot = self._current_snapshot()
+        if snapshot is not None:
+            return snapshot.graph_for(self.db, entity_ids)
+        return TransactionGraph.from_db(self.db, entity_ids, dates=True,
+                                        from_transactions=not self.db.migration_applied(8))
+
+    def whole_network(self) -> TransactionGraph:
+        """Every entity and edge: the snapshot plus overlay, else network_edges"""
+        snapshot = self._current_snapshot()
+        if snapshot is not None:
+            return snapshot.graph_for(self.db)
+        return TransactionGraph.from_db(self.db, dates=True,
+                                        from_transactions=not self.db.migration_applied(8))
+
+    def calculate_centrality(self, graph: TransactionGraph) -> Dict[str, float]:
+        """Calculate node centrality scores (weighted degree)"""
+        return graph.weighted_degree_centrality()
+
+    def stored_centrality(self, entity_ids: List[str]) -> Dict[str, Dict]:
+        """Whole-network PageRank, eigenvector, betweenness and percentile
+        from the last centrality run, for the entities it covered.
+        """
+        stored = {}
+        for start in range(0, len(entity_ids), 500):
+            chunk = tuple(entity_ids[start:start + 500])
+            for row in self.db.execute_query(f"""
+                    SELECT entity_id, pagerank, eigenvector, betweenness, network_percentile, computed_at
+                    FROM entity_centrality WHERE entity_id IN ({','.join('?' * len(chunk))})
+            """, chunk):
+                stored[row[0]] = {'pagerank': row[1], 'eigenvector': row[2], 'betweenness': row[3],
+                                  'network_percentile': row[4], 'computed_at': row[5]}
+        return stored
+
+    def find_suspicious_chains(self, graph: TransactionGraph,
+                               min_chain_length: int = 3) -> List[List[str]]:
         """Find suspicious transaction chains (potential layering)"""
-        chains = []
-        visited = set()
-
-        for start_node in self.graph.keys():
-            if start_node in visited:
-                continue
-
-            # BFS to find chains
-            queue = deque([(start_node, [start_node])])
-
-            while queue:
-                current, path = queue.popleft()
-
-                if len(path) > min_chain_length:
-                    chains.append(path)
-                    visited.update(path)
-                    continue
-
-                for next_node, _, _ in self.graph.get(current, []):
-                    if next_node not in visited:
-                        queue.append((next_node, path + [next_node]))
-
-        return chains
+        return graph.find_chains(min_chain_length)
+
+    def expand_subgraph(self, entity_id: str, limits: SubgraphLimits) -> Iterator[Dict]:
+        """Bounded k-hop neighbourhood of one entity, node and edge dicts as
+        they are found (see subgraph.py). Reads live network_edges rather
+        than the snapshot, whose arrays are not ordered by amount, or the
+        transactions until the network_edges backfill has finished. The
+        stream lasts as long as the client takes to read it, so it opens its
+        own connection instead of holding one of the pool's.
+        """
+        from_transactions = not self.db.migration_applied(8)
+        conn = self.db.get_connection()
+        try:
+            yield from subgraph.expand(conn, entity_id, limits, from_transactions)
+        finally:
+            conn.close()
 
 
 class RiskScorer:
     """Calculate comprehensive risk scores"""
 
+    # Stored network_percentile at or above which an entity counts as central
+    CENTRALITY_PERCENTILE = 0.99
+
     def __init__(self, db: DatabaseManager, pattern_detector: PatternDetector,
                  network_analyzer: NetworkAnalyzer):
         self.db = db
@@ -738,20 +1415,29 @@ class RiskScorer:
             elif pep_flag:
                 scores['pep'] = 70
 
-        # Transaction history risk
-        query = "SELECT COUNT(*) as txn_count, SUM(amount) as total FROM transactions WHERE source_entity = ? OR destination_entity = ?"
-        result = self.db.execute_query(query, (entity_id, entity_id))
-
-        if result and result[0][0] > 0:
-            txn_count = result[0][0]
-            if txn_count > 100:
-                scores['activity_level'] = 30
-
-        # Network centrality
-        self.network_analyzer.build_network([entity_id])
-        centrality = self.network_analyzer.calculate_centrality()
-        if entity_id in centrality and centrality[entity_id] > 50:
-            scores['network_centrality'] = 40
+        # Transaction history risk: all-time count from the entity_stats row,
+        # counted from the transactions until its backfill has finished
+        if self.db.migration_applied(6):
+            query = "SELECT txn_count FROM entity_stats WHERE entity_id = ?"
+            result = self.db.execute_query(query, (entity_id,))
+        else:
+            query = "SELECT COUNT(*) FROM transactions WHERE source_entity = ? OR destination_entity = ?"
+            result = self.db.execute_query(query, (entity_id, entity_id))
+
+        if result and result[0][0] > 100:
+            scores['activity_level'] = 30
+
+        # Network centrality: the last whole-network run (PageRank/betweenness
+        # percentile), else the weighted degree of the entity's own edges
+        stored = self.network_analyzer.stored_centrality([entity_id])
+        if entity_id in stored:
+            if stored[entity_id]['network_percentile'] >= self.CENTRALITY_PERCENTILE:
+                scores['network_centrality'] = 40
+        else:
+            graph = self.network_analyzer.build_network([entity_id])
+            centrality = self.network_analyzer.calculate_centrality(graph)
+            if entity_id in centrality and centrality[entity_id] > 50:
+                scores['network_centrality'] = 40
 
         # Structuring detection
         is_structuring, _ = self.pattern_detector.detect_structuring(entity_id)
@@ -844,24 +1530,199 @@ class EntityManager:
             return row
         return None
 
+    def get_activity(self, entity_id: str, days: float = 30) -> Dict:
+        """Transaction totals over the trailing `days` and the per-day rollups
+        behind them (the first day's row may start before the window)
+        """
+        since = window_start(days)
+        # Aggregated from the transactions until the rollups backfill has finished
+        rollups = self.db.migration_applied(12)
+        totals = self.db.execute_query(*daily_rollups.window_query(entity_id, since, rollups))
+        daily = self.db.execute_query(*daily_rollups.daily_query(
+            entity_id, daily_rollups.day_of(since), rollups))
+        return {
+            'entity_id': entity_id,
+            'days': days,
+            'since': since,
+            'sub_threshold_amount': daily_rollups.SUB_THRESHOLD_AMOUNT,
+            'totals': dict(zip(daily_rollups.WINDOW_FIELDS, totals[0])) if totals else {},
+            'daily': [dict(row, date=time.strftime('%Y-%m-%d', time.gmtime(row['day'] * SECONDS_PER_DAY)))
+                      for row in daily]
+        }
+
     def update_entity_risk(self, entity_id: str, risk_score: float):
-        """Update entity risk score"""
-        query = "UPDATE entities SET risk_score = ? WHERE entity_id = ?"
-        self.db.execute_update(query, (risk_score, entity_id))
+        """Update entity risk score, and its cluster's max_risk with it"""
+        def write(conn):
+            row = conn.execute("SELECT risk_score FROM entities WHERE entity_id = ?",
+                               (entity_id,)).fetchone()
+            conn.execute("UPDATE entities SET risk_score = ? WHERE entity_id = ?", (risk_score, entity_id))
+            if row is not None:
+                entity_clusters.update_risk(conn, entity_id, row[0], risk_score)
+
+        try:
+            self.db.writer.submit(write).result()
+        except Exception as e:
+            logger.error(f"Update error: {e}")
+
+    def get_cluster(self, entity_id: str) -> Optional[Dict]:
+        """Aggregates of the entity's connected cluster; an entity that has
+        not transacted is a cluster of its own. None if the entity is unknown.
+        """
+        cluster = entity_clusters.cluster_of(self.db, entity_id)
+        if cluster is not None:
+            return cluster
+        entity = self.db.execute_query("SELECT risk_score FROM entities WHERE entity_id = ?", (entity_id,))
+        if not entity:
+            return None
+        return {'cluster_id': entity_id, 'size': 1, 'transaction_count': 0, 'total_flow': 0.0,
+                'max_risk': entity[0][0] or 0.0, 'updated_at': None}
+
+
+# ======================== CASE ANALYSIS WORKERS ========================
+
+
+def detect_entity_patterns(detector: PatternDetector, entity_id: str) -> Dict:
+    """Every pattern detector for one entity, merged into {pattern_name: details}"""
+    patterns = {}
+    structuring, details = detector.detect_structuring(entity_id)
+    if structuring:
+        patterns['structuring'] = details
+    round_trip, details = detector.detect_round_tripping(entity_id)
+    if round_trip:
+        patterns['round_tripping'] = details
+    patterns.update(detector.detect_fan_in_fan_out(entity_id))
+    return patterns
+
+
+class _ReadOnlyDatabase:
+    """execute_query() on one read-only connection, for analysis worker processes"""
+
+    def __init__(self, db_path: str, busy_timeout: float = 30.0):
+        self.conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=busy_timeout)
+        self.conn.row_factory = sqlite3.Row
+        self._applied: Set[int] = set()
+
+    def migration_applied(self, version: int) -> bool:
+        """DatabaseManager.migration_applied() over the worker's connection"""
+        if version not in self._applied and self.execute_query(
+                "SELECT 1 FROM schema_version WHERE version = ? AND status = 'applied'", (version,)):
+            self._applied.add(version)
+        return version in self._applied
+
+    def execute_query(self, query: str, params: tuple = ()) -> list:
+        try:
+            return self.conn.execute(query, params).fetchall()
+        except Exception as e:
+            logger.error(f"Query error: {e}")
+            return []
+
+
+_worker_detector: Optional[PatternDetector] = None
+
+
+def _init_analysis_worker(db_path: str):
+    global _worker_detector
+    _worker_detector = PatternDetector(_ReadOnlyDatabase(db_path))
+
+
+def _analyze_entity_task(entity_id: str) -> Dict:
+    return detect_entity_patterns(_worker_detector, entity_id)
+
+
+class _AnalysisPool:
+    """Case analysis worker processes that can be stopped mid-task.
+
+    ProcessPoolExecutor cannot stop a task that has started; terminate()
+    here kills the workers and fails the futures still pending with
+    BrokenProcessPool.
+    """
+
+    def __init__(self, workers: int, db_path: str):
+        # spawn: forking a process that runs the writer and request
+        # threads could copy a held lock into the child
+        self._pool = multiprocessing.get_context('spawn').Pool(
+            workers, initializer=_init_analysis_worker, initargs=(db_path,))
+        self._pending: Set[Future] = set()
+        self._lock = threading.Lock()
+        self._terminated = False
+
+    def submit(self, fn, *args) -> Future:
+        future = Future()
+        with self._lock:
+            if self._terminated:
+                raise RuntimeError("analysis pool terminated")
+            self._pending.add(future)
+
+        def settle(setter, value):
+            with self._lock:
+                self._pending.discard(future)
+            try:
+                setter(value)
+            except InvalidStateError:
+                pass  # cancelled or failed by terminate() meanwhile
+
+        self._pool.apply_async(fn, args, callback=lambda result: settle(future.set_result, result),
+                               error_callback=lambda e: settle(future.set_exception, e))
+        return future
+
+    def terminate(self):
+        with self._lock:
+            self._terminated = True
+            pending, self._pending = self._pending, set()
+        self._pool.terminate()
+        self._pool.join()
+        for future in pending:
+            try:
+                future.set_exception(BrokenProcessPool("analysis pool terminated"))
+            except InvalidStateError:
+                pass
 
 
 # ======================== CASE MANAGER (Enhanced) ========================
 
 
 class CaseManager:
+    INSERT_TRANSACTION = """
+        INSERT INTO transactions 
+        (transaction_id, case_id, source_entity, destination_entity, 
+         amount, currency, transaction_date, transaction_ts, status, transaction_type, 
+         channels, description, flags, risk_score, detected_patterns, anomaly_score)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+
+    INSERT_ANOMALY = """
+        INSERT INTO anomaly_scores (anomaly_id, transaction_id, score, reasons)
+        VALUES (?, ?, ?, ?)
+    """
+
+    INSERT_MODEL_SCORE = """
+        INSERT OR REPLACE INTO model_scores
+        (transaction_id, model_version, score, flagged, heuristic_score)
+        VALUES (?, ?, ?, ?, ?)
+    """
+
+    # Cases with this many entities or fewer are analyzed in-process
+    ANALYSIS_INLINE_ENTITIES = 8
+
     def __init__(self, db: DatabaseManager, entity_mgr: EntityManager,
                  pattern_detector: PatternDetector, risk_scorer: RiskScorer,
-                 network_analyzer: NetworkAnalyzer):
+                 network_analyzer: NetworkAnalyzer, analysis_workers: Optional[int] = None,
+                 analysis_deadline: float = 30.0, velocity: Optional[VelocityMonitor] = None,
+                 anomaly_model: Optional[AnomalyModel] = None):
         self.db = db
         self.entity_mgr = entity_mgr
         self.pattern_detector = pattern_detector
         self.risk_scorer = risk_scorer
         self.network_analyzer = network_analyzer
+        # 0 runs every detector in-process; None sizes the pool to the CPUs
+        self.analysis_workers = (os.cpu_count() or 1) if analysis_workers is None else analysis_workers
+        self.analysis_deadline = analysis_deadline
+        self._analysis_pool: Optional[_AnalysisPool] = None
+        self._analysis_pool_lock = threading.Lock()
+        # Burst checks on add_transaction_to_case; None disables them
+        self.velocity = velocity
+        # Shadow-scored next to the heuristic detector into model_scores; None disables it
+        self.anomaly_model = anomaly_model
 
     def create_case(self, case_data: dict) -> Tuple[bool, str, str]:
         """Create new AML case"""
@@ -907,128 +1768,459 @@ class CaseManager:
         """Add transaction to case with anomaly detection"""
         try:
             transaction_id = str(uuid.uuid4())
+            transaction_date = transaction_data.get(
+                'transaction_date', datetime.now().isoformat())
+            transaction_ts = to_epoch(transaction_date)
 
-            # Get entity history for anomaly detection
+            # Score against the source entity's running statistics
             source_entity = transaction_data.get('source_entity')
-            history_query = """
-                SELECT amount, created_at FROM transactions 
-                WHERE source_entity = ? OR destination_entity = ?
-                ORDER BY created_at DESC LIMIT 20
-            """
-            history = self.db.execute_query(
-                history_query, (source_entity, source_entity))
-            history_dicts = [{'amount': h[0], 'created_at': h[1]}
-                             for h in history]
+            destination_entity = transaction_data.get('destination_entity')
+            with self.db.connection() as conn:
+                # Replayed from the transactions until the entity_stats backfill is done
+                party_stats = entity_stats.load(conn, [source_entity, destination_entity],
+                                                not self.db.migration_applied(6))
+            stats = party_stats.get(source_entity)
 
-            # Detect anomalies
             anomaly_detector = AnomalyDetector()
-            anomaly_score, anomaly_reasons = anomaly_detector.detect_transaction_anomaly(
-                transaction_data, history_dicts
+            amount = float(transaction_data.get('amount', 0))
+            anomaly_score, anomaly_reasons = anomaly_detector.score_with_stats(
+                dict(transaction_data, amount=amount, transaction_ts=transaction_ts), stats
             )
 
-            query = """
-                INSERT INTO transactions 
-                (transaction_id, case_id, source_entity, destination_entity, 
-                 amount, currency, transaction_date, status, transaction_type, 
-                 channels, description, flags, risk_score, detected_patterns, anomaly_score)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """
-
-            params = (
-                transaction_id,
-                case_id,
-                source_entity,
-                transaction_data.get('destination_entity'),
-                float(transaction_data.get('amount', 0)),
-                transaction_data.get('currency', 'PKR'),
-                transaction_data.get('transaction_date',
-                                     datetime.now().isoformat()),
-                'completed',
-                transaction_data.get('transaction_type', 'transfer'),
-                json.dumps(transaction_data.get('channels', [])),
-                transaction_data.get('description', ''),
-                json.dumps(transaction_data.get('flags', [])),
-                transaction_data.get('risk_score', 0.0),
-                json.dumps(transaction_data.get('detected_patterns', [])),
-                anomaly_score
-            )
-
-            if self.db.execute_update(query, params):
-                # Store anomaly score
+            # Velocity: would this transaction push either party over a window limit?
+            if self.velocity is not None and transaction_ts is not None:
+                parties = {'source': source_entity}
+                if destination_entity != source_entity:
+                    parties['destination'] = destination_entity
+                velocity_score, velocity_reasons = self.velocity.score({
+                    role: self.velocity.check(entity, amount, transaction_ts)
+                    for role, entity in parties.items() if entity})
+                if velocity_reasons:
+                    anomaly_score = max(anomaly_score, velocity_score)
+                    anomaly_reasons = anomaly_reasons + velocity_reasons
+
+            params = self._transaction_params(
+                transaction_id, case_id, transaction_data,
+                transaction_date, transaction_ts, anomaly_score)
+            model_params = self._shadow_score_params(
+                [transaction_id], [anomaly_score],
+                lambda: [anomaly_model.features_from_stats(
+                    amount, transaction_ts, destination_entity or source_entity,
+                    stats, party_stats.get(destination_entity))])
+
+            def write(conn):
+                # Rollups first: they look for the pair's earlier transactions that day
+                rollups = {}
+                daily_rollups.record(rollups, source_entity, destination_entity,
+                                     params[4], transaction_ts)
+                daily_rollups.save(conn, rollups)
+                conn.execute(self.INSERT_TRANSACTION, params)
                 if anomaly_score > 0:
-                    anomaly_query = """
-                        INSERT INTO anomaly_scores (anomaly_id, transaction_id, score, reasons)
-                        VALUES (?, ?, ?, ?)
-                    """
-                    self.db.execute_update(anomaly_query, (
+                    conn.execute(self.INSERT_ANOMALY, (
                         str(uuid.uuid4()),
                         transaction_id,
                         anomaly_score,
                         json.dumps(anomaly_reasons)
                     ))
-
-                logger.info(f"Transaction added to case {case_id}")
-                return True, f"Transaction {transaction_id} added"
-
-            return False, "Failed to add transaction"
+                if model_params:
+                    conn.executemany(self.INSERT_MODEL_SCORE, model_params)
+                # Re-read on the writer so concurrent inserts are not lost
+                current = entity_stats.load(conn, [source_entity, destination_entity])
+                entity_stats.record(current, source_entity, destination_entity,
+                                    params[4], transaction_ts)
+                entity_stats.save(conn, current.values())
+                if source_entity and destination_entity:
+                    edges = {}
+                    network_edges.record(edges, source_entity, destination_entity,
+                                         params[4], transaction_ts)
+                    network_edges.save(conn, edges)
+                    entity_clusters.save(conn, edges)
+
+            try:
+                self.db.writer.submit(write).result()
+            except Exception as e:
+                logger.error(f"Database error: {e}")
+                return False, "Failed to add transaction"
+            if self.velocity is not None:
+                self.velocity.record(source_entity, destination_entity, amount, transaction_ts)
+
+            logger.info(f"Transaction added to case {case_id}")
+            return True, f"Transaction {transaction_id} added"
         except Exception as e:
             logger.error(f"Add transaction error: {e}")
             return False, str(e)
 
-    def analyze_case(self, case_id: str) -> Dict:
-        """Comprehensive case analysis including pattern detection"""
+    def _shadow_score_params(self, transaction_ids: List[str], heuristic_scores: List[float],
+                             features) -> list:
+        """INSERT_MODEL_SCORE rows for the anomaly model's scores of `features()`
+        (one row per transaction); none without a model, or if scoring fails.
+        """
+        model = self.anomaly_model
+        if model is None or not transaction_ids:
+            return []
+        try:
+            rows = features()
+            if len(rows) == 1:
+                scores = [model.score(rows[0])]
+            else:
+                scores = model.score_batch(np.vstack(rows)).tolist()
+        except Exception as e:
+            logger.warning(f"Shadow anomaly model scoring failed: {e}")
+            return []
+        return [(transaction_id, model.version, score, int(score >= model.alert_threshold),
+                 heuristic)
+                for transaction_id, score, heuristic in zip(transaction_ids, scores, heuristic_scores)]
+
+    def reload_anomaly_model(self, model_dir: str = anomaly_model.DEFAULT_MODEL_DIR) -> Tuple[bool, str]:
+        """Swap in the CURRENT model of model_dir for shadow scoring"""
+        model = anomaly_model.load_current(model_dir)
+        if model is None:
+            return False, f"No anomaly model could be loaded from {model_dir}"
+        self.anomaly_model = model
+        logger.info(f"Shadow scoring with anomaly model {model.version}")
+        return True, f"Loaded anomaly model {model.version}"
+
+    def shadow_model_stats(self) -> Dict:
+        """The shadow model's scores so far against the heuristic detector's"""
+        model = self.anomaly_model
+        result = {'enabled': model is not None,
+                  'model': model.describe() if model is not None else None}
+        if model is None:
+            return result
+        with self.db.connection() as conn:
+            row = conn.execute("""
+                SELECT COUNT(*), AVG(score), SUM(flagged), SUM(heuristic_score > 0),
+                       SUM(flagged AND heuristic_score > 0)
+                FROM model_scores WHERE model_version = ?
+            """, (model.version,)).fetchone()
+        scored, mean_score, flagged, heuristic, both = row
+        result['shadow'] = {
+            'scored': scored,
+            'mean_score': round(mean_score, 4) if mean_score is not None else None,
+            'model_flagged': flagged or 0,
+            'heuristic_flagged': heuristic or 0,
+            'both_flagged': both or 0
+        }
+        return result
+
+    @staticmethod
+    def _transaction_params(transaction_id: str, case_id: str, transaction_data: Dict,
+                            transaction_date: str, transaction_ts: Optional[int],
+                            anomaly_score: float) -> tuple:
+        """Parameters for INSERT_TRANSACTION"""
+        return (
+            transaction_id,
+            case_id,
+            transaction_data.get('source_entity'),
+            transaction_data.get('destination_entity'),
+            float(transaction_data.get('amount', 0)),
+            transaction_data.get('currency', 'PKR'),
+            transaction_date,
+            transaction_ts,
+            'completed',
+            transaction_data.get('transaction_type', 'transfer'),
+            json.dumps(transaction_data.get('channels', [])),
+            transaction_data.get('description', ''),
+            json.dumps(transaction_data.get('flags', [])),
+            transaction_data.get('risk_score', 0.0),
+            json.dumps(transaction_data.get('detected_patterns', [])),
+            anomaly_score
+        )
+
+    def _validate_bulk_rows(self, conn: sqlite3.Connection, batch: List[Tuple[int, Any]]) -> Dict[int, str]:
+        """Return {row_index: error} for the rows of a batch that cannot be inserted"""
+        errors = {}
+        referenced = set()
+        for index, row in batch:
+            if not isinstance(row, dict):
+                errors[index] = "Row must be an object"
+                continue
+            missing = [key for key in ('source_entity', 'destination_entity') if not row.get(key)]
+            if missing:
+                errors[index] = f"{missing[0]} is required"
+                continue
+            try:
+                float(row.get('amount', 0))
+            except (TypeError, ValueError):
+                errors[index] = f"Invalid amount: {row.get('amount')!r}"
+                continue
+            if 'transaction_date' in row and to_epoch(row['transaction_date']) is None:
+                errors[index] = f"Invalid transaction_date: {row['transaction_date']!r}"
+                continue
+            referenced.update(e for e in (row.get('source_entity'), row.get('destination_entity')) if e)
+
+        # One lookup per batch for the entity foreign keys
+        known = set()
+        referenced = list(referenced)
+        for start in range(0, len(referenced), 500):
+            chunk = referenced[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            known.update(r[0] for r in conn.execute(
+                f"SELECT entity_id FROM entities WHERE entity_id IN ({placeholders})", chunk))
+
+        for index, row in batch:
+            if index in errors:
+                continue
+            for key in ('source_entity', 'destination_entity'):
+                if row.get(key) and row[key] not in known:
+                    errors[index] = f"Unknown {key}: {row[key]}"
+                    break
+        return errors
+
+    def insert_transaction_batch(self, conn: sqlite3.Connection, case_id: str,
+                                 batch: List[Tuple[int, Any]],
+                                 score_anomalies: bool = True) -> List[Dict]:
+        """Validate, score and insert one batch of (row_index, row) on `conn`.
+
+        `conn` must hold the write lock (db.write_transaction()); does not
+        commit. The entity_stats rows of the batch are read once, folded in
+        row by row and written back with it; network_edges get one upsert
+        per pair in the batch, entity_daily_stats one per entity and day.
+        With score_anomalies=False rows are stored with a NULL anomaly_score
+        for score_unscored_transactions() to fill in later.
+        """
+        errors = self._validate_bulk_rows(conn, batch)
+        results = []
+        stats = entity_stats.load(conn, (row[key] for index, row in batch if index not in errors
+                                         for key in ('source_entity', 'destination_entity')),
+                                  not self.db.migration_applied(6))
+        if score_anomalies:
+            anomaly_detector = AnomalyDetector()
+        shadow = score_anomalies and self.anomaly_model is not None
+
+        txn_params, anomaly_params = [], []
+        shadow_ids, shadow_heuristic, shadow_features = [], [], []
+        edges, rollups = {}, {}
+        for index, row in batch:
+            if index in errors:
+                results.append({'row': index, 'success': False, 'error': errors[index]})
+                continue
+
+            transaction_id = str(uuid.uuid4())
+            transaction_date = row.get('transaction_date', datetime.now().isoformat())
+            transaction_ts = to_epoch(transaction_date)
+            anomaly_score = None
+
+            if score_anomalies:
+                anomaly_score, anomaly_reasons = anomaly_detector.score_with_stats(
+                    dict(row, amount=float(row.get('amount', 0)), transaction_ts=transaction_ts),
+                    stats[row['source_entity']])
+                if anomaly_score > 0:
+                    anomaly_params.append((str(uuid.uuid4()), transaction_id,
+                                           anomaly_score, json.dumps(anomaly_reasons)))
+                if shadow:
+                    shadow_ids.append(transaction_id)
+                    shadow_heuristic.append(anomaly_score)
+                    shadow_features.append(anomaly_model.features_from_stats(
+                        float(row.get('amount', 0)), transaction_ts, row['destination_entity'],
+                        stats[row['source_entity']], stats[row['destination_entity']]))
+
+            params = self._transaction_params(
+                transaction_id, case_id, row,
+                transaction_date, transaction_ts, anomaly_score)
+            # Later rows of the batch are scored with this one folded in
+            entity_stats.record(stats, row['source_entity'], row['destination_entity'],
+                                params[4], transaction_ts)
+            network_edges.record(edges, row['source_entity'], row['destination_entity'],
+                                 params[4], transaction_ts)
+            daily_rollups.record(rollups, row['source_entity'], row['destination_entity'],
+                                 params[4], transaction_ts)
+            txn_params.append(params)
+            result = {'row': index, 'success': True, 'transaction_id': transaction_id}
+            if anomaly_score is not None:
+                result['anomaly_score'] = round(float(anomaly_score), 2)
+            results.append(result)
+
+        if txn_params:
+            # Rollups first: they look for the pairs' earlier transactions that day
+            daily_rollups.save(conn, rollups)
+            conn.executemany(self.INSERT_TRANSACTION, txn_params)
+        if anomaly_params:
+            conn.executemany(self.INSERT_ANOMALY, anomaly_params)
+        if shadow_ids:
+            # The whole batch in one vectorized pass
+            conn.executemany(self.INSERT_MODEL_SCORE, self._shadow_score_params(
+                shadow_ids, shadow_heuristic, lambda: shadow_features))
+        if txn_params:
+            entity_stats.save(conn, (s for s in stats.values() if s.txn_count))
+            network_edges.save(conn, edges)
+            entity_clusters.save(conn, edges)
+        return results
+
+    def add_transactions_bulk(self, case_id: str, rows: List[Dict],
+                              batch_size: int = 1000) -> Dict:
+        """Add many transactions to a case in a single database transaction.
+
+        Rows are validated and scored a batch at a time against entity_stats,
+        folding in the rows already accepted, so scores match adding the rows
+        one by one. Invalid rows are reported and skipped; a database error
+        rolls back the whole load.
+        """
+        started = time.perf_counter()
+        results: List[Dict] = []
+
+        if not self.get_case(case_id):
+            return {'success': False, 'message': 'Case not found'}
         try:
+            with self.db.write_transaction() as conn:
+                for start in range(0, len(rows), batch_size):
+                    batch = list(enumerate(rows[start:start + batch_size], start))
+                    results.extend(self.insert_transaction_batch(conn, case_id, batch))
+        except Exception as e:
+            logger.error(f"Bulk add transaction error: {e}")
+            return {'success': False, 'message': str(e), 'inserted': 0}
+
+        if self.velocity is not None:
+            for result in results:
+                if result['success']:
+                    row = rows[result['row']]
+                    self.velocity.record(row['source_entity'], row['destination_entity'],
+                                         float(row.get('amount', 0)),
+                                         to_epoch(row.get('transaction_date')) or int(time.time()))
+
+        inserted = sum(1 for r in results if r['success'])
+        elapsed = time.perf_counter() - started
+        logger.info(f"Bulk added {inserted}/{len(rows)} transactions to case {case_id} "
+                    f"in {elapsed:.2f}s")
+        return {
+            'success': True,
+            'inserted': inserted,
+            'failed': len(rows) - inserted,
+            'results': results,
+            'elapsed_seconds': round(elapsed, 3),
+            'rows_per_second': round(len(rows) / elapsed, 1) if elapsed > 0 else None
+        }
+
+    def score_unscored_transactions(self, case_id: Optional[str] = None,
+                                    batch_size: int = 50000) -> int:
+        """Fill in anomaly scores for rows loaded with score_anomalies=False.
+
+        Each row is scored against the history that existed when it was
+        inserted. Chunks commit one at a time, so an interrupted pass simply
+        resumes with the rows still NULL.
+        """
+        scored = self.rescore_transactions(case_id, only_unscored=True, chunk_size=batch_size)
+        logger.info(f"Scored {scored} deferred transactions")
+        return scored
+
+    def rescore_transactions(self, case_id: Optional[str] = None, only_unscored: bool = False,
+                             chunk_size: int = 50000,
+                             detector: Optional[AnomalyDetector] = None) -> int:
+        """Recompute anomaly scores with AnomalyDetector.score_batch, e.g. after a
+        threshold change, and bulk-update transactions.anomaly_score and
+        anomaly_scores. Every transaction is loaded to build each entity's
+        history; only rows of `case_id` (and NULL-scored ones with
+        only_unscored) are written. Returns the number of rows written.
+        """
+        detector = detector or AnomalyDetector()
+        target_sql = "case_id = ?" if case_id else "1"
+        if only_unscored:
+            target_sql += " AND anomaly_score IS NULL"
+
+        columns = load_transaction_columns(self.db, target_sql, (case_id,) if case_id else (),
+                                           chunk_size)
+        if columns is None:
+            return 0
+        rowid, target = columns['rowid'], columns['target']
+        started = time.perf_counter()
+        scores, flags, zscores = detector.score_batch(
+            columns['amount'], columns['ts'], columns['src'], columns['dst'], columns['now'])
+        logger.info(f"Scored {len(scores)} transactions in {time.perf_counter() - started:.2f}s")
+        if not target.any():
+            return 0
+
+        written = 0
+        for chunk in np.array_split(np.flatnonzero(target),
+                                    max(1, -(-int(target.sum()) // chunk_size))):
+            updates = list(zip(scores[chunk].tolist(), rowid[chunk].tolist()))
+            anomalies = [(str(uuid.uuid4()), score,
+                          json.dumps(detector.batch_reasons(int(flags[i]), float(zscores[i]))), rid)
+                         for i, score, rid in zip(chunk.tolist(), scores[chunk].tolist(),
+                                                  rowid[chunk].tolist()) if score > 0]
+
+            def write(conn, updates=updates, anomalies=anomalies):
+                conn.executemany("UPDATE transactions SET anomaly_score = ? WHERE rowid = ?", updates)
+                if not only_unscored:
+                    # Unscored rows have no anomaly_scores rows to replace
+                    conn.executemany("""
+                        DELETE FROM anomaly_scores WHERE transaction_id =
+                            (SELECT transaction_id FROM transactions WHERE rowid = ?)
+                    """, [(rid,) for _, rid in updates])
+                conn.executemany("""
+                    INSERT INTO anomaly_scores (anomaly_id, transaction_id, score, reasons)
+                    SELECT ?, transaction_id, ?, ? FROM transactions WHERE rowid = ?
+                """, anomalies)
+
+            # One atomic write per chunk through the single writer
+            self.db.writer.submit(write).result()
+            written += len(updates)
+        return written
+
+    def analyze_case(self, case_id: str, deadline: Optional[float] = None) -> Dict:
+        """Comprehensive case analysis including pattern detection.
+
+        Every detector runs for every entity in the case, fanned out to the
+        analysis process pool. Entities not reached within `deadline` seconds
+        (default analysis_deadline) are skipped and the result is flagged
+        partial.
+        """
+        try:
+            started = time.monotonic()
+            deadline = self.analysis_deadline if deadline is None else deadline
             case = self.get_case(case_id)
             if not case:
                 return {'error': 'Case not found'}
 
             # Get all transactions in case
-            query = "SELECT * FROM transactions WHERE case_id = ?"
+            query = "SELECT source_entity, destination_entity FROM transactions WHERE case_id = ?"
             transactions = self.db.execute_query(query, (case_id,))
 
             analysis = {
                 'case_id': case_id,
                 'patterns': {},
+                'entity_patterns': {},
                 'network_analysis': {},
                 'risk_assessment': {},
-                'anomalies': []
+                'anomalies': [],
+                'partial': False
             }
 
             if transactions:
                 # Extract entities
                 entities = set()
                 for txn in transactions:
-                    entities.add(txn[2])  # source_entity
-                    entities.add(txn[3])  # destination_entity
-
-                # Pattern detection
-                if len(entities) > 0:
-                    sample_entity = list(entities)[0]
-
-                    structuring, struct_details = self.pattern_detector.detect_structuring(
-                        sample_entity)
-                    if structuring:
-                        analysis['patterns']['structuring'] = struct_details
-
-                    round_trip, rt_details = self.pattern_detector.detect_round_tripping(
-                        sample_entity)
-                    if round_trip:
-                        analysis['patterns']['round_tripping'] = rt_details
-
-                    fan_patterns = self.pattern_detector.detect_fan_in_fan_out(
-                        sample_entity)
-                    analysis['patterns'].update(fan_patterns)
+                    entities.add(txn[0])  # source_entity
+                    entities.add(txn[1])  # destination_entity
+
+                # Pattern detection over every entity
+                entity_patterns, partial = self._detect_case_patterns(
+                    sorted(entities), started + deadline)
+                analysis['entity_patterns'] = {e: p for e, p in entity_patterns.items() if p}
+                analysis['patterns'] = self._summarize_patterns(analysis['entity_patterns'])
+                analysis['partial'] = partial
+                analysis['coverage'] = {
+                    'entities_total': len(entities),
+                    'entities_analyzed': len(entity_patterns),
+                    'deadline_seconds': deadline,
+                    'elapsed_seconds': round(time.monotonic() - started, 3)
+                }
+                if partial:
+                    logger.warning(f"Case {case_id} analysis hit the {deadline}s deadline: "
+                                   f"{len(entity_patterns)}/{len(entities)} entities analyzed")
 
                 # Network analysis
                 if len(entities) > 1:
-                    self.network_analyzer.build_network(list(entities))
-                    centrality = self.network_analyzer.calculate_centrality()
-                    suspicious_chains = self.network_analyzer.find_suspicious_chains()
+                    graph = self.network_analyzer.build_network(list(entities))
+                    centrality = self.network_analyzer.calculate_centrality(graph)
+                    suspicious_chains = self.network_analyzer.find_suspicious_chains(graph)
 
+                    stored = self.network_analyzer.stored_centrality(list(entities))
                     analysis['network_analysis'] = {
                         'total_entities': len(entities),
                         'high_centrality_nodes': {k: v for k, v in centrality.items() if v > 50},
-                        'suspicious_chains': suspicious_chains[:5]
+                        'suspicious_chains': suspicious_chains[:5],
+                        'network_centrality': dict(sorted(
+                            stored.items(), key=lambda item: -item[1]['network_percentile'])[:10])
                     }
 
                 # Risk assessment
@@ -1053,6 +2245,105 @@ class CaseManager:
             logger.error(f"Analyze case error: {e}")
             return {'error': str(e)}
 
+    def _detect_case_patterns(self, entity_ids: List[str], deadline: float) -> Tuple[Dict[str, Dict], bool]:
+        """{entity_id: patterns} for the entities finished before `deadline`
+        (a time.monotonic() value), and whether any were left out"""
+        results = {}
+        if not self.analysis_workers or len(entity_ids) <= self.ANALYSIS_INLINE_ENTITIES:
+            for entity_id in entity_ids:
+                if time.monotonic() >= deadline:
+                    return results, True
+                results[entity_id] = detect_entity_patterns(self.pattern_detector, entity_id)
+            return results, False
+
+        # At most two tasks per worker in flight (one running, one queued
+        # behind it): the rest of the case never reaches the pool, so other
+        # requests are not stuck behind this one's backlog
+        queue = deque(entity_ids)
+        running = {}  # future -> (entity_id, pool)
+        attempts = defaultdict(int)
+        while queue or running:
+            while queue and len(running) < 2 * self.analysis_workers:
+                entity_id = queue.popleft()
+                pool = self._get_analysis_pool()
+                try:
+                    running[pool.submit(_analyze_entity_task, entity_id)] = (entity_id, pool)
+                except (BrokenProcessPool, RuntimeError) as e:
+                    # Retired by another request since we looked it up
+                    self._retire_analysis_pool(pool)
+                    attempts[entity_id] += 1
+                    if attempts[entity_id] < 3:
+                        queue.appendleft(entity_id)
+                    else:
+                        logger.error(f"Analysis pool failed: {e}")
+            remaining = deadline - time.monotonic()
+            if not running or remaining <= 0:
+                break
+            done, _ = wait(running, timeout=remaining, return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                entity_id, pool = running.pop(future)
+                try:
+                    results[entity_id] = future.result()
+                except (BrokenProcessPool, CancelledError) as e:
+                    # Its pool was retired (or died): retry once on a fresh one
+                    self._retire_analysis_pool(pool)
+                    attempts[entity_id] += 1
+                    if attempts[entity_id] < 2:
+                        queue.appendleft(entity_id)
+                    else:
+                        logger.error(f"Analysis pool failed for {entity_id}: {e!r}")
+                except Exception as e:
+                    logger.error(f"Entity analysis error for {entity_id}: {e}")
+
+        # Entities still running (or queued) at the deadline would hold the
+        # workers for the next request, so their pool is terminated; other
+        # requests' tasks on it fail and are retried on a fresh pool
+        for pool in {pool for _, pool in running.values()}:
+            self._retire_analysis_pool(pool)
+        return results, len(results) < len(entity_ids)
+
+    @staticmethod
+    def _summarize_patterns(entity_patterns: Dict[str, Dict]) -> Dict:
+        """Per pattern: how many entities show it, the strongest ones first"""
+        by_pattern = defaultdict(list)
+        for entity_id, patterns in entity_patterns.items():
+            for name, details in patterns.items():
+                strength = details.get('confidence', details.get('risk_score', 0))
+                by_pattern[name].append((strength, entity_id, details))
+        summary = {}
+        for name, hits in by_pattern.items():
+            hits.sort(key=lambda h: (-h[0], h[1]))
+            summary[name] = {
+                'entity_count': len(hits),
+                'entities': [entity_id for _, entity_id, _ in hits[:20]],
+                'strongest': dict(hits[0][2], entity_id=hits[0][1])
+            }
+        return summary
+
+    def _get_analysis_pool(self) -> _AnalysisPool:
+        with self._analysis_pool_lock:
+            if self._analysis_pool is None:
+                self._analysis_pool = _AnalysisPool(self.analysis_workers,
+                                                    os.path.abspath(self.db.db_path))
+            return self._analysis_pool
+
+    def _retire_analysis_pool(self, pool: _AnalysisPool):
+        """Stop `pool`'s workers, tasks in progress included; the next
+        _get_analysis_pool() starts a fresh pool
+        """
+        with self._analysis_pool_lock:
+            if self._analysis_pool is pool:
+                self._analysis_pool = None
+        pool.terminate()
+
+    def close_analysis_pool(self):
+        with self._analysis_pool_lock:
+            pool, self._analysis_pool = self._analysis_pool, None
+        if pool is not None:
+            pool.terminate()
+
     def get_case(self, case_id: str) -> Optional[dict]:
         """Get case details"""
         try:
@@ -1188,14 +2479,46 @@ def create_app():
         'SECRET_KEY', 'aml-secret-v6-prod-enhanced')
 
     # Initialize all managers
-    db = DatabaseManager()
+    db = DatabaseManager(
+        pool_size=int(os.environ.get('AML_DB_POOL_SIZE', 8)),
+        pool_timeout=float(os.environ.get('AML_DB_POOL_TIMEOUT', 30)),
+        busy_timeout=float(os.environ.get('AML_DB_BUSY_TIMEOUT', 30)),
+        background_migrations=True)
     entity_mgr = EntityManager(db)
     pattern_detector = PatternDetector(db)
-    network_analyzer = NetworkAnalyzer(db)
+    # Graph snapshot written by `graph_snapshot.py build`; unset or missing reads network_edges
+    network_analyzer = NetworkAnalyzer(
+        db, os.environ.get('AML_GRAPH_SNAPSHOT', graph_snapshot.DEFAULT_SNAPSHOT_PATH) or None)
     risk_scorer = RiskScorer(db, pattern_detector, network_analyzer)
+    velocity = VelocityMonitor(
+        parse_windows(os.environ.get('AML_VELOCITY_WINDOWS', DEFAULT_WINDOWS)),
+        capacity=int(os.environ.get('AML_VELOCITY_CAPACITY', 64)),
+        max_entities=int(os.environ.get('AML_VELOCITY_MAX_ENTITIES', 100000)))
+    if db.migration_applied(3):
+        velocity.rebuild(db)
+    else:
+        # transaction_ts is still being backfilled: load the buffers once the
+        # background migrations finish instead of starting from empty ones
+        threading.Thread(target=lambda: (db.migrations.wait(), velocity.rebuild(db)),
+                         name='velocity-rebuild', daemon=True).start()
     case_mgr = CaseManager(db, entity_mgr, pattern_detector,
-                           risk_scorer, network_analyzer)
+                           risk_scorer, network_analyzer,
+                           analysis_workers=(int(os.environ['AML_ANALYSIS_WORKERS'])
+                                             if os.environ.get('AML_ANALYSIS_WORKERS') else None),
+                           analysis_deadline=float(os.environ.get('AML_ANALYSIS_DEADLINE', 30)),
+                           velocity=velocity)
+    # off | shadow: score every insert with the CURRENT model next to the heuristic detector
+    model_dir = os.environ.get('AML_MODEL_DIR', anomaly_model.DEFAULT_MODEL_DIR)
+    if os.environ.get('AML_ANOMALY_MODEL_MODE', 'off') == 'shadow':
+        case_mgr.reload_anomaly_model(model_dir)
     threat_mgr = ThreatManager(db)
+    rule_engine = RuleEngine(db, os.environ.get('AML_RULES_PATH', DEFAULT_RULES_PATH))
+    bulk_max_rows = int(os.environ.get('AML_BULK_MAX_ROWS', 100000))
+    # Ceilings on what one /subgraph request may ask for
+    subgraph_caps = {
+        'max_nodes': int(os.environ.get('AML_SUBGRAPH_MAX_NODES', 100000)),
+        'max_edges': int(os.environ.get('AML_SUBGRAPH_MAX_EDGES', 200000)),
+        'deadline': float(os.environ.get('AML_SUBGRAPH_DEADLINE', 30))}
 
     # ========== ROOT ENDPOINTS ==========
 
@@ -1229,6 +2552,9 @@ def create_app():
             'version': '6.0-enhanced',
             'timestamp': datetime.now().isoformat(),
             'database': 'connected',
+            'database_pool': db.pool_stats(),
+            'database_writer': db.writer.stats(),
+            'schema_version': db.migrations.current_version(),
             'features': {
                 'anomaly_detection': True,
                 'pattern_detection': True,
@@ -1256,6 +2582,41 @@ def create_app():
             return jsonify(entity), 200
         return jsonify({'error': 'Entity not found'}), 404
 
+    @app.route('/api/entities/<entity_id>/activity', methods=['GET'])
+    def get_entity_activity(entity_id):
+        """Transaction totals over ?days= (default 30) from the daily rollups"""
+        days = request.args.get('days', 30, type=float)
+        if days <= 0:
+            return jsonify({'error': 'days must be positive'}), 400
+        return jsonify(entity_mgr.get_activity(entity_id, days)), 200
+
+    @app.route('/api/entities/<entity_id>/velocity', methods=['GET'])
+    def get_entity_velocity(entity_id):
+        """Transaction count and amount of the entity in each velocity window"""
+        return jsonify(velocity.current(entity_id)), 200
+
+    @app.route('/api/entities/<entity_id>/subgraph', methods=['GET'])
+    def get_entity_subgraph(entity_id):
+        """Stream the entity's k-hop neighbourhood as NDJSON.
+
+        ?hops=2&direction=both&fan_out=100&min_amount=0&since=&until=
+        &max_nodes=5000&max_edges=50000; the last line is a summary saying
+        whether (and why) the expansion was cut off.
+        """
+        try:
+            limits = SubgraphLimits.from_args(request.args, **subgraph_caps)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if not db.execute_query("SELECT 1 FROM entities WHERE entity_id = ?", (entity_id,)):
+            return jsonify({'error': 'Entity not found'}), 404
+        lines = (json.dumps(item) + '\n' for item in network_analyzer.expand_subgraph(entity_id, limits))
+        return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+
+    @app.route('/api/velocity', methods=['GET'])
+    def get_velocity_stats():
+        """Velocity monitor windows, tracked entities and evictions"""
+        return jsonify(velocity.stats()), 200
+
     # ========== CASE ENDPOINTS ==========
 
     @app.route('/api/cases', methods=['GET'])
@@ -1301,12 +2662,96 @@ def create_app():
             return jsonify({'success': True, 'message': message}), 201
         return jsonify({'success': False, 'message': message}), 400
 
+    @app.route('/api/cases/<case_id>/transactions/bulk', methods=['POST'])
+    def add_transactions_bulk(case_id):
+        """Add a batch of transactions in one database transaction"""
+        data = request.get_json(silent=True)
+        rows = data.get('transactions') if isinstance(data, dict) else data
+        if not isinstance(rows, list):
+            return jsonify({'success': False,
+                            'message': 'Expected a list of transactions'}), 400
+        if len(rows) > bulk_max_rows:
+            return jsonify({'success': False,
+                            'message': f'At most {bulk_max_rows} transactions per request'}), 413
+        result = case_mgr.add_transactions_bulk(case_id, rows)
+        if not result['success']:
+            status = 404 if result['message'] == 'Case not found' else 400
+            return jsonify(result), status
+        return jsonify(result), 201 if result['inserted'] else 400
+
     @app.route('/api/cases/<case_id>/analysis', methods=['GET'])
     def analyze_case(case_id):
-        """Get comprehensive case analysis"""
-        analysis = case_mgr.analyze_case(case_id)
+        """Get comprehensive case analysis (?deadline=seconds)"""
+        analysis = case_mgr.analyze_case(case_id, request.args.get('deadline', type=float))
         return jsonify(analysis), 200
 
+    # ========== DETECTION RULES ==========
+
+    @app.route('/api/rules', methods=['GET'])
+    def get_rules():
+        """Loaded rule definitions and per-rule evaluation times"""
+        rule_engine.reload_if_changed()
+        return jsonify(rule_engine.describe()), 200
+
+    @app.route('/api/rules/reload', methods=['POST'])
+    def reload_rules():
+        """Re-read the rules file now"""
+        success, message = rule_engine.reload()
+        return jsonify({'success': success, 'message': message}), 200 if success else 400
+
+    @app.route('/api/rules/evaluate', methods=['POST'])
+    def evaluate_rules():
+        """Run the active rules (or {"rules": [...]}) over the transactions; ?limit=hits per rule"""
+        data = request.get_json(silent=True) or {}
+        limit = request.args.get('limit', 100, type=int)
+        names = data.get('rules') if isinstance(data, dict) else data
+        if not isinstance(data, dict) or names is not None and (
+                not isinstance(names, list) or not all(isinstance(name, str) for name in names)):
+            return jsonify({'error': 'rules must be a list of rule names'}), 400
+        report = rule_engine.evaluate(names)
+        results = {}
+        for name, hits in report['results'].items():
+            results[name] = {'count': len(hits),
+                             'hits': dict(list(hits.items())[:limit])}
+        return jsonify({'results': results, 'timings': report['timings']}), 200
+
+    # ========== ANOMALY MODEL ==========
+
+    @app.route('/api/model', methods=['GET'])
+    def get_anomaly_model():
+        """Shadow anomaly model metadata and how its flags compare with the heuristic's"""
+        return jsonify(case_mgr.shadow_model_stats()), 200
+
+    @app.route('/api/model/reload', methods=['POST'])
+    def reload_anomaly_model():
+        """Load the CURRENT model version and start shadow scoring with it"""
+        success, message = case_mgr.reload_anomaly_model(model_dir)
+        return jsonify({'success': success, 'message': message}), 200 if success else 400
+
+    # ========== NETWORK ==========
+
+    @app.route('/api/network/snapshot', methods=['GET'])
+    def get_graph_snapshot():
+        """Graph snapshot header, watermark and transactions overlaid since"""
+        return jsonify(network_analyzer.snapshot_info()), 200
+
+    @app.route('/api/entities/<entity_id>/cluster', methods=['GET'])
+    def get_entity_cluster(entity_id):
+        """Size, transaction count, total flow and max member risk of the entity's cluster"""
+        cluster = entity_mgr.get_cluster(entity_id)
+        if cluster:
+            return jsonify(cluster), 200
+        return jsonify({'error': 'Entity not found'}), 404
+
+    @app.route('/api/clusters/<cluster_id>', methods=['GET'])
+    def get_cluster(cluster_id):
+        """Cluster aggregates and up to ?members= (default 100) member entity ids"""
+        cluster = entity_clusters.get_cluster(db, cluster_id)
+        if not cluster:
+            return jsonify({'error': 'Cluster not found'}), 404
+        limit = min(max(request.args.get('members', 100, type=int), 0), 10000)
+        return jsonify(dict(cluster, members=entity_clusters.members(db, cluster_id, limit))), 200
+
     # ========== STATISTICS ==========
 
     @app.route('/api/statistics', methods=['GET'])
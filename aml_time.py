@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Timestamp normalization for transaction time windows
+Transactions carry an integer UTC epoch (`transaction_ts`) next to the
+original ISO `transaction_date`, so window predicates are index range scans.
+
+Naive timestamps (no UTC offset) are interpreted in the zone named by the
+AML_TIMEZONE environment variable, e.g. "Asia/Karachi" or "UTC". When it is
+unset they are taken as server local time, which is what datetime.now()
+produced when they were recorded.
+"""
+
+import os
+import math
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # Python < 3.9
+    ZoneInfo = None
+
+SECONDS_PER_DAY = 86400
+
+
+def _configured_zone():
+    name = os.environ.get('AML_TIMEZONE', '').strip()
+    if not name:
+        return None
+    if name.upper() == 'UTC':
+        return timezone.utc
+    if ZoneInfo is None:
+        raise RuntimeError("AML_TIMEZONE requires Python 3.9+ (zoneinfo)")
+    return ZoneInfo(name)
+
+
+AML_TIMEZONE = _configured_zone()
+
+
+def to_epoch(value) -> Optional[int]:
+    """Normalize an ISO string, datetime or epoch number to integer UTC epoch seconds"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return int(math.floor(value))
+    if isinstance(value, str):
+        try:
+            dt = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    elif isinstance(value, datetime):
+        dt = value
+    else:
+        return None
+
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=AML_TIMEZONE) if AML_TIMEZONE else dt.astimezone()
+    return int(math.floor(dt.timestamp()))
+
+
+def window_start(days: float, now: Optional[float] = None) -> int:
+    """Epoch lower bound of a trailing window of `days` days"""
+    if now is None:
+        now = time.time()
+    return int(now) - int(float(days) * SECONDS_PER_DAY)
+
+
+def local_hour(epoch: int) -> int:
+    """Hour of day of an epoch timestamp in AML_TIMEZONE"""
+    if AML_TIMEZONE is None:
+        return datetime.fromtimestamp(epoch).hour
+    return datetime.fromtimestamp(epoch, AML_TIMEZONE).hour
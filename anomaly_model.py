@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+Isolation Forest Anomaly Model
+A pure-NumPy isolation forest trained offline over transaction feature
+matrices. Every tree is stored as a complete binary tree in flat arrays
+(node i has children 2i+1 and 2i+2) with each leaf pushed down to the
+bottom level, so scoring is the same branch-free vectorized step once per
+level, for one transaction or a million.
+
+Trained models are versioned directories of .npy arrays plus meta.json:
+
+    models/anomaly/v0001/{feature,threshold,value}.npy, meta.json
+    models/anomaly/CURRENT          # name of the version to serve
+
+and are memory-mapped when loaded. The model runs in shadow next to the
+heuristic AnomalyDetector (AML_ANOMALY_MODEL_MODE=shadow): its scores are
+stored in model_scores for comparison and never change anomaly_score.
+
+Usage:
+    python anomaly_model.py train aml_system.db [--trees 100] [--sample-size 256] [--limit N]
+    python anomaly_model.py info [--version v0001]
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import logging
+import argparse
+from typing import Dict, Optional
+
+import numpy as np
+
+from aml_time import local_hour, SECONDS_PER_DAY
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'anomaly')
+
+FEATURES = (
+    'log_amount',               # log1p(amount)
+    'amount_zscore',            # signed, against the source's prior amounts, clipped to +-50
+    'log_history',              # log1p(source's prior transactions)
+    'log_days_active',          # log1p(days since the source's first transaction)
+    'daily_rate',               # source's prior transactions per active day
+    'hour_sin', 'hour_cos',     # local hour of the transaction on the unit circle
+    'new_counterparty',         # 1 when the source has history but not with this counterparty
+    'log_destination_history',  # log1p(destination's prior transactions)
+)
+
+ZSCORE_CLIP = 50.0
+_EULER_GAMMA = 0.5772156649015329
+
+
+def _hour_features(hours):
+    angle = np.asarray(hours, dtype=np.float64) * (2 * math.pi / 24)
+    return np.sin(angle), np.cos(angle)
+
+
+def features_from_context(ctx: Dict[str, np.ndarray]) -> np.ndarray:
+    """Feature matrix (rows x FEATURES) from AnomalyDetector.batch_context()"""
+    history = ctx['history']
+    hour_sin, hour_cos = _hour_features(ctx['hours'])
+    return np.column_stack([
+        np.log1p(np.maximum(ctx['amounts'], 0)),
+        np.clip(ctx['signed_zscores'], -ZSCORE_CLIP, ZSCORE_CLIP),
+        np.log1p(history),
+        np.log1p(ctx['days']),
+        history / ctx['days'],
+        hour_sin, hour_cos,
+        ((history > 0) & ctx['new_party']).astype(np.float64),
+        np.log1p(ctx['destination_history']),
+    ])
+
+
+def features_from_stats(amount: float, transaction_ts: Optional[int], counterparty: Optional[str],
+                        source_stats, destination_stats, now: Optional[float] = None) -> np.ndarray:
+    """One feature row from the parties' entity_stats rows, before the
+    transaction is folded in. Matches features_from_context() except that a
+    new counterparty is told by the stats' Bloom filter.
+    """
+    now = int(time.time() if now is None else now)
+    history = source_stats.txn_count if source_stats is not None else 0
+    zscore, days, new_party = 0.0, 1, 0.0
+    if history:
+        if source_stats.amount_std > 0:
+            zscore = (amount - source_stats.amount_mean) / source_stats.amount_std
+        if source_stats.first_seen is not None:
+            days = max(0, now - source_stats.first_seen) // SECONDS_PER_DAY + 1
+        new_party = float(not source_stats.knows(counterparty or ''))
+    hour_sin, hour_cos = _hour_features(local_hour(now if transaction_ts is None else transaction_ts))
+    return np.array([
+        math.log1p(max(amount, 0.0)),
+        min(max(zscore, -ZSCORE_CLIP), ZSCORE_CLIP),
+        math.log1p(history),
+        math.log1p(days),
+        history / days,
+        hour_sin, hour_cos,
+        new_party,
+        math.log1p(destination_stats.txn_count if destination_stats is not None else 0),
+    ])
+
+
+def average_path_length(n) -> np.ndarray:
+    """c(n): the average depth of an unsuccessful binary search tree lookup"""
+    n = np.asarray(n, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        c = 2 * (np.log(np.maximum(n - 1, 1)) + _EULER_GAMMA) - 2 * (n - 1) / n
+    return np.where(n > 2, c, np.where(n == 2, 1.0, 0.0))
+
+
+class AnomalyModel:
+    """An isolation forest: trees of (feature, threshold, value) node arrays.
+
+    A split sends x[feature] < threshold left. A leaf above the bottom level
+    becomes a chain of always-left nodes (threshold +inf) down to it, so
+    every lookup ends on the bottom level, whose value is the leaf's
+    isolation depth + c(rows that reached it).
+    """
+
+    ARRAYS = ('feature', 'threshold', 'value')
+
+    def __init__(self, feature: np.ndarray, threshold: np.ndarray, value: np.ndarray, meta: Dict):
+        self.trees, self.nodes = feature.shape
+        self.depth = int(math.log2(self.nodes + 1)) - 1
+        # Flat views: node n of tree t is entry t * nodes + n
+        self.feature = feature.reshape(-1)
+        self.threshold = threshold.reshape(-1)
+        self.value = value.reshape(-1)
+        self.meta = meta
+        self.version = meta.get('version', 'unsaved')
+        self.alert_threshold = float(meta.get('alert_threshold', 1.0))
+        self._normalizer = float(average_path_length(meta['sample_size']))
+        self._tree_base = np.arange(self.trees, dtype=np.intp) * self.nodes
+        # Flat index of each node's left child (the bottom level's are never followed)
+        self._left = np.minimum(
+            (self._tree_base[:, None] + 2 * np.arange(self.nodes, dtype=np.intp) + 1).reshape(-1),
+            self.trees * self.nodes - 1)
+
+    # ---- training ----
+
+    @classmethod
+    def train(cls, X: np.ndarray, trees: int = 100, sample_size: int = 256,
+              contamination: float = 0.01, seed: Optional[int] = None) -> 'AnomalyModel':
+        """Fit on a (rows x features) matrix; alert_threshold is the score the
+        top `contamination` share of the training rows reach.
+        """
+        started = time.perf_counter()
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        rng = np.random.default_rng(seed)
+        sample_size = max(2, min(sample_size, len(X)))
+        depth = math.ceil(math.log2(sample_size))
+        nodes = 2 ** (depth + 1) - 1
+        feature = np.zeros((trees, nodes), dtype=np.intp)
+        threshold = np.full((trees, nodes), np.inf)
+        value = np.zeros((trees, nodes))
+
+        for t in range(trees):
+            sample = X[rng.choice(len(X), sample_size, replace=False)]
+            stack = [(0, 0, sample)]
+            while stack:
+                node, level, rows = stack.pop()
+                low, high = rows.min(axis=0), rows.max(axis=0)
+                splittable = np.flatnonzero(high > low)
+                if level == depth or len(rows) < 2 or not len(splittable):
+                    bottom = node
+                    for _ in range(depth - level):
+                        bottom = 2 * bottom + 1
+                    value[t, bottom] = level + average_path_length(len(rows))
+                    continue
+                f = rng.choice(splittable)
+                cut = rng.uniform(low[f], high[f])
+                if cut <= low[f]:
+                    cut = np.nextafter(low[f], high[f])
+                feature[t, node] = f
+                threshold[t, node] = cut
+                left = rows[:, f] < cut
+                stack.append((2 * node + 1, level + 1, rows[left]))
+                stack.append((2 * node + 2, level + 1, rows[~left]))
+
+        model = cls(feature, threshold, value, {
+            'features': list(FEATURES), 'trees': trees, 'sample_size': sample_size,
+            'depth': depth, 'training_rows': len(X), 'contamination': contamination,
+            'seed': seed})
+        scores = model.score_batch(X)
+        model.alert_threshold = float(np.quantile(scores, 1 - contamination)) if len(X) else 1.0
+        model.meta['alert_threshold'] = model.alert_threshold
+        model.meta['training_seconds'] = round(time.perf_counter() - started, 3)
+        return model
+
+    # ---- scoring ----
+
+    def path_lengths(self, X: np.ndarray) -> np.ndarray:
+        """Mean isolation depth of each row over the trees"""
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        flat = X.reshape(-1)
+        row_base = (np.arange(len(X), dtype=np.intp) * X.shape[1])[:, None]
+        at = np.broadcast_to(self._tree_base, (len(X), self.trees))
+        for _ in range(self.depth):
+            at = self._left.take(at) + (flat.take(row_base + self.feature.take(at))
+                                        >= self.threshold.take(at))
+        return self.value.take(at).mean(axis=1)
+
+    def score_batch(self, X: np.ndarray, chunk_size: int = 512) -> np.ndarray:
+        """Anomaly score 2^(-E[h(x)] / c(sample_size)) per row, in (0, 1]; above
+        about 0.6 is unusual, around 0.5 or below is normal.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        scores = np.empty(len(X))
+        for start in range(0, len(X), chunk_size):
+            depth = self.path_lengths(X[start:start + chunk_size])
+            scores[start:start + chunk_size] = np.exp2(-depth / self._normalizer)
+        return scores
+
+    def score(self, x: np.ndarray) -> float:
+        """Score of one feature row: one take() per array and tree level"""
+        x = np.asarray(x, dtype=np.float64)
+        at = self._tree_base
+        for _ in range(self.depth):
+            at = self._left.take(at) + (x.take(self.feature.take(at)) >= self.threshold.take(at))
+        return 2.0 ** (-float(self.value.take(at).sum()) / (self.trees * self._normalizer))
+
+    def describe(self) -> Dict:
+        return dict(self.meta, depth=self.depth, nodes_per_tree=self.nodes)
+
+    # ---- storage ----
+
+    def save(self, model_dir: str = DEFAULT_MODEL_DIR, make_current: bool = True) -> str:
+        """Write the next vNNNN directory under model_dir; returns the version"""
+        os.makedirs(model_dir, exist_ok=True)
+        existing = [int(name[1:]) for name in os.listdir(model_dir)
+                    if name.startswith('v') and name[1:].isdigit()]
+        version = f"v{max(existing, default=0) + 1:04d}"
+        path = os.path.join(model_dir, version)
+        os.makedirs(path)
+        for name in self.ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"),
+                    getattr(self, name).reshape(self.trees, self.nodes))
+        self.version = self.meta['version'] = version
+        self.meta['created_at'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(self.meta, f, indent=2)
+        if make_current:
+            set_current(model_dir, version)
+        logger.info(f"Saved anomaly model {version} to {path}")
+        return version
+
+    @classmethod
+    def load(cls, model_dir: str = DEFAULT_MODEL_DIR, version: Optional[str] = None) -> 'AnomalyModel':
+        """Memory-map a stored version (default CURRENT); raises OSError/ValueError"""
+        version = version or current_version(model_dir)
+        if version is None:
+            raise FileNotFoundError(f"no current anomaly model in {model_dir}")
+        path = os.path.join(model_dir, version)
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta.get('features') != list(FEATURES):
+            raise ValueError(f"model {version} was trained on other features: {meta.get('features')}")
+        # Plain ndarray views of the mappings: memmap subclass dispatch costs microseconds per index
+        arrays = [np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r').view(np.ndarray)
+                  for name in cls.ARRAYS]
+        return cls(*arrays, meta)
+
+
+def current_version(model_dir: str = DEFAULT_MODEL_DIR) -> Optional[str]:
+    try:
+        with open(os.path.join(model_dir, 'CURRENT')) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def set_current(model_dir: str, version: str):
+    """Point CURRENT at `version` atomically"""
+    if not os.path.isdir(os.path.join(model_dir, version)):
+        raise FileNotFoundError(f"no anomaly model {version} in {model_dir}")
+    pending = os.path.join(model_dir, 'CURRENT.tmp')
+    with open(pending, 'w') as f:
+        f.write(version + '\n')
+    os.replace(pending, os.path.join(model_dir, 'CURRENT'))
+
+
+def load_current(model_dir: str = DEFAULT_MODEL_DIR) -> Optional[AnomalyModel]:
+    """The CURRENT model, or None (logged) when there is none or it cannot be read"""
+    try:
+        return AnomalyModel.load(model_dir)
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Anomaly model not loaded: {e}")
+        return None
+
+
+def training_matrix(db, limit: Optional[int] = None, chunk_size: int = 50000) -> np.ndarray:
+    """Feature rows of the stored transactions, each against the history
+    before it (AnomalyDetector.batch_context); the latest `limit` rows only
+    when given.
+    """
+    from aml_system_v6_enhanced import AnomalyDetector, load_transaction_columns
+    columns = load_transaction_columns(db, chunk_size=chunk_size)
+    if columns is None:
+        return np.zeros((0, len(FEATURES)))
+    ctx = AnomalyDetector().batch_context(columns['amount'], columns['ts'], columns['src'],
+                                          columns['dst'], columns['now'])
+    X = features_from_context(ctx)
+    return X[-limit:] if limit else X
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train and inspect the isolation forest anomaly model")
+    parser.add_argument('--model-dir', default=os.environ.get('AML_MODEL_DIR', DEFAULT_MODEL_DIR))
+    commands = parser.add_subparsers(dest='command', required=True)
+    train = commands.add_parser('train', help="train a new version on a database")
+    train.add_argument('db_path')
+    train.add_argument('--trees', type=int, default=100)
+    train.add_argument('--sample-size', type=int, default=256)
+    train.add_argument('--contamination', type=float, default=0.01,
+                       help="share of training rows above the alert threshold")
+    train.add_argument('--limit', type=int, help="train on the latest N transactions only")
+    train.add_argument('--seed', type=int)
+    train.add_argument('--no-activate', action='store_true', help="do not make it CURRENT")
+    info = commands.add_parser('info', help="describe a stored version")
+    info.add_argument('--version', help="default: CURRENT")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == 'info':
+        try:
+            model = AnomalyModel.load(args.model_dir, args.version)
+        except (OSError, ValueError) as e:
+            print(json.dumps({'error': str(e)}))
+            return 1
+        print(json.dumps(dict(model.describe(), current=current_version(args.model_dir)), indent=2))
+        return 0
+
+    from aml_system_v6_enhanced import DatabaseManager
+    db = DatabaseManager(args.db_path)
+    started = time.perf_counter()
+    X = training_matrix(db, args.limit)
+    features_seconds = time.perf_counter() - started
+    if not len(X):
+        print(json.dumps({'error': 'no transactions to train on'}))
+        return 1
+    model = AnomalyModel.train(X, args.trees, args.sample_size, args.contamination, args.seed)
+    model.meta['feature_seconds'] = round(features_seconds, 3)
+    model.save(args.model_dir, make_current=not args.no_activate)
+    print(json.dumps(model.describe(), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,1243 @@
+#!/usr/bin/env python3
+"""
+Performance Benchmarks - AML System v6.0 Enhanced
+Runs against throwaway SQLite databases, never the production files
+
+Usage:
+    python benchmark_aml.py pool [--threads 4] [--seconds 5]
+    python benchmark_aml.py endpoints [--requests 500]
+    python benchmark_aml.py indexes [--rows 1000000]
+    python benchmark_aml.py timestamps [--rows 1000000]
+    python benchmark_aml.py bulk [--requests 500] [--rows 50000]
+    python benchmark_aml.py audit [--requests 5000] [--threads 4]
+    python benchmark_aml.py readonly [--threads 4] [--seconds 5]
+    python benchmark_aml.py structuring [--entities 100000] [--rows 5000000]
+    python benchmark_aml.py roundtrip [--rows 100000]
+    python benchmark_aml.py anomaly [--entities 100000] [--rows 1000000]
+    python benchmark_aml.py analysis [--entities 500] [--rows 50000] [--threads 4]
+    python benchmark_aml.py rules [--entities 100000] [--rows 1000000]
+    python benchmark_aml.py edges [--entities 5000] [--rows 1000000]
+    python benchmark_aml.py velocity [--entities 100000] [--rows 1000000] [--requests 20000]
+    python benchmark_aml.py model [--entities 100000] [--rows 1000000] [--requests 10000]
+    python benchmark_aml.py rollups [--entities 5000] [--rows 1000000]
+    python benchmark_aml.py graph [--entities 100000] [--rows 1000000]
+    python benchmark_aml.py snapshot [--entities 100000] [--rows 1000000] [--requests 200]
+    python benchmark_aml.py centrality [--entities 1000000] [--rows 10000000]
+    python benchmark_aml.py subgraph [--entities 100000] [--rows 1000000]
+    python benchmark_aml.py clusters [--entities 100000] [--rows 1000000] [--requests 500]
+"""
+
+import os
+import time
+import uuid
+import random
+import sqlite3
+import json
+import argparse
+import tempfile
+import threading
+import tracemalloc
+import resource
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict
+
+import numpy as np
+
+from aml_time import to_epoch, window_start
+from aml_system_v6_enhanced import (DatabaseManager, PatternDetector, EntityManager,
+                                    NetworkAnalyzer, NetworkNode, RiskScorer, CaseManager)
+from rule_engine import RuleEngine, DEFAULT_RULES_PATH
+import network_edges
+import daily_rollups
+import entity_clusters
+from velocity import VelocityMonitor
+import anomaly_model
+from anomaly_model import AnomalyModel
+from transaction_graph import TransactionGraph
+import graph_snapshot
+import centrality
+from subgraph import SubgraphLimits
+
+
+def print_header(title):
+    print(f"\n{'='*60}")
+    print(f"  {title}")
+    print(f"{'='*60}\n")
+
+
+def temp_db_path(name):
+    return os.path.join(tempfile.mkdtemp(prefix='aml_bench_'), name)
+
+
+def seed_transactions(db: DatabaseManager, entity_count: int, rows: int, days: int = 60,
+                      hub_share: float = 0.0):
+    """Insert synthetic entities, one case and `rows` transactions.
+
+    With `hub_share` > 0 that fraction of transactions touches entity_ids[0].
+    """
+    entity_ids = [str(uuid.uuid4()) for _ in range(entity_count)]
+    case_id = str(uuid.uuid4())
+    now = datetime.now()
+
+    with db.connection() as conn:
+        conn.executemany(
+            "INSERT INTO entities (entity_id, name, entity_type) VALUES (?, ?, 'account')",
+            [(eid, f"Account {i}") for i, eid in enumerate(entity_ids)])
+        conn.execute(
+            "INSERT INTO aml_cases (case_id, case_number, title, case_type) VALUES (?, ?, ?, ?)",
+            (case_id, f"CASE-BENCH-{case_id[:8]}", 'Benchmark', 'other'))
+
+        insert = """INSERT INTO transactions (transaction_id, case_id, source_entity,
+                    destination_entity, amount, transaction_date, transaction_ts)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)"""
+        batch = []
+        for _ in range(rows):
+            src, dst = random.sample(entity_ids, 2)
+            if hub_share and random.random() < hub_share:
+                src = entity_ids[0] if dst != entity_ids[0] else src
+            date = now - timedelta(seconds=random.randint(0, days * 86400))
+            batch.append((str(uuid.uuid4()), case_id, src, dst,
+                          round(random.uniform(1000, 100000), 2), date.isoformat(),
+                          to_epoch(date)))
+            if len(batch) >= 50000:
+                conn.executemany(insert, batch)
+                batch = []
+        if batch:
+            conn.executemany(insert, batch)
+        conn.commit()
+
+    return entity_ids, case_id
+
+
+def run_threads(worker, threads: int, seconds: float) -> int:
+    """Run `worker(stop_at)` on N threads and return the total operation count"""
+    counts = [0] * threads
+    stop_at = time.monotonic() + seconds
+
+    def target(i):
+        counts[i] = worker(stop_at)
+
+    pool = [threading.Thread(target=target, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return sum(counts)
+
+
+# ======================== BENCHMARKS ========================
+
+
+def bench_pool(args):
+    """Queries/sec: pooled connections vs opening a connection per call"""
+    print_header("BENCHMARK: Connection pool vs open-per-call")
+
+    db = DatabaseManager(temp_db_path('pool.db'), pool_size=args.threads)
+    entity_ids, _ = seed_transactions(db, 200, 20000)
+    query = """
+        SELECT amount, transaction_date FROM transactions
+        WHERE source_entity = ? OR destination_entity = ?
+        LIMIT 20
+    """
+
+    def open_per_call(stop_at):
+        # Mirrors the previous DatabaseManager.execute_query behaviour
+        n = 0
+        while time.monotonic() < stop_at:
+            eid = random.choice(entity_ids)
+            conn = sqlite3.connect(db.db_path)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA foreign_keys = ON")
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute(query, (eid, eid)).fetchall()
+            conn.close()
+            n += 1
+        return n
+
+    def pooled(stop_at):
+        n = 0
+        while time.monotonic() < stop_at:
+            eid = random.choice(entity_ids)
+            db.execute_query(query, (eid, eid))
+            n += 1
+        return n
+
+    baseline = run_threads(open_per_call, args.threads, args.seconds)
+    pooled_ops = run_threads(pooled, args.threads, args.seconds)
+
+    baseline_qps = baseline / args.seconds
+    pooled_qps = pooled_ops / args.seconds
+    print(f"Threads:            {args.threads}")
+    print(f"Open-per-call:      {baseline_qps:,.0f} queries/sec")
+    print(f"Pooled:             {pooled_qps:,.0f} queries/sec")
+    print(f"Speedup:            {pooled_qps / max(baseline_qps, 1):.2f}x")
+    print(f"Pool stats:         {db.pool_stats()}")
+
+
+class OpenPerCallDatabase:
+    """The pre-connection-manager aml_system.Database: connect/close per call"""
+
+    def __init__(self, db_path="aml_multi_user.db", **kwargs):
+        # Schema is created up front by the real Database
+        self.db_path = db_path
+
+    def init_app(self, app):
+        pass
+
+    def read_only_route(self, view):
+        return view
+
+    def in_transaction(self):
+        return False
+
+    def get_conn(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def query(self, sql, params=()):
+        conn = self.get_conn()
+        results = conn.execute(sql, params).fetchall()
+        conn.close()
+        return results
+
+    def execute(self, sql, params=()):
+        conn = self.get_conn()
+        conn.execute(sql, params)
+        conn.commit()
+        conn.close()
+        return True
+
+
+def seed_multi_user(client, cases: int, enquiries: int):
+    """Register a user through the API and bulk-load cases, enquiries and audit rows"""
+    import aml_system
+    client.post('/api/auth/register', json={
+        'username': 'bench', 'email': 'bench@example.com', 'password': 'bench',
+        'full_name': 'Bench User', 'organization': 'Bench'})
+    with client.session_transaction() as sess:
+        user_id = sess['user_id']
+
+    conn = sqlite3.connect('aml_multi_user.db')
+    statuses = ['open', 'closed', 'escalated']
+    risks = ['low', 'medium', 'high', 'critical']
+    conn.executemany(
+        "INSERT INTO cases (id, user_id, case_number, title, risk_level, status) VALUES (?, ?, ?, ?, ?, ?)",
+        [(str(uuid.uuid4()), user_id, f"CASE-{i}", f"Case {i}", random.choice(risks),
+          random.choice(statuses)) for i in range(cases)])
+    conn.executemany(
+        """INSERT INTO enquiries (id, user_id, enquiry_number, subject, category, priority, status)
+           VALUES (?, ?, ?, ?, ?, ?, ?)""",
+        [(str(uuid.uuid4()), user_id, f"ENQ-{i}", f"Enquiry {i}", random.choice(['kyc', 'sanctions']),
+          random.choice(['LOW', 'MEDIUM', 'HIGH']), random.choice(['OPEN', 'CLOSED']))
+         for i in range(enquiries)])
+    conn.executemany(
+        "INSERT INTO audit_trail (id, user_id, action, entity_type, entity_id) VALUES (?, ?, ?, ?, ?)",
+        [(str(uuid.uuid4()), user_id, 'CASE_EDIT', 'CASE', str(i)) for i in range(cases)])
+    conn.commit()
+    conn.close()
+
+
+def time_endpoint(client, path: str, requests: int) -> Dict:
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get(path)
+        samples.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.data
+    samples.sort()
+    return {
+        'mean_ms': sum(samples) / len(samples),
+        'p50_ms': samples[len(samples) // 2],
+        'p95_ms': samples[int(len(samples) * 0.95) - 1]
+    }
+
+
+def bench_endpoints(args):
+    """Latency of the multi-user dashboard endpoints before/after the connection manager"""
+    print_header("BENCHMARK: aml_system endpoints, open-per-call vs per-thread connections")
+    import aml_system
+
+    paths = ['/api/analytics/dashboard', '/api/enquiries/statistics']
+    cwd = os.getcwd()
+    results = {}
+    original = aml_system.Database
+    try:
+        for label, db_class in (('before', OpenPerCallDatabase), ('after', original)):
+            os.chdir(tempfile.mkdtemp(prefix='aml_bench_'))
+            original('aml_multi_user.db').close_all()
+            aml_system.Database = db_class
+            app = aml_system.create_app()
+            client = app.test_client()
+            seed_multi_user(client, cases=2000, enquiries=2000)
+            for path in paths:
+                time_endpoint(client, path, 20)  # warm-up
+                results[(label, path)] = time_endpoint(client, path, args.requests)
+    finally:
+        aml_system.Database = original
+        os.chdir(cwd)
+
+    for path in paths:
+        before, after = results[('before', path)], results[('after', path)]
+        print(path)
+        for key in ('mean_ms', 'p50_ms', 'p95_ms'):
+            print(f"  {key:<8} before {before[key]:7.3f}   after {after[key]:7.3f}")
+
+
+def bench_indexes(args):
+    """Hot-query latency on a large transactions table without/with the advisor indexes"""
+    print_header(f"BENCHMARK: Index advisor on {args.rows:,} transactions")
+    from index_advisor import IndexAdvisor, RECOMMENDED_INDEXES, HOT_QUERIES
+
+    db = DatabaseManager(temp_db_path('indexes.db'))
+    with db.connection() as conn:
+        for name, _, _ in RECOMMENDED_INDEXES['v6']:
+            conn.execute(f"DROP INDEX IF EXISTS {name}")
+        conn.commit()
+
+    start = time.perf_counter()
+    entity_ids, case_id = seed_transactions(db, 10000, args.rows)
+    print(f"Seeded {args.rows:,} rows in {time.perf_counter() - start:.1f}s\n")
+
+    queries = [q for q in HOT_QUERIES if q.schema == 'v6'
+               and q.name.startswith(('PatternDetector', 'RiskScorer', 'CaseManager.add'))]
+    sample = random.sample(entity_ids, 20)
+
+    def time_queries(conn):
+        timings = {}
+        for q in queries:
+            start = time.perf_counter()
+            for eid in sample:
+                params = tuple(eid if p == 'E1' else p for p in q.params)
+                conn.execute(q.sql, params).fetchall()
+            timings[q.name] = (time.perf_counter() - start) / len(sample) * 1000
+        return timings
+
+    with db.connection() as conn:
+        advisor = IndexAdvisor(conn, 'v6')
+        before_report = {r['query']: r for r in advisor.analyze()}
+        before = time_queries(conn)
+
+        start = time.perf_counter()
+        created = advisor.create_missing_indexes(analyze=True)
+        print(f"Created {len(created)} indexes in {time.perf_counter() - start:.1f}s: {', '.join(created)}\n")
+
+        after_report = {r['query']: r for r in advisor.analyze()}
+        after = time_queries(conn)
+
+    for q in queries:
+        print(q.name)
+        print(f"  plan before: {' | '.join(before_report[q.name]['plan'])}")
+        print(f"  plan after:  {' | '.join(after_report[q.name]['plan'])}")
+        print(f"  latency:     {before[q.name]:9.2f} ms -> {after[q.name]:7.2f} ms "
+              f"({before[q.name] / max(after[q.name], 1e-6):,.0f}x)\n")
+
+
+def bench_timestamps(args):
+    """detect_structuring: datetime() on transaction_date vs a range on transaction_ts"""
+    print_header(f"BENCHMARK: Sargable time windows on {args.rows:,} transactions")
+
+    db = DatabaseManager(temp_db_path('timestamps.db'))
+    # A year of history; entity_ids[0] is a hub touching 5% of all rows
+    entity_ids, _ = seed_transactions(db, 10000, args.rows, days=365, hub_share=0.05)
+    old_query = """
+        SELECT amount, transaction_date FROM transactions
+        WHERE (source_entity = ? OR destination_entity = ?)
+        AND datetime(transaction_date) >= datetime('now', '-' || ? || ' days')
+        ORDER BY transaction_date
+    """
+    detector = PatternDetector(db)
+
+    with db.connection() as conn:
+        # The index set the old query ran against
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_source_date "
+                     "ON transactions(source_entity, transaction_date)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_dest_date "
+                     "ON transactions(destination_entity, transaction_date)")
+        conn.execute("ANALYZE")
+        conn.commit()
+        old_plan = [r[3] for r in conn.execute(
+            f"EXPLAIN QUERY PLAN {old_query}", ('E1', 'E1', 30)).fetchall()]
+        new_plan = [r[3] for r in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT amount FROM transactions WHERE "
+            "(source_entity = ? OR destination_entity = ?) AND transaction_ts >= ? "
+            "ORDER BY transaction_ts", ('E1', 'E1', 0)).fetchall()]
+
+    def timed(fn, entities, repeat=5):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for eid in entities:
+                fn(eid)
+        return (time.perf_counter() - start) / (repeat * len(entities)) * 1000
+
+    def old_detect(eid):
+        return db.execute_query(old_query, (eid, eid, 30))
+
+    print(f"Plan before: {' | '.join(old_plan)}")
+    print(f"Plan after:  {' | '.join(new_plan)}\n")
+    for label, entities in (('hub entity', entity_ids[:1]),
+                            ('typical entity', random.sample(entity_ids[1:], 50))):
+        before = timed(old_detect, entities)
+        after = timed(detector.detect_structuring, entities)
+        print(f"detect_structuring ({label}): {before:8.2f} ms -> {after:6.2f} ms "
+              f"({before / max(after, 1e-6):.1f}x)")
+
+
+def bench_bulk(args):
+    """add_transaction_to_case per row vs add_transactions_bulk"""
+    print_header(f"BENCHMARK: Bulk ingestion ({args.requests:,} single vs {args.rows:,} bulk rows)")
+
+    db = DatabaseManager(temp_db_path('bulk.db'))
+    entity_ids, case_id = seed_transactions(db, 1000, 10000)
+    pattern_detector = PatternDetector(db)
+    network_analyzer = NetworkAnalyzer(db)
+    case_mgr = CaseManager(db, EntityManager(db), pattern_detector,
+                           RiskScorer(db, pattern_detector, network_analyzer),
+                           network_analyzer)
+
+    def make_rows(count):
+        rows = []
+        for _ in range(count):
+            src, dst = random.sample(entity_ids, 2)
+            rows.append({'source_entity': src, 'destination_entity': dst,
+                         'amount': round(random.uniform(1000, 100000), 2),
+                         'transaction_date': datetime.now().isoformat()})
+        return rows
+
+    single_rows = make_rows(args.requests)
+    start = time.perf_counter()
+    for row in single_rows:
+        case_mgr.add_transaction_to_case(case_id, row)
+    single_rate = len(single_rows) / (time.perf_counter() - start)
+
+    result = case_mgr.add_transactions_bulk(case_id, make_rows(args.rows))
+    print(f"add_transaction_to_case: {single_rate:10,.0f} rows/sec")
+    print(f"add_transactions_bulk:   {result['rows_per_second']:10,.0f} rows/sec "
+          f"({result['inserted']:,} inserted, {result['failed']} failed)")
+    print(f"Speedup: {result['rows_per_second'] / single_rate:.1f}x")
+
+
+def bench_audit(args):
+    """AuditTrail.log_action: synchronous inserts vs the write-behind writer"""
+    import aml_system
+    print_header(f"BENCHMARK: Audit logging ({args.requests:,} records)")
+
+    for mode in ('sync', 'write_behind'):
+        db = aml_system.Database(temp_db_path('audit.db'))
+        audit = aml_system.AuditTrail(db, mode=mode)
+        user_id = str(uuid.uuid4())
+        case_ids = [str(uuid.uuid4()) for _ in range(args.requests)]
+        with db.transaction() as conn:
+            conn.execute("INSERT INTO users (id, username, email, password) VALUES (?, 'b', 'b@x', 'x')",
+                         (user_id,))
+            conn.executemany("INSERT INTO cases (id, user_id, case_number, status) VALUES (?, ?, ?, 'open')",
+                             [(cid, user_id, f"CASE-{i}") for i, cid in enumerate(case_ids)])
+
+        # One audited action per request, as the per-item endpoints do
+        per_thread = args.requests // args.threads
+
+        def worker(offset):
+            for cid in case_ids[offset:offset + per_thread]:
+                audit.log_action(user_id, 'CASE_EDIT', 'CASE', cid, {'status': 'open'},
+                                 {'status': 'review'}, '127.0.0.1')
+            db.close_thread_conn()
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(i * per_thread,))
+                   for i in range(args.threads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        single = time.perf_counter() - start
+        audit.flush(30)
+        drained = time.perf_counter() - start
+
+        bulk_ops = aml_system.BulkOperations(db, audit)
+        start = time.perf_counter()
+        bulk_ops.bulk_update_cases(user_id, case_ids, {'status': 'closed'})
+        bulk = time.perf_counter() - start
+        audit.close()
+
+        written = db.query("SELECT COUNT(*) FROM audit_trail")[0][0]
+        print(f"{mode:>12}: per-request {single * 1000:8.1f} ms "
+              f"({args.requests / single:8,.0f} records/sec, drained in {drained * 1000:.1f} ms) | "
+              f"bulk_update_cases {bulk * 1000:8.1f} ms | rows {written:,}")
+        if mode == 'write_behind':
+            metrics = audit.metrics()
+            print(f"{'':>12}  batches {metrics['batches']}, avg flush {metrics['avg_flush_ms']} ms, "
+                  f"max flush {metrics['max_flush_ms']} ms, backpressure waits "
+                  f"{metrics['backpressure_waits']}")
+        db.close_all()
+
+
+def bench_readonly(args):
+    """Case-insert latency while analytics scans run, rollback journal vs WAL + read-only pool"""
+    import aml_system
+    print_header(f"BENCHMARK: Writes under {args.threads} concurrent analytics readers")
+
+    scan = """SELECT c.risk_level, c.status, COUNT(*), COUNT(DISTINCT a.action)
+              FROM cases c LEFT JOIN audit_trail a ON a.entity_id = c.id
+              GROUP BY c.risk_level, c.status"""
+    for label in ('journal=delete, shared connections', 'WAL + read-only pool'):
+        routed = label.startswith('WAL')
+        db = aml_system.Database(temp_db_path('readonly.db'), read_pool_size=args.threads)
+        user_id = str(uuid.uuid4())
+        conn = sqlite3.connect(db.db_path)
+        if not routed:
+            conn.execute("PRAGMA journal_mode=DELETE")
+        conn.execute("INSERT INTO users (id, username, email, password) VALUES (?, 'b', 'b@x', 'x')",
+                     (user_id,))
+        ids = [str(uuid.uuid4()) for _ in range(100000)]
+        conn.executemany("INSERT INTO cases (id, user_id, case_number, risk_level, status) "
+                         "VALUES (?, ?, ?, ?, 'open')",
+                         [(cid, user_id, f"CASE-{i}", random.choice(['low', 'high']))
+                          for i, cid in enumerate(ids)])
+        conn.executemany("INSERT INTO audit_trail (id, user_id, action, entity_type, entity_id) "
+                         "VALUES (?, ?, 'CASE_EDIT', 'CASE', ?)",
+                         [(str(uuid.uuid4()), user_id, cid) for cid in ids])
+        conn.commit()
+        conn.close()
+
+        stop_at = time.perf_counter() + args.seconds
+        scans = [0]
+
+        def reader():
+            while time.perf_counter() < stop_at:
+                if routed:
+                    with db.read_only():
+                        db.query(scan)
+                else:
+                    db.query(scan)
+                scans[0] += 1
+            db.close_thread_conn()
+
+        threads = [threading.Thread(target=reader) for _ in range(args.threads)]
+        for t in threads:
+            t.start()
+        latencies, errors = [], 0
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            try:
+                db.execute("INSERT INTO cases (id, user_id, case_number, status) VALUES (?, ?, ?, 'open')",
+                           (str(uuid.uuid4()), user_id, f"W-{uuid.uuid4().hex}"))
+                latencies.append((time.perf_counter() - start) * 1000)
+            except sqlite3.OperationalError:
+                errors += 1
+        for t in threads:
+            t.join()
+
+        latencies.sort()
+        p = lambda q: latencies[min(len(latencies) - 1, int(len(latencies) * q))] if latencies else 0
+        print(f"{label:<36} writes {len(latencies):6,} ({errors} lock errors)  "
+              f"p50 {p(0.5):7.2f} ms  p99 {p(0.99):8.2f} ms  max {p(1.0):8.2f} ms  scans {scans[0]}")
+        db.close_all()
+
+
+def bench_structuring(args):
+    """detect_structuring per entity vs one detect_structuring_batch sweep"""
+    rows = args.rows if args.rows != 1000000 else 5000000
+    print_header(f"BENCHMARK: Structuring sweep over {args.entities:,} entities, {rows:,} transactions")
+
+    db = DatabaseManager(temp_db_path('structuring.db'))
+    started = time.perf_counter()
+    entity_ids, _ = seed_transactions(db, args.entities, rows)
+    print(f"Seeded in {time.perf_counter() - started:.1f}s")
+    detector = PatternDetector(db)
+
+    # The per-entity loop is timed on a sample and extrapolated to the portfolio
+    sample = random.sample(entity_ids, min(len(entity_ids), 2000))
+    first_since = window_start(30)
+    started = time.perf_counter()
+    loop = {eid: detector.detect_structuring(eid) for eid in sample}
+    per_entity = (time.perf_counter() - started) / len(sample)
+
+    started = time.perf_counter()
+    flagged = detector.detect_structuring_batch()
+    batch = time.perf_counter() - started
+    stored = db.execute_query("SELECT COUNT(*) FROM patterns WHERE pattern_type = 'structuring'")[0][0]
+
+    # The 30-day window slid between the two runs: skip entities with rows in the gap
+    drifted = {e for row in db.execute_query(
+        "SELECT source_entity, destination_entity FROM transactions "
+        "WHERE transaction_ts >= ? AND transaction_ts < ?", (first_since, window_start(30)))
+        for e in row}
+    mismatches = 0
+    for eid, (hit, details) in loop.items():
+        if eid in drifted:
+            continue
+        swept = flagged.get(eid)
+        if hit != (swept is not None) or (hit and (
+                details['transaction_count'] != swept['transaction_count']
+                or abs(details['confidence'] - swept['confidence']) > 1e-9
+                or abs(details['total_amount'] - swept['total_amount']) > 1e-6)):
+            mismatches += 1
+
+    loop_total = per_entity * len(entity_ids)
+    print(f"Per-entity loop: {per_entity * 1000:6.2f} ms/entity -> ~{loop_total:,.0f}s for all entities")
+    print(f"Batch sweep:     {batch:6.2f}s ({len(flagged):,} flagged, {stored:,} pattern rows)"
+          f" -> {loop_total / max(batch, 1e-6):,.0f}x")
+    print(f"Verdict mismatches on {len(set(sample) - drifted):,} sampled entities: {mismatches}")
+
+
+def bench_roundtrip(args):
+    """detect_round_tripping matcher: quadratic pair scan vs counterparty sweep"""
+    from test_round_tripping import quadratic_round_trips, random_history
+
+    limit = args.rows if args.rows != 1000000 else 100000
+    print_header(f"BENCHMARK: Round-trip matching, one account with up to {limit:,} transactions")
+    rng = random.Random(3)
+    counterparties = [f"C{i}" for i in range(20)]
+    sizes = [n for n in (1000, 2500, 5000, 20000, 100000) if n <= limit]
+
+    for size in sizes:
+        rows = random_history(rng, 'E0', size, counterparties)
+        started = time.perf_counter()
+        hit, details = PatternDetector.match_round_trips('E0', rows)
+        sweep = time.perf_counter() - started
+        line = f"{size:>7,} rows: sweep {sweep * 1000:9.1f} ms"
+        # The quadratic matcher takes minutes past a few thousand rows
+        if size <= 5000:
+            started = time.perf_counter()
+            assert quadratic_round_trips('E0', rows) == (hit, details)
+            quadratic = time.perf_counter() - started
+            line += f"   quadratic {quadratic * 1000:10.1f} ms ({quadratic / max(sweep, 1e-6):,.0f}x)"
+        print(f"{line}   {details.get('round_trip_count', 0):,} round trips")
+
+
+def bench_anomaly(args):
+    """Per-row score_with_stats vs AnomalyDetector.score_batch / rescore_transactions"""
+    import entity_stats
+    from aml_system_v6_enhanced import AnomalyDetector
+
+    print_header(f"BENCHMARK: Anomaly rescoring of {args.rows:,} transactions")
+    db = DatabaseManager(temp_db_path('anomaly.db'))
+    seed_transactions(db, args.entities, args.rows)
+    case_mgr = CaseManager(db, EntityManager(db), None, None, None)
+    detector = AnomalyDetector()
+
+    # Per-row baseline on a prefix: replay entity_stats, scoring each row first
+    sample = db.execute_query("""
+        SELECT source_entity, destination_entity, amount, transaction_ts FROM transactions
+        ORDER BY rowid LIMIT 100000
+    """)
+    stats = defaultdict(lambda: None)
+    started = time.perf_counter()
+    for source, destination, amount, ts in sample:
+        for entity in (source, destination):
+            if stats[entity] is None:
+                stats[entity] = entity_stats.EntityStats(entity)
+        detector.score_with_stats({'amount': amount, 'transaction_ts': ts,
+                                   'destination_entity': destination}, stats[source])
+        entity_stats.record(stats, source, destination, amount, ts)
+    per_row = len(sample) / (time.perf_counter() - started)
+
+    columns = db.execute_query("""
+        SELECT source_entity, destination_entity, amount, transaction_ts FROM transactions
+        ORDER BY rowid
+    """)
+    src, dst, amount, ts = (list(c) for c in zip(*columns))
+    _, codes = np.unique(np.array(src + dst, dtype=object), return_inverse=True)
+    started = time.perf_counter()
+    detector.score_batch(amount, ts, codes[:len(src)], codes[len(src):])
+    batch = len(columns) / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    written = case_mgr.rescore_transactions()
+    end_to_end = written / (time.perf_counter() - started)
+
+    print(f"score_with_stats per row:          {per_row:12,.0f} transactions/sec")
+    print(f"score_batch (vectorized):          {batch:12,.0f} transactions/sec")
+    print(f"rescore_transactions (load+write): {end_to_end:12,.0f} transactions/sec "
+          f"({written:,} rows updated)")
+
+
+def bench_analysis(args):
+    """analyze_case over every entity: in-process vs the analysis process pool"""
+    entities = args.entities if args.entities != 100000 else 500
+    rows = args.rows if args.rows != 1000000 else 50000
+    print_header(f"BENCHMARK: analyze_case, {entities:,} entities, {rows:,} transactions")
+
+    db = DatabaseManager(temp_db_path('analysis.db'))
+    _, case_id = seed_transactions(db, entities, rows, days=30)
+    pattern_detector = PatternDetector(db)
+
+    def run(case_mgr, deadline=3600):
+        # coverage.elapsed_seconds stops before the network analysis, which
+        # does not depend on the pool
+        analysis = case_mgr.analyze_case(case_id, deadline=deadline)
+        return analysis, analysis['coverage']['elapsed_seconds']
+
+    def managers(workers):
+        # NetworkAnalyzer keeps its graph between calls; a fresh one per manager
+        network_analyzer = NetworkAnalyzer(db)
+        return CaseManager(db, EntityManager(db), pattern_detector,
+                           RiskScorer(db, pattern_detector, network_analyzer),
+                           network_analyzer, analysis_workers=workers)
+
+    serial, serial_time = run(managers(0))
+    pooled_mgr = managers(args.threads)
+    run(pooled_mgr)  # spawns the workers and imports the module in each
+    pooled, pooled_time = run(pooled_mgr)
+    differing = sum(serial['entity_patterns'].get(e) != pooled['entity_patterns'].get(e)
+                    for e in set(serial['entity_patterns']) | set(pooled['entity_patterns']))
+    print(f"In-process:      {serial_time:7.2f}s  "
+          f"({serial['coverage']['entities_analyzed']:,} entities, "
+          f"{len(serial['entity_patterns']):,} with patterns)")
+    print(f"{args.threads} processes:     {pooled_time:7.2f}s  ({serial_time / pooled_time:.1f}x on "
+          f"{os.cpu_count()} CPUs, {differing} entities differ)")
+
+    deadline = serial_time / 4
+    partial, partial_time = run(pooled_mgr, deadline)
+    pooled_mgr.close_analysis_pool()
+    print(f"Deadline {deadline:.2f}s:  {partial_time:7.2f}s  partial={partial['partial']}, "
+          f"{partial['coverage']['entities_analyzed']:,}/{partial['coverage']['entities_total']:,} "
+          f"entities")
+
+
+def bench_rules(args):
+    """Rule engine: agreement with the coded detectors, and N rules vs N scans"""
+    print_header(f"BENCHMARK: Detection rules over {args.entities:,} entities, {args.rows:,} transactions")
+
+    db = DatabaseManager(temp_db_path('rules.db'))
+    entity_ids, _ = seed_transactions(db, args.entities, args.rows)
+    detector = PatternDetector(db)
+    engine = RuleEngine(db)
+
+    now = time.time()
+    report = engine.evaluate(now=now)
+    swept = detector.detect_structuring_batch(persist=False)
+    drifted = {e for row in db.execute_query(
+        "SELECT source_entity, destination_entity FROM transactions "
+        "WHERE transaction_ts >= ? AND transaction_ts < ?", (window_start(30, now), window_start(30)))
+        for e in row}
+
+    def same(a, b):
+        return a is None and b is None or (a is not None and b is not None and all(
+            abs(a[k] - b[k]) <= 1e-6 * max(1.0, abs(b[k])) if isinstance(b[k], float) else a[k] == b[k]
+            for k in b))
+
+    structuring = report['results']['structuring']
+    mismatches = sum(not same(structuring.get(e), swept.get(e))
+                     for e in (set(structuring) | set(swept)) - drifted)
+    sample = random.sample(entity_ids, min(len(entity_ids), 500))
+    for eid in sample:
+        coded = detector.detect_fan_in_fan_out(eid)
+        for name in ('fan_in', 'fan_out'):
+            mismatches += not same(report['results'][name].get(eid), coded.get(name))
+    print(f"Hits: " + ", ".join(f"{name} {len(hits):,}" for name, hits in report['results'].items()))
+    print(f"Mismatches vs coded detectors (structuring: all entities, fan-in/out: "
+          f"{len(sample)} sampled): {mismatches}")
+
+    # N variants of the structuring rule: one engine pass vs one pass per rule
+    base = json.load(open(DEFAULT_RULES_PATH))['rules'][0]
+    rules_path = temp_db_path('rules.json')
+    for count in (1, 4, 16):
+        variants = [dict(base, name=f"structuring_{i}",
+                         when=[["below", ">=", 3 + i]]) for i in range(count)]
+        with open(rules_path, 'w') as f:
+            json.dump({'rules': variants}, f)
+        engine = RuleEngine(db, rules_path)
+        shared = engine.evaluate()['timings']
+        started = time.perf_counter()
+        for variant in variants:
+            engine.evaluate([variant['name']])
+        separate = time.perf_counter() - started
+        slowest = max(shared['rules'].values())
+        print(f"{count:2d} rules: one pass {shared['total_seconds']:6.2f}s "
+              f"(scan {shared['scan_seconds']:.2f}s, slowest rule {slowest * 1000:.1f} ms) | "
+              f"one pass per rule {separate:6.2f}s")
+
+    # Hot reload: a new rule is picked up by the next evaluation
+    time.sleep(0.01)
+    with open(rules_path, 'w') as f:
+        json.dump({'rules': [dict(base, name='reloaded')]}, f)
+    print(f"Hot reload: {list(engine.evaluate()['results'])}")
+
+
+def bench_edges(args):
+    """Fan-in/fan-out and build_network: raw transactions vs network_edges"""
+    entities = args.entities if args.entities != 100000 else 5000
+    print_header(f"BENCHMARK: network_edges, {entities:,} entities, {args.rows:,} transactions, "
+                 f"20% from one hub")
+
+    db = DatabaseManager(temp_db_path('edges.db'))
+    entity_ids, _ = seed_transactions(db, entities, args.rows, hub_share=0.2)
+    started = time.perf_counter()
+    with db.write_transaction() as conn:
+        edge_count = network_edges.rebuild(conn)
+    print(f"Rebuild: {edge_count:,} edges in {time.perf_counter() - started:.1f}s")
+
+    # The queries detect_fan_in_fan_out and build_network ran before edges
+    raw_fan = [
+        "SELECT COUNT(DISTINCT source_entity), SUM(amount) FROM transactions WHERE destination_entity = ?",
+        "SELECT COUNT(DISTINCT destination_entity), SUM(amount) FROM transactions WHERE source_entity = ?"
+    ]
+    raw_network = """
+        SELECT source_entity, destination_entity, amount, COUNT(*) as txn_count
+        FROM transactions WHERE source_entity IN (?) OR destination_entity IN (?)
+        GROUP BY source_entity, destination_entity
+    """
+    detector = PatternDetector(db)
+    hub, others = entity_ids[0], random.sample(entity_ids[1:], 200)
+
+    def timed(fn, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            result = fn()
+        return (time.perf_counter() - started) / repeat * 1000, result
+
+    for label, eid, repeat in (('hub', hub, 5), ('typical', others, 1)):
+        ids = eid if isinstance(eid, list) else [eid]
+        raw_ms, raw = timed(lambda: [[db.execute_query(q, (e,))[0] for q in raw_fan] for e in ids], repeat)
+        edge_ms, _ = timed(lambda: [detector.detect_fan_in_fan_out(e) for e in ids], repeat)
+        counts = [[r[0] for r in pair] for pair in raw]
+        same = all(detector.detect_fan_in_fan_out(e).get(name, {}).get('count', c[i]) == c[i]
+                   for e, c in zip(ids, counts) for i, name in enumerate(('fan_in', 'fan_out')))
+        per = len(ids)
+        print(f"Fan-in/out, {label:8s}: raw {raw_ms / per:8.2f} ms | edges {edge_ms / per:7.2f} ms "
+              f"({raw_ms / edge_ms:5.1f}x, counts {'match' if same else 'DIFFER'})")
+
+    analyzer = NetworkAnalyzer(db)
+    raw_ms, raw = timed(lambda: db.execute_query(raw_network, (hub, hub)), 3)
+
+    edge_ms, built = timed(lambda: analyzer.build_network([hub]).edge_count, 3)
+    print(f"build_network(hub):   raw {raw_ms:8.2f} ms | edges {edge_ms:7.2f} ms "
+          f"({raw_ms / edge_ms:5.1f}x, {len(raw):,} vs {built:,} edges)")
+
+
+def bench_rollups(args):
+    """Windowed structuring and activity: raw transactions vs entity_daily_stats"""
+    entities = args.entities if args.entities != 100000 else 5000
+    print_header(f"BENCHMARK: entity_daily_stats, {entities:,} entities, {args.rows:,} transactions "
+                 f"over 60 days, 20% from one hub")
+
+    db = DatabaseManager(temp_db_path('rollups.db'))
+    entity_ids, case_id = seed_transactions(db, entities, args.rows, hub_share=0.2)
+    started = time.perf_counter()
+    with db.write_transaction() as conn:
+        network_edges.rebuild(conn)
+        edges_seconds = time.perf_counter() - started
+        rollup_count = daily_rollups.rebuild(conn)
+    print(f"Rebuild: {rollup_count:,} rollups in {time.perf_counter() - started - edges_seconds:.1f}s")
+
+    # The query detect_structuring ran before rollups
+    raw_structuring = """
+        SELECT amount, transaction_date FROM transactions
+        WHERE (source_entity = ? OR destination_entity = ?)
+        AND transaction_ts >= ?
+        ORDER BY transaction_ts
+    """
+
+    def raw_detect(entity_id, days):
+        amounts = [r[0] for r in db.execute_query(raw_structuring,
+                                                  (entity_id, entity_id, window_start(days)))]
+        return len(amounts), sum(1 for a in amounts if a < daily_rollups.SUB_THRESHOLD_AMOUNT)
+
+    detector = PatternDetector(db)
+    entity_mgr = EntityManager(db)
+    hub, others = entity_ids[0], random.sample(entity_ids[1:], 200)
+    for label, ids, repeat in (('hub', [hub], 3), ('typical', others, 1)):
+        for days in (1, 7, 30):
+            started = time.perf_counter()
+            for _ in range(repeat):
+                raw = [raw_detect(e, days) for e in ids]
+            raw_ms = (time.perf_counter() - started) / repeat / len(ids) * 1000
+            started = time.perf_counter()
+            for _ in range(repeat):
+                rolled = [detector.detect_structuring(e, days) for e in ids]
+            rollup_ms = (time.perf_counter() - started) / repeat / len(ids) * 1000
+            same = all(flagged == (below >= 5 and count >= 5)
+                       for (flagged, _), (count, below) in zip(rolled, raw))
+            print(f"Structuring {days:>2}d, {label:8s}: raw {raw_ms:8.2f} ms | rollups {rollup_ms:7.2f} ms "
+                  f"({raw_ms / rollup_ms:6.1f}x, verdicts {'match' if same else 'DIFFER'})")
+
+    started = time.perf_counter()
+    activity = entity_mgr.get_activity(hub, 30)
+    print(f"Activity 30d, hub:       {(time.perf_counter() - started) * 1000:8.2f} ms "
+          f"({activity['totals']['txn_count']:,} transactions, {len(activity['daily'])} days)")
+
+    case_mgr = CaseManager(db, entity_mgr, None, None, None)
+    rows = [{'source_entity': src, 'destination_entity': dst,
+             'amount': round(random.uniform(1000, 100000), 2)}
+            for src, dst in (random.sample(entity_ids, 2) for _ in range(20000))]
+    result = case_mgr.add_transactions_bulk(case_id, rows)
+    with db.connection() as conn:
+        report = daily_rollups.check(conn, 200)
+    print(f"Bulk insert:             {result['rows_per_second']:8,.0f} rows/sec with rollups maintained "
+          f"({report['mismatched']} of {report['checked']:,} sampled rollups differ from a rebuild)")
+
+
+def bench_velocity(args):
+    """Velocity windows: ring buffers vs counting each window in SQL"""
+    print_header(f"BENCHMARK: Velocity checks, {args.entities:,} entities, {args.rows:,} transactions "
+                 f"over 2 days")
+
+    db = DatabaseManager(temp_db_path('velocity.db'))
+    entity_ids, _ = seed_transactions(db, args.entities, args.rows, days=2)
+    monitor = VelocityMonitor()
+    started = time.perf_counter()
+    loaded = monitor.rebuild(db)
+    print(f"Rebuild: {loaded:,} transactions, {monitor.stats()['entities']:,} entities "
+          f"in {time.perf_counter() - started:.1f}s")
+
+    now = int(time.time())
+    probes = [(random.choice(entity_ids), round(random.uniform(1000, 100000), 2))
+              for _ in range(args.requests)]
+    window_query = """
+        SELECT (SELECT COUNT(*) FROM transactions WHERE source_entity = ?1 AND transaction_ts >= ?2)
+             + (SELECT COUNT(*) FROM transactions WHERE destination_entity = ?1 AND transaction_ts >= ?2
+                AND source_entity != ?1),
+               (SELECT COALESCE(SUM(amount), 0) FROM transactions WHERE source_entity = ?1 AND transaction_ts >= ?2)
+             + (SELECT COALESCE(SUM(amount), 0) FROM transactions WHERE destination_entity = ?1
+                AND transaction_ts >= ?2 AND source_entity != ?1)
+    """
+    sql_probes = probes[:max(1, len(probes) // 10)]
+    started = time.perf_counter()
+    with db.connection() as conn:
+        for entity_id, _ in sql_probes:
+            for window in monitor.windows:
+                conn.execute(window_query, (entity_id, now - window.seconds)).fetchone()
+    sql_rate = len(sql_probes) / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    breached = 0
+    for i, (entity_id, amount) in enumerate(probes):
+        breached += bool(monitor.check(entity_id, amount, now + i // 100))
+        monitor.record(entity_id, entity_ids[i % len(entity_ids)], amount, now + i // 100)
+    ring_rate = len(probes) / (time.perf_counter() - started)
+    print(f"SQL window counts:  {sql_rate:10,.0f} checks/sec ({len(monitor.windows)} windows each)")
+    print(f"Ring buffers:       {ring_rate:10,.0f} checks/sec, check + record "
+          f"({ring_rate / sql_rate:,.0f}x, {breached:,} breaching)")
+
+
+def bench_model(args):
+    """Isolation forest: training, memory-mapped load, single and batch scoring"""
+    print_header(f"BENCHMARK: Anomaly model on {args.rows:,} transactions")
+    requests = args.requests if args.requests != 500 else 10000
+    db = DatabaseManager(temp_db_path('model.db'))
+    entity_ids, case_id = seed_transactions(db, args.entities, args.rows)
+
+    started = time.perf_counter()
+    X = anomaly_model.training_matrix(db)
+    print(f"Feature matrix:  {X.shape[0]:,} x {X.shape[1]} in {time.perf_counter() - started:.2f}s")
+    models = {}
+    for trees in (50, 100, 200):
+        models[trees] = AnomalyModel.train(X, trees=trees, seed=1)
+        print(f"Training:        {trees:>3} trees x 256 samples in "
+              f"{models[trees].meta['training_seconds']:.2f}s (threshold scoring over every row included)")
+    model = models[100]
+
+    model_dir = os.path.join(tempfile.mkdtemp(prefix='aml_bench_'), 'anomaly')
+    version = model.save(model_dir)
+    started = time.perf_counter()
+    loaded = AnomalyModel.load(model_dir)
+    print(f"Load (mmap):     {version} in {(time.perf_counter() - started) * 1000:.2f} ms")
+
+    rows = X[np.random.default_rng(0).integers(0, len(X), requests)]
+    started = time.perf_counter()
+    single = [loaded.score(x) for x in rows]
+    latency = (time.perf_counter() - started) / requests * 1e6
+    assert np.allclose(single, loaded.score_batch(rows))
+    started = time.perf_counter()
+    scores = loaded.score_batch(X)
+    batch = len(X) / (time.perf_counter() - started)
+    print(f"Single score:    {latency:10.1f} us/transaction ({loaded.trees} trees)")
+    print(f"Batch score:     {batch:10,.0f} transactions/sec, "
+          f"{int((scores >= loaded.alert_threshold).sum()):,} over the alert threshold")
+
+    def bulk(model):
+        case_mgr = CaseManager(db, EntityManager(db), None, None, None, anomaly_model=model)
+        rows = [{'source_entity': src, 'destination_entity': dst,
+                 'amount': round(random.uniform(1000, 100000), 2)}
+                for src, dst in (random.sample(entity_ids, 2) for _ in range(20000))]
+        return case_mgr.add_transactions_bulk(case_id, rows)['rows_per_second']
+
+    print(f"Bulk insert:     {bulk(None):10,.0f} rows/sec heuristic only, "
+          f"{bulk(loaded):,.0f} rows/sec with shadow scoring")
+
+
+def bench_graph(args):
+    """Whole-network graph: dict-of-lists with NetworkNode objects vs CSR arrays"""
+    print_header(f"BENCHMARK: Transaction graph, {args.entities:,} entities, {args.rows:,} transactions")
+    db = DatabaseManager(temp_db_path('graph.db'))
+    entity_ids, _ = seed_transactions(db, args.entities, args.rows)
+    with db.write_transaction() as conn:
+        network_edges.rebuild(conn)
+
+    def legacy():
+        # The structure NetworkAnalyzer kept before the CSR graph
+        graph, nodes = defaultdict(list), {}
+        for source, dest, amount, count in db.execute_query("""
+                SELECT source_entity, destination_entity, total_amount, transaction_count
+                FROM network_edges ORDER BY rowid"""):
+            graph[source].append((dest, amount, count))
+            if source not in nodes:
+                nodes[source] = NetworkNode(str(uuid.uuid4()), source, 'source')
+            if dest not in nodes:
+                nodes[dest] = NetworkNode(str(uuid.uuid4()), dest, 'destination')
+            nodes[source].out_degree += 1
+            nodes[dest].in_degree += 1
+        return graph, nodes
+
+    def measured(build):
+        # Memory still held once the build returns, query rows included
+        tracemalloc.start()
+        started = time.perf_counter()
+        result = build()
+        elapsed = time.perf_counter() - started
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return result, elapsed, size
+
+    (graph, nodes), legacy_s, legacy_bytes = measured(legacy)
+    csr, csr_s, csr_bytes = measured(lambda: TransactionGraph.from_db(db))
+    edge_count = csr.edge_count
+    print(f"{edge_count:,} edges, {csr.node_count:,} nodes")
+    print(f"dict of lists: {legacy_bytes / edge_count:7.1f} bytes/edge, built in {legacy_s:.2f}s")
+    print(f"CSR:           {csr_bytes / edge_count:7.1f} bytes/edge, built in {csr_s:.2f}s "
+          f"({csr.nbytes() / edge_count:.1f} bytes/edge in arrays, the rest is interned ids)")
+    print(f"Memory:        {legacy_bytes / csr_bytes:.1f}x smaller")
+
+    started = time.perf_counter()
+    old = {node_id: (node.in_degree + node.out_degree) *
+           (1 + np.log1p(sum(amount for _, amount, _ in graph[node_id])))
+           for node_id, node in nodes.items()}
+    legacy_s = time.perf_counter() - started
+    started = time.perf_counter()
+    new = csr.weighted_degree_centrality()
+    csr_s = time.perf_counter() - started
+    same = old.keys() == new.keys() and all(abs(old[k] - new[k]) <= 1e-9 * max(1, old[k]) for k in old)
+    print(f"Centrality:    dict {legacy_s * 1000:8.1f} ms | CSR {csr_s * 1000:7.1f} ms "
+          f"({legacy_s / csr_s:.0f}x, {'identical' if same else 'DIFFERENT'})")
+
+    analyzer = NetworkAnalyzer(db)
+    sample = random.sample(entity_ids, 200)
+    started = time.perf_counter()
+    for entity_id in sample:
+        analyzer.calculate_centrality(analyzer.build_network([entity_id]))
+    print(f"Per-entity:    build_network + centrality {(time.perf_counter() - started) / len(sample) * 1000:.2f} ms")
+    started = time.perf_counter()
+    chains = csr.subgraph(sample).find_chains()
+    print(f"Subgraph:      {len(sample)} entities -> chains in "
+          f"{(time.perf_counter() - started) * 1000:.1f} ms ({len(chains)} chains)")
+
+
+def bench_snapshot(args):
+    """Graph startup and build_network: network_edges queries vs the mapped snapshot"""
+    print_header(f"BENCHMARK: Graph snapshot, {args.entities:,} entities, {args.rows:,} transactions")
+    db = DatabaseManager(temp_db_path('snapshot.db'))
+    entity_ids, case_id = seed_transactions(db, args.entities, args.rows)
+    with db.write_transaction() as conn:
+        network_edges.rebuild(conn)
+    path = os.path.join(tempfile.mkdtemp(prefix='aml_bench_'), 'network.snap')
+
+    started = time.perf_counter()
+    full = TransactionGraph.from_db(db, dates=True)
+    print(f"Whole graph from SQL:  {time.perf_counter() - started:8.2f} s "
+          f"({full.edge_count:,} edges, every process pays this)")
+    started = time.perf_counter()
+    header = graph_snapshot.build(db, path)
+    print(f"Snapshot build:        {time.perf_counter() - started:8.2f} s "
+          f"({os.path.getsize(path) / 2**20:.1f} MiB, watermark {header['watermark']:,})")
+    started = time.perf_counter()
+    snapshot = graph_snapshot.GraphSnapshot(path)
+    print(f"Snapshot open:         {(time.perf_counter() - started) * 1000:8.2f} ms (zero copy)")
+
+    # Transactions after the watermark come from the overlay
+    case_mgr = CaseManager(db, EntityManager(db), None, None, None)
+    case_mgr.add_transactions_bulk(case_id, [
+        {'source_entity': src, 'destination_entity': dst, 'amount': round(random.uniform(1000, 100000), 2)}
+        for src, dst in (random.sample(entity_ids, 2) for _ in range(10000))])
+    print(f"Overlay:               {snapshot.pending_transactions(db):,} transactions since the snapshot")
+
+    sample = random.sample(entity_ids, min(args.requests, len(entity_ids)))
+    sql, mapped = NetworkAnalyzer(db), NetworkAnalyzer(db, path)
+    for label, analyzer in (('network_edges', sql), ('snapshot+delta', mapped)):
+        started = time.perf_counter()
+        for entity_id in sample:
+            analyzer.build_network([entity_id])
+        print(f"build_network, {label:15s} {(time.perf_counter() - started) / len(sample) * 1000:6.2f} ms/entity")
+    same = all(sql.build_network([e]).edge_count == mapped.build_network([e]).edge_count for e in sample)
+    started = time.perf_counter()
+    current = snapshot.graph_for(db)
+    print(f"Whole graph, overlaid: {time.perf_counter() - started:8.2f} s "
+          f"({current.edge_count:,} edges, per-entity edges {'match' if same else 'DIFFER'})")
+
+
+def synthetic_graph(nodes: int, edges: int, seed: int = 0) -> TransactionGraph:
+    """Random graph with heavy-tailed in-degree (hubs) built straight into CSR"""
+    rng = np.random.default_rng(seed)
+    src = rng.integers(0, nodes, edges)
+    dst = rng.permutation(nodes)[np.minimum((rng.pareto(1.1, edges) * nodes / 200).astype(np.int64),
+                                            nodes - 1)]
+    keep = src != dst
+    pairs = np.unique(src[keep] * nodes + dst[keep])
+    src, dst = (pairs // nodes).astype(np.int32), (pairs % nodes).astype(np.int32)
+    amounts = np.round(rng.lognormal(8, 1.5, len(pairs)), 2)
+    counts = rng.integers(1, 20, len(pairs)).astype(np.int32)
+    return TransactionGraph._from_codes([f"E{i}" for i in range(nodes)], src, dst, amounts, counts)
+
+
+def bench_centrality(args):
+    """PageRank, eigenvector and sampled betweenness on a synthetic graph, cold and warm"""
+    nodes = args.entities if args.entities != 100000 else 1000000
+    edges = args.rows if args.rows != 1000000 else 10000000
+    print_header(f"BENCHMARK: Centrality, {nodes:,} nodes x {edges:,} edges")
+    started = time.perf_counter()
+    graph = synthetic_graph(nodes, edges)
+    print(f"Graph:        {graph.edge_count:,} distinct edges in {time.perf_counter() - started:.1f}s, "
+          f"{graph.nbytes() / 2**20:.0f} MiB of CSR arrays")
+
+    results, info = centrality.compute(graph, samples=8, seed=1)
+    for name in ('pagerank', 'eigenvector'):
+        print(f"{name:12s}  cold: {info[name]['iterations']:3d} iterations, {info[name]['seconds']:6.2f}s "
+              f"({info[name]['seconds'] / info[name]['iterations'] * 1000:.0f} ms/iteration, "
+              f"{'converged' if info[name]['converged'] else 'NOT converged'})")
+    print(f"betweenness   8 sampled sources in {info['betweenness']['seconds']:.2f}s "
+          f"({info['betweenness']['seconds'] / 8:.2f}s per BFS)")
+
+    # A day later: 1% of edges changed amount; start from yesterday's vectors
+    rng = np.random.default_rng(2)
+    amounts = graph.amount.copy()
+    changed = rng.choice(len(amounts), len(amounts) // 100, replace=False)
+    amounts[changed] *= rng.uniform(0.5, 2.0, len(changed))
+    updated = TransactionGraph(graph.ids, graph.out_offsets, graph.targets, amounts, graph.count,
+                               graph.in_offsets, graph.in_edges, graph.chain_starts, index=graph.index)
+    for name, fn in (('pagerank', centrality.pagerank), ('eigenvector', centrality.eigenvector)):
+        started = time.perf_counter()
+        _, cold = fn(updated)
+        cold_s = time.perf_counter() - started
+        started = time.perf_counter()
+        _, warm = fn(updated, start=results[name])
+        warm_s = time.perf_counter() - started
+        print(f"{name:12s}  1% of edges changed: cold {cold['iterations']:3d} it / {cold_s:5.2f}s, "
+              f"warm {warm['iterations']:3d} it / {warm_s:5.2f}s")
+    print(f"Peak RSS:     {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10:.0f} MiB")
+
+
+def bench_subgraph(args):
+    """k-hop extraction around a hub: all edges via build_network vs bounded frontier"""
+    print_header(f"BENCHMARK: Subgraph, {args.entities:,} entities, {args.rows:,} transactions, "
+                 f"20% from one hub")
+    db = DatabaseManager(temp_db_path('subgraph.db'))
+    entity_ids, _ = seed_transactions(db, args.entities, args.rows, hub_share=0.2)
+    with db.write_transaction() as conn:
+        network_edges.rebuild(conn)
+    analyzer = NetworkAnalyzer(db)
+    hub = entity_ids[0]
+
+    started = time.perf_counter()
+    graph = analyzer.build_network([hub])
+    print(f"build_network(hub):        {graph.edge_count:7,} edges, "
+          f"{(time.perf_counter() - started) * 1000:8.1f} ms (1 hop, every edge)")
+
+    def stream(label, limits):
+        started, first, lines = time.perf_counter(), None, 0
+        for item in analyzer.expand_subgraph(hub, limits):
+            json.dumps(item)
+            lines += 1
+            first = first or time.perf_counter() - started
+        summary = item
+        print(f"{label:26s} {summary['edges']:7,} edges, {(time.perf_counter() - started) * 1000:8.1f} ms, "
+              f"first line {first * 1000:.2f} ms, {summary['nodes']:,} nodes, "
+              f"truncated: {summary['truncated']}")
+
+    stream("1 hop, no fan-out limit:", SubgraphLimits(hops=1, fan_out=10**6, max_nodes=10**6, max_edges=10**7))
+    stream("3 hops, fan_out 100:", SubgraphLimits(hops=3, fan_out=100))
+    stream("3 hops, > 90k, fan_out 50:", SubgraphLimits(hops=3, fan_out=50, min_amount=90000))
+    stream("3 hops, budget 20k nodes:", SubgraphLimits(hops=3, fan_out=1000, max_nodes=20000))
+
+
+def bench_clusters(args):
+    """Cluster of an entity: BFS over the whole graph vs the maintained union-find"""
+    print_header(f"BENCHMARK: Entity clusters, {args.entities:,} entities, {args.rows:,} transactions")
+    db = DatabaseManager(temp_db_path('clusters.db'))
+    entity_ids, case_id = seed_transactions(db, args.entities, args.rows)
+    with db.write_transaction() as conn:
+        network_edges.rebuild(conn)
+        started = time.perf_counter()
+        count = entity_clusters.rebuild(conn)
+    print(f"Rebuild (union-find over network_edges): {count:,} clusters in "
+          f"{time.perf_counter() - started:.2f}s")
+
+    # What answering "which cluster" took before: load the graph, walk it
+    started = time.perf_counter()
+    graph = NetworkAnalyzer(db).whole_network()
+    seen, queue = {0}, [0]
+    while queue:
+        node = queue.pop()
+        for following in np.concatenate([graph.successors(node), graph.predecessors(node)]).tolist():
+            if following not in seen:
+                seen.add(following)
+                queue.append(following)
+    bfs_s = time.perf_counter() - started
+
+    sample = random.sample(entity_ids, min(args.requests, len(entity_ids)))
+    entity_mgr = EntityManager(db)
+    started = time.perf_counter()
+    for entity_id in sample:
+        entity_mgr.get_cluster(entity_id)
+    lookup_ms = (time.perf_counter() - started) / len(sample) * 1000
+    print(f"Cluster of one entity:  BFS {bfs_s * 1000:9.1f} ms ({len(seen):,} nodes) | "
+          f"lookup {lookup_ms:.3f} ms ({bfs_s * 1000 / lookup_ms:,.0f}x)")
+
+    # Insert cost: what the insert path adds for 20,000 new transactions
+    deltas = {}
+    for _ in range(20000):
+        network_edges.record(deltas, *random.sample(entity_ids, 2), round(random.uniform(1000, 100000), 2),
+                             int(time.time()))
+    with db.write_transaction() as conn:
+        started = time.perf_counter()
+        network_edges.save(conn, deltas)
+        edges_s = time.perf_counter() - started
+        started = time.perf_counter()
+        entity_clusters.save(conn, deltas)
+        clusters_s = time.perf_counter() - started
+    print(f"Per transaction insert: network_edges upsert {edges_s / len(deltas) * 1e6:.0f} us | "
+          f"cluster union {clusters_s / len(deltas) * 1e6:.0f} us")
+    with db.connection() as conn:
+        report = entity_clusters.check(conn)
+    print(f"Check after inserts:    {report['mismatched']} mismatches over {report['checked']:,} clusters")
+
+
+BENCHMARKS = {
+    'pool': bench_pool,
+    'endpoints': bench_endpoints,
+    'indexes': bench_indexes,
+    'timestamps': bench_timestamps,
+    'bulk': bench_bulk,
+    'audit': bench_audit,
+    'readonly': bench_readonly,
+    'structuring': bench_structuring,
+    'roundtrip': bench_roundtrip,
+    'anomaly': bench_anomaly,
+    'analysis': bench_analysis,
+    'rules': bench_rules,
+    'edges': bench_edges,
+    'velocity': bench_velocity,
+    'model': bench_model,
+    'rollups': bench_rollups,
+    'graph': bench_graph,
+    'snapshot': bench_snapshot,
+    'centrality': bench_centrality,
+    'subgraph': bench_subgraph,
+    'clusters': bench_clusters,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AML System performance benchmarks")
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--entities', type=int, default=100000)
+    args = parser.parse_args(argv)
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == '__main__':
+    main()
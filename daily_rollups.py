@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Daily Per-Entity Rollups
+One `entity_daily_stats` row per entity and UTC day holding the day's
+transaction count, amount sum/min/max, incoming and outgoing counts and
+amounts, distinct counterparties in and out, and the count of transactions
+below SUB_THRESHOLD_AMOUNT. Every transaction insert upserts the rows of
+both parties in the same transaction, so windowed detectors read one row
+per day instead of every transaction in the window.
+
+A transaction counts once per entity it touches (a self-transfer once, as
+neither incoming nor outgoing). Rows without a transaction_ts are not
+rolled up, as no time window selects them.
+
+Usage:
+    python daily_rollups.py aml_system.db --rebuild
+    python daily_rollups.py aml_system.db --check [--sample 1000 | --all]
+"""
+
+import sys
+import json
+import random
+import logging
+import sqlite3
+import argparse
+from typing import Dict, List, Optional, Tuple
+
+from aml_time import SECONDS_PER_DAY
+
+logger = logging.getLogger(__name__)
+
+# The structuring reporting threshold (PatternDetector.detect_structuring's default)
+SUB_THRESHOLD_AMOUNT = 50000.0
+
+RollupKey = Tuple[str, int]
+
+ROLLUP_COLUMNS = ("txn_count, total_amount, min_amount, max_amount, in_count, in_amount, "
+                  "out_count, out_amount, counterparties_in, counterparties_out, sub_threshold_count")
+
+# Deltas add to the stored row; min/max only ever widen
+UPSERT_ROLLUP = f"""
+    INSERT INTO entity_daily_stats (entity_id, day, {ROLLUP_COLUMNS})
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(entity_id, day) DO UPDATE SET
+        txn_count = txn_count + excluded.txn_count,
+        total_amount = total_amount + excluded.total_amount,
+        min_amount = MIN(min_amount, excluded.min_amount),
+        max_amount = MAX(max_amount, excluded.max_amount),
+        in_count = in_count + excluded.in_count,
+        in_amount = in_amount + excluded.in_amount,
+        out_count = out_count + excluded.out_count,
+        out_amount = out_amount + excluded.out_amount,
+        counterparties_in = counterparties_in + excluded.counterparties_in,
+        counterparties_out = counterparties_out + excluded.counterparties_out,
+        sub_threshold_count = sub_threshold_count + excluded.sub_threshold_count
+"""
+
+# One event per (entity, transaction) side; a self-transfer is one event
+_EVENTS = """
+    SELECT source_entity AS entity_id, transaction_ts, COALESCE(amount, 0.0) AS amount,
+           0 AS incoming, source_entity IS NOT destination_entity AS outgoing,
+           CASE WHEN source_entity IS NOT destination_entity THEN destination_entity END AS counterparty
+    FROM transactions WHERE transaction_ts IS NOT NULL AND source_entity IS NOT NULL {source_filter}
+    UNION ALL
+    SELECT destination_entity, transaction_ts, COALESCE(amount, 0.0), 1, 0, source_entity
+    FROM transactions WHERE transaction_ts IS NOT NULL AND destination_entity IS NOT NULL
+        AND source_entity IS NOT destination_entity {destination_filter}
+"""
+
+AGGREGATE_TRANSACTIONS = """
+    SELECT entity_id, transaction_ts / 86400 AS day, COUNT(*) AS txn_count, SUM(amount) AS total_amount,
+           MIN(amount) AS min_amount, MAX(amount) AS max_amount,
+           SUM(incoming) AS in_count, SUM(CASE WHEN incoming THEN amount ELSE 0 END) AS in_amount,
+           SUM(outgoing) AS out_count, SUM(CASE WHEN outgoing THEN amount ELSE 0 END) AS out_amount,
+           COUNT(DISTINCT CASE WHEN incoming THEN counterparty END) AS counterparties_in,
+           COUNT(DISTINCT CASE WHEN outgoing THEN counterparty END) AS counterparties_out,
+           SUM(amount < {threshold}) AS sub_threshold_count
+    FROM ({events})
+    GROUP BY entity_id, day
+"""
+
+# Totals of an entity since a timestamp: whole days from the rollups, the
+# part of the first day inside the window from the transactions themselves
+WINDOW_TOTALS = """
+    SELECT COALESCE(SUM(txn_count), 0), COALESCE(SUM(total_amount), 0.0),
+           MIN(min_amount), MAX(max_amount),
+           COALESCE(SUM(in_count), 0), COALESCE(SUM(in_amount), 0.0),
+           COALESCE(SUM(out_count), 0), COALESCE(SUM(out_amount), 0.0),
+           COALESCE(SUM(sub_threshold_count), 0)
+    FROM (
+        SELECT txn_count, total_amount, min_amount, max_amount, in_count, in_amount,
+               out_count, out_amount, sub_threshold_count
+        FROM entity_daily_stats WHERE entity_id = ?1 AND day >= ?3
+        UNION ALL
+        SELECT 1, amount, amount, amount,
+               source_entity IS NOT ?1, CASE WHEN source_entity IS NOT ?1 THEN amount ELSE 0 END,
+               destination_entity IS NOT ?1, CASE WHEN destination_entity IS NOT ?1 THEN amount ELSE 0 END,
+               amount < ?4
+        FROM (SELECT source_entity, destination_entity, COALESCE(amount, 0.0) AS amount
+              FROM transactions
+              WHERE (source_entity = ?1 OR destination_entity = ?1)
+                AND transaction_ts >= ?2 AND transaction_ts < ?3 * 86400)
+    )
+"""
+
+WINDOW_FIELDS = ('txn_count', 'total_amount', 'min_amount', 'max_amount', 'in_count', 'in_amount',
+                 'out_count', 'out_amount', 'sub_threshold_count')
+
+
+def day_of(ts: int) -> int:
+    return ts // SECONDS_PER_DAY
+
+
+DAILY_ROWS = f"""
+    SELECT day, {ROLLUP_COLUMNS} FROM entity_daily_stats
+    WHERE entity_id = ? AND day >= ? ORDER BY day
+"""
+
+
+def window_query(entity_id: str, since: int, rollups: bool = True) -> Tuple[str, tuple]:
+    """(sql, params) of the entity's WINDOW_FIELDS over transaction_ts >= since,
+    exact for any window: cost is one row per day plus the transactions of the
+    window's first, partial day. For execute_query() on any connection.
+
+    With rollups=False (entity_daily_stats still being backfilled) every
+    transaction of the window is read instead.
+    """
+    first_full_day = -(-since // SECONDS_PER_DAY) if rollups else sys.maxsize // SECONDS_PER_DAY
+    return WINDOW_TOTALS, (entity_id, since, first_full_day, SUB_THRESHOLD_AMOUNT)
+
+
+def daily_query(entity_id: str, since_day: int, rollups: bool = True) -> Tuple[str, tuple]:
+    """(sql, params) of the entity's day, ROLLUP_COLUMNS rows from since_day on,
+    aggregated from the transactions when rollups=False
+    """
+    if rollups:
+        return DAILY_ROWS, (entity_id, since_day)
+    since = f"AND transaction_ts >= ?2 * {SECONDS_PER_DAY}"
+    events = _EVENTS.format(source_filter=f"AND source_entity = ?1 {since}",
+                            destination_filter=f"AND destination_entity = ?1 {since}")
+    return (f"SELECT day, {ROLLUP_COLUMNS} FROM ("
+            f"{AGGREGATE_TRANSACTIONS.format(threshold=SUB_THRESHOLD_AMOUNT, events=events)}) ORDER BY day",
+            (entity_id, since_day))
+
+
+def record(deltas: Dict[RollupKey, list], source: str, destination: str,
+           amount: float, ts: Optional[int]):
+    """Fold one transaction into the pending rollups of its parties' day.
+
+    A delta is [count, total, min, max, in_count, in_amount, out_count,
+    out_amount, set of counterparties in, set out, sub_threshold_count].
+    """
+    if ts is None:
+        return
+    day = day_of(ts)
+    # (entity, incoming, outgoing, counterparty) per side
+    if destination == source:
+        sides = [(source, False, False, None)]
+    else:
+        sides = [(source, False, True, destination), (destination, True, False, source)]
+    for entity_id, incoming, outgoing, counterparty in sides:
+        if not entity_id:
+            continue
+        delta = deltas.get((entity_id, day))
+        if delta is None:
+            delta = deltas[(entity_id, day)] = [0, 0.0, amount, amount, 0, 0.0, 0, 0.0,
+                                                set(), set(), 0]
+        delta[0] += 1
+        delta[1] += amount
+        delta[2] = min(delta[2], amount)
+        delta[3] = max(delta[3], amount)
+        if incoming:
+            delta[4] += 1
+            delta[5] += amount
+        if outgoing:
+            delta[6] += 1
+            delta[7] += amount
+        if counterparty:
+            delta[8 if incoming else 9].add(counterparty)
+        delta[10] += amount < SUB_THRESHOLD_AMOUNT
+
+
+def _pair_seen_on(conn: sqlite3.Connection, source: str, destination: str, day: int) -> bool:
+    """Whether a stored transaction source -> destination falls on `day`.
+
+    The pair's network_edges row answers unless the day lies strictly
+    inside its first/last span, i.e. for backdated transactions.
+    """
+    row = conn.execute("SELECT first_seen, last_seen FROM network_edges "
+                       "WHERE source_entity = ? AND destination_entity = ?",
+                       (source, destination)).fetchone()
+    start, end = day * SECONDS_PER_DAY, (day + 1) * SECONDS_PER_DAY
+    if row is None or row[0] is None or row[1] < start or row[0] >= end:
+        return False
+    if start <= row[0] < end or start <= row[1] < end:
+        return True
+    return conn.execute("""
+        SELECT 1 FROM transactions WHERE source_entity = ? AND transaction_ts >= ?
+        AND transaction_ts < ? AND destination_entity = ? LIMIT 1
+    """, (source, start, end, destination)).fetchone() is not None
+
+
+def save(conn: sqlite3.Connection, deltas: Dict[RollupKey, list]):
+    """Add pending deltas to the stored rollups; does not commit.
+
+    Must run before the same transactions reach the transactions and
+    network_edges tables: counterparties are new for the day if no stored
+    transaction already links the pair on it.
+    """
+    rows = []
+    for (entity_id, day), (count, total, low, high, in_count, in_amount, out_count, out_amount,
+                           parties_in, parties_out, below) in deltas.items():
+        new_in = sum(1 for party in parties_in if not _pair_seen_on(conn, party, entity_id, day))
+        new_out = sum(1 for party in parties_out if not _pair_seen_on(conn, entity_id, party, day))
+        rows.append((entity_id, day, count, total, low, high, in_count, in_amount,
+                     out_count, out_amount, new_in, new_out, below))
+    conn.executemany(UPSERT_ROLLUP, rows)
+
+
+def rebuild(conn: sqlite3.Connection, entity_ids: Optional[List[str]] = None) -> int:
+    """Replace rollups from the transactions table: every rollup, or those
+    of `entity_ids` only; does not commit
+    """
+    source_filter = destination_filter = ''
+    params: tuple = ()
+    if entity_ids is None:
+        conn.execute("DELETE FROM entity_daily_stats")
+    else:
+        placeholders = ','.join(f'?{i + 1}' for i in range(len(entity_ids)))
+        source_filter = f'AND source_entity IN ({placeholders})'
+        destination_filter = f'AND destination_entity IN ({placeholders})'
+        params = tuple(entity_ids)
+        conn.execute(f"DELETE FROM entity_daily_stats WHERE entity_id IN ({placeholders})", params)
+    cursor = conn.execute(f"""
+        INSERT INTO entity_daily_stats (entity_id, day, {ROLLUP_COLUMNS})
+        {AGGREGATE_TRANSACTIONS.format(threshold=SUB_THRESHOLD_AMOUNT, events=_EVENTS.format(
+            source_filter=source_filter, destination_filter=destination_filter))}
+    """, params)
+    logger.info(f"Rebuilt {cursor.rowcount} entity daily rollups")
+    return cursor.rowcount
+
+
+def check(conn: sqlite3.Connection, sample: Optional[int] = 1000,
+          tolerance: float = 1e-6) -> Dict:
+    """Compare stored rollups with rollups aggregated from transactions.
+
+    Checks every day of `sample` random entities, or every rollup with
+    sample=None.
+    """
+    columns = f"entity_id, day, {ROLLUP_COLUMNS}"
+    if sample is None:
+        expected = conn.execute(AGGREGATE_TRANSACTIONS.format(
+            threshold=SUB_THRESHOLD_AMOUNT,
+            events=_EVENTS.format(source_filter='', destination_filter=''))).fetchall()
+        stored = conn.execute(f"SELECT {columns} FROM entity_daily_stats").fetchall()
+    else:
+        entity_ids = [r[0] for r in conn.execute("SELECT entity_id FROM entities")]
+        entity_ids = random.sample(entity_ids, min(sample, len(entity_ids)))
+        expected, stored = [], []
+        events = _EVENTS.format(source_filter='AND source_entity = ?1',
+                                destination_filter='AND destination_entity = ?1')
+        for entity_id in entity_ids:
+            expected += conn.execute(AGGREGATE_TRANSACTIONS.format(
+                threshold=SUB_THRESHOLD_AMOUNT, events=events), (entity_id,)).fetchall()
+            stored += conn.execute(f"SELECT {columns} FROM entity_daily_stats WHERE entity_id = ?",
+                                   (entity_id,)).fetchall()
+
+    names = ROLLUP_COLUMNS.split(', ')
+    amounts = {'total_amount', 'min_amount', 'max_amount', 'in_amount', 'out_amount'}
+    expected = {(r[0], r[1]): r[2:] for r in expected}
+    stored = {(r[0], r[1]): r[2:] for r in stored}
+    mismatches = []
+    for key in sorted(set(expected) | set(stored)):
+        want, have = expected.get(key), stored.get(key)
+        if want is None or have is None:
+            problems = ['missing' if have is None else 'unexpected']
+        else:
+            problems = [name for name, a, b in zip(names, want, have)
+                        if (abs(a - b) > tolerance * max(1.0, abs(a)) if name in amounts else a != b)]
+        if problems:
+            mismatches.append({'entity_id': key[0], 'day': key[1], 'fields': problems})
+    return {'checked': len(set(expected) | set(stored)), 'mismatched': len(mismatches),
+            'mismatches': mismatches[:50]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the entity_daily_stats rollups")
+    parser.add_argument('db_path')
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument('--rebuild', action='store_true', help="recompute every rollup")
+    action.add_argument('--check', action='store_true', help="compare rollups with transactions")
+    parser.add_argument('--sample', type=int, default=1000, help="entities to check")
+    parser.add_argument('--all', action='store_true', help="check every rollup")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    # Opening the database applies pending migrations, entity_daily_stats included
+    from aml_system_v6_enhanced import DatabaseManager
+    db = DatabaseManager(args.db_path)
+
+    if args.rebuild:
+        with db.write_transaction() as conn:
+            count = rebuild(conn)
+        print(json.dumps({'rebuilt': count}))
+        return 0
+
+    with db.connection() as conn:
+        report = check(conn, None if args.all else args.sample)
+    print(json.dumps(report, indent=2))
+    return 0 if not report['mismatched'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Incrementally Maintained Entity Clusters
+Connected components of the transaction graph (direction ignored): every
+entity that has transacted has an `entity_clusters` row naming its cluster,
+and every cluster a `clusters` row with its size, transaction count, total
+flow and the highest risk_score among its members. A cluster's id is the
+entity_id of its representative.
+
+The stored cluster_id is a disjoint-set forest with every path already
+compressed: each entity points straight at its root. Each transaction insert
+unions its parties in the same write transaction, by size: the smaller
+cluster's members are relabelled to the larger's id, so an entity moves
+O(log n) times over its lifetime and reading an entity's cluster or a
+cluster's aggregates is two primary-key lookups. Components only merge, so
+deleting transactions needs a --rebuild, which runs union-find with path
+compression over network_edges.
+
+Usage:
+    python entity_clusters.py aml_system.db --rebuild
+    python entity_clusters.py aml_system.db --check
+"""
+
+import sys
+import json
+import logging
+import sqlite3
+import argparse
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CLUSTER_COLUMNS = "cluster_id, size, transaction_count, total_flow, max_risk"
+
+INSERT_MEMBER = "INSERT INTO entity_clusters (entity_id, cluster_id) VALUES (?, ?)"
+INSERT_CLUSTER = f"""
+    INSERT INTO clusters ({CLUSTER_COLUMNS}, updated_at)
+    VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+"""
+ADD_FLOW = """
+    UPDATE clusters SET transaction_count = transaction_count + ?, total_flow = total_flow + ?,
+                        updated_at = CURRENT_TIMESTAMP
+    WHERE cluster_id = ?
+"""
+MAX_MEMBER_RISK = """
+    SELECT COALESCE(MAX(e.risk_score), 0.0) FROM entity_clusters m
+    JOIN entities e ON e.entity_id = m.entity_id WHERE m.cluster_id = ?
+"""
+
+
+class DisjointSet:
+    """Union-find over 0..n-1: union by size, find with path compression"""
+
+    def __init__(self):
+        self.parent: List[int] = []
+        self.size: List[int] = []
+
+    def add(self) -> int:
+        self.parent.append(len(self.parent))
+        self.size.append(1)
+        return len(self.parent) - 1
+
+    def find(self, x: int) -> int:
+        parent = self.parent
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    def union(self, a: int, b: int) -> int:
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return a
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        return a
+
+
+# ===== INCREMENTAL =====
+
+def _risk(conn: sqlite3.Connection, entity_id: str) -> float:
+    row = conn.execute("SELECT risk_score FROM entities WHERE entity_id = ?", (entity_id,)).fetchone()
+    return float(row[0] or 0.0) if row else 0.0
+
+
+def _cluster_id(conn: sqlite3.Connection, entity_id: str) -> str:
+    """The entity's cluster, a new singleton one if it has none yet"""
+    row = conn.execute("SELECT cluster_id FROM entity_clusters WHERE entity_id = ?",
+                       (entity_id,)).fetchone()
+    if row is not None:
+        return row[0]
+    conn.execute(INSERT_MEMBER, (entity_id, entity_id))
+    conn.execute(INSERT_CLUSTER, (entity_id, 1, 0, 0.0, _risk(conn, entity_id)))
+    return entity_id
+
+
+def _merge(conn: sqlite3.Connection, a: str, b: str) -> str:
+    """Fold the smaller of two clusters into the larger; returns the survivor"""
+    rows = {row[0]: tuple(row) for row in conn.execute(
+        f"SELECT {CLUSTER_COLUMNS} FROM clusters WHERE cluster_id IN (?, ?)", (a, b))}
+    big, small = (a, b) if rows[a][1] >= rows[b][1] else (b, a)
+    _, size, count, flow, risk = rows[small]
+    conn.execute("UPDATE entity_clusters SET cluster_id = ? WHERE cluster_id = ?", (big, small))
+    conn.execute("""
+        UPDATE clusters SET size = size + ?, transaction_count = transaction_count + ?,
+                            total_flow = total_flow + ?, max_risk = MAX(max_risk, ?),
+                            updated_at = CURRENT_TIMESTAMP
+        WHERE cluster_id = ?
+    """, (size, count, flow, risk, big))
+    conn.execute("DELETE FROM clusters WHERE cluster_id = ?", (small,))
+    return big
+
+
+def _union(conn: sqlite3.Connection, source: str, destination: str) -> str:
+    cluster_id = _cluster_id(conn, source)
+    if destination != source:
+        other = _cluster_id(conn, destination)
+        if other != cluster_id:
+            cluster_id = _merge(conn, cluster_id, other)
+    return cluster_id
+
+
+def save(conn: sqlite3.Connection, edges: Dict[Tuple[str, str], list]):
+    """Union the parties of pending network_edges deltas ([count, total, ...]
+    per (source, destination)) and add their flow; does not commit.
+    """
+    for (source, destination), delta in edges.items():
+        conn.execute(ADD_FLOW, (delta[0], delta[1], _union(conn, source, destination)))
+
+
+def update_risk(conn: sqlite3.Connection, entity_id: str, old_risk: float, new_risk: float):
+    """Keep max_risk of the entity's cluster after its risk_score changed;
+    only lowering the member that held the maximum rescans the members.
+    """
+    row = conn.execute("""
+        SELECT c.cluster_id, c.max_risk FROM entity_clusters m
+        JOIN clusters c ON c.cluster_id = m.cluster_id WHERE m.entity_id = ?
+    """, (entity_id,)).fetchone()
+    if row is None:
+        return
+    cluster_id, max_risk = row[0], row[1]
+    if new_risk >= max_risk:
+        conn.execute("UPDATE clusters SET max_risk = ? WHERE cluster_id = ?", (new_risk, cluster_id))
+    elif (old_risk or 0.0) >= max_risk:
+        conn.execute(f"UPDATE clusters SET max_risk = ({MAX_MEMBER_RISK}) WHERE cluster_id = ?",
+                     (cluster_id, cluster_id))
+
+
+# ===== READS =====
+
+def cluster_of(db, entity_id: str) -> Optional[Dict]:
+    """Aggregates of the entity's cluster; None if it has never transacted"""
+    rows = db.execute_query(f"""
+        SELECT {', '.join('c.' + name for name in CLUSTER_COLUMNS.split(', '))}, c.updated_at
+        FROM entity_clusters m JOIN clusters c ON c.cluster_id = m.cluster_id
+        WHERE m.entity_id = ?
+    """, (entity_id,))
+    return dict(rows[0]) if rows else None
+
+
+def get_cluster(db, cluster_id: str) -> Optional[Dict]:
+    rows = db.execute_query(f"SELECT {CLUSTER_COLUMNS}, updated_at FROM clusters WHERE cluster_id = ?",
+                            (cluster_id,))
+    return dict(rows[0]) if rows else None
+
+
+def members(db, cluster_id: str, limit: int = 100) -> List[str]:
+    return [row[0] for row in db.execute_query(
+        "SELECT entity_id FROM entity_clusters WHERE cluster_id = ? ORDER BY entity_id LIMIT ?",
+        (cluster_id, limit))]
+
+
+# ===== REBUILD =====
+
+# Aggregates recomputed from the members and their outgoing edges
+SETTLE_CLUSTERS = """
+    UPDATE clusters SET
+        size = (SELECT COUNT(*) FROM entity_clusters m WHERE m.cluster_id = clusters.cluster_id),
+        (transaction_count, total_flow) = (
+            SELECT COALESCE(SUM(e.transaction_count), 0), COALESCE(SUM(e.total_amount), 0.0)
+            FROM entity_clusters m JOIN network_edges e ON e.source_entity = m.entity_id
+            WHERE m.cluster_id = clusters.cluster_id),
+        max_risk = (SELECT COALESCE(MAX(e.risk_score), 0.0) FROM entity_clusters m
+                    JOIN entities e ON e.entity_id = m.entity_id WHERE m.cluster_id = clusters.cluster_id)
+    WHERE {where}
+"""
+
+
+def link(conn: sqlite3.Connection, pairs: Iterable[Tuple[str, str]]):
+    """Union the parties of stored edges without adding their flow (rerunning
+    it is harmless); settle() then recomputes the aggregates. Does not commit.
+    """
+    for source, destination in pairs:
+        _union(conn, source, destination)
+
+
+def settle(conn: sqlite3.Connection, where: str, params: tuple = ()) -> int:
+    """Recompute the aggregates of the clusters `where` selects; does not commit"""
+    return conn.execute(SETTLE_CLUSTERS.format(where=where), params).rowcount
+
+
+def components(conn: sqlite3.Connection) -> Tuple[Dict[str, str], Dict[str, list]]:
+    """Union-find over every network_edges row: ({entity_id: cluster_id},
+    {cluster_id: [size, transaction_count, total_flow, max_risk]}).
+    """
+    index: Dict[str, int] = {}
+    ids: List[str] = []
+    forest = DisjointSet()
+    flows = []
+
+    def node(entity_id):
+        code = index.get(entity_id)
+        if code is None:
+            code = index[entity_id] = forest.add()
+            ids.append(entity_id)
+        return code
+
+    for source, destination, count, total in conn.execute(
+            "SELECT source_entity, destination_entity, transaction_count, total_amount FROM network_edges"):
+        a = node(source)
+        forest.union(a, node(destination))
+        flows.append((a, count, total))
+
+    risks = dict(conn.execute("SELECT entity_id, COALESCE(risk_score, 0.0) FROM entities"))
+    assignment = {entity_id: ids[forest.find(code)] for code, entity_id in enumerate(ids)}
+    aggregates: Dict[str, list] = {}
+    for entity_id, cluster_id in assignment.items():
+        totals = aggregates.setdefault(cluster_id, [0, 0, 0.0, 0.0])
+        totals[0] += 1
+        totals[3] = max(totals[3], float(risks.get(entity_id, 0.0)))
+    for code, count, total in flows:
+        totals = aggregates[assignment[ids[code]]]
+        totals[1] += count
+        totals[2] += total
+    return assignment, aggregates
+
+
+def rebuild(conn: sqlite3.Connection) -> int:
+    """Replace every cluster from network_edges; does not commit"""
+    # Delete first: it takes the write lock, so no insert commits between
+    # reading the edges and writing the clusters built from them
+    conn.execute("DELETE FROM entity_clusters")
+    conn.execute("DELETE FROM clusters")
+    assignment, aggregates = components(conn)
+    conn.executemany(INSERT_MEMBER, assignment.items())
+    conn.executemany(INSERT_CLUSTER, [(cluster_id, *totals) for cluster_id, totals in aggregates.items()])
+    logger.info(f"Rebuilt {len(aggregates)} clusters over {len(assignment)} entities")
+    return len(aggregates)
+
+
+def check(conn: sqlite3.Connection, tolerance: float = 1e-6) -> Dict:
+    """Compare the stored clusters with a union-find rebuild: same partition
+    of entities (cluster ids may differ) and same aggregates.
+    """
+    expected, totals = components(conn)
+    stored = dict(conn.execute("SELECT entity_id, cluster_id FROM entity_clusters"))
+    clusters = {row[0]: tuple(row)[1:] for row in conn.execute(f"SELECT {CLUSTER_COLUMNS} FROM clusters")}
+
+    mismatches = []
+    matched: Dict[str, str] = {}  # stored cluster_id -> rebuilt cluster_id
+    for entity_id in sorted(set(expected) | set(stored)):
+        want, have = expected.get(entity_id), stored.get(entity_id)
+        if want is None or have is None:
+            mismatches.append({'entity_id': entity_id, 'fields': ['missing' if have is None else 'unexpected']})
+        elif matched.setdefault(have, want) != want:
+            mismatches.append({'entity_id': entity_id, 'fields': ['partition']})
+    if len(set(matched.values())) != len(matched):
+        mismatches.append({'cluster_id': None, 'fields': ['partition']})
+
+    names = CLUSTER_COLUMNS.split(', ')[1:]
+    for cluster_id in sorted(set(clusters) | set(matched)):
+        want, have = totals.get(matched.get(cluster_id)), clusters.get(cluster_id)
+        if want is None or have is None:
+            problems = ['missing' if have is None else 'unexpected']
+        else:
+            problems = [name for name, a, b in zip(names, want, have)
+                        if abs(a - b) > tolerance * max(1.0, abs(a))]
+        if problems:
+            mismatches.append({'cluster_id': cluster_id, 'fields': problems})
+    return {'checked': len(clusters), 'entities': len(stored), 'mismatched': len(mismatches),
+            'mismatches': mismatches[:50]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the entity_clusters and clusters tables")
+    parser.add_argument('db_path')
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument('--rebuild', action='store_true',
+                        help="recompute every cluster (needed after transactions are deleted)")
+    action.add_argument('--check', action='store_true', help="compare clusters with a rebuild")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    # Opening the database applies pending migrations, the cluster tables included
+    from aml_system_v6_enhanced import DatabaseManager
+    db = DatabaseManager(args.db_path)
+
+    if args.rebuild:
+        with db.write_transaction() as conn:
+            count = rebuild(conn)
+        print(json.dumps({'rebuilt': count}))
+        return 0
+
+    with db.connection() as conn:
+        report = check(conn)
+    print(json.dumps(report, indent=2))
+    return 0 if not report['mismatched'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+Memory-Mapped Transaction Graph Snapshot
+Serializes the whole network_edges graph (sorted entity ids, CSR offsets,
+edge amounts/counts, first/last seen) into one binary file that
+NetworkAnalyzer maps read-only: every thread, and every process on the host,
+shares the same page-cached copy and opening it costs no parsing.
+
+File layout: MAGIC, <format version, header length> as two little-endian
+uint32, a JSON header (watermark, counts, section offsets/dtypes), then each
+array at a 64-byte aligned offset. The watermark is MAX(transactions.rowid)
+read in the same transaction as the edges; transactions above it are read
+incrementally into an in-memory per-pair overlay and merged at read time.
+Deleted transactions stay in the graph until the next snapshot.
+
+Usage:
+    python graph_snapshot.py build aml_system.db [--path models/graph/network.snap]
+    python graph_snapshot.py info [--path ...] [--db aml_system.db]
+"""
+
+import os
+import sys
+import mmap
+import json
+import time
+import struct
+import logging
+import argparse
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+import network_edges
+from transaction_graph import TransactionGraph, EDGE_QUERY
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'AMLGRAPH'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+PREAMBLE = struct.Struct('<II')  # format version, header length
+DEFAULT_SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                     'models', 'graph', 'network.snap')
+
+# Section name -> TransactionGraph attribute ('ids' is the sorted, encoded id table)
+SECTIONS = ('ids', 'out_offsets', 'targets', 'amount', 'count', 'in_offsets', 'in_edges',
+            'chain_starts', 'first_seen', 'last_seen')
+
+# New transactions since the last read; NOT INDEXED keeps SQLite on the rowid
+# range rather than an index that would walk the whole table
+DELTA_QUERY = """
+    SELECT rowid, source_entity, destination_entity, amount, transaction_ts
+    FROM transactions NOT INDEXED WHERE rowid > ? ORDER BY rowid
+"""
+
+
+# ===== ID TABLE =====
+
+class _SortedIds:
+    """Entity id by node number, decoded from the mapped fixed-width table"""
+
+    def __init__(self, encoded: np.ndarray):
+        self._encoded = encoded
+
+    def __len__(self) -> int:
+        return len(self._encoded)
+
+    def __getitem__(self, node: int) -> str:
+        return self._encoded[node].decode('utf-8')
+
+    def __iter__(self):
+        return (value.decode('utf-8') for value in self._encoded.tolist())
+
+
+class _SortedIndex:
+    """Node number by entity id: binary search over the sorted id table"""
+
+    def __init__(self, encoded: np.ndarray):
+        self._encoded = encoded
+
+    def get(self, entity_id: str, default=None) -> Optional[int]:
+        key = entity_id.encode('utf-8')
+        if len(key) > self._encoded.dtype.itemsize:
+            return default
+        node = int(np.searchsorted(self._encoded, key))
+        if node < len(self._encoded) and self._encoded[node] == key:
+            return node
+        return default
+
+    def __contains__(self, entity_id: str) -> bool:
+        return self.get(entity_id) is not None
+
+    def __getitem__(self, entity_id: str) -> int:
+        node = self.get(entity_id)
+        if node is None:
+            raise KeyError(entity_id)
+        return node
+
+
+# ===== WRITING =====
+
+def _read_edges(db, chunk_size: int) -> Tuple[int, List[str], Dict[str, np.ndarray]]:
+    """Watermark, ids in first-seen order and coded edge columns, read in one transaction"""
+    index: Dict[str, int] = {}
+    columns = {name: [] for name in ('src', 'dst', 'amount', 'count', 'first_seen', 'last_seen')}
+    with db.connection() as conn:
+        conn.execute("BEGIN")
+        try:
+            watermark = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM transactions").fetchone()[0]
+            cursor = conn.execute(EDGE_QUERY + " ORDER BY rowid")
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                src, dst = [], []
+                for row in rows:
+                    src.append(index.setdefault(row[0], len(index)))
+                    dst.append(index.setdefault(row[1], len(index)))
+                columns['src'].append(np.array(src, dtype=np.int32))
+                columns['dst'].append(np.array(dst, dtype=np.int32))
+                columns['amount'].append(np.array([r[2] or 0.0 for r in rows], dtype=np.float64))
+                columns['count'].append(np.array([r[3] for r in rows], dtype=np.int32))
+                for name, position in (('first_seen', 4), ('last_seen', 5)):
+                    columns[name].append(np.array(
+                        [np.nan if r[position] is None else r[position] for r in rows], dtype=np.float64))
+        finally:
+            conn.rollback()
+    empty = {'src': np.int32, 'dst': np.int32, 'amount': np.float64, 'count': np.int32,
+             'first_seen': np.float64, 'last_seen': np.float64}
+    return watermark, list(index), {name: np.concatenate(parts) if parts else np.zeros(0, empty[name])
+                                    for name, parts in columns.items()}
+
+
+def build(db, path: str = DEFAULT_SNAPSHOT_PATH, chunk_size: int = 100000) -> Dict:
+    """Write a snapshot of network_edges to `path` atomically; returns its header"""
+    started = time.perf_counter()
+    watermark, seen, columns = _read_edges(db, chunk_size)
+    # Renumber nodes in id order so the mapped table can be binary searched
+    encoded = [entity_id.encode('utf-8') for entity_id in seen]
+    by_id = sorted(range(len(seen)), key=encoded.__getitem__)
+    rank = np.empty(len(seen), dtype=np.int32)
+    rank[by_id] = np.arange(len(seen), dtype=np.int32)
+    ids = [seen[i] for i in by_id]
+    # Only the arrays are written, so skip building the id -> node dict
+    graph = TransactionGraph._from_codes(
+        ids, rank[columns['src']], rank[columns['dst']], columns['amount'], columns['count'],
+        columns['first_seen'], columns['last_seen'], index={})
+    width = max((len(value) for value in encoded), default=1)
+    arrays = {'ids': np.array([encoded[i] for i in by_id], dtype=f'S{width}')}
+    arrays.update((name, getattr(graph, name)) for name in SECTIONS[1:])
+
+    header = {'format': FORMAT_VERSION, 'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'watermark': watermark, 'nodes': graph.node_count, 'edges': graph.edge_count,
+              'sections': {}}
+    # Offsets depend on the header length, which depends on the offsets: reserve room
+    offset = 0
+    for name in SECTIONS:
+        header['sections'][name] = {'offset': offset, 'dtype': arrays[name].dtype.str,
+                                    'count': len(arrays[name])}
+        offset += -(-arrays[name].nbytes // ALIGNMENT) * ALIGNMENT
+    reserved = len(json.dumps(header)) + 32 * len(SECTIONS)
+    data_start = -(-(len(MAGIC) + PREAMBLE.size + reserved) // ALIGNMENT) * ALIGNMENT
+    for section in header['sections'].values():
+        section['offset'] += data_start
+    encoded_header = json.dumps(header).encode('utf-8')
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    pending = path + '.tmp'
+    with open(pending, 'wb') as f:
+        f.write(MAGIC + PREAMBLE.pack(FORMAT_VERSION, len(encoded_header)) + encoded_header)
+        for name in SECTIONS:
+            f.write(b'\0' * (header['sections'][name]['offset'] - f.tell()))
+            f.write(np.ascontiguousarray(arrays[name]).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    # Readers holding the old mapping keep it; new opens see the new file
+    os.replace(pending, path)
+    logger.info(f"Graph snapshot {path}: {graph.node_count:,} nodes, {graph.edge_count:,} edges "
+                f"up to rowid {watermark} in {time.perf_counter() - started:.1f}s")
+    return header
+
+
+# ===== READING =====
+
+def file_identity(path: str) -> Optional[Tuple[int, int]]:
+    """(inode, mtime) of the snapshot file, None when there is none"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+class GraphSnapshot:
+    """An opened snapshot: its header and a TransactionGraph over the mapping"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.identity = file_identity(path)
+        with open(path, 'rb') as f:
+            self._mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mapping[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a graph snapshot")
+        version, header_length = PREAMBLE.unpack_from(self._mapping, len(MAGIC))
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path} has snapshot format {version}, expected {FORMAT_VERSION}")
+        start = len(MAGIC) + PREAMBLE.size
+        self.header = json.loads(self._mapping[start:start + header_length].decode('utf-8'))
+        self.watermark = self.header['watermark']
+
+        arrays = {}
+        for name in SECTIONS:
+            section = self.header['sections'][name]
+            dtype = np.dtype(section['dtype'])
+            if section['offset'] + dtype.itemsize * section['count'] > len(self._mapping):
+                raise ValueError(f"{path} is truncated in section {name}")
+            # Zero copy: read-only views straight onto the mapped pages
+            arrays[name] = np.frombuffer(self._mapping, dtype=dtype, count=section['count'],
+                                         offset=section['offset'])
+        encoded = arrays.pop('ids')
+        self.graph = TransactionGraph(_SortedIds(encoded), index=_SortedIndex(encoded), **arrays)
+
+        # Overlay: per-pair [count, total, first, last] of rows past the watermark,
+        # read incrementally so each call only fetches what was inserted since
+        self._delta: Dict[Tuple[str, str], list] = {}
+        self._delta_touching: Dict[str, set] = defaultdict(set)
+        self._delta_rowid = self.watermark
+        self._delta_lock = threading.Lock()
+
+    def _refresh_delta(self, db):
+        """Fold transactions inserted since the last read into the overlay"""
+        for rowid, source, destination, amount, ts in db.execute_query(DELTA_QUERY, (self._delta_rowid,)):
+            if (source, destination) not in self._delta:
+                self._delta_touching[source].add((source, destination))
+                self._delta_touching[destination].add((source, destination))
+            network_edges.record(self._delta, source, destination, amount or 0.0, ts)
+            self._delta_rowid = rowid
+
+    def delta_rows(self, db, entity_ids: Optional[Iterable[str]] = None) -> List[tuple]:
+        """(source, destination, amount, count, first_seen, last_seen) totals of
+        the transactions after the watermark, optionally only the pairs
+        touching `entity_ids`.
+        """
+        with self._delta_lock:
+            self._refresh_delta(db)
+            if entity_ids is None:
+                pairs = list(self._delta)
+            else:
+                pairs = set()
+                for entity_id in entity_ids:
+                    pairs.update(self._delta_touching.get(entity_id, ()))
+            return [(source, destination, total, count, first, last)
+                    for (source, destination), (count, total, first, last)
+                    in ((pair, self._delta[pair]) for pair in pairs)]
+
+    def graph_for(self, db, entity_ids: Optional[Iterable[str]] = None) -> TransactionGraph:
+        """The current graph (or the edges touching `entity_ids`): snapshot plus delta"""
+        if entity_ids is None:
+            return self.graph.with_edges(self.delta_rows(db))
+        entity_ids = list(entity_ids)
+        rows = {(row[0], row[1]): row for row in
+                self.graph.edge_rows(self.graph.touching(entity_ids))}
+        for source, destination, amount, count, first, last in self.delta_rows(db, entity_ids):
+            first = np.nan if first is None else first
+            last = np.nan if last is None else last
+            base = rows.get((source, destination))
+            if base is not None:
+                amount, count = base[2] + amount, base[3] + count
+                first, last = float(np.fmin(base[4], first)), float(np.fmax(base[5], last))
+            rows[(source, destination)] = (source, destination, amount, count, first, last)
+        return TransactionGraph.from_rows(list(rows.values()), dates=True)
+
+    def pending_transactions(self, db) -> int:
+        """Transactions inserted since the snapshot (the delta overlay's size)"""
+        return db.execute_query("SELECT COUNT(*) FROM transactions WHERE rowid > ?",
+                                (self.watermark,))[0][0]
+
+    def describe(self) -> Dict:
+        return dict(self.header, path=self.path, bytes=len(self._mapping))
+
+
+def open_snapshot(path: str = DEFAULT_SNAPSHOT_PATH) -> Optional[GraphSnapshot]:
+    """The snapshot at `path`, or None (logged) when there is none or it cannot be read"""
+    try:
+        return GraphSnapshot(path)
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Graph snapshot not loaded: {e}")
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and inspect the memory-mapped graph snapshot")
+    parser.add_argument('--path', default=os.environ.get('AML_GRAPH_SNAPSHOT', DEFAULT_SNAPSHOT_PATH))
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_cmd = commands.add_parser('build', help="snapshot network_edges of a database")
+    build_cmd.add_argument('db_path')
+    info = commands.add_parser('info', help="describe the snapshot file")
+    info.add_argument('--db', help="also count transactions pending since the watermark")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    from aml_system_v6_enhanced import DatabaseManager
+
+    if args.command == 'build':
+        header = build(DatabaseManager(args.db_path), args.path)
+        print(json.dumps({k: v for k, v in header.items() if k != 'sections'}, indent=2))
+        return 0
+
+    snapshot = open_snapshot(args.path)
+    if snapshot is None:
+        print(json.dumps({'error': f"no readable snapshot at {args.path}"}))
+        return 1
+    description = snapshot.describe()
+    if args.db:
+        description['pending_transactions'] = snapshot.pending_transactions(DatabaseManager(args.db))
+    print(json.dumps(description, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
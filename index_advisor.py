@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Index Advisor for the AML SQLite databases
+Runs EXPLAIN QUERY PLAN over a registry of hot queries, reports full table
+scans and creates the composite indexes those queries need. The schema
+migrations build their indexes from RECOMMENDED_INDEXES, so a new entry
+also needs a migration that names it.
+
+Schemas:
+    v6 - aml_system_v6_enhanced.DatabaseManager (aml_system.db)
+    v9 - aml_system.Database (aml_multi_user.db)
+
+Usage:
+    python index_advisor.py aml_system.db --schema v6 [--apply]
+"""
+
+import sys
+import json
+import logging
+import sqlite3
+import argparse
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+import daily_rollups
+import entity_stats
+import subgraph
+import transaction_graph
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class HotQuery:
+    """A query on a request or detector hot path, with representative parameters"""
+    name: str
+    schema: str
+    sql: str
+    params: Tuple = ()
+    # Index-ordered scans that stop at a LIMIT are acceptable
+    bounded_scan: bool = False
+
+
+# ======================== HOT QUERY REGISTRY ========================
+
+HOT_QUERIES: List[HotQuery] = [
+    # ---- v6: detectors, risk scoring and case management ----
+    HotQuery('PatternDetector.detect_structuring', 'v6', """
+        SELECT amount FROM transactions
+        WHERE (source_entity = ? OR destination_entity = ?)
+        AND transaction_ts >= ?
+    """, ('E1', 'E1', 0)),
+    HotQuery('PatternDetector.detect_structuring.rollups', 'v6', daily_rollups.WINDOW_TOTALS,
+             daily_rollups.window_query('E1', 0)[1]),
+    HotQuery('EntityManager.get_activity.daily', 'v6', daily_rollups.DAILY_ROWS, ('E1', 0)),
+    HotQuery('PatternDetector.detect_round_tripping', 'v6', """
+        SELECT source_entity, destination_entity, amount, transaction_date
+        FROM transactions
+        WHERE (source_entity = ? OR destination_entity = ?)
+        AND transaction_ts >= ?
+        ORDER BY transaction_ts
+    """, ('E1', 'E1', 0)),
+    HotQuery('PatternDetector.detect_fan_in', 'v6', """
+        SELECT COUNT(*), SUM(total_amount)
+        FROM network_edges WHERE destination_entity = ?
+    """, ('E1',)),
+    HotQuery('PatternDetector.detect_fan_out', 'v6', """
+        SELECT COUNT(*), SUM(total_amount)
+        FROM network_edges WHERE source_entity = ?
+    """, ('E1',)),
+    HotQuery('NetworkAnalyzer.build_network.out', 'v6',
+             f"{transaction_graph.EDGE_QUERY} WHERE source_entity IN (?, ?)", ('E1', 'E2')),
+    HotQuery('NetworkAnalyzer.build_network.in', 'v6',
+             f"{transaction_graph.EDGE_QUERY} WHERE destination_entity IN (?, ?)", ('E1', 'E2')),
+    HotQuery('NetworkAnalyzer.expand_subgraph.out', 'v6', subgraph.QUERIES['out'],
+             ('E1', 0, None, None, None, None, 100)),
+    HotQuery('NetworkAnalyzer.expand_subgraph.in', 'v6', subgraph.QUERIES['in'],
+             ('E1', 0, None, None, None, None, 100)),
+    # Until the network_edges backfill (migration 8) has finished
+    HotQuery('PatternDetector.detect_fan_in.backfill', 'v6', """
+        SELECT COUNT(DISTINCT source_entity), SUM(amount)
+        FROM transactions WHERE destination_entity = ? AND source_entity IS NOT NULL
+    """, ('E1',)),
+    HotQuery('PatternDetector.detect_fan_out.backfill', 'v6', """
+        SELECT COUNT(DISTINCT destination_entity), SUM(amount)
+        FROM transactions WHERE source_entity = ? AND destination_entity IS NOT NULL
+    """, ('E1',)),
+    HotQuery('NetworkAnalyzer.build_network.backfill', 'v6', transaction_graph.TRANSACTION_EDGE_QUERY.format(
+        where="AND destination_entity IN (?, ?)"), ('E1', 'E2')),
+    HotQuery('NetworkAnalyzer.expand_subgraph.backfill', 'v6', subgraph.TRANSACTION_QUERIES['in'],
+             ('E1', 0, None, None, None, None, 100)),
+    HotQuery('RiskScorer.score_entity', 'v6', """
+        SELECT txn_count FROM entity_stats WHERE entity_id = ?
+    """, ('E1',)),
+    HotQuery('CaseManager.add_transaction_to_case.entity_stats', 'v6', f"""
+        SELECT {entity_stats.STATS_COLUMNS} FROM entity_stats WHERE entity_id IN (?, ?)
+    """, ('E1', 'E2')),
+    # Until the entity_stats backfill (migration 6) has finished
+    HotQuery('RiskScorer.score_entity.backfill', 'v6', """
+        SELECT COUNT(*) FROM transactions WHERE source_entity = ? OR destination_entity = ?
+    """, ('E1', 'E1')),
+    HotQuery('entity_stats.replay', 'v6', """
+        SELECT source_entity, destination_entity, amount, transaction_ts
+        FROM transactions WHERE source_entity IN (?1, ?2) OR destination_entity IN (?1, ?2)
+        ORDER BY rowid
+    """, ('E1', 'E2')),
+    HotQuery('VelocityMonitor.rebuild', 'v6', """
+        SELECT source_entity, destination_entity, amount, transaction_ts
+        FROM transactions WHERE transaction_ts >= ?
+        ORDER BY transaction_ts
+    """, (0,)),
+    HotQuery('CaseManager.analyze_case.anomalies', 'v6', """
+        SELECT * FROM anomaly_scores WHERE transaction_id IN
+        (SELECT transaction_id FROM transactions WHERE case_id = ?)
+    """, ('C1',)),
+    HotQuery('CaseManager.list_cases.by_status', 'v6', """
+        SELECT * FROM aml_cases WHERE status = ? ORDER BY created_at DESC LIMIT ?
+    """, ('open', 100)),
+    HotQuery('CaseManager.list_cases', 'v6', """
+        SELECT * FROM aml_cases ORDER BY updated_at DESC LIMIT ?
+    """, (100,), bounded_scan=True),
+
+    # ---- v9: multi-user dashboard, audit trail and enquiries ----
+    HotQuery('CaseManager.list_user_cases', 'v9', """
+        SELECT * FROM cases WHERE user_id = ? ORDER BY created_at DESC
+    """, ('U1',)),
+    HotQuery('analytics_dashboard.status_breakdown', 'v9', """
+        SELECT status, COUNT(*) as count FROM cases
+        WHERE user_id = ? GROUP BY status
+    """, ('U1',)),
+    HotQuery('analytics_dashboard.recent_activity', 'v9', """
+        SELECT * FROM audit_trail WHERE user_id = ?
+        ORDER BY timestamp DESC LIMIT 10
+    """, ('U1',)),
+    HotQuery('AuditTrail.get_trace_history', 'v9', """
+        SELECT * FROM audit_trail WHERE entity_id = ? AND entity_type = ?
+        ORDER BY timestamp ASC
+    """, ('X1', 'CASE')),
+    HotQuery('EnquiryManager.list_user_enquiries', 'v9', """
+        SELECT * FROM enquiries WHERE user_id = ? ORDER BY created_at DESC
+    """, ('U1',)),
+    HotQuery('EnquiryManager.get_statistics', 'v9', """
+        SELECT status, COUNT(*) as count FROM enquiries
+        WHERE user_id = ? AND status != 'DELETED' GROUP BY status
+    """, ('U1',)),
+    HotQuery('list_transactions', 'v9', """
+        SELECT * FROM transactions WHERE case_id = ? ORDER BY date DESC
+    """, ('C1',)),
+    HotQuery('generate_report.latest_assessment', 'v9', """
+        SELECT * FROM assessments WHERE case_id = ? ORDER BY created_at DESC LIMIT 1
+    """, ('C1',)),
+    HotQuery('assess_case.files', 'v9', """
+        SELECT filepath FROM files WHERE case_id = ? LIMIT 10
+    """, ('C1',)),
+    HotQuery('get_compliance', 'v9', """
+        SELECT * FROM compliance WHERE case_id = ?
+    """, ('C1',)),
+]
+
+# Composite indexes serving the registry: (index_name, table, columns)
+RECOMMENDED_INDEXES: Dict[str, List[Tuple[str, str, Tuple[str, ...]]]] = {
+    'v6': [
+        ('idx_transactions_source_ts', 'transactions',
+         ('source_entity', 'transaction_ts')),
+        ('idx_transactions_dest_ts', 'transactions',
+         ('destination_entity', 'transaction_ts')),
+        ('idx_transactions_ts', 'transactions', ('transaction_ts',)),
+        ('idx_anomaly_scores_txn', 'anomaly_scores', ('transaction_id',)),
+        ('idx_cases_status_created', 'aml_cases', ('status', 'created_at')),
+        ('idx_cases_updated', 'aml_cases', ('updated_at',)),
+        # Covering: a node's heaviest edges without touching the table
+        ('idx_network_edges_source_amount', 'network_edges',
+         ('source_entity', 'total_amount', 'destination_entity',
+          'transaction_count', 'first_seen', 'last_seen')),
+        ('idx_network_edges_destination_amount', 'network_edges',
+         ('destination_entity', 'total_amount', 'source_entity',
+          'transaction_count', 'first_seen', 'last_seen')),
+    ],
+    'v9': [
+        ('idx_cases_user_created', 'cases', ('user_id', 'created_at')),
+        ('idx_audit_user_time', 'audit_trail', ('user_id', 'timestamp')),
+        ('idx_audit_entity_time', 'audit_trail', ('entity_id', 'timestamp')),
+        ('idx_enquiries_user_created', 'enquiries', ('user_id', 'created_at')),
+        ('idx_transactions_case_date', 'transactions', ('case_id', 'date')),
+        ('idx_assessments_case_created', 'assessments', ('case_id', 'created_at')),
+        ('idx_files_case', 'files', ('case_id',)),
+        ('idx_compliance_case', 'compliance', ('case_id',)),
+    ],
+}
+
+
+def index_sql(name: str, table: str, columns: Tuple[str, ...]) -> str:
+    return f"CREATE INDEX IF NOT EXISTS {name} ON {table}({', '.join(columns)})"
+
+
+# ======================== ADVISOR ========================
+
+
+class IndexAdvisor:
+    """Explain the hot queries of one schema and create the indexes they need"""
+
+    def __init__(self, conn: sqlite3.Connection, schema: str):
+        if schema not in RECOMMENDED_INDEXES:
+            raise ValueError(f"Unknown schema: {schema}")
+        self.conn = conn
+        self.schema = schema
+
+    def hot_queries(self) -> List[HotQuery]:
+        return [q for q in HOT_QUERIES if q.schema == self.schema]
+
+    def explain(self, sql: str, params: Tuple = ()) -> List[str]:
+        """Return the EXPLAIN QUERY PLAN detail lines for a query"""
+        rows = self.conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        return [row[3] for row in rows]
+
+    @staticmethod
+    def full_scans(plan: List[str], bounded_scan: bool = False) -> List[str]:
+        # Scans of a subquery's or CTE's own rows read no table
+        scans = [line for line in plan if line.startswith('SCAN')
+                 and 'CONSTANT ROW' not in line and 'subquery' not in line]
+        if bounded_scan:
+            scans = [line for line in scans if 'USING' not in line]
+        return scans
+
+    def analyze(self) -> List[Dict]:
+        """Plan every registered hot query and flag the ones that scan"""
+        report = []
+        for query in self.hot_queries():
+            try:
+                plan = self.explain(query.sql, query.params)
+            except sqlite3.Error as e:
+                report.append({'query': query.name, 'error': str(e)})
+                continue
+            scans = self.full_scans(plan, query.bounded_scan)
+            report.append({
+                'query': query.name,
+                'plan': plan,
+                'scans': scans,
+                'ok': not scans
+            })
+        return report
+
+    def existing_indexes(self) -> set:
+        rows = self.conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index'").fetchall()
+        return {row[0] for row in rows}
+
+    def missing_indexes(self) -> List[Tuple[str, str, Tuple[str, ...]]]:
+        existing = self.existing_indexes()
+        return [idx for idx in RECOMMENDED_INDEXES[self.schema] if idx[0] not in existing]
+
+    def create_missing_indexes(self, analyze: bool = False) -> List[str]:
+        """Create every recommended index that does not exist yet"""
+        created = []
+        for name, table, columns in self.missing_indexes():
+            self.conn.execute(index_sql(name, table, columns))
+            created.append(name)
+            logger.info(f"Created index {name} on {table}({', '.join(columns)})")
+        if analyze and created:
+            # Refresh planner statistics so the new indexes are costed correctly
+            self.conn.execute("ANALYZE")
+        self.conn.commit()
+        return created
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AML hot-query index advisor")
+    parser.add_argument('db_path')
+    parser.add_argument('--schema', choices=sorted(RECOMMENDED_INDEXES), required=True)
+    parser.add_argument('--apply', action='store_true',
+                        help="create the missing indexes, then re-run the report")
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.db_path)
+    advisor = IndexAdvisor(conn, args.schema)
+    output = {'before': advisor.analyze(),
+              'missing_indexes': [idx[0] for idx in advisor.missing_indexes()]}
+    if args.apply:
+        output['created'] = advisor.create_missing_indexes(analyze=True)
+        output['after'] = advisor.analyze()
+    conn.close()
+
+    print(json.dumps(output, indent=2))
+    scans_left = output.get('after', output['before'])
+    return 1 if any(not r.get('ok', False) for r in scans_left) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+Streaming Transaction Ingest - AML System v6.0 Enhanced
+Loads CSV or JSON-lines files of entities and transactions into aml_system.db
+through a generator pipeline, so memory stays bounded however large the file.
+
+Transaction rows name their parties either by entity id (source_entity,
+destination_entity) or by CNIC (source_cnic, destination_cnic, with optional
+source_name/destination_name/source_type/destination_type). Unknown CNICs are
+created as entities on the fly. Other recognised columns: amount, currency,
+transaction_date, transaction_type, description.
+
+Progress is checkpointed in ingest_checkpoints after every committed batch;
+re-running the same command resumes where it stopped.
+
+Usage:
+    python ingest_transactions.py transactions.csv --case-id CASE_ID
+    python ingest_transactions.py data.jsonl --case-title "Bank extract" \\
+        --entities entities.csv --batch-size 5000 --score
+    python ingest_transactions.py --score-only --case-id CASE_ID
+    python ingest_transactions.py --rescore [--case-id CASE_ID]
+"""
+
+import os
+import csv
+import sys
+import json
+import time
+import uuid
+import logging
+import argparse
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from aml_system_v6_enhanced import (DatabaseManager, EntityManager, PatternDetector,
+                                    NetworkAnalyzer, RiskScorer, CaseManager)
+
+logger = logging.getLogger(__name__)
+
+TRANSACTION_FIELDS = ('amount', 'currency', 'transaction_date', 'transaction_type',
+                      'description', 'source_entity', 'destination_entity')
+
+
+# ======================== READERS ========================
+
+
+def detect_format(path: str) -> str:
+    return 'jsonl' if path.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def read_records(path: str, fmt: str, offset: int = 0) -> Iterator[Tuple[Dict, int]]:
+    """Yield (record, byte offset just past it), starting at `offset`.
+
+    The file is read line by line in binary mode so the offset of every
+    record is exact; CSV records that span lines are handled by feeding the
+    lines to csv.reader one at a time.
+    """
+    with open(path, 'rb') as f:
+        header = None
+        if fmt == 'csv':
+            header_line = f.readline().decode('utf-8-sig')
+            header = next(csv.reader([header_line]))
+            offset = max(offset, f.tell())
+        f.seek(offset)
+
+        position = [offset]
+
+        def lines():
+            while True:
+                line = f.readline()
+                if not line:
+                    return
+                position[0] = f.tell()
+                yield line.decode('utf-8')
+
+        if fmt == 'jsonl':
+            for line in lines():
+                if line.strip():
+                    try:
+                        record = json.loads(line)
+                    except ValueError as e:
+                        record = {'_error': f"Invalid JSON: {e}"}
+                    yield record, position[0]
+        else:
+            for values in csv.reader(lines()):
+                if values:
+                    yield dict(zip(header, values)), position[0]
+
+
+def batched(records: Iterator[Tuple[Dict, int]], size: int) -> Iterator[List[Tuple[Dict, int]]]:
+    batch = []
+    for item in records:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ======================== ENTITY RESOLUTION ========================
+
+
+class EntityResolver:
+    """Map CNIC numbers to entity ids, creating missing entities.
+
+    Keeps an LRU cache of recent CNICs; misses are looked up with one
+    IN (...) query per batch and created with one executemany.
+    """
+
+    def __init__(self, cache_size: int = 100000):
+        self.cache_size = cache_size
+        self.cache: 'OrderedDict[str, str]' = OrderedDict()
+        self.created = 0
+
+    def _remember(self, cnic: str, entity_id: str):
+        self.cache[cnic] = entity_id
+        self.cache.move_to_end(cnic)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def resolve(self, conn, entities: Dict[str, Dict]) -> Dict[str, str]:
+        """Return {cnic: entity_id} for `entities` ({cnic: attributes})"""
+        resolved = {}
+        missing = []
+        for cnic in entities:
+            if cnic in self.cache:
+                self.cache.move_to_end(cnic)
+                resolved[cnic] = self.cache[cnic]
+            else:
+                missing.append(cnic)
+
+        for start in range(0, len(missing), 500):
+            chunk = missing[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            for entity_id, cnic in conn.execute(
+                    f"SELECT entity_id, cnic_number FROM entities "
+                    f"WHERE cnic_number IN ({placeholders})", chunk):
+                resolved[cnic] = entity_id
+
+        new_rows = []
+        for cnic in missing:
+            if cnic in resolved:
+                continue
+            attrs = entities[cnic]
+            entity_id = str(uuid.uuid4())
+            resolved[cnic] = entity_id
+            new_rows.append((entity_id, attrs.get('name') or cnic,
+                             attrs.get('entity_type') or 'person', cnic,
+                             _flag(attrs.get('pep_flag')), _flag(attrs.get('sanctions_flag')),
+                             json.dumps({'source': 'ingest'})))
+        if new_rows:
+            conn.executemany("""
+                INSERT INTO entities (entity_id, name, entity_type, cnic_number,
+                                      pep_flag, sanctions_flag, metadata)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, new_rows)
+            self.created += len(new_rows)
+
+        for cnic in missing:
+            self._remember(cnic, resolved[cnic])
+        return resolved
+
+
+def _flag(value) -> bool:
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y')
+
+
+def party_entities(record: Dict) -> Dict[str, Dict]:
+    """The CNIC-identified parties of a transaction record"""
+    parties = {}
+    for side in ('source', 'destination'):
+        cnic = (record.get(f'{side}_cnic') or '').strip()
+        if cnic and not record.get(f'{side}_entity'):
+            parties[cnic] = {'name': record.get(f'{side}_name'),
+                             'entity_type': record.get(f'{side}_type')}
+    return parties
+
+
+def to_transaction(record: Dict, cnic_ids: Dict[str, str]) -> Dict:
+    """Normalise a raw record into the add_transactions_bulk row shape"""
+    if '_error' in record:
+        return record
+    row = {key: record[key] for key in TRANSACTION_FIELDS
+           if record.get(key) not in (None, '')}
+    for side in ('source', 'destination'):
+        cnic = (record.get(f'{side}_cnic') or '').strip()
+        if cnic and not row.get(f'{side}_entity'):
+            row[f'{side}_entity'] = cnic_ids[cnic]
+    return row
+
+
+# ======================== INGEST ========================
+
+
+class TransactionIngester:
+    """Stream a file into one case in committed, checkpointed batches"""
+
+    def __init__(self, db: DatabaseManager, case_mgr: CaseManager, batch_size: int = 5000,
+                 entity_cache_size: int = 100000, progress_interval: float = 5.0,
+                 rejects_path: Optional[str] = None):
+        self.db = db
+        self.case_mgr = case_mgr
+        self.batch_size = batch_size
+        self.resolver = EntityResolver(entity_cache_size)
+        self.progress_interval = progress_interval
+        self.rejects_path = rejects_path
+
+    @staticmethod
+    def source_key(path: str) -> str:
+        return os.path.realpath(path)
+
+    def get_checkpoint(self, path: str) -> Optional[Dict]:
+        rows = self.db.execute_query(
+            "SELECT * FROM ingest_checkpoints WHERE source = ?", (self.source_key(path),))
+        return dict(rows[0]) if rows else None
+
+    def clear_checkpoint(self, path: str):
+        self.db.execute_update(
+            "DELETE FROM ingest_checkpoints WHERE source = ?", (self.source_key(path),))
+
+    def load_entities(self, path: str) -> int:
+        """Resolve or create every entity in an entities file (idempotent)"""
+        fmt = detect_format(path)
+        count = 0
+        for batch in batched(read_records(path, fmt), self.batch_size):
+            entities = {}
+            for record, _ in batch:
+                cnic = (record.get('cnic_number') or '').strip()
+                if cnic:
+                    entities[cnic] = record
+            with self.db.write_transaction() as conn:
+                self.resolver.resolve(conn, entities)
+            count += len(entities)
+        logger.info(f"Resolved {count} entities from {path} ({self.resolver.created} created)")
+        return count
+
+    def ingest(self, path: str, case_id: str, score_anomalies: bool = False) -> Dict:
+        """Load a transactions file, resuming from its checkpoint if there is one"""
+        source = self.source_key(path)
+        checkpoint = self.get_checkpoint(path)
+        if checkpoint and checkpoint['case_id'] != case_id:
+            raise ValueError(f"{path} was being loaded into case {checkpoint['case_id']}; "
+                             f"use --restart to load it into {case_id}")
+        if checkpoint and checkpoint['status'] == 'complete':
+            logger.info(f"{path} already loaded ({checkpoint['rows_inserted']} rows)")
+            return checkpoint
+
+        offset = checkpoint['byte_offset'] if checkpoint else 0
+        rows_read = checkpoint['rows_read'] if checkpoint else 0
+        inserted = checkpoint['rows_inserted'] if checkpoint else 0
+        failed = checkpoint['rows_failed'] if checkpoint else 0
+        if checkpoint:
+            logger.info(f"Resuming {path} at row {rows_read} (byte {offset})")
+
+        started = time.perf_counter()
+        session_rows = 0
+        last_report = started
+        rejects = open(self.rejects_path, 'a', encoding='utf-8') if self.rejects_path else None
+
+        try:
+            for batch in batched(read_records(path, detect_format(path), offset), self.batch_size):
+                with self.db.write_transaction() as conn:
+                    parties = {}
+                    for record, _ in batch:
+                        if '_error' not in record:
+                            parties.update(party_entities(record))
+                    cnic_ids = self.resolver.resolve(conn, parties)
+
+                    rows = [(rows_read + i, to_transaction(record, cnic_ids))
+                            for i, (record, _) in enumerate(batch)]
+                    valid = [(i, row) for i, row in rows if '_error' not in row]
+                    results = self.case_mgr.insert_transaction_batch(
+                        conn, case_id, valid, score_anomalies=score_anomalies)
+                    errors = [(i, row['_error']) for i, row in rows if '_error' in row]
+                    errors += [(r['row'], r['error']) for r in results if not r['success']]
+
+                    rows_read += len(batch)
+                    inserted += len(results) - sum(1 for r in results if not r['success'])
+                    failed += len(errors)
+                    offset = batch[-1][1]
+                    conn.execute("""
+                        INSERT OR REPLACE INTO ingest_checkpoints
+                        (source, case_id, byte_offset, rows_read, rows_inserted, rows_failed,
+                         status, updated_at)
+                        VALUES (?, ?, ?, ?, ?, ?, 'running', CURRENT_TIMESTAMP)
+                    """, (source, case_id, offset, rows_read, inserted, failed))
+
+                if rejects:
+                    for index, error in errors:
+                        rejects.write(json.dumps({'row': index, 'error': error}) + '\n')
+                elif errors:
+                    logger.warning(f"{len(errors)} rows rejected, first: row {errors[0][0]}: "
+                                   f"{errors[0][1]}")
+
+                session_rows += len(batch)
+                now = time.perf_counter()
+                if now - last_report >= self.progress_interval:
+                    logger.info(f"{rows_read:,} rows read, {inserted:,} inserted, "
+                                f"{session_rows / (now - started):,.0f} rows/sec")
+                    last_report = now
+        finally:
+            if rejects:
+                rejects.close()
+
+        self.db.execute_update(
+            "UPDATE ingest_checkpoints SET status = 'complete', updated_at = CURRENT_TIMESTAMP "
+            "WHERE source = ?", (source,))
+        elapsed = time.perf_counter() - started
+        return {
+            'source': source,
+            'case_id': case_id,
+            'rows_read': rows_read,
+            'rows_inserted': inserted,
+            'rows_failed': failed,
+            'entities_created': self.resolver.created,
+            'elapsed_seconds': round(elapsed, 2),
+            'rows_per_second': round(session_rows / elapsed, 1) if elapsed > 0 else None
+        }
+
+
+def build_case_manager(db: DatabaseManager) -> CaseManager:
+    pattern_detector = PatternDetector(db)
+    network_analyzer = NetworkAnalyzer(db)
+    return CaseManager(db, EntityManager(db), pattern_detector,
+                       RiskScorer(db, pattern_detector, network_analyzer), network_analyzer)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream CSV/JSONL transactions into a case")
+    parser.add_argument('path', nargs='?', help="transactions file (.csv or .jsonl)")
+    parser.add_argument('--db', default='aml_system.db')
+    parser.add_argument('--case-id', help="existing case to load into")
+    parser.add_argument('--case-title', help="create a new case with this title")
+    parser.add_argument('--entities', help="entities file (.csv or .jsonl) keyed by cnic_number")
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--entity-cache', type=int, default=100000,
+                        help="CNICs kept in the in-memory resolution cache")
+    parser.add_argument('--rejects', help="append rejected rows to this JSONL file")
+    parser.add_argument('--inline-scores', action='store_true',
+                        help="score anomalies while loading (slower)")
+    parser.add_argument('--score', action='store_true',
+                        help="run the deferred anomaly pass after loading")
+    parser.add_argument('--score-only', action='store_true',
+                        help="only run the deferred anomaly pass")
+    parser.add_argument('--rescore', action='store_true',
+                        help="only recompute every anomaly score (of --case-id if given), "
+                             "e.g. after a threshold change")
+    parser.add_argument('--restart', action='store_true',
+                        help="ignore any checkpoint and load the file from the start")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    db = DatabaseManager(args.db)
+    case_mgr = build_case_manager(db)
+
+    if args.rescore:
+        rescored = case_mgr.rescore_transactions(args.case_id)
+        print(json.dumps({'rescored': rescored}, indent=2))
+        return 0
+    if args.score_only:
+        scored = case_mgr.score_unscored_transactions(args.case_id)
+        print(json.dumps({'scored': scored}, indent=2))
+        return 0
+    if not args.path:
+        parser.error("a transactions file is required unless --score-only or --rescore is given")
+
+    ingester = TransactionIngester(db, case_mgr, args.batch_size, args.entity_cache,
+                                   rejects_path=args.rejects)
+    if args.restart:
+        ingester.clear_checkpoint(args.path)
+
+    case_id = args.case_id
+    checkpoint = ingester.get_checkpoint(args.path)
+    if not case_id and checkpoint:
+        case_id = checkpoint['case_id']
+    if not case_id:
+        if not args.case_title:
+            parser.error("--case-id or --case-title is required")
+        success, message, case_id = case_mgr.create_case({'title': args.case_title})
+        if not success:
+            print(message, file=sys.stderr)
+            return 1
+    elif not case_mgr.get_case(case_id):
+        print(f"Case not found: {case_id}", file=sys.stderr)
+        return 1
+
+    if args.entities:
+        ingester.load_entities(args.entities)
+    summary = ingester.ingest(args.path, case_id, score_anomalies=args.inline_scores)
+    if args.score and not args.inline_scores:
+        summary['scored'] = case_mgr.score_unscored_transactions(case_id)
+
+    print(json.dumps(summary, indent=2, default=str))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,599 @@
+#!/usr/bin/env python3
+"""
+Versioned Schema Migrations for the AML SQLite databases
+Tracks applied versions in a `schema_version` table and applies ordered
+migrations on startup. Heavy migrations (backfills, index builds) run in
+resumable chunks, optionally on a background thread so the app keeps serving.
+
+Schemas:
+    v6 - aml_system_v6_enhanced.DatabaseManager (aml_system.db)
+    v9 - aml_system.Database (aml_multi_user.db)
+
+Usage:
+    python migrations.py aml_system.db --schema v6 [--status]
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import sqlite3
+import argparse
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from aml_time import to_epoch
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Migration:
+    """One schema change.
+
+    Heavy migrations (backfills, index builds) touch every row of a large
+    table and may run in the background. Light migrations (new tables and
+    columns) always run synchronously at startup, ahead of any pending heavy
+    ones, so they must not depend on an earlier heavy migration.
+    """
+    version: int
+    description: str
+    up: Callable[['MigrationContext'], None]
+    heavy: bool = False
+
+
+class MigrationContext:
+    """Helpers handed to a migration's `up` function"""
+
+    def __init__(self, runner: 'MigrationRunner', conn: sqlite3.Connection,
+                 migration: Migration, checkpoint: Dict):
+        self.runner = runner
+        self.conn = conn
+        self.migration = migration
+        self.checkpoint = checkpoint
+
+    def execute(self, sql: str, params: tuple = ()):
+        self.conn.execute(sql, params)
+        self.conn.commit()
+
+    def column_exists(self, table: str, column: str) -> bool:
+        rows = self.conn.execute(f"PRAGMA table_info({table})").fetchall()
+        return any(row[1] == column for row in rows)
+
+    def add_column(self, table: str, column: str, declaration: str):
+        if not self.column_exists(table, column):
+            self.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+    def create_index(self, name: str, table: str, columns: tuple):
+        """Build one index in its own short transaction.
+
+        SQLite cannot build an index incrementally; under WAL readers keep
+        serving while it runs and writers wait on the busy timeout.
+        """
+        if name in self.checkpoint.get('indexes', []):
+            return
+        started = time.monotonic()
+        self.conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {name} ON {table}({', '.join(columns)})")
+        self.checkpoint.setdefault('indexes', []).append(name)
+        self.runner._save_checkpoint(self.conn, self.migration, self.checkpoint)
+        self.conn.commit()
+        logger.info(f"Migration {self.migration.version}: built {name} "
+                    f"in {time.monotonic() - started:.1f}s")
+
+    def backfill(self, table: str, columns: str, handler: Callable, where: str = ""):
+        """Walk `table` in rowid order, `chunk_size` rows per transaction.
+
+        `handler(conn, rows)` receives rows of (rowid, *columns) and issues its
+        own writes. Progress is checkpointed in the same transaction as each
+        chunk, so an interrupted backfill resumes after the last committed row.
+        """
+        key = f"backfill:{table}"
+        last_rowid = self.checkpoint.get(key, 0)
+        where_sql = f" AND ({where})" if where else ""
+        total = 0
+        while True:
+            rows = self.conn.execute(
+                f"SELECT rowid, {columns} FROM {table} WHERE rowid > ?{where_sql} "
+                f"ORDER BY rowid LIMIT ?", (last_rowid, self.runner.chunk_size)).fetchall()
+            if not rows:
+                break
+            handler(self.conn, rows)
+            last_rowid = rows[-1][0]
+            total += len(rows)
+            self.checkpoint[key] = last_rowid
+            self.runner._save_checkpoint(self.conn, self.migration, self.checkpoint)
+            self.conn.commit()
+            if self.runner.pause:
+                # Let request threads get at the write lock between chunks
+                time.sleep(self.runner.pause)
+        logger.info(f"Migration {self.migration.version}: backfilled {total} rows of {table}")
+
+
+class MigrationRunner:
+    """Apply pending migrations of one schema to one database file"""
+
+    # A running migration whose heartbeat is older than this is taken over
+    LEASE_SECONDS = 120
+
+    def __init__(self, db_path: str, schema: str, migrations: Optional[List[Migration]] = None,
+                 chunk_size: int = 5000, pause: float = 0.0, busy_timeout: float = 30.0):
+        if migrations is None:
+            migrations = MIGRATIONS[schema]
+        self.db_path = db_path
+        self.schema = schema
+        self.migrations = sorted(migrations, key=lambda m: m.version)
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.busy_timeout = busy_timeout
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{id(self)}"
+        self.thread: Optional[threading.Thread] = None
+
+    def connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode = WAL")
+        self.ensure_version_table(conn)
+        return conn
+
+    @staticmethod
+    def ensure_version_table(conn: sqlite3.Connection):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                status TEXT NOT NULL,
+                checkpoint TEXT,
+                owner TEXT,
+                heartbeat_at REAL,
+                started_at TIMESTAMP,
+                applied_at TIMESTAMP
+            )
+        """)
+        conn.commit()
+
+    def status(self) -> List[Dict]:
+        conn = self.connect()
+        try:
+            rows = conn.execute(
+                "SELECT * FROM schema_version ORDER BY version").fetchall()
+            recorded = {row['version']: dict(row) for row in rows}
+        finally:
+            conn.close()
+        return [recorded.get(m.version, {'version': m.version, 'description': m.description,
+                                         'status': 'pending'})
+                for m in self.migrations]
+
+    def current_version(self) -> int:
+        applied = [row['version'] for row in self.status() if row['status'] == 'applied']
+        return max(applied, default=0)
+
+    def is_applied(self, version: int) -> bool:
+        conn = self.connect()
+        try:
+            return conn.execute("SELECT 1 FROM schema_version WHERE version = ? AND status = 'applied'",
+                                (version,)).fetchone() is not None
+        finally:
+            conn.close()
+
+    def pending(self) -> List[Migration]:
+        applied = {row['version'] for row in self.status() if row['status'] == 'applied'}
+        return [m for m in self.migrations if m.version not in applied]
+
+    def run(self, background: bool = False) -> List[int]:
+        """Apply pending migrations.
+
+        In the foreground everything runs in version order. With
+        `background=True` the light migrations run now and the heavy ones are
+        handed, in version order, to a daemon thread; the caller gets back the
+        versions applied synchronously.
+        """
+        pending = self.pending()
+        heavy = [m for m in pending if m.heavy] if background else []
+        applied = []
+        conn = self.connect()
+        try:
+            for migration in pending:
+                if migration in heavy:
+                    continue
+                if not self._apply(conn, migration):
+                    break
+                applied.append(migration.version)
+        finally:
+            conn.close()
+
+        if heavy:
+            self.thread = threading.Thread(
+                target=self._run_remaining, args=(heavy,),
+                name=f"migrations-{self.schema}", daemon=True)
+            self.thread.start()
+        return applied
+
+    def wait(self, timeout: Optional[float] = None):
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def _run_remaining(self, migrations: List[Migration]):
+        conn = self.connect()
+        try:
+            for migration in migrations:
+                if not self._apply(conn, migration):
+                    break
+        except Exception as e:
+            logger.error(f"Background migration error ({self.db_path}): {e}")
+        finally:
+            conn.close()
+
+    def _claim(self, conn: sqlite3.Connection, migration: Migration) -> Optional[Dict]:
+        """Take the lease on a migration; returns its checkpoint or None"""
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT * FROM schema_version WHERE version = ?",
+                               (migration.version,)).fetchone()
+            if row and row['status'] == 'applied':
+                conn.rollback()
+                return None
+            if (row and row['owner'] != self.owner
+                    and now - (row['heartbeat_at'] or 0) < self.LEASE_SECONDS):
+                conn.rollback()
+                logger.info(f"Migration {migration.version} is running in {row['owner']}")
+                return None
+            checkpoint = json.loads(row['checkpoint']) if row and row['checkpoint'] else {}
+            conn.execute("""
+                INSERT INTO schema_version (version, description, status, checkpoint,
+                                            owner, heartbeat_at, started_at)
+                VALUES (?, ?, 'running', ?, ?, ?, ?)
+                ON CONFLICT(version) DO UPDATE SET
+                    status = 'running', owner = excluded.owner,
+                    heartbeat_at = excluded.heartbeat_at
+            """, (migration.version, migration.description, json.dumps(checkpoint),
+                  self.owner, now, datetime.now().isoformat()))
+            conn.commit()
+            return checkpoint
+        except Exception:
+            conn.rollback()
+            raise
+
+    def _save_checkpoint(self, conn: sqlite3.Connection, migration: Migration, checkpoint: Dict):
+        # Runs inside the caller's chunk transaction
+        conn.execute(
+            "UPDATE schema_version SET checkpoint = ?, heartbeat_at = ? WHERE version = ?",
+            (json.dumps(checkpoint), time.time(), migration.version))
+
+    def _apply(self, conn: sqlite3.Connection, migration: Migration) -> bool:
+        checkpoint = self._claim(conn, migration)
+        if checkpoint is None:
+            # Either applied meanwhile, or another process holds the lease
+            row = conn.execute("SELECT status FROM schema_version WHERE version = ?",
+                               (migration.version,)).fetchone()
+            return bool(row and row['status'] == 'applied')
+
+        if checkpoint:
+            logger.info(f"Resuming migration {migration.version} from {checkpoint}")
+        started = time.monotonic()
+        try:
+            migration.up(MigrationContext(self, conn, migration, checkpoint))
+        except Exception:
+            conn.rollback()
+            # Keep the checkpoint but release the lease so the next start resumes
+            conn.execute("UPDATE schema_version SET status = 'failed', heartbeat_at = 0 "
+                         "WHERE version = ?", (migration.version,))
+            conn.commit()
+            raise
+        conn.execute(
+            "UPDATE schema_version SET status = 'applied', checkpoint = NULL, "
+            "applied_at = ? WHERE version = ?",
+            (datetime.now().isoformat(), migration.version))
+        conn.commit()
+        logger.info(f"Applied {self.schema} migration {migration.version} "
+                    f"({migration.description}) in {time.monotonic() - started:.1f}s")
+        return True
+
+
+def _create_recommended(ctx: MigrationContext, schema: str, *names: str):
+    """Build the named index_advisor.RECOMMENDED_INDEXES entries of `schema`
+    (all of them if none are named)
+    """
+    from index_advisor import RECOMMENDED_INDEXES
+    recommended = {name: (table, columns) for name, table, columns in RECOMMENDED_INDEXES[schema]}
+    for name in names or recommended:
+        ctx.create_index(name, *recommended[name])
+
+
+# ======================== v6 MIGRATIONS (aml_system.db) ========================
+
+
+def _v6_001_hot_path_indexes(ctx: MigrationContext):
+    # The (entity, transaction_ts) ones follow in migration 3, once the column is filled
+    _create_recommended(ctx, 'v6', 'idx_anomaly_scores_txn', 'idx_cases_status_created',
+                        'idx_cases_updated')
+
+
+def _v6_002_transaction_ts_column(ctx: MigrationContext):
+    ctx.add_column('transactions', 'transaction_ts', 'INTEGER')
+
+
+def _v6_003_transaction_ts_backfill(ctx: MigrationContext):
+    def fill(conn, rows):
+        conn.executemany(
+            "UPDATE transactions SET transaction_ts = ? WHERE rowid = ?",
+            [(to_epoch(date), rowid) for rowid, date in rows])
+
+    ctx.backfill('transactions', 'transaction_date', fill,
+                 where="transaction_ts IS NULL")
+    _create_recommended(ctx, 'v6', 'idx_transactions_source_ts', 'idx_transactions_dest_ts')
+    # Superseded by the epoch indexes above; older databases built them in migration 1
+    ctx.execute("DROP INDEX IF EXISTS idx_transactions_source_date")
+    ctx.execute("DROP INDEX IF EXISTS idx_transactions_dest_date")
+
+
+def _v6_004_ingest_checkpoints(ctx: MigrationContext):
+    ctx.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+            source TEXT PRIMARY KEY,
+            case_id TEXT NOT NULL,
+            byte_offset INTEGER DEFAULT 0,
+            rows_read INTEGER DEFAULT 0,
+            rows_inserted INTEGER DEFAULT 0,
+            rows_failed INTEGER DEFAULT 0,
+            status TEXT DEFAULT 'running',
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def _v6_005_entity_stats(ctx: MigrationContext):
+    ctx.execute("""
+        CREATE TABLE IF NOT EXISTS entity_stats (
+            entity_id TEXT PRIMARY KEY,
+            txn_count INTEGER NOT NULL DEFAULT 0,
+            amount_mean REAL NOT NULL DEFAULT 0,
+            amount_m2 REAL NOT NULL DEFAULT 0,
+            first_seen INTEGER,
+            last_seen INTEGER,
+            counterparty_count INTEGER NOT NULL DEFAULT 0,
+            counterparty_sketch BLOB
+        )
+    """)
+
+
+def _rebuild_by_entity(ctx: MigrationContext, rebuild: Callable):
+    """Backfill a per-entity table a chunk of entities at a time.
+
+    Inserts already fold into the table, so rows can be partial until their
+    chunk replaces them whole; each chunk does so in its own write
+    transaction and later inserts fold into complete rows. Every party of a
+    transaction is an entities row (foreign keys).
+    """
+    ctx.backfill('entities', 'entity_id', lambda conn, rows: rebuild(conn, [row[1] for row in rows]))
+
+
+def _v6_006_entity_stats_backfill(ctx: MigrationContext):
+    import entity_stats
+    _rebuild_by_entity(ctx, entity_stats.rebuild)
+
+
+def _v6_007_network_edges(ctx: MigrationContext):
+    # Nothing wrote the table before; rows that do exist are rebuilt by 8
+    ctx.execute("DELETE FROM network_edges")
+    ctx.add_column('network_edges', 'first_seen', 'INTEGER')
+    ctx.add_column('network_edges', 'last_seen', 'INTEGER')
+    ctx.execute("DROP INDEX IF EXISTS idx_network_edges")
+    ctx.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_network_edges_pair "
+                "ON network_edges(source_entity, destination_entity)")
+    ctx.execute("CREATE INDEX IF NOT EXISTS idx_network_edges_destination "
+                "ON network_edges(destination_entity)")
+
+
+def _v6_008_network_edges_backfill(ctx: MigrationContext):
+    # Edges are keyed on their source entity
+    import network_edges
+    _rebuild_by_entity(ctx, network_edges.rebuild)
+
+
+def _v6_009_transaction_ts_index(ctx: MigrationContext):
+    _create_recommended(ctx, 'v6', 'idx_transactions_ts')
+
+
+def _v6_010_model_scores(ctx: MigrationContext):
+    ctx.execute("""
+        CREATE TABLE IF NOT EXISTS model_scores (
+            transaction_id TEXT NOT NULL,
+            model_version TEXT NOT NULL,
+            score REAL NOT NULL,
+            flagged INTEGER NOT NULL DEFAULT 0,
+            heuristic_score REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (transaction_id, model_version)
+        )
+    """)
+    ctx.execute("CREATE INDEX IF NOT EXISTS idx_model_scores_version "
+                "ON model_scores(model_version, flagged)")
+
+
+def _v6_011_entity_daily_stats(ctx: MigrationContext):
+    ctx.execute("""
+        CREATE TABLE IF NOT EXISTS entity_daily_stats (
+            entity_id TEXT NOT NULL,
+            day INTEGER NOT NULL,
+            txn_count INTEGER NOT NULL DEFAULT 0,
+            total_amount REAL NOT NULL DEFAULT 0,
+            min_amount REAL,
+            max_amount REAL,
+            in_count INTEGER NOT NULL DEFAULT 0,
+            in_amount REAL NOT NULL DEFAULT 0,
+            out_count INTEGER NOT NULL DEFAULT 0,
+            out_amount REAL NOT NULL DEFAULT 0,
+            counterparties_in INTEGER NOT NULL DEFAULT 0,
+            counterparties_out INTEGER NOT NULL DEFAULT 0,
+            sub_threshold_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (entity_id, day)
+        ) WITHOUT ROWID
+    """)
+
+
+def _v6_012_entity_daily_stats_backfill(ctx: MigrationContext):
+    import daily_rollups
+    _rebuild_by_entity(ctx, daily_rollups.rebuild)
+
+
+def _v6_013_entity_centrality(ctx: MigrationContext):
+    ctx.execute("""
+        CREATE TABLE IF NOT EXISTS entity_centrality (
+            entity_id TEXT PRIMARY KEY,
+            pagerank REAL NOT NULL DEFAULT 0,
+            eigenvector REAL NOT NULL DEFAULT 0,
+            betweenness REAL NOT NULL DEFAULT 0,
+            network_percentile REAL NOT NULL DEFAULT 0,
+            run_id TEXT,
+            computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def _v6_014_network_edges_amount_indexes(ctx: MigrationContext):
+    # Covering (entity, total_amount) indexes: subgraph.py reads a node's
+    # heaviest edges without touching the table. The destination one
+    # replaces the plain destination index as a prefix of it.
+    _create_recommended(ctx, 'v6', 'idx_network_edges_source_amount',
+                        'idx_network_edges_destination_amount')
+    ctx.execute("DROP INDEX IF EXISTS idx_network_edges_destination")
+
+
+def _v6_015_entity_clusters(ctx: MigrationContext):
+    ctx.execute("""
+        CREATE TABLE IF NOT EXISTS entity_clusters (
+            entity_id TEXT PRIMARY KEY,
+            cluster_id TEXT NOT NULL
+        )
+    """)
+    ctx.execute("CREATE INDEX IF NOT EXISTS idx_entity_clusters_cluster "
+                "ON entity_clusters(cluster_id)")
+    ctx.execute("""
+        CREATE TABLE IF NOT EXISTS clusters (
+            cluster_id TEXT PRIMARY KEY,
+            size INTEGER NOT NULL DEFAULT 1,
+            transaction_count INTEGER NOT NULL DEFAULT 0,
+            total_flow REAL NOT NULL DEFAULT 0,
+            max_risk REAL NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def _v6_016_entity_clusters_backfill(ctx: MigrationContext):
+    # Components span key ranges, so: union the parties of every stored edge,
+    # then recompute each cluster's aggregates, chunk by chunk. Inserts keep
+    # merging meanwhile and may fold a cluster not yet recomputed into one
+    # that was; the last pass recomputes every cluster touched since the
+    # second began, in one write transaction.
+    import entity_clusters
+
+    def link(conn, rows):
+        # Take the write lock before the unions read memberships inserts also write
+        conn.execute("BEGIN IMMEDIATE")
+        entity_clusters.link(conn, [tuple(row)[1:] for row in rows])
+
+    ctx.backfill('network_edges', 'source_entity, destination_entity', link)
+    if 'settle_from' not in ctx.checkpoint:
+        ctx.checkpoint['settle_from'] = ctx.conn.execute("SELECT CURRENT_TIMESTAMP").fetchone()[0]
+        ctx.runner._save_checkpoint(ctx.conn, ctx.migration, ctx.checkpoint)
+        ctx.conn.commit()
+    ctx.backfill('clusters', 'cluster_id', lambda conn, rows: entity_clusters.settle(
+        conn, f"cluster_id IN ({','.join('?' * len(rows))})", tuple(row[1] for row in rows)))
+    entity_clusters.settle(ctx.conn, "updated_at >= ?", (ctx.checkpoint['settle_from'],))
+    ctx.conn.commit()
+
+
+def _v6_017_network_edges_edge_id(ctx: MigrationContext):
+    import network_edges
+    ctx.backfill('network_edges', 'source_entity', lambda conn, rows: conn.execute(
+        f"UPDATE network_edges SET edge_id = {network_edges.EDGE_ID_SQL} "
+        f"WHERE rowid BETWEEN ? AND ?", (rows[0][0], rows[-1][0])),
+        where=f"edge_id IS NOT {network_edges.EDGE_ID_SQL}")
+
+
+V6_MIGRATIONS = [
+    Migration(1, "Composite indexes for detector and case hot paths",
+              _v6_001_hot_path_indexes, heavy=True),
+    Migration(2, "Add transactions.transaction_ts (UTC epoch seconds)",
+              _v6_002_transaction_ts_column),
+    Migration(3, "Backfill transaction_ts and index (entity, transaction_ts)",
+              _v6_003_transaction_ts_backfill, heavy=True),
+    Migration(4, "Resumable ingest checkpoints",
+              _v6_004_ingest_checkpoints),
+    Migration(5, "Per-entity rolling statistics table",
+              _v6_005_entity_stats),
+    Migration(6, "Build entity_stats from existing transactions",
+              _v6_006_entity_stats_backfill, heavy=True),
+    Migration(7, "Upsertable network_edges: unique (source, destination), first/last seen",
+              _v6_007_network_edges),
+    Migration(8, "Build network_edges from existing transactions",
+              _v6_008_network_edges_backfill, heavy=True),
+    Migration(9, "Index transactions.transaction_ts for the velocity buffer rebuild",
+              _v6_009_transaction_ts_index, heavy=True),
+    Migration(10, "Shadow anomaly model scores",
+              _v6_010_model_scores),
+    Migration(11, "Per-entity daily rollup table (day = UTC epoch day)",
+              _v6_011_entity_daily_stats),
+    Migration(12, "Build entity_daily_stats from existing transactions",
+              _v6_012_entity_daily_stats_backfill, heavy=True),
+    Migration(13, "Whole-network centrality per entity (centrality.py)",
+              _v6_013_entity_centrality),
+    Migration(14, "Covering (entity, total_amount) indexes on network_edges for k-hop expansion",
+              _v6_014_network_edges_amount_indexes, heavy=True),
+    Migration(15, "Connected-component clusters per entity and per cluster aggregates",
+              _v6_015_entity_clusters),
+    Migration(16, "Build entity clusters from network_edges",
+              _v6_016_entity_clusters_backfill, heavy=True),
+    Migration(17, "Key network_edges.edge_id as a JSON array of the pair",
+              _v6_017_network_edges_edge_id, heavy=True),
+]
+
+
+# ======================== v9 MIGRATIONS (aml_multi_user.db) ========================
+
+
+def _v9_001_secondary_indexes(ctx: MigrationContext):
+    _create_recommended(ctx, 'v9')
+
+
+V9_MIGRATIONS = [
+    Migration(1, "Secondary indexes for per-user listings, audit trail and enquiries",
+              _v9_001_secondary_indexes, heavy=True),
+]
+
+
+MIGRATIONS: Dict[str, List[Migration]] = {
+    'v6': V6_MIGRATIONS,
+    'v9': V9_MIGRATIONS,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AML schema migrations")
+    parser.add_argument('db_path')
+    parser.add_argument('--schema', choices=sorted(MIGRATIONS), required=True)
+    parser.add_argument('--status', action='store_true', help="only show migration status")
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--pause', type=float, default=0.0,
+                        help="seconds to sleep between backfill chunks")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    runner = MigrationRunner(args.db_path, args.schema,
+                             chunk_size=args.chunk_size, pause=args.pause)
+    if not args.status:
+        runner.run()
+    for row in runner.status():
+        print(f"{row['version']:>4}  {row['status']:<8}  {row['description']}")
+    return 0 if not runner.pending() else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
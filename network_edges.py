@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Incrementally Maintained Transaction Graph Edges
+One `network_edges` row per (source_entity, destination_entity) pair holding
+the transaction count, total amount and first/last transaction time. Every
+transaction insert upserts its edge in the same transaction, so fan-in/fan-out
+and network construction read a hub's edges instead of all its transactions.
+
+Usage:
+    python network_edges.py aml_system.db --rebuild
+    python network_edges.py aml_system.db --check [--sample 1000 | --all]
+"""
+
+import sys
+import json
+import random
+import logging
+import sqlite3
+import argparse
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+EdgeKey = Tuple[str, str]
+
+# Deltas add to the stored row; first/last only ever widen
+UPSERT_EDGE = """
+    INSERT INTO network_edges (edge_id, source_entity, destination_entity,
+                               transaction_count, total_amount, first_seen, last_seen)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(source_entity, destination_entity) DO UPDATE SET
+        transaction_count = transaction_count + excluded.transaction_count,
+        total_amount = total_amount + excluded.total_amount,
+        first_seen = CASE WHEN first_seen IS NULL OR excluded.first_seen < first_seen
+                          THEN excluded.first_seen ELSE first_seen END,
+        last_seen = CASE WHEN last_seen IS NULL OR excluded.last_seen > last_seen
+                         THEN excluded.last_seen ELSE last_seen END
+"""
+
+AGGREGATE_TRANSACTIONS = """
+    SELECT source_entity, destination_entity, COUNT(*), COALESCE(SUM(amount), 0.0),
+           MIN(transaction_ts), MAX(transaction_ts)
+    FROM transactions {where}
+    GROUP BY source_entity, destination_entity
+"""
+
+
+# The pair as a JSON array, as SQLite's json_array() writes it: no entity id
+# can make two pairs share an edge_id (as "a->b" + "c" and "a" + "b->c" did)
+EDGE_ID_SQL = "json_array(source_entity, destination_entity)"
+
+
+def edge_id(source: str, destination: str) -> str:
+    return json.dumps([source, destination], separators=(',', ':'), ensure_ascii=False)
+
+
+def record(deltas: Dict[EdgeKey, list], source: str, destination: str,
+           amount: float, ts: Optional[int]):
+    """Fold one transaction into the pending [count, total, first, last] of its edge"""
+    delta = deltas.get((source, destination))
+    if delta is None:
+        deltas[(source, destination)] = [1, amount, ts, ts]
+        return
+    delta[0] += 1
+    delta[1] += amount
+    if ts is not None:
+        delta[2] = ts if delta[2] is None else min(delta[2], ts)
+        delta[3] = ts if delta[3] is None else max(delta[3], ts)
+
+
+def save(conn: sqlite3.Connection, deltas: Dict[EdgeKey, list]):
+    """Add pending deltas to the stored edges; does not commit"""
+    conn.executemany(UPSERT_EDGE, [
+        (edge_id(source, destination), source, destination, count, total, first, last)
+        for (source, destination), (count, total, first, last) in deltas.items()])
+
+
+def rebuild(conn: sqlite3.Connection, entity_ids: Optional[List[str]] = None) -> int:
+    """Replace edges from the transactions table: every edge, or the
+    outgoing edges of `entity_ids` only; does not commit
+    """
+    where = "WHERE source_entity IS NOT NULL AND destination_entity IS NOT NULL"
+    params: tuple = ()
+    if entity_ids is None:
+        conn.execute("DELETE FROM network_edges")
+    else:
+        placeholders = ','.join('?' * len(entity_ids))
+        where += f" AND source_entity IN ({placeholders})"
+        params = tuple(entity_ids)
+        conn.execute(f"DELETE FROM network_edges WHERE source_entity IN ({placeholders})", params)
+    cursor = conn.execute(f"""
+        INSERT INTO network_edges (edge_id, source_entity, destination_entity,
+                                   transaction_count, total_amount, first_seen, last_seen)
+        SELECT {EDGE_ID_SQL}, * FROM ({AGGREGATE_TRANSACTIONS.format(
+            where=where)})
+    """, params)
+    logger.info(f"Rebuilt {cursor.rowcount} network edges")
+    return cursor.rowcount
+
+
+def check(conn: sqlite3.Connection, sample: Optional[int] = 1000,
+          tolerance: float = 1e-6) -> Dict:
+    """Compare stored edges with edges aggregated from transactions.
+
+    Checks the outgoing edges of `sample` random entities, or every edge
+    with sample=None.
+    """
+    columns = ("source_entity, destination_entity, transaction_count, total_amount, "
+               "first_seen, last_seen")
+    if sample is None:
+        expected = conn.execute(AGGREGATE_TRANSACTIONS.format(
+            where="WHERE source_entity IS NOT NULL AND destination_entity IS NOT NULL")).fetchall()
+        stored = conn.execute(f"SELECT {columns} FROM network_edges").fetchall()
+    else:
+        entity_ids = [r[0] for r in conn.execute("SELECT entity_id FROM entities")]
+        entity_ids = random.sample(entity_ids, min(sample, len(entity_ids)))
+        expected, stored = [], []
+        for entity_id in entity_ids:
+            expected += conn.execute(AGGREGATE_TRANSACTIONS.format(
+                where="WHERE source_entity = ? AND destination_entity IS NOT NULL"),
+                (entity_id,)).fetchall()
+            stored += conn.execute(f"SELECT {columns} FROM network_edges WHERE source_entity = ?",
+                                   (entity_id,)).fetchall()
+
+    expected = {(r[0], r[1]): r[2:] for r in expected}
+    stored = {(r[0], r[1]): r[2:] for r in stored}
+    mismatches = []
+    for key in sorted(set(expected) | set(stored)):
+        want, have = expected.get(key), stored.get(key)
+        if want is None or have is None:
+            problems = ['missing' if have is None else 'unexpected']
+        else:
+            problems = [name for name, a, b in zip(('transaction_count', 'first_seen', 'last_seen'),
+                                                   (want[0], want[2], want[3]),
+                                                   (have[0], have[2], have[3])) if a != b]
+            if abs(want[1] - have[1]) > tolerance * max(1.0, abs(want[1])):
+                problems.append('total_amount')
+        if problems:
+            mismatches.append({'edge': edge_id(*key), 'fields': problems})
+    return {'checked': len(set(expected) | set(stored)), 'mismatched': len(mismatches),
+            'mismatches': mismatches[:50]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the network_edges table")
+    parser.add_argument('db_path')
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument('--rebuild', action='store_true', help="recompute every edge")
+    action.add_argument('--check', action='store_true', help="compare edges with transactions")
+    parser.add_argument('--sample', type=int, default=1000, help="entities to check")
+    parser.add_argument('--all', action='store_true', help="check every edge")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    # Opening the database applies pending migrations, network_edges included
+    from aml_system_v6_enhanced import DatabaseManager
+    db = DatabaseManager(args.db_path)
+
+    if args.rebuild:
+        with db.write_transaction() as conn:
+            count = rebuild(conn)
+        print(json.dumps({'rebuilt': count}))
+        return 0
+
+    with db.connection() as conn:
+        report = check(conn, None if args.all else args.sample)
+    print(json.dumps(report, indent=2))
+    return 0 if not report['mismatched'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+"""
+Declarative Detection Rules
+Typologies are declared in a JSON file instead of being coded as
+PatternDetector methods: a time window, a group-by key, named aggregates, a
+predicate over the aggregates and a score. Every active rule is evaluated
+from ONE scan of the transactions table (the widest window; narrower windows
+are masks over it), and aggregates shared by several rules are computed
+once. The file is re-read whenever it changes.
+
+A rule:
+    {
+      "name": "structuring",
+      "pattern": "structuring",
+      "window_days": 30,
+      "group_by": "entity",
+      "aggregates": {
+        "txn_count": {"fn": "count"},
+        "below": {"fn": "count", "where": [["amount", "<", 50000]]},
+        "total": {"fn": "sum", "field": "amount"}
+      },
+      "when": [["below", ">=", 5]],
+      "score": {"name": "confidence", "ratio": ["below", "txn_count"], "max": 0.95},
+      "details": {"total_amount": "total", "transaction_count": "below"}
+    }
+
+window_days      trailing window; null scans every transaction
+group_by         entity (both sides; a self-transfer counts once), source,
+                 destination, or pair ("source->destination")
+aggregates       count | sum/mean/min/max of amount | distinct of
+                 counterparty/source/destination, each with an optional
+                 "where" list of [amount, op, value] filters
+when             [aggregate, op, value] conditions, all of which must hold
+score            min(max, scale * value) or min(max, scale * a / b)
+details          output key -> aggregate; windowed rules add period_days
+
+Usage:
+    python rule_engine.py aml_system.db [--rules detection_rules.json] [--rule structuring ...]
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from aml_time import window_start
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'detection_rules.json')
+
+OPERATORS = {
+    '<': np.less, '<=': np.less_equal, '>': np.greater,
+    '>=': np.greater_equal, '==': np.equal, '!=': np.not_equal
+}
+GROUP_KEYS = ('entity', 'source', 'destination', 'pair')
+# fn -> fields it accepts (None: no field)
+FUNCTIONS = {
+    'count': (None,),
+    'sum': ('amount',), 'mean': ('amount',), 'min': ('amount',), 'max': ('amount',),
+    'distinct': ('counterparty', 'source', 'destination')
+}
+FILTER_FIELDS = ('amount',)
+
+
+def _mapping(value, context: str) -> Dict:
+    """An optional JSON object (missing or null reads as empty)"""
+    if value is None:
+        return {}
+    if not isinstance(value, dict):
+        raise ValueError(f"{context} must be an object, not {type(value).__name__}")
+    return value
+
+
+def _conditions(value, context: str) -> Tuple[Tuple[str, str, float], ...]:
+    if not isinstance(value, list) or any(not isinstance(c, list) or len(c) != 3 for c in value):
+        raise ValueError(f"{context} must be a list of [name, op, value] conditions")
+    for name, op, operand in value:
+        if not isinstance(name, str):
+            raise ValueError(f"{context}: {name!r} is not a name")
+        if not isinstance(op, str) or op not in OPERATORS:
+            raise ValueError(f"{context}: unknown operator {op!r}")
+        if isinstance(operand, bool) or not isinstance(operand, (int, float)):
+            raise ValueError(f"{context}: {operand!r} is not a number")
+    return tuple((name, op, operand) for name, op, operand in value)
+
+
+@dataclass
+class Rule:
+    """One compiled rule definition"""
+    name: str
+    group_by: str
+    aggregates: Dict[str, Tuple[str, Optional[str], tuple]]  # name -> (fn, field, where)
+    when: Tuple[Tuple[str, str, float], ...]
+    score: Dict
+    details: Dict[str, str] = field(default_factory=dict)
+    window_days: Optional[float] = None
+    pattern: Optional[str] = None
+    enabled: bool = True
+    definition: Dict = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Rule':
+        """Validate a rule definition; raises ValueError"""
+        if not isinstance(data, dict):
+            raise ValueError(f"a rule must be an object, not {type(data).__name__}")
+        name = data.get('name')
+        if not name or not isinstance(name, str):
+            raise ValueError("rule without a name")
+        group_by = data.get('group_by', 'entity')
+        if group_by not in GROUP_KEYS:
+            raise ValueError(f"{name}: group_by must be one of {', '.join(GROUP_KEYS)}")
+        window_days = data.get('window_days')
+        if window_days is not None and (not isinstance(window_days, (int, float)) or window_days <= 0):
+            raise ValueError(f"{name}: window_days must be a positive number or null")
+
+        aggregates = {}
+        for agg_name, spec in _mapping(data.get('aggregates'), f"{name}.aggregates").items():
+            if not isinstance(spec, dict):
+                raise ValueError(f"{name}.aggregates.{agg_name} must be an object")
+            fn, agg_field = spec.get('fn'), spec.get('field')
+            if fn not in FUNCTIONS:
+                raise ValueError(f"{name}.{agg_name}: unknown fn {fn!r}")
+            if agg_field not in FUNCTIONS[fn]:
+                if agg_field is None and FUNCTIONS[fn][0] is not None:
+                    agg_field = FUNCTIONS[fn][0]
+                else:
+                    raise ValueError(f"{name}.{agg_name}: {fn} does not take field {agg_field!r}")
+            where = _conditions(spec.get('where', []), f"{name}.{agg_name}.where")
+            for column, _, _ in where:
+                if column not in FILTER_FIELDS:
+                    raise ValueError(f"{name}.{agg_name}: cannot filter on {column!r}")
+            aggregates[agg_name] = (fn, agg_field, where)
+        if not aggregates:
+            raise ValueError(f"{name}: no aggregates")
+
+        when = _conditions(data.get('when', []), f"{name}.when")
+        score = dict(_mapping(data.get('score'), f"{name}.score"))
+        details = dict(_mapping(data.get('details'), f"{name}.details"))
+        score.setdefault('name', 'score')
+        if 'ratio' in score and (not isinstance(score['ratio'], list) or len(score['ratio']) != 2):
+            raise ValueError(f"{name}.score: ratio takes a list of two aggregates")
+        for key in ('scale', 'max'):
+            if key in score and (isinstance(score[key], bool) or not isinstance(score[key], (int, float))):
+                raise ValueError(f"{name}.score.{key}: {score[key]!r} is not a number")
+        operands = score.get('ratio') or [score.get('value')]
+        referenced = [c[0] for c in when] + list(details.values()) + list(operands)
+        for agg_name in referenced:
+            if not isinstance(agg_name, str) or agg_name not in aggregates:
+                raise ValueError(f"{name}: unknown aggregate {agg_name!r}")
+
+        return cls(name=name, group_by=group_by, aggregates=aggregates, when=when,
+                   score=score, details=details, window_days=window_days,
+                   pattern=data.get('pattern'), enabled=bool(data.get('enabled', True)),
+                   definition=data)
+
+
+def load_rules(path: str) -> List[Rule]:
+    """Parse and validate a rules file; raises ValueError or OSError"""
+    with open(path, 'r', encoding='utf-8') as f:
+        try:
+            data = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"invalid JSON: {e}")
+    if isinstance(data, dict):
+        data = data.get('rules', [])
+    if not isinstance(data, list):
+        raise ValueError("rules must be a list (or an object with a \"rules\" list)")
+    rules = []
+    for i, definition in enumerate(data):
+        try:
+            rules.append(Rule.from_dict(definition))
+        except ValueError as e:
+            raise ValueError(f"rules[{i}]: {e}") from None
+    names = [r.name for r in rules]
+    duplicates = sorted({n for n in names if names.count(n) > 1})
+    if duplicates:
+        raise ValueError(f"duplicate rule names: {', '.join(duplicates)}")
+    return rules
+
+
+class _Frame:
+    """The scanned transactions plus the views and aggregates shared by rules"""
+
+    def __init__(self, names: List[str], src, dst, amount, ts, now: float):
+        self.names = np.array(names, dtype=object)
+        self.src, self.dst, self.amount, self.ts = src, dst, amount, ts
+        self.now = now
+        self.cache = {}
+
+    def _cached(self, key, compute):
+        if key not in self.cache:
+            self.cache[key] = compute()
+        return self.cache[key]
+
+    def rows(self, window_days):
+        """Row indexes inside the window"""
+        if window_days is None:
+            return self._cached(('rows', None), lambda: np.arange(len(self.src)))
+        since = window_start(window_days, self.now)
+        return self._cached(('rows', window_days), lambda: np.flatnonzero(self.ts >= since))
+
+    def view(self, window_days, group_by):
+        """(row index, group code, counterparty code, group count, group names)"""
+        def compute():
+            rows = self.rows(window_days)
+            src, dst = self.src[rows], self.dst[rows]
+            n = len(self.names)
+            if group_by == 'entity':
+                other = dst != src
+                return (np.concatenate([rows, rows[other]]), np.concatenate([src, dst[other]]),
+                        np.concatenate([dst, src[other]]), n, self.names)
+            if group_by == 'source':
+                return rows, src, dst, n, self.names
+            if group_by == 'destination':
+                return rows, dst, src, n, self.names
+            pairs, group = np.unique(src * n + dst, return_inverse=True)
+            names = np.array([f"{self.names[p // n]}->{self.names[p % n]}" for p in pairs.tolist()],
+                             dtype=object)
+            return rows, group.reshape(-1), dst, len(pairs), names
+        return self._cached(('view', window_days, group_by), compute)
+
+    def present(self, window_days, group_by):
+        """Groups with at least one transaction in the window"""
+        def compute():
+            _, group, _, groups, _ = self.view(window_days, group_by)
+            return np.bincount(group, minlength=groups) > 0
+        return self._cached(('present', window_days, group_by), compute)
+
+    def aggregate(self, window_days, group_by, fn, agg_field, where):
+        return self._cached(('agg', window_days, group_by, fn, agg_field, where),
+                            lambda: self._aggregate(window_days, group_by, fn, agg_field, where))
+
+    def _aggregate(self, window_days, group_by, fn, agg_field, where):
+        rows, group, counterparty, groups, _ = self.view(window_days, group_by)
+        amount = self.amount[rows]
+        if where:
+            keep = np.ones(len(rows), dtype=bool)
+            for _, op, operand in where:  # the only filter field is amount
+                keep &= OPERATORS[op](amount, operand)
+            rows, group, counterparty, amount = rows[keep], group[keep], counterparty[keep], amount[keep]
+
+        if fn == 'count':
+            return np.bincount(group, minlength=groups)
+        if fn == 'distinct':
+            values = {'counterparty': counterparty, 'source': self.src[rows],
+                      'destination': self.dst[rows]}[agg_field]
+            n = len(self.names)
+            return np.bincount(np.unique(group * n + values) // n, minlength=groups)
+        amount = np.nan_to_num(amount)  # NULL amounts count as 0, as SUM() skips them
+        if fn in ('sum', 'mean'):
+            sums = np.bincount(group, weights=amount, minlength=groups)
+            if fn == 'sum':
+                return sums
+            counts = np.bincount(group, minlength=groups)
+            return np.divide(sums, counts, out=np.zeros(groups), where=counts > 0)
+        out = np.full(groups, np.inf if fn == 'min' else -np.inf)
+        (np.minimum if fn == 'min' else np.maximum).at(out, group, amount)
+        # A group with no row left has no min/max: NaN, as MIN() gives NULL
+        out[np.bincount(group, minlength=groups) == 0] = np.nan
+        return out
+
+
+def _json_list(values: np.ndarray) -> list:
+    """values.tolist() with None for NaN, which JSON cannot carry"""
+    return [None if v != v else v for v in values.tolist()]
+
+
+class RuleEngine:
+    """Evaluates every active rule from one scan of the transactions table"""
+
+    def __init__(self, db, rules_path: str = DEFAULT_RULES_PATH, chunk_size: int = 200000):
+        self.db = db
+        self.rules_path = rules_path
+        self.chunk_size = chunk_size
+        self.rules: List[Rule] = []
+        self.loaded_at: Optional[str] = None
+        self.load_error: Optional[str] = None
+        self.stats: Dict[str, Dict] = {}
+        self._signature = None
+        self._lock = threading.Lock()
+        self.reload()
+
+    def _file_signature(self):
+        try:
+            st = os.stat(self.rules_path)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def reload(self) -> Tuple[bool, str]:
+        """Re-read the rules file. An invalid file keeps the rules already loaded."""
+        with self._lock:
+            signature = self._file_signature()
+            self._signature = signature
+            try:
+                rules = load_rules(self.rules_path)
+            except (OSError, ValueError) as e:
+                self.load_error = str(e)
+                logger.error(f"Rules not loaded from {self.rules_path}: {e}")
+                return False, f"Rules not loaded: {e}"
+            self.rules = rules
+            self.load_error = None
+            self.loaded_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+            active = sum(r.enabled for r in rules)
+            logger.info(f"Loaded {len(rules)} detection rules ({active} active) from {self.rules_path}")
+            return True, f"Loaded {len(rules)} rules ({active} active)"
+
+    def reload_if_changed(self) -> bool:
+        """Hot reload: re-read the file when its mtime or size changed"""
+        if self._file_signature() == self._signature:
+            return False
+        self.reload()
+        return True
+
+    def describe(self) -> Dict:
+        with self._lock:
+            stats = {name: dict(s) for name, s in self.stats.items()}
+        return {
+            'rules_path': self.rules_path,
+            'loaded_at': self.loaded_at,
+            'load_error': self.load_error,
+            'rules': [dict(r.definition, enabled=r.enabled) for r in self.rules],
+            'stats': stats
+        }
+
+    def _scan(self, since: Optional[int], now: float) -> _Frame:
+        index = {}
+        intern = index.setdefault
+        parts = {'src': [], 'dst': [], 'amount': [], 'ts': []}
+
+        def codes(values):
+            return np.fromiter((intern(v, len(index)) for v in values), dtype=np.int64,
+                               count=len(values))
+
+        where, params = ("WHERE transaction_ts >= ?", (since,)) if since is not None else ("", ())
+        with self.db.connection() as conn:
+            cursor = conn.execute(f"""
+                SELECT source_entity, destination_entity, amount, transaction_ts
+                FROM transactions {where}
+            """, params)
+            while True:
+                rows = cursor.fetchmany(self.chunk_size)
+                if not rows:
+                    break
+                src, dst, amount, ts = zip(*rows)
+                parts['src'].append(codes(src))
+                parts['dst'].append(codes(dst))
+                parts['amount'].append(np.array(amount, dtype=np.float64))
+                # NULL transaction_ts becomes NaN, which no window includes
+                parts['ts'].append(np.array(ts, dtype=np.float64))
+
+        def joined(key, dtype):
+            return np.concatenate(parts[key]) if parts[key] else np.empty(0, dtype=dtype)
+
+        return _Frame(list(index), joined('src', np.int64), joined('dst', np.int64),
+                      joined('amount', np.float64), joined('ts', np.float64), now)
+
+    def evaluate(self, rule_names: Optional[List[str]] = None, now: Optional[float] = None) -> Dict:
+        """
+        Run the active rules (or `rule_names`) and return
+        {'results': {rule: {key: details}}, 'timings': {...}}, hits strongest first.
+        Per-rule time covers the aggregates the rule was first to need.
+        """
+        self.reload_if_changed()
+        if rule_names is not None:
+            rule_names = set(rule_names)
+        rules = [r for r in self.rules
+                 if r.enabled and (rule_names is None or r.name in rule_names)]
+        now = time.time() if now is None else now
+        started = time.perf_counter()
+
+        windows = [r.window_days for r in rules]
+        since = None if not rules or None in windows else window_start(max(windows), now)
+        frame = self._scan(since, now)
+        scan_seconds = time.perf_counter() - started
+
+        results, rule_seconds = {}, {}
+        for rule in rules:
+            rule_started = time.perf_counter()
+            try:
+                results[rule.name] = self._evaluate_rule(rule, frame)
+            except Exception as e:
+                logger.error(f"Rule {rule.name} failed: {e}")
+                results[rule.name] = {}
+            elapsed = time.perf_counter() - rule_started
+            rule_seconds[rule.name] = round(elapsed, 6)
+
+            # Other request threads evaluate and describe() concurrently
+            with self._lock:
+                stats = self.stats.setdefault(rule.name, {'evaluations': 0, 'total_seconds': 0.0})
+                stats['evaluations'] += 1
+                stats['total_seconds'] = round(stats['total_seconds'] + elapsed, 6)
+                stats['last_seconds'] = round(elapsed, 6)
+                stats['last_hits'] = len(results[rule.name])
+
+        return {
+            'results': results,
+            'timings': {
+                'rows_scanned': len(frame.src),
+                'scan_seconds': round(scan_seconds, 6),
+                'rules': rule_seconds,
+                'total_seconds': round(time.perf_counter() - started, 6)
+            }
+        }
+
+    @staticmethod
+    def _evaluate_rule(rule: Rule, frame: _Frame) -> Dict[str, Dict]:
+        key = (rule.window_days, rule.group_by)
+        values = {name: frame.aggregate(*key, *spec) for name, spec in rule.aggregates.items()}
+
+        matched = frame.present(*key).copy()
+        for agg_name, op, operand in rule.when:
+            # NaN (no min/max) matches no condition, '!=' included
+            matched &= OPERATORS[op](values[agg_name], operand) & ~np.isnan(values[agg_name])
+        hits = np.flatnonzero(matched)
+        if not len(hits):
+            return {}
+
+        score = rule.score
+        scale = score.get('scale', 1)
+        if 'ratio' in score:
+            numerator, denominator = (values[a][hits] for a in score['ratio'])
+            raw = scale * np.divide(numerator, denominator, out=np.zeros(len(hits)),
+                                    where=denominator != 0)
+        else:
+            raw = scale * values[score['value']][hits]
+        scores = np.minimum(score['max'], raw) if 'max' in score else raw
+
+        # Strongest first
+        order = np.argsort(-scores, kind='stable')
+        hits, scores = hits[order], scores[order]
+        names = frame.view(*key)[4]
+        columns = {out: _json_list(values[agg_name][hits]) for out, agg_name in rule.details.items()}
+        scores = _json_list(scores)
+        results = {}
+        for i, code in enumerate(hits.tolist()):
+            details = {'pattern': rule.pattern} if rule.pattern else {}
+            details[score['name']] = scores[i]
+            for out, column in columns.items():
+                details[out] = column[i]
+            if rule.window_days is not None:
+                details['period_days'] = rule.window_days
+            results[names[code]] = details
+        return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate the declarative detection rules")
+    parser.add_argument('db_path')
+    parser.add_argument('--rules', default=os.environ.get('AML_RULES_PATH', DEFAULT_RULES_PATH))
+    parser.add_argument('--rule', action='append', help="evaluate only this rule (repeatable)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    from aml_system_v6_enhanced import DatabaseManager
+    engine = RuleEngine(DatabaseManager(args.db_path), args.rules)
+    if engine.load_error:
+        print(json.dumps({'error': engine.load_error}))
+        return 1
+
+    report = engine.evaluate(args.rule)
+    print(json.dumps({
+        'hits': {name: len(hits) for name, hits in report['results'].items()},
+        'timings': report['timings']
+    }, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
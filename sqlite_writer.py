@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Single-Writer Queue for the AML SQLite databases
+One background thread owns the only write connection. Request threads hand
+it writes and wait on futures; writes that arrive together are committed
+together (group commit), each inside its own SAVEPOINT so one failing write
+never takes its neighbours down with it.
+
+Code that has to read its own writes inside a transaction leases the write
+connection for the duration of the block instead.
+"""
+
+import queue
+import sqlite3
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# A write is either a list of (sql, params) pairs or a callable(conn)
+WriteOps = Union[Iterable[Tuple[str, tuple]], Callable[[sqlite3.Connection], object]]
+
+
+class _Lease:
+    def __init__(self):
+        self.granted = threading.Event()
+        self.released = threading.Event()
+        self.conn: Optional[sqlite3.Connection] = None
+
+
+class SingleWriter:
+    """Serialise all writes to one SQLite database through one thread"""
+
+    def __init__(self, factory: Callable[[], sqlite3.Connection], busy_timeout: float = 30.0,
+                 max_batch: int = 256, max_queue: int = 10000, name: str = 'sqlite-writer'):
+        self.factory = factory
+        self.busy_timeout = busy_timeout
+        self.max_batch = max_batch
+        self._queue: 'queue.Queue' = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._lock = threading.Lock()
+        self._stats = {'writes': 0, 'failed': 0, 'commits': 0, 'leases': 0,
+                       'max_group': 0, 'total_commit_ms': 0.0}
+        self._lease_owner: Optional[int] = None
+        self._lease_conn: Optional[sqlite3.Connection] = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    # ---- request-thread API ----
+
+    def submit(self, ops: WriteOps) -> Future:
+        """Queue a write; the future resolves to its result once committed"""
+        future = Future()
+        if self._closed:
+            future.set_exception(RuntimeError("Writer is closed"))
+        elif self._lease_owner == threading.get_ident():
+            # The caller holds the lease: queueing would deadlock, so run the
+            # write inline as part of its transaction
+            try:
+                future.set_result(self._apply(self._lease_conn, ops))
+            except Exception as e:
+                future.set_exception(e)
+        else:
+            self._queue.put((ops, future))
+        return future
+
+    def execute(self, sql: str, params: tuple = (), timeout: Optional[float] = None) -> int:
+        """Run one statement through the writer and return its rowcount"""
+        return self.submit([(sql, params)]).result(timeout)
+
+    def executemany(self, sql: str, params_list, timeout: Optional[float] = None) -> int:
+        return self.submit(lambda conn: conn.executemany(sql, params_list).rowcount).result(timeout)
+
+    @contextmanager
+    def lease(self, timeout: Optional[float] = None):
+        """Borrow the write connection exclusively: `with writer.lease() as conn:`.
+
+        The writer thread commits whatever it has batched, then waits until
+        the block exits. The caller owns the transaction (BEGIN/COMMIT).
+        """
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("lease() called from the writer thread")
+        lease = _Lease()
+        self._queue.put((lease, None))
+        if not lease.granted.wait(timeout):
+            # Too late to withdraw: release as soon as it is granted
+            lease.released.set()
+            raise TimeoutError(f"Write connection not available within {timeout}s")
+        self._lease_owner, self._lease_conn = threading.get_ident(), lease.conn
+        try:
+            yield lease.conn
+        finally:
+            self._lease_owner, self._lease_conn = None, None
+            if lease.conn.in_transaction:
+                lease.conn.rollback()
+            lease.released.set()
+
+    def close(self, timeout: float = 10.0):
+        """Finish queued writes and stop the writer thread"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put((None, None))
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            s = dict(self._stats)
+        total = s.pop('total_commit_ms')
+        s['avg_commit_ms'] = round(total / s['commits'], 3) if s['commits'] else 0.0
+        s['queue_depth'] = self._queue.qsize()
+        return s
+
+    # ---- writer thread ----
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = self.factory()
+        # Transactions are managed explicitly below
+        conn.isolation_level = None
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout * 1000)}")
+        return conn
+
+    def _run(self):
+        conn = self._connect()
+        self._ready.set()
+        try:
+            stop = False
+            while not stop:
+                group = [self._queue.get()]
+                while len(group) < self.max_batch:
+                    try:
+                        group.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                writes = []
+                for ops, future in group:
+                    if ops is None:
+                        stop = True
+                    elif isinstance(ops, _Lease):
+                        # Commit what came before the lease, then hand over
+                        self._commit_group(conn, writes)
+                        writes = []
+                        self._grant(conn, ops)
+                    else:
+                        writes.append((ops, future))
+                self._commit_group(conn, writes)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _apply(conn, ops: WriteOps):
+        if callable(ops):
+            return ops(conn)
+        result = 0
+        for sql, params in ops:
+            result += max(conn.execute(sql, params).rowcount, 0)
+        return result
+
+    def _grant(self, conn, lease: _Lease):
+        lease.conn = conn
+        lease.granted.set()
+        lease.released.wait()
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            self._stats['leases'] += 1
+
+    def _commit_group(self, conn, writes):
+        if not writes:
+            return
+        started = time.perf_counter()
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for i, (ops, future) in enumerate(writes):
+                conn.execute(f"SAVEPOINT w{i}")
+                try:
+                    result = self._apply(conn, ops)
+                    conn.execute(f"RELEASE w{i}")
+                    results.append((future, result, None))
+                except Exception as e:
+                    conn.execute(f"ROLLBACK TO w{i}")
+                    conn.execute(f"RELEASE w{i}")
+                    results.append((future, None, e))
+            conn.execute("COMMIT")
+        except Exception as e:
+            # Could not begin or commit (e.g. busy beyond busy_timeout): fail the group
+            logger.error(f"Group commit of {len(writes)} writes failed: {e}")
+            if conn.in_transaction:
+                conn.rollback()
+            for _, future in writes:
+                future.set_exception(e)
+            with self._lock:
+                self._stats['failed'] += len(writes)
+            return
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._stats['commits'] += 1
+            self._stats['writes'] += len(writes)
+            self._stats['failed'] += sum(1 for _, _, e in results if e is not None)
+            self._stats['max_group'] = max(self._stats['max_group'], len(writes))
+            self._stats['total_commit_ms'] += elapsed_ms
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Bounded k-Hop Subgraph Extraction
+Expands outward from one entity a hop at a time over network_edges. Every
+frontier node reads at most `fan_out` of its edges per direction, heaviest
+first, off the (entity, total_amount) covering indexes, so a hub with 100k
+counterparties costs `fan_out` index entries instead of a scan. Edges below
+`min_amount` or outside the since/until window are skipped. Expansion stops
+after `hops`, or early at the node budget, the edge budget or the deadline;
+nodes and edges are yielded as they are found so the API can stream them.
+
+Output is NDJSON, one object per line:
+    {"type": "node", "entity_id": ..., "hop": 1}
+    {"type": "edge", "source": ..., "destination": ..., "total_amount": ..., "hop": 1, ...}
+    {"type": "summary", "nodes": ..., "edges": ..., "truncated": null | "max_nodes" | ...}
+
+Usage:
+    python subgraph.py aml_system.db ENTITY_ID [--hops 2] [--fan-out 100]
+                       [--min-amount 0] [--since 2024-01-01] [--until 2024-06-30]
+                       [--direction both] [--max-nodes 5000] [--max-edges 50000]
+"""
+
+import sys
+import json
+import time
+import logging
+import sqlite3
+import argparse
+from dataclasses import dataclass, asdict, replace
+from typing import Dict, Iterator, Mapping, Optional
+
+from aml_time import to_epoch
+
+logger = logging.getLogger(__name__)
+
+DIRECTIONS = ('out', 'in', 'both')
+MAX_HOPS = 6
+
+# `other` is the counterparty; ORDER BY + LIMIT walk the amount index backwards
+NEIGHBOUR_QUERY = """
+    SELECT {other}, total_amount, transaction_count, first_seen, last_seen
+    FROM network_edges
+    WHERE {entity} = ? AND total_amount >= ?
+      AND (? IS NULL OR last_seen >= ?) AND (? IS NULL OR first_seen <= ?)
+    ORDER BY total_amount DESC
+    LIMIT ?
+"""
+QUERIES = {
+    'out': NEIGHBOUR_QUERY.format(entity='source_entity', other='destination_entity'),
+    'in': NEIGHBOUR_QUERY.format(entity='destination_entity', other='source_entity'),
+}
+# The same edges aggregated from the transactions, while network_edges is being backfilled
+TRANSACTION_NEIGHBOUR_QUERY = """
+    SELECT {other}, COALESCE(SUM(amount), 0.0) AS total_amount, COUNT(*),
+           MIN(transaction_ts) AS first_seen, MAX(transaction_ts) AS last_seen
+    FROM transactions
+    WHERE {entity} = ? AND {other} IS NOT NULL
+    GROUP BY {other}
+    HAVING total_amount >= ?
+      AND (? IS NULL OR last_seen >= ?) AND (? IS NULL OR first_seen <= ?)
+    ORDER BY total_amount DESC
+    LIMIT ?
+"""
+TRANSACTION_QUERIES = {
+    'out': TRANSACTION_NEIGHBOUR_QUERY.format(entity='source_entity', other='destination_entity'),
+    'in': TRANSACTION_NEIGHBOUR_QUERY.format(entity='destination_entity', other='source_entity'),
+}
+
+
+@dataclass(frozen=True)
+class SubgraphLimits:
+    """How far and how wide one extraction may go"""
+    hops: int = 2
+    direction: str = 'both'
+    fan_out: int = 100            # edges read per node and direction, heaviest first
+    min_amount: float = 0.0       # edge total_amount
+    since: Optional[int] = None   # epoch; edges last seen at or after
+    until: Optional[int] = None   # epoch; edges first seen at or before
+    max_nodes: int = 5000
+    max_edges: int = 50000
+    deadline: Optional[float] = None  # seconds
+
+    def __post_init__(self):
+        if not 0 <= self.hops <= MAX_HOPS:
+            raise ValueError(f"hops must be between 0 and {MAX_HOPS}")
+        if self.direction not in DIRECTIONS:
+            raise ValueError(f"direction must be one of {', '.join(DIRECTIONS)}")
+        if self.fan_out < 1 or self.max_nodes < 1 or self.max_edges < 0:
+            raise ValueError("fan_out and max_nodes must be positive, max_edges not negative")
+        if self.since is not None and self.until is not None and self.since > self.until:
+            raise ValueError("since is after until")
+
+    @classmethod
+    def from_args(cls, args: Mapping[str, str], max_nodes: Optional[int] = None,
+                  max_edges: Optional[int] = None, deadline: Optional[float] = None) -> 'SubgraphLimits':
+        """Limits from query-string values (raises ValueError); `max_*` and
+        `deadline` cap what a caller may ask for.
+        """
+        values = {}
+        for name, parse in (('hops', int), ('fan_out', int), ('min_amount', float),
+                            ('max_nodes', int), ('max_edges', int)):
+            if args.get(name) not in (None, ''):
+                try:
+                    values[name] = parse(args[name])
+                except ValueError:
+                    raise ValueError(f"{name} must be a number") from None
+        for name in ('since', 'until'):
+            if args.get(name) not in (None, ''):
+                try:
+                    values[name] = to_epoch(float(args[name]))
+                except ValueError:
+                    values[name] = to_epoch(args[name])
+                if values[name] is None:
+                    raise ValueError(f"{name} must be an ISO date or epoch seconds")
+        if args.get('direction'):
+            values['direction'] = args['direction']
+        limits = cls(**values)
+        if max_nodes is not None and limits.max_nodes > max_nodes:
+            limits = replace(limits, max_nodes=max_nodes)
+        if max_edges is not None and limits.max_edges > max_edges:
+            limits = replace(limits, max_edges=max_edges)
+        if deadline is not None:
+            limits = replace(limits, deadline=deadline)
+        return limits
+
+
+def _neighbours(conn: sqlite3.Connection, entity_id: str, limits: SubgraphLimits, queries: Dict):
+    """Edges of one node within the limits as (source, destination, other, row),
+    and whether any direction had more than fan_out of them.
+    """
+    window = (limits.since, limits.since, limits.until, limits.until)
+    directions = ('out', 'in') if limits.direction == 'both' else (limits.direction,)
+    edges, capped = [], False
+    for direction in directions:
+        rows = conn.execute(queries[direction],
+                            (entity_id, limits.min_amount, *window, limits.fan_out + 1)).fetchall()
+        if len(rows) > limits.fan_out:
+            capped, rows = True, rows[:limits.fan_out]
+        for row in rows:
+            source, destination = (entity_id, row[0]) if direction == 'out' else (row[0], entity_id)
+            edges.append((source, destination, row[0], row))
+    return edges, capped
+
+
+def expand(conn: sqlite3.Connection, entity_id: str, limits: SubgraphLimits,
+           from_transactions: bool = False) -> Iterator[Dict]:
+    """Breadth-first expansion from entity_id; yields node and edge dicts and
+    ends with a summary. Reads in one transaction, so a streamed result is one
+    consistent cut of network_edges. Edges between two nodes of the last hop
+    are not read (that would be one more hop of queries). With
+    from_transactions=True each node's edges are aggregated from its
+    transactions instead.
+    """
+    queries = TRANSACTION_QUERIES if from_transactions else QUERIES
+    started = time.monotonic()
+    hop_of = {entity_id: 0}
+    emitted = set()
+    capped_nodes = 0
+    truncated = None
+    hop = 0
+    frontier = [entity_id]
+
+    conn.execute("BEGIN")
+    try:
+        yield {'type': 'node', 'entity_id': entity_id, 'hop': 0}
+        while frontier and hop < limits.hops and truncated is None:
+            hop += 1
+            following = []
+            for node in frontier:
+                if limits.deadline is not None and time.monotonic() - started > limits.deadline:
+                    truncated = 'deadline'
+                    break
+                edges, capped = _neighbours(conn, node, limits, queries)
+                capped_nodes += capped
+                for source, destination, other, row in edges:
+                    if (source, destination) in emitted:
+                        continue
+                    if other not in hop_of:
+                        if len(hop_of) >= limits.max_nodes:
+                            truncated = 'max_nodes'
+                            break
+                        hop_of[other] = hop
+                        following.append(other)
+                        yield {'type': 'node', 'entity_id': other, 'hop': hop}
+                    if len(emitted) >= limits.max_edges:
+                        truncated = 'max_edges'
+                        break
+                    emitted.add((source, destination))
+                    yield {'type': 'edge', 'source': source, 'destination': destination,
+                           'total_amount': row[1], 'transaction_count': row[2],
+                           'first_seen': row[3], 'last_seen': row[4], 'hop': hop}
+                if truncated:
+                    break
+            frontier = following
+    finally:
+        conn.rollback()
+
+    yield {'type': 'summary', 'entity_id': entity_id, 'nodes': len(hop_of), 'edges': len(emitted),
+           'hops': hop, 'truncated': truncated, 'fan_out_capped': capped_nodes,
+           'seconds': round(time.monotonic() - started, 4), 'limits': asdict(limits)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print the bounded k-hop subgraph of an entity as NDJSON")
+    parser.add_argument('db_path')
+    parser.add_argument('entity_id')
+    parser.add_argument('--hops', type=int, default=2)
+    parser.add_argument('--direction', choices=DIRECTIONS, default='both')
+    parser.add_argument('--fan-out', type=int, default=100)
+    parser.add_argument('--min-amount', type=float, default=0.0)
+    parser.add_argument('--since', help="ISO date or epoch seconds")
+    parser.add_argument('--until', help="ISO date or epoch seconds")
+    parser.add_argument('--max-nodes', type=int, default=5000)
+    parser.add_argument('--max-edges', type=int, default=50000)
+    args = parser.parse_args(argv)
+
+    try:
+        limits = SubgraphLimits.from_args({name: str(value) for name, value in vars(args).items()
+                                           if value is not None and name not in ('db_path', 'entity_id')})
+    except ValueError as e:
+        parser.error(str(e))
+    conn = sqlite3.connect(args.db_path)
+    try:
+        for item in expand(conn, args.entity_id, limits):
+            print(json.dumps(item))
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Equivalence Test - Vectorized anomaly scoring
+Checks that AnomalyDetector.score_batch gives, row by row, the score and
+reasons of score_with_stats against entity_stats replayed up to that row,
+on seeded streams with zero-variance entities, single-transaction entities,
+an entity moving far larger amounts than the rest, self-transfers and
+undated rows; and that rescore_transactions rewrites the anomaly_score every
+insert stored.
+No server needed.
+
+Usage:
+    python test_anomaly_batch.py
+"""
+
+import sys
+import time
+import random
+from collections import defaultdict
+from datetime import datetime
+
+
+def print_header(title):
+    print(f"\n{'='*60}")
+    print(f"  {title}")
+    print(f"{'='*60}\n")
+
+
+def seeded_stream(rng, now, rows):
+    """(source, destination, amount, ts) rows: random parties plus a
+    zero-variance pair (Z0/Z1, always 500.0), single-transaction entities
+    (S*) and an entity moving hundreds of millions (A0, grouped before the
+    others). Timestamps sit mid-day relative to `now` so the days-since-first
+    count cannot change while the test runs.
+    """
+    parties = [f"E{i}" for i in range(25)]
+    stream = []
+    for i in range(rows):
+        ts = now - rng.randint(0, 60) * 86400 - 43200 + rng.randint(-3600, 3600)
+        if rng.random() < 0.05:
+            ts = None
+        pick = rng.random()
+        if pick < 0.03:
+            stream.append(('A0', 'A1', round(rng.uniform(2e8, 9e8), 2), ts))
+        elif pick < 0.1:
+            stream.append(('Z0', 'Z1', 500.0, ts))
+        elif pick < 0.15:
+            stream.append((f"S{i}", rng.choice(parties), round(rng.uniform(10, 5000), 2), ts))
+        else:
+            source, destination = rng.choice(parties), rng.choice(parties)
+            stream.append((source, destination, round(rng.lognormvariate(7, 1.2), 2), ts))
+    return stream
+
+
+def replay_scores(detector, stream):
+    """score_with_stats per row against the stats of the rows before it"""
+    import entity_stats
+
+    stats = {}
+    expected = []
+    for source, destination, amount, ts in stream:
+        for entity in (source, destination):
+            stats.setdefault(entity, entity_stats.EntityStats(entity))
+        expected.append(detector.score_with_stats(
+            {'amount': amount, 'transaction_ts': ts, 'destination_entity': destination}, stats[source]))
+        entity_stats.record(stats, source, destination, amount, ts)
+    return expected
+
+
+def test_score_batch_matches_per_row():
+    """score_batch equals score_with_stats on every row"""
+    print_header("TEST 1: score_batch vs per-row score_with_stats")
+    import numpy as np
+    from aml_system_v6_enhanced import AnomalyDetector
+
+    rng = random.Random(14)
+    detector = AnomalyDetector()
+    now = int(time.time())
+    checked = scored = 0
+    for _ in range(20):
+        stream = seeded_stream(rng, now, 400)
+        expected = replay_scores(detector, stream)
+        source, destination, amount, ts = zip(*stream)
+        timestamps = [np.nan if t is None else t for t in ts]
+        scores, flags, zscores = detector.score_batch(amount, timestamps, source, destination, now)
+        for i, (score, reasons) in enumerate(expected):
+            assert abs(scores[i] - score) < 1e-6, (i, stream[i], scores[i], score, reasons)
+            batch = detector.batch_reasons(int(flags[i]), float(zscores[i]))
+            assert [r.split(' (')[0] for r in batch] == [r.split(' (')[0] for r in reasons], \
+                (i, stream[i], batch, reasons)
+        zero_variance = [i for i, row in enumerate(stream) if row[0] == 'Z0']
+        assert zero_variance and all(zscores[i] == 0 for i in zero_variance)
+        singles = [i for i, row in enumerate(stream) if row[0].startswith('S')]
+        assert singles and all(scores[i] == 0 for i in singles)
+        checked += len(stream)
+        scored += int((scores > 0).sum())
+    print(f"✅ {checked} rows identical to score_with_stats ({scored} scored above zero)")
+
+
+def test_rescore_matches_inserts():
+    """rescore_transactions rewrites the score each insert stored, row by row"""
+    print_header("TEST 2: rescore_transactions vs scores stored on insert")
+    from aml_system_v6_enhanced import CaseManager, EntityManager
+    from test_structuring_batch import seeded_database
+
+    db, entity_ids = seeded_database(2000)
+    extra = ['Z0', 'Z1', 'S0', 'S1', 'S2']
+    with db.connection() as conn:
+        conn.executemany("INSERT INTO entities (entity_id, name, entity_type) VALUES (?, ?, 'account')",
+                         [(e, e) for e in extra])
+        conn.commit()
+    case_id = db.execute_query("SELECT case_id FROM aml_cases")[0][0]
+    case_mgr = CaseManager(db, EntityManager(db), None, None, None)
+    date = datetime.now().replace(hour=12, microsecond=0).isoformat()
+    rows = ([{'source_entity': 'Z0', 'destination_entity': 'Z1', 'amount': 500.0, 'transaction_date': date}] * 8
+            + [{'source_entity': 'S0', 'destination_entity': 'S1', 'amount': 75000.0, 'transaction_date': date},
+               {'source_entity': 'S2', 'destination_entity': 'E0', 'amount': 120.0, 'transaction_date': date}])
+    assert case_mgr.add_transactions_bulk(case_id, rows[:4])['success']
+    for row in rows[4:]:
+        success, message = case_mgr.add_transaction_to_case(case_id, row)
+        assert success, message
+
+    query = "SELECT transaction_id, source_entity, anomaly_score FROM transactions ORDER BY rowid"
+    stored = db.execute_query(query)
+    written = case_mgr.rescore_transactions(chunk_size=700)
+    rescored = db.execute_query(query)
+    assert written == len(stored) == len(rescored)
+    by_source = defaultdict(list)
+    for before, after in zip(stored, rescored):
+        assert before[0] == after[0]
+        assert abs(before[2] - after[2]) < 1e-6, (tuple(before), tuple(after))
+        by_source[before[1]].append(after[2])
+    assert by_source['S0'] == [0.0] and by_source['S2'] == [0.0]
+    assert all(score == by_source['Z0'][1] for score in by_source['Z0'][1:])
+
+    anomalies = db.execute_query("SELECT COUNT(*) FROM anomaly_scores")[0][0]
+    assert anomalies == sum(1 for row in rescored if row[2] > 0), anomalies
+    print(f"✅ {written} rescored rows identical to the scores stored on insert")
+
+
+def run_all_tests():
+    results = []
+    for test in (test_score_batch_matches_per_row, test_rescore_matches_inserts):
+        try:
+            test()
+            results.append(True)
+        except AssertionError as e:
+            print(f"❌ Failed: {e}")
+            results.append(False)
+    print_header(f"RESULTS: {sum(results)}/{len(results)} passed")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run_all_tests() else 1)
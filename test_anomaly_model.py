@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Shadow Model Test - Isolation forest anomaly model
+Checks that a seeded forest scores planted outliers above every inlier (one
+row at a time, in batches and after a save/load round trip), and that
+shadow scoring on inserts writes model_scores rows without changing the
+live anomaly_score.
+No server needed.
+
+Usage:
+    python test_anomaly_model.py
+"""
+
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+
+def print_header(title):
+    print(f"\n{'='*60}")
+    print(f"  {title}")
+    print(f"{'='*60}\n")
+
+
+def test_outliers_score_above_inliers():
+    """Planted outliers outscore every inlier, for score(), score_batch() and a reloaded model"""
+    print_header("TEST 1: Planted outliers vs inliers")
+    import numpy as np
+    from anomaly_model import AnomalyModel, FEATURES
+
+    rng = np.random.default_rng(19)
+    inliers = rng.normal(0.0, 1.0, (3000, len(FEATURES)))
+    # Every feature pushed 6-9 standard deviations out, in a random direction
+    outliers = rng.choice([-1.0, 1.0], (30, len(FEATURES))) * rng.uniform(6.0, 9.0, (30, len(FEATURES)))
+    X = np.vstack([inliers, outliers])
+    model = AnomalyModel.train(X, trees=100, sample_size=256, contamination=0.01, seed=19)
+
+    scores = model.score_batch(X)
+    inlier_scores, outlier_scores = scores[:len(inliers)], scores[len(inliers):]
+    assert outlier_scores.min() > inlier_scores.max(), (outlier_scores.min(), inlier_scores.max())
+    assert (outlier_scores >= model.alert_threshold).all(), (outlier_scores.min(), model.alert_threshold)
+    assert np.allclose([model.score(x) for x in X[::37]], scores[::37])
+
+    model_dir = os.path.join(tempfile.mkdtemp(prefix='aml_model_'), 'anomaly')
+    version = model.save(model_dir)
+    loaded = AnomalyModel.load(model_dir)
+    assert loaded.version == version and np.array_equal(loaded.score_batch(X), scores)
+    print(f"✅ Lowest outlier {outlier_scores.min():.3f} > highest inlier {inlier_scores.max():.3f}; "
+          f"alert threshold {model.alert_threshold:.3f}")
+
+
+def test_shadow_scores_leave_live_result():
+    """Inserts with a model loaded write model_scores and the heuristic anomaly_score unchanged"""
+    print_header("TEST 2: Shadow scoring on inserts")
+    import numpy as np
+    import entity_stats
+    import anomaly_model
+    from aml_time import to_epoch
+    from aml_system_v6_enhanced import AnomalyDetector, CaseManager, EntityManager
+    from test_structuring_batch import seeded_database
+
+    db, entity_ids = seeded_database(3000)
+    model = anomaly_model.AnomalyModel.train(anomaly_model.training_matrix(db), trees=50, seed=19)
+    model_dir = os.path.join(tempfile.mkdtemp(prefix='aml_model_'), 'anomaly')
+    model.save(model_dir)
+    case_mgr = CaseManager(db, EntityManager(db), None, None, None)
+    assert case_mgr.reload_anomaly_model(model_dir)[0]
+    case_id = db.execute_query("SELECT case_id FROM aml_cases")[0][0]
+
+    # Ordinary rows in bulk, then planted outliers one by one
+    date = datetime.now().replace(hour=14, microsecond=0).isoformat()
+    night = datetime.now().replace(hour=3, microsecond=0).isoformat()
+    typical = db.execute_query("SELECT AVG(amount) FROM transactions")[0][0]
+    rows = [{'source_entity': entity_ids[i % 40], 'destination_entity': entity_ids[(i * 7 + 1) % 40],
+             'amount': round(typical * (0.5 + (i % 10) / 10), 2), 'transaction_date': date}
+            for i in range(200)]
+    result = case_mgr.add_transactions_bulk(case_id, rows)
+    assert result['success'] and result['inserted'] == len(rows), result
+
+    planted = {}
+    for i in range(5):
+        row = {'source_entity': entity_ids[i], 'destination_entity': entity_ids[39 - i],
+               'amount': 5e8, 'transaction_date': night}
+        with db.connection() as conn:
+            stats = entity_stats.load(conn, [row['source_entity']])[row['source_entity']]
+        expected = AnomalyDetector().score_with_stats(dict(row, transaction_ts=to_epoch(night)), stats)[0]
+        assert case_mgr.add_transaction_to_case(case_id, row)[0]
+        planted[row['source_entity']] = expected
+
+    shadow = db.execute_query("""
+        SELECT t.source_entity, t.amount, t.anomaly_score, m.heuristic_score, m.score, m.model_version
+        FROM transactions t JOIN model_scores m ON m.transaction_id = t.transaction_id
+    """)
+    assert len(shadow) == len(rows) + len(planted), len(shadow)
+    assert all(r[5] == model.version and abs(r[2] - r[3]) < 1e-9 for r in shadow)
+    for source, amount, anomaly_score, _, _, _ in shadow:
+        if amount == 5e8:
+            assert abs(anomaly_score - planted[source]) < 1e-9, (source, anomaly_score, planted[source])
+    ordinary = np.array([r[4] for r in shadow if r[1] != 5e8])
+    outliers = np.array([r[4] for r in shadow if r[1] == 5e8])
+    assert outliers.min() > np.median(ordinary), (outliers.min(), np.median(ordinary))
+
+    # The live scores are the heuristic detector's alone
+    live = db.execute_query("SELECT transaction_id, anomaly_score FROM transactions ORDER BY rowid")
+    case_mgr.rescore_transactions()
+    rescored = db.execute_query("SELECT transaction_id, anomaly_score FROM transactions ORDER BY rowid")
+    assert all(a[0] == b[0] and abs(a[1] - b[1]) < 1e-6 for a, b in zip(live, rescored))
+    print(f"✅ {len(shadow)} shadow rows; planted outliers {outliers.min():.3f}+ vs median "
+          f"{np.median(ordinary):.3f}; anomaly_score unchanged")
+
+
+def run_all_tests():
+    results = []
+    for test in (test_outliers_score_above_inliers, test_shadow_scores_leave_live_result):
+        try:
+            test()
+            results.append(True)
+        except AssertionError as e:
+            print(f"❌ Failed: {e}")
+            results.append(False)
+    print_header(f"RESULTS: {sum(results)}/{len(results)} passed")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run_all_tests() else 1)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Stress Test - Write-behind audit trail
+Pushes more audit records than the AuditWriter queue holds, through a writer
+slowed down enough for producers to hit backpressure and the synchronous
+fallback, and checks that every record submitted is in audit_trail after
+close(), including records submitted while close() runs. Also checks that
+AuditTrail writes synchronously unless write-behind is asked for.
+Runs against throwaway databases; no server needed.
+
+Usage:
+    python test_audit_writer.py [--writers 8] [--rows 200]
+"""
+
+import os
+import sys
+import time
+import uuid
+import argparse
+import tempfile
+import threading
+
+WRITERS = 8
+ROWS_PER_WRITER = 200
+
+
+def print_header(title):
+    print(f"\n{'='*60}")
+    print(f"  {title}")
+    print(f"{'='*60}\n")
+
+
+class SlowWriter:
+    """The database's SingleWriter, taking `delay` seconds longer per batch"""
+
+    def __init__(self, writer, delay):
+        self.writer = writer
+        self.delay = delay
+
+    def executemany(self, sql, params):
+        time.sleep(self.delay)
+        return self.writer.executemany(sql, params)
+
+
+def audit_database():
+    """(db, user_id) for a throwaway aml_multi_user.db"""
+    import aml_system
+
+    db = aml_system.Database(os.path.join(tempfile.mkdtemp(prefix='aml_audit_'), 'aml_multi_user.db'))
+    user_id = str(uuid.uuid4())
+    db.execute("INSERT INTO users (id, username, email, password) VALUES (?, 'u', 'u@x', 'x')", (user_id,))
+    return db, user_id
+
+
+def record(user_id, entity_id):
+    return (str(uuid.uuid4()), user_id, 'STRESS', 'CASE', entity_id, '', '', '', '',
+            time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime()))
+
+
+def produce(writer, user_id, writers, rows, during=None):
+    """Submit writers x rows records from `writers` threads; `during` runs
+    once half of them are in. Returns the exceptions raised.
+    """
+    errors = []
+    halfway = threading.Barrier(writers + 1)
+
+    def target(i):
+        try:
+            for n in range(rows):
+                if n == rows // 2:
+                    halfway.wait()
+                writer.submit(record(user_id, f"{i}-{n}"))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(writers)]
+    for t in threads:
+        t.start()
+    halfway.wait()
+    if during:
+        during()
+    for t in threads:
+        t.join()
+    return errors
+
+
+def stored(db):
+    return db.query("SELECT COUNT(DISTINCT entity_id) FROM audit_trail WHERE action = 'STRESS'")[0][0]
+
+
+def test_past_capacity(writers=WRITERS, rows=ROWS_PER_WRITER):
+    """Backpressure and synchronous fallbacks lose nothing; close() drains the rest"""
+    print_header(f"TEST 1: {writers} producers x {rows} records into a 20-record queue")
+    from aml_system import AuditWriter
+
+    db, user_id = audit_database()
+    writer = AuditWriter(SlowWriter(db.writer, 0.01), max_queue=20, batch_size=10, put_timeout=0.02)
+    errors = produce(writer, user_id, writers, rows)
+    # A shutdown too short for the writer thread to catch up
+    writer.writer.delay = 0.1
+    writer.close(timeout=0.05)
+    metrics = writer.metrics()
+    count = stored(db)
+    db.close_all()
+    print(f"Rows: {count}/{writers * rows}, {metrics['backpressure_waits']} backpressure waits, "
+          f"{metrics['sync_fallbacks']} synchronous fallbacks")
+    assert not errors, errors[:3]
+    assert metrics['backpressure_waits'] and metrics['sync_fallbacks'], metrics
+    assert count == writers * rows
+    print("✅ Every record persisted after close()")
+
+
+def test_close_while_submitting(writers=WRITERS, rows=ROWS_PER_WRITER):
+    """Records submitted while close() runs are written, not left in the queue"""
+    print_header("TEST 2: close() with producers still submitting")
+    from aml_system import AuditWriter
+
+    db, user_id = audit_database()
+    writer = AuditWriter(SlowWriter(db.writer, 0.01), max_queue=20, batch_size=10, put_timeout=0.02)
+    errors = produce(writer, user_id, writers, rows, during=lambda: writer.close(timeout=0.05))
+    count = stored(db)
+    db.close_all()
+    print(f"Rows: {count}/{writers * rows}")
+    assert not errors, errors[:3]
+    assert count == writers * rows
+    print("✅ Every record persisted")
+
+
+def test_sync_by_default():
+    """AuditTrail commits each record before log_action returns unless write-behind is chosen"""
+    print_header("TEST 3: Synchronous audit trail by default")
+    from aml_system import AuditTrail
+
+    db, user_id = audit_database()
+    trail = AuditTrail(db)
+    assert trail.writer is None
+    trail.log_action(user_id, 'STRESS', 'CASE', 'sync-0')
+    assert stored(db) == 1
+    trail.close()
+    db.close_all()
+    print("✅ Record committed by log_action itself")
+
+
+def run_all_tests(writers=WRITERS, rows=ROWS_PER_WRITER):
+    results = []
+    for test in (lambda: test_past_capacity(writers, rows),
+                 lambda: test_close_while_submitting(writers, rows),
+                 test_sync_by_default):
+        try:
+            test()
+            results.append(True)
+        except AssertionError as e:
+            print(f"❌ Failed: {e}")
+            results.append(False)
+    print_header(f"RESULTS: {sum(results)}/{len(results)} passed")
+    return all(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write-behind audit trail stress test")
+    parser.add_argument('--writers', type=int, default=WRITERS)
+    parser.add_argument('--rows', type=int, default=ROWS_PER_WRITER)
+    args = parser.parse_args()
+    sys.exit(0 if run_all_tests(args.writers, args.rows) else 1)
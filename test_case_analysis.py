@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Deadline Test - Case analysis on the process pool
+Checks that pooled analysis finds the same patterns as the in-process run,
+and that entities still running when a request's deadline passes do not
+hold the pool's workers: a second request right after one that timed out
+on slow entities still finishes within its own deadline.
+No server needed.
+
+Usage:
+    python test_case_analysis.py
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+SLOW_ENTITIES = ('E0', 'E1')
+SLOW_FLAG = 'AML_TEST_SLOW_ANALYSIS_FLAG'
+
+
+def print_header(title):
+    print(f"\n{'='*60}")
+    print(f"  {title}")
+    print(f"{'='*60}\n")
+
+
+def slow_task(entity_id):
+    """The worker task, stalled on SLOW_ENTITIES while the flag file exists"""
+    import aml_system_v6_enhanced
+    flag = os.environ.get(SLOW_FLAG)
+    if entity_id in SLOW_ENTITIES and flag and os.path.exists(flag):
+        time.sleep(120)
+    return aml_system_v6_enhanced._analyze_entity_task(entity_id)
+
+
+def case_manager(db, workers):
+    from aml_system_v6_enhanced import CaseManager, EntityManager, NetworkAnalyzer, PatternDetector, RiskScorer
+    detector, analyzer = PatternDetector(db), NetworkAnalyzer(db)
+    return CaseManager(db, EntityManager(db), detector, RiskScorer(db, detector, analyzer), analyzer,
+                       analysis_workers=workers)
+
+
+def test_pool_matches_inline():
+    """Every entity analyzed on the pool gives the in-process patterns"""
+    print_header("TEST 1: Pooled vs in-process analysis")
+    from test_structuring_batch import seeded_database
+
+    db, entity_ids = seeded_database(600)
+    case_id = db.execute_query("SELECT case_id FROM aml_cases")[0][0]
+    inline = case_manager(db, 0).analyze_case(case_id, deadline=60)
+    pooled_mgr = case_manager(db, 2)
+    try:
+        pooled = pooled_mgr.analyze_case(case_id, deadline=60)
+    finally:
+        pooled_mgr.close_analysis_pool()
+    assert not inline['partial'] and not pooled['partial']
+    assert pooled['entity_patterns'] == inline['entity_patterns']
+    print(f"✅ {len(entity_ids)} entities, identical patterns on the pool")
+
+
+def test_slow_entities_do_not_hold_workers():
+    """A request after one that timed out on slow entities meets its own deadline"""
+    print_header("TEST 2: Deadline with entities still running")
+    import aml_system_v6_enhanced
+    from test_structuring_batch import seeded_database
+
+    db, entity_ids = seeded_database(400)
+    case_id = db.execute_query("SELECT case_id FROM aml_cases")[0][0]
+    flag = os.path.join(tempfile.mkdtemp(prefix='aml_analysis_'), 'slow')
+    open(flag, 'w').close()
+    os.environ[SLOW_FLAG] = flag
+    original = aml_system_v6_enhanced._analyze_entity_task
+    aml_system_v6_enhanced._analyze_entity_task = slow_task
+    case_mgr = case_manager(db, 2)
+    try:
+        started = time.monotonic()
+        first = case_mgr.analyze_case(case_id, deadline=4)
+        first_seconds = time.monotonic() - started
+        assert first['partial'] and first_seconds < 15, (first['partial'], first_seconds)
+        assert not set(SLOW_ENTITIES) & set(first['entity_patterns'])
+
+        os.remove(flag)
+        started = time.monotonic()
+        second = case_mgr.analyze_case(case_id, deadline=30)
+        second_seconds = time.monotonic() - started
+        assert not second['partial'] and second_seconds < 30, (second['partial'], second_seconds)
+        assert set(SLOW_ENTITIES) <= set(second['entity_patterns'])
+    finally:
+        aml_system_v6_enhanced._analyze_entity_task = original
+        os.environ.pop(SLOW_FLAG, None)
+        case_mgr.close_analysis_pool()
+    print(f"✅ First request partial after {first_seconds:.1f}s; "
+          f"second finished all {len(entity_ids)} entities in {second_seconds:.1f}s")
+
+
+def run_all_tests():
+    results = []
+    for test in (test_pool_matches_inline, test_slow_entities_do_not_hold_workers):
+        try:
+            test()
+            results.append(True)
+        except AssertionError as e:
+            print(f"❌ Failed: {e}")
+            results.append(False)
+    print_header(f"RESULTS: {sum(results)}/{len(results)} passed")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run_all_tests() else 1)
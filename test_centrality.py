@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Equivalence Test - Whole-network centrality
+Checks the sparse power iteration against dense references (PageRank as a
+linear solve, betweenness as textbook Brandes with all sources), and that a
+stored run feeds RiskScorer and warm-starts the next one.
+No server needed.
+
+Usage:
+    python test_centrality.py
+"""
+
+import sys
+import random
+from collections import deque
+
+import numpy as np
+
+
+def print_header(title):
+    print(f"\n{'='*60}")
+    print(f"  {title}")
+    print(f"{'='*60}\n")
+
+
+def random_graph(rng):
+    from transaction_graph import TransactionGraph
+    ids = [f"E{i}" for i in range(rng.randint(3, 40))]
+    pairs = {(rng.choice(ids), rng.choice(ids)) for _ in range(rng.randint(2, 200))}
+    edges = [(s, d, round(rng.uniform(1, 90000), 2), rng.randint(1, 9)) for s, d in pairs]
+    return TransactionGraph.from_edges(*zip(*edges))
+
+
+def dense_pagerank(graph, damping=0.85):
+    n = graph.node_count
+    W = np.zeros((n, n))
+    np.add.at(W, (graph.edge_sources(), graph.targets), graph.amount)
+    out = W.sum(axis=1)
+    M = np.where(out[:, None] > 0, W / np.where(out > 0, out, 1)[:, None], 1.0 / n)
+    x = np.linalg.solve(np.eye(n) - damping * M.T, np.full(n, (1 - damping) / n))
+    return x / x.sum()
+
+
+def brandes(graph):
+    n, offsets = graph.node_count, graph.out_offsets
+    scores = [0.0] * n
+    for source in range(n):
+        order, parents = [], [[] for _ in range(n)]
+        paths, distance = [0] * n, [-1] * n
+        paths[source], distance[source] = 1, 0
+        queue = deque([source])
+        while queue:
+            v = queue.popleft()
+            order.append(v)
+            for w in graph.targets[offsets[v]:offsets[v + 1]].tolist():
+                if distance[w] < 0:
+                    distance[w] = distance[v] + 1
+                    queue.append(w)
+                if distance[w] == distance[v] + 1:
+                    paths[w] += paths[v]
+                    parents[w].append(v)
+        dependency = [0.0] * n
+        while order:
+            w = order.pop()
+            for v in parents[w]:
+                dependency[v] += paths[v] / paths[w] * (1 + dependency[w])
+            if w != source:
+                scores[w] += dependency[w]
+    return np.array(scores)
+
+
+def test_matches_dense_reference():
+    """PageRank and all-source betweenness equal the dense/textbook results"""
+    print_header("TEST 1: Power iteration vs dense reference")
+    import centrality
+
+    rng = random.Random(4)
+    for trial in range(40):
+        graph = random_graph(rng)
+        scores, info = centrality.pagerank(graph, tol=1e-15, max_iter=2000)
+        assert info['converged'], trial
+        assert np.abs(scores - dense_pagerank(graph)).max() < 1e-9, trial
+        exact, _ = centrality.betweenness(graph, samples=graph.node_count)
+        assert np.abs(exact - brandes(graph)).max() < 1e-8, trial
+        vector, info = centrality.eigenvector(graph, tol=1e-12, max_iter=5000)
+        assert abs(np.linalg.norm(vector) - 1) < 1e-9 and (vector >= 0).all(), trial
+    print("✅ 40 random graphs identical to the reference")
+
+
+def test_run_feeds_risk_and_warm_start():
+    """A stored run is a RiskScorer input and the next run starts from it"""
+    print_header("TEST 2: Stored centrality, risk input and warm start")
+    import centrality
+    from aml_system_v6_enhanced import NetworkAnalyzer, RiskScorer, PatternDetector
+    from test_structuring_batch import seeded_database
+
+    db, entity_ids = seeded_database(1000)
+    analyzer = NetworkAnalyzer(db)
+    graph = analyzer.whole_network()
+    first = centrality.run(db, graph, samples=8, seed=1)
+    stored = analyzer.stored_centrality(entity_ids)
+    assert len(stored) == graph.node_count
+    assert abs(sum(row['pagerank'] for row in stored.values()) - 1) < 1e-9
+
+    second = centrality.run(db, graph, samples=8, seed=1)
+    assert second['pagerank']['warm_start'] and not first['pagerank']['warm_start']
+    assert second['pagerank']['iterations'] < first['pagerank']['iterations']
+    assert db.execute_query("SELECT COUNT(DISTINCT run_id) FROM entity_centrality")[0][0] == 1
+
+    # The stored percentile decides the network_centrality component
+    scorer = RiskScorer(db, PatternDetector(db), analyzer)
+    top = max(stored, key=lambda e: stored[e]['network_percentile'])
+    scorer.CENTRALITY_PERCENTILE = 1.01
+    without = scorer.score_entity(top)
+    scorer.CENTRALITY_PERCENTILE = stored[top]['network_percentile']
+    assert scorer.score_entity(top) != without
+    print(f"✅ {graph.node_count} entities stored; warm start {first['pagerank']['iterations']} -> "
+          f"{second['pagerank']['iterations']} PageRank iterations")
+
+
+def run_all_tests():
+    results = []
+    for test in (test_matches_dense_reference, test_run_feeds_risk_and_warm_start):
+        try:
+            test()
+            results.append(True)
+        except AssertionError as e:
+            print(f"❌ Failed: {e}")
+            results.append(False)
+    print_header(f"RESULTS: {sum(results)}/{len(results)} passed")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run_all_tests() else 1)
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Equivalence Test - Incrementally maintained entity clusters
+Checks that the clusters unioned on every insert equal the connected
+components of the transactions (a plain BFS) with the same size, count,
+flow and max risk, that risk updates keep max_risk, that --rebuild
+splits a cluster again after its bridging transaction is deleted, and that
+the backfill migration, run in chunks while inserts keep merging clusters,
+ends with the same components and aggregates.
+No server needed.
+
+Usage:
+    python test_entity_clusters.py
+"""
+
+import sys
+import random
+from collections import defaultdict, deque
+
+
+def print_header(title):
+    print(f"\n{'='*60}")
+    print(f"  {title}")
+    print(f"{'='*60}\n")
+
+
+def reference(db):
+    """Connected components of the transactions, as frozensets of entity ids"""
+    neighbours = defaultdict(set)
+    for source, destination in db.execute_query("SELECT source_entity, destination_entity FROM transactions"):
+        neighbours[source].add(destination)
+        neighbours[destination].add(source)
+    components, seen = set(), set()
+    for start in neighbours:
+        if start in seen:
+            continue
+        component, queue = {start}, deque([start])
+        while queue:
+            for following in neighbours[queue.popleft()] - component:
+                component.add(following)
+                queue.append(following)
+        seen |= component
+        components.add(frozenset(component))
+    return components
+
+
+def stored(db):
+    members = defaultdict(set)
+    for entity_id, cluster_id in db.execute_query("SELECT entity_id, cluster_id FROM entity_clusters"):
+        members[cluster_id].add(entity_id)
+    return {frozenset(m) for m in members.values()}
+
+
+def test_inserts_match_components():
+    """Clusters unioned on insert equal a BFS over the transactions, aggregates included"""
+    print_header("TEST 1: Incremental union-find vs connected components")
+    import entity_clusters
+    from aml_system_v6_enhanced import CaseManager, EntityManager
+    from test_structuring_batch import seeded_database
+
+    db, entity_ids = seeded_database(60)
+    case_mgr = CaseManager(db, EntityManager(db), None, None, None)
+    case_id = db.execute_query("SELECT case_id FROM aml_cases")[0][0]
+    rng = random.Random(6)
+    new_ids = [f"N{i}" for i in range(300)]
+    with db.connection() as conn:
+        conn.executemany("INSERT INTO entities (entity_id, name, entity_type) VALUES (?, ?, 'account')",
+                         [(e, e) for e in new_ids])
+        conn.commit()
+    everyone = entity_ids + new_ids
+    for step in range(6):
+        rows = [{'source_entity': rng.choice(everyone), 'destination_entity': rng.choice(everyone),
+                 'amount': round(rng.uniform(10, 90000), 2)} for _ in range(40)]
+        assert case_mgr.add_transactions_bulk(case_id, rows, batch_size=7)['success']
+        success, message = case_mgr.add_transaction_to_case(case_id, rng.choice(rows))
+        assert success, message
+        assert stored(db) == reference(db), step
+        with db.connection() as conn:
+            report = entity_clusters.check(conn)
+        assert report['mismatched'] == 0, report
+
+    flow = db.execute_query("SELECT COUNT(*), SUM(amount) FROM transactions")[0]
+    totals = db.execute_query("SELECT SUM(transaction_count), SUM(total_flow) FROM clusters")[0]
+    assert totals[0] == flow[0] and abs(totals[1] - flow[1]) < 1e-6 * flow[1]
+    print(f"✅ {len(stored(db))} clusters over {len(everyone)} entities match after every batch")
+
+
+def test_risk_and_rebuild():
+    """max_risk follows risk updates; --rebuild splits clusters after a delete"""
+    print_header("TEST 2: Max risk and rebuild after delete")
+    import entity_clusters
+    from aml_system_v6_enhanced import CaseManager, EntityManager
+    from test_structuring_batch import seeded_database
+
+    db, _ = seeded_database(30)
+    entity_mgr = EntityManager(db)
+    case_mgr = CaseManager(db, entity_mgr, None, None, None)
+    case_id = db.execute_query("SELECT case_id FROM aml_cases")[0][0]
+    with db.connection() as conn:
+        conn.executemany("INSERT INTO entities (entity_id, name, entity_type) VALUES (?, ?, 'account')",
+                         [(e, e) for e in ('A', 'B', 'C', 'D', 'LONE')])
+        conn.commit()
+    for source, destination in (('A', 'B'), ('C', 'D')):
+        assert case_mgr.add_transaction_to_case(case_id, {'source_entity': source, 'destination_entity': destination,
+                                                          'amount': 100.0})[0]
+    entity_mgr.update_entity_risk('D', 70.0)
+    assert case_mgr.add_transaction_to_case(case_id, {'source_entity': 'B', 'destination_entity': 'C',
+                                                      'amount': 50.0})[0]
+    cluster = entity_mgr.get_cluster('A')
+    assert (cluster['size'], cluster['transaction_count'], cluster['total_flow'], cluster['max_risk']) == \
+        (4, 3, 250.0, 70.0), cluster
+    entity_mgr.update_entity_risk('A', 90.0)
+    entity_mgr.update_entity_risk('A', 10.0)
+    assert entity_mgr.get_cluster('D')['max_risk'] == 70.0
+    assert entity_mgr.get_cluster('LONE')['size'] == 1 and entity_mgr.get_cluster('nobody') is None
+
+    with db.write_transaction() as conn:
+        bridge = "SELECT transaction_id FROM transactions WHERE source_entity = 'B' AND destination_entity = 'C'"
+        conn.execute(f"DELETE FROM anomaly_scores WHERE transaction_id IN ({bridge})")
+        conn.execute(f"DELETE FROM transactions WHERE transaction_id IN ({bridge})")
+        conn.execute("DELETE FROM network_edges WHERE source_entity = 'B' AND destination_entity = 'C'")
+        entity_clusters.rebuild(conn)
+    assert entity_mgr.get_cluster('A')['size'] == 2 and entity_mgr.get_cluster('C')['max_risk'] == 70.0
+    assert stored(db) == reference(db)
+    print("✅ max_risk kept through risk updates; rebuild splits the cluster again")
+
+
+def test_chunked_backfill():
+    """Migration 16 settles clusters inserts merged before and while it ran"""
+    print_header("TEST 3: Chunked clusters backfill")
+    import entity_clusters
+    from aml_system_v6_enhanced import CaseManager, EntityManager
+    from test_entity_stats import rerun_backfill
+    from test_structuring_batch import seeded_database
+
+    db, entity_ids = seeded_database(60)
+    case_mgr = CaseManager(db, EntityManager(db), None, None, None)
+    case_id = db.execute_query("SELECT case_id FROM aml_cases")[0][0]
+    rng = random.Random(16)
+    new_ids = [f"N{i}" for i in range(300)]
+    with db.connection() as conn:
+        conn.executemany("INSERT INTO entities (entity_id, name, entity_type) VALUES (?, ?, 'account')",
+                         [(e, e) for e in new_ids])
+        conn.commit()
+    everyone = entity_ids + new_ids
+    rows = [{'source_entity': rng.choice(everyone), 'destination_entity': rng.choice(everyone),
+             'amount': round(rng.uniform(10, 90000), 2)} for _ in range(200)]
+    assert case_mgr.add_transactions_bulk(case_id, rows)['success']
+
+    rerun_backfill(db, everyone, 16, 'entity_clusters', 'clusters')
+    assert stored(db) == reference(db)
+    with db.connection() as conn:
+        report = entity_clusters.check(conn)
+    assert report['mismatched'] == 0, report
+    print(f"✅ {len(stored(db))} clusters match the components after the chunked backfill")
+
+
+def run_all_tests():
+    results = []
+    for test in (test_inserts_match_components, test_risk_and_rebuild, test_chunked_backfill):
+        try:
+            test()
+            results.append(True)
+        except AssertionError as e:
+            print(f"❌ Failed: {e}")
+            results.append(False)
+    print_header(f"RESULTS: {sum(results)}/{len(results)} passed")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run_all_tests() else 1)
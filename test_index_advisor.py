@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Consistency Test - Index advisor registry and schema migrations
+Checks that a freshly migrated database of each schema has every index in
+RECOMMENDED_INDEXES (the migrations build theirs from it) and that no
+registered hot query scans a table.
+No server needed.
+
+Usage:
+    python test_index_advisor.py
+"""
+
+import os
+import sys
+import sqlite3
+import tempfile
+
+
+def print_header(title):
+    print(f"\n{'='*60}")
+    print(f"  {title}")
+    print(f"{'='*60}\n")
+
+
+def check_schema(db_path, schema):
+    from index_advisor import IndexAdvisor, RECOMMENDED_INDEXES
+
+    conn = sqlite3.connect(db_path)
+    try:
+        advisor = IndexAdvisor(conn, schema)
+        assert not advisor.missing_indexes(), advisor.missing_indexes()
+        report = advisor.analyze()
+        assert report and all(r.get('ok') for r in report), [r for r in report if not r.get('ok')]
+    finally:
+        conn.close()
+    return len(RECOMMENDED_INDEXES[schema]), len(report)
+
+
+def test_v6_migrations_build_registry():
+    """aml_system.db: every recommended index built, no hot query scans"""
+    print_header("TEST 1: v6 schema")
+    from aml_system_v6_enhanced import DatabaseManager
+
+    db = DatabaseManager(os.path.join(tempfile.mkdtemp(prefix='aml_advisor_'), 'aml_system.db'))
+    indexes, queries = check_schema(db.db_path, 'v6')
+    print(f"✅ {indexes} indexes present, {queries} hot queries without a table scan")
+
+
+def test_v9_migrations_build_registry():
+    """aml_multi_user.db: every recommended index built, no hot query scans"""
+    print_header("TEST 2: v9 schema")
+    from aml_system import Database
+
+    db = Database(os.path.join(tempfile.mkdtemp(prefix='aml_advisor_'), 'aml_multi_user.db'))
+    indexes, queries = check_schema(db.db_path, 'v9')
+    print(f"✅ {indexes} indexes present, {queries} hot queries without a table scan")
+
+
+def run_all_tests():
+    results = []
+    for test in (test_v6_migrations_build_registry, test_v9_migrations_build_registry):
+        try:
+            test()
+            results.append(True)
+        except AssertionError as e:
+            print(f"❌ Failed: {e}")
+            results.append(False)
+    print_header(f"RESULTS: {sum(results)}/{len(results)} passed")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run_all_tests() else 1)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Equivalence Test - Round-trip matcher
+Checks PatternDetector.detect_round_tripping against the original quadratic
+matcher, on synthetic transaction lists and on a throwaway database.
+No server needed.
+
+Usage:
+    python test_round_tripping.py [--cases 300]
+"""
+
+import os
+import sys
+import uuid
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+CASES = 300
+
+
+def print_header(title):
+    print(f"\n{'='*60}")
+    print(f"  {title}")
+    print(f"{'='*60}\n")
+
+
+def quadratic_round_trips(entity_id, results):
+    """The matcher detect_round_tripping used before the sweep, verbatim"""
+    round_trips = []
+
+    for i, result in enumerate(results):
+        source, dest, amount, date = result
+        counterparty = dest if source == entity_id else source
+
+        for j in range(i + 1, len(results)):
+            source2, dest2, amount2, date2 = results[j]
+            counterparty2 = dest2 if source2 == entity_id else source2
+
+            if counterparty == counterparty2 and source2 == entity_id and dest2 != entity_id:
+                time_diff = (datetime.fromisoformat(date2) -
+                             datetime.fromisoformat(date)).days
+                if time_diff <= 3 and abs(amount - amount2) / amount < 0.1:
+                    round_trips.append({
+                        'counterparty': counterparty,
+                        'amount': amount,
+                        'days_between': time_diff
+                    })
+
+    if round_trips:
+        return True, {
+            'pattern': 'round_tripping',
+            'confidence': min(0.9, len(round_trips) / max(1, len(results) / 2)),
+            'round_trip_count': len(round_trips),
+            'examples': round_trips[:3]
+        }
+    return False, {}
+
+
+def random_history(rng, entity_id, size, counterparties, days=30):
+    """Time-ordered (source, destination, amount, date) rows around entity_id"""
+    start = datetime(2026, 1, 1)
+    rows = []
+    for _ in range(size):
+        other = rng.choice(counterparties)
+        source, dest = (entity_id, other) if rng.random() < 0.5 else (other, entity_id)
+        if rng.random() < 0.02:
+            source = dest = entity_id
+        # Few distinct amounts and whole-day offsets hit the 10% and 3-day edges often
+        amount = rng.choice((1000.0, 1100.0, 909.09, 900.0, 1111.11, 5000.0, 4600.0))
+        if rng.random() < 0.5:
+            amount = round(rng.uniform(500, 6000), 2)
+        offset = timedelta(days=rng.randint(0, days), seconds=rng.choice((0, 0, 1, 43200)))
+        rows.append((source, dest, amount, (start + offset).isoformat()))
+    rows.sort(key=lambda r: r[3])
+    return rows
+
+
+def test_matches_quadratic(cases=CASES):
+    """Same verdict, count, confidence and examples on random histories"""
+    print_header(f"TEST 1: Sweep vs quadratic matcher on {cases} random histories")
+    from aml_system_v6_enhanced import PatternDetector
+
+    rng = random.Random(12)
+    entity_id = 'E0'
+    flagged = 0
+    for n in range(cases):
+        counterparties = [f"C{i}" for i in range(rng.randint(1, 8))]
+        rows = random_history(rng, entity_id, rng.randint(0, 120), counterparties)
+        expected = quadratic_round_trips(entity_id, rows)
+        actual = PatternDetector.match_round_trips(entity_id, rows)
+        assert actual == expected, f"case {n}: {actual} != {expected}"
+        flagged += expected[0]
+    print(f"{cases} histories identical ({flagged} flagged)")
+    print("✅ Equivalent to the quadratic matcher")
+
+
+def test_detect_round_tripping_db():
+    """detect_round_tripping on a database agrees with the quadratic matcher on its rows"""
+    print_header("TEST 2: detect_round_tripping on a database")
+    from aml_time import to_epoch
+    from aml_system_v6_enhanced import DatabaseManager, PatternDetector
+
+    db = DatabaseManager(os.path.join(tempfile.mkdtemp(prefix='aml_roundtrip_'), 'aml_system.db'))
+    rng = random.Random(7)
+    entity_ids = ['E0'] + [f"C{i}" for i in range(5)]
+    case_id = str(uuid.uuid4())
+    now = datetime.now().replace(microsecond=0)
+    with db.connection() as conn:
+        conn.executemany("INSERT INTO entities (entity_id, name, entity_type) VALUES (?, ?, 'account')",
+                         [(e, e) for e in entity_ids])
+        conn.execute("INSERT INTO aml_cases (case_id, case_number, title, case_type) "
+                     "VALUES (?, 'CASE-RT', 'Round trips', 'other')", (case_id,))
+        rows = random_history(rng, 'E0', 400, entity_ids[1:], days=25)
+        shift = now - datetime.fromisoformat(rows[-1][3])
+        conn.executemany(
+            "INSERT INTO transactions (transaction_id, case_id, source_entity, destination_entity, "
+            "amount, transaction_date, transaction_ts) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(str(uuid.uuid4()), case_id, s, d, a, (datetime.fromisoformat(t) + shift).isoformat(),
+              to_epoch(datetime.fromisoformat(t) + shift)) for s, d, a, t in rows])
+        conn.commit()
+
+    detector = PatternDetector(db)
+    stored = db.execute_query("""
+        SELECT source_entity, destination_entity, amount, transaction_date FROM transactions
+        WHERE (source_entity = 'E0' OR destination_entity = 'E0')
+        ORDER BY transaction_ts, transaction_date
+    """)
+    expected = quadratic_round_trips('E0', stored)
+    actual = detector.detect_round_tripping('E0')
+    print(f"{len(stored)} transactions, {expected[1].get('round_trip_count', 0)} round trips")
+    assert expected[0]
+    assert actual == expected, f"{actual} != {expected}"
+    print("✅ Database results identical")
+
+
+def run_all_tests(cases=CASES):
+    results = []
+    for test in (lambda: test_matches_quadratic(cases), test_detect_round_tripping_db):
+        try:
+            test()
+            results.append(True)
+        except AssertionError as e:
+            print(f"❌ Failed: {e}")
+            results.append(False)
+    print_header(f"RESULTS: {sum(results)}/{len(results)} passed")
+    return all(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Round-trip matcher equivalence test")
+    parser.add_argument('--cases', type=int, default=CASES)
+    args = parser.parse_args()
+    sys.exit(0 if run_all_tests(args.cases) else 1)
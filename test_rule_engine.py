@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Equivalence Test - Declarative detection rules
+Checks the one-scan NumPy evaluation against a row-by-row Python reference
+(every group_by, aggregate fn, amount filter, window and score form, and
+min/max over groups the filter empties), and that a malformed rules file is rejected with ValueError while the rules
+already loaded stay active.
+No server needed.
+
+Usage:
+    python test_rule_engine.py
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+from collections import defaultdict
+
+import numpy as np
+
+OPS = {'<': np.less, '<=': np.less_equal, '>': np.greater, '>=': np.greater_equal,
+       '==': np.equal, '!=': np.not_equal}
+
+RULES = [
+    {"name": "small_entity", "pattern": "structuring", "window_days": 30, "group_by": "entity",
+     "aggregates": {"n": {"fn": "count"}, "below": {"fn": "count", "where": [["amount", "<", 50000]]},
+                    "total": {"fn": "sum", "field": "amount"}},
+     "when": [["below", ">=", 3]], "score": {"name": "confidence", "ratio": ["below", "n"], "max": 0.95},
+     "details": {"total_amount": "total", "transaction_count": "below"}},
+    {"name": "wide_source", "window_days": None, "group_by": "source",
+     "aggregates": {"parties": {"fn": "distinct", "field": "counterparty"},
+                    "biggest": {"fn": "max", "field": "amount"}},
+     "when": [["parties", ">", 5]], "score": {"name": "risk_score", "value": "parties", "scale": 2, "max": 100},
+     "details": {"count": "parties", "largest": "biggest"}},
+    {"name": "inflow", "window_days": 7, "group_by": "destination",
+     "aggregates": {"mean": {"fn": "mean", "field": "amount"}, "least": {"fn": "min", "field": "amount"},
+                    "sources": {"fn": "distinct", "field": "source"}},
+     "when": [["mean", ">", 20000], ["sources", ">=", 2]], "score": {"value": "mean", "scale": 0.001},
+     "details": {"smallest": "least"}},
+    {"name": "pair_repeat", "window_days": 45, "group_by": "pair",
+     "aggregates": {"n": {"fn": "count", "where": [["amount", ">=", 1000], ["amount", "!=", 50000]]}},
+     "when": [["n", ">=", 2]], "score": {"name": "repeats", "value": "n"}, "details": {"count": "n"}},
+    {"name": "large_floor", "window_days": 10, "group_by": "source",
+     "aggregates": {"n": {"fn": "count"},
+                    "floor": {"fn": "min", "field": "amount", "where": [["amount", ">=", 85000]]},
+                    "peak": {"fn": "max", "field": "amount", "where": [["amount", "<", 150]]}},
+     "when": [["floor", "!=", 0]], "score": {"name": "count", "value": "n"},
+     "details": {"floor": "floor", "peak": "peak"}},
+]
+
+
+def print_header(title):
+    print(f"\n{'='*60}")
+    print(f"  {title}")
+    print(f"{'='*60}\n")
+
+
+def reference(rows, rule, now):
+    """The rule evaluated one transaction at a time"""
+    from aml_time import window_start
+    since = None if rule['window_days'] is None else window_start(rule['window_days'], now)
+    entries = defaultdict(list)  # group -> [(amount, counterparty, source, destination)]
+    for source, destination, amount, ts in rows:
+        if since is not None and (ts is None or ts < since):
+            continue
+        amount = amount or 0.0
+        sides = {'entity': [(source, destination)] + ([(destination, source)] if destination != source else []),
+                 'source': [(source, destination)], 'destination': [(destination, source)],
+                 'pair': [(f"{source}->{destination}", destination)]}[rule['group_by']]
+        for group, counterparty in sides:
+            entries[group].append((amount, counterparty, source, destination))
+
+    results = {}
+    for group, items in entries.items():
+        values = {}
+        for name, spec in rule['aggregates'].items():
+            kept = [i for i in items if all(OPS[op](i[0], v) for _, op, v in spec.get('where', []))]
+            amounts = [i[0] for i in kept]
+            fn = spec['fn']
+            if fn == 'count':
+                values[name] = len(kept)
+            elif fn == 'distinct':
+                column = {'counterparty': 1, 'source': 2, 'destination': 3}[spec['field']]
+                values[name] = len({i[column] for i in kept})
+            elif fn == 'sum':
+                values[name] = sum(amounts)
+            elif fn == 'mean':
+                values[name] = sum(amounts) / len(amounts) if amounts else 0.0
+            else:
+                values[name] = (min if fn == 'min' else max)(amounts) if amounts else None
+        if not all(values[name] is not None and OPS[op](values[name], v) for name, op, v in rule['when']):
+            continue
+        score = rule['score']
+        if 'ratio' in score:
+            a, b = (values[n] for n in score['ratio'])
+            raw = score.get('scale', 1) * (a / b if b else 0.0)
+        else:
+            raw = score.get('scale', 1) * values[score['value']]
+        details = {'pattern': rule['pattern']} if rule.get('pattern') else {}
+        details[score.get('name', 'score')] = min(score['max'], raw) if 'max' in score else raw
+        details.update({out: values[name] for out, name in rule['details'].items()})
+        if rule['window_days'] is not None:
+            details['period_days'] = rule['window_days']
+        results[group] = details
+    return results
+
+
+def write_rules(directory, content):
+    path = os.path.join(directory, 'rules.json')
+    with open(path, 'w') as f:
+        f.write(content if isinstance(content, str) else json.dumps(content))
+    return path
+
+
+def test_matches_reference():
+    """Every rule's hits, scores and details equal the row-by-row reference"""
+    print_header("TEST 1: One-scan evaluation vs row-by-row reference")
+    from rule_engine import RuleEngine
+    from test_structuring_batch import seeded_database
+
+    db, _ = seeded_database(3000)
+    with db.write_transaction() as conn:
+        conn.execute("UPDATE transactions SET transaction_ts = NULL WHERE rowid % 17 = 0")
+    rows = [tuple(r) for r in db.execute_query(
+        "SELECT source_entity, destination_entity, amount, transaction_ts FROM transactions")]
+    engine = RuleEngine(db, write_rules(tempfile.mkdtemp(prefix='aml_rules_'), {'rules': RULES}))
+    assert engine.load_error is None, engine.load_error
+
+    now = time.time()
+    report = engine.evaluate(now=now)
+    assert report['timings']['rows_scanned'] == len(rows)
+    hits = 0
+    for rule in RULES:
+        actual, expected = report['results'][rule['name']], reference(rows, rule, now)
+        assert actual.keys() == expected.keys(), rule['name']
+        for key, details in expected.items():
+            assert actual[key].keys() == details.keys(), (rule['name'], key)
+            for field, value in details.items():
+                if isinstance(value, str) or value is None:
+                    assert actual[key][field] == value, (rule['name'], key, field)
+                else:
+                    assert abs(actual[key][field] - value) <= 1e-9 * max(1.0, abs(value)), (rule['name'], key, field)
+        scores = [d[rule['score'].get('name', 'score')] for d in actual.values()]
+        assert scores == sorted(scores, reverse=True), rule['name']
+        hits += len(actual)
+    assert hits > 0
+    floors = report['results']['large_floor'].values()
+    assert floors and any(d['peak'] is None for d in floors), list(floors)[:3]
+    # Names match whole, not as substrings
+    assert set(engine.evaluate(['small_entity', 'inflow'], now=now)['results']) == {'small_entity', 'inflow'}
+    assert not engine.evaluate(['small'], now=now)['results']
+    assert engine.describe()['stats']['inflow']['evaluations'] == 2
+    print(f"✅ {len(RULES)} rules, {hits} hits over {len(rows)} transactions identical to the reference")
+
+
+def test_bad_files_keep_previous_rules():
+    """A malformed rules file is a ValueError; the loaded rules stay active"""
+    print_header("TEST 2: Malformed rules files")
+    from rule_engine import RuleEngine, load_rules
+    from test_structuring_batch import seeded_database
+
+    db, _ = seeded_database(200)
+    directory = tempfile.mkdtemp(prefix='aml_rules_')
+    engine = RuleEngine(db, write_rules(directory, {'rules': RULES}))
+    loaded = [r.name for r in engine.rules]
+
+    bad_files = [
+        {"rules": [{"name": "x", "aggregates": {"a": 5}, "when": []}]},
+        ["notadict"],
+        {"rules": "structuring"},
+        {"rules": [{"name": "x", "aggregates": [], "when": []}]},
+        {"rules": [{"name": "x", "aggregates": {"a": {"fn": "count", "where": "amount"}}}]},
+        {"rules": [{"name": "x", "aggregates": {"a": {"fn": "count"}}, "when": "a > 1"}]},
+        {"rules": [{"name": "x", "aggregates": {"a": {"fn": "count"}}, "when": [[["a"], ">", 1]]}]},
+        {"rules": [{"name": "x", "aggregates": {"a": {"fn": "count"}}, "score": ["a"]}]},
+        {"rules": [{"name": "x", "aggregates": {"a": {"fn": "count"}}, "score": {"ratio": "a"}}]},
+        {"rules": [{"name": "x", "aggregates": {"a": {"fn": "count"}}, "score": {"value": "a", "max": "9"}}]},
+        {"rules": [{"name": "x", "aggregates": {"a": {"fn": "count"}}, "details": ["a"]}]},
+        "{not json",
+    ]
+    for bad in bad_files:
+        path = write_rules(directory, bad)
+        try:
+            load_rules(path)
+            assert False, bad
+        except ValueError:
+            pass
+        success, message = engine.reload()
+        assert not success and engine.load_error, bad
+        assert [r.name for r in engine.rules] == loaded, bad
+        assert set(engine.evaluate()['results']) == set(loaded)
+    print(f"✅ {len(bad_files)} malformed files rejected, {len(loaded)} rules still active")
+
+
+def run_all_tests():
+    results = []
+    for test in (test_matches_reference, test_bad_files_keep_previous_rules):
+        try:
+            test()
+            results.append(True)
+        except AssertionError as e:
+            print(f"❌ Failed: {e}")
+            results.append(False)
+    print_header(f"RESULTS: {sum(results)}/{len(results)} passed")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run_all_tests() else 1)
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Stress Test - Single-writer queue
+Hammers both databases with concurrent writers and checks that no write is
+lost: every INSERT acknowledged to a request thread must be in the table.
+Also checks that a thread per request does not leave a connection per thread.
+Runs against throwaway databases; no server needed.
+
+Usage:
+    python test_single_writer.py [--writers 8] [--rows 500]
+"""
+
+import os
+import sys
+import uuid
+import sqlite3
+import argparse
+import tempfile
+import threading
+import time
+
+WRITERS = 8
+ROWS_PER_WRITER = 500
+
+
+def print_header(title):
+    print(f"\n{'='*60}")
+    print(f"  {title}")
+    print(f"{'='*60}\n")
+
+
+def temp_path(name):
+    return os.path.join(tempfile.mkdtemp(prefix='aml_writer_'), name)
+
+
+def run_writers(writers, work):
+    """Run work(i) on `writers` threads at once; return the exceptions raised"""
+    errors = []
+    start = threading.Barrier(writers)
+
+    def target(i):
+        start.wait()
+        try:
+            work(i)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(writers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return errors
+
+
+def test_v9_concurrent_writers(writers=WRITERS, rows=ROWS_PER_WRITER):
+    """aml_system.Database: N autocommit writers plus bulk transactions and readers"""
+    print_header(f"TEST 1: aml_system.Database, {writers} writers x {rows} rows")
+    import aml_system
+
+    db = aml_system.Database(temp_path('aml_multi_user.db'))
+    user_id = str(uuid.uuid4())
+    db.execute("INSERT INTO users (id, username, email, password) VALUES (?, 'u', 'u@x', 'x')",
+               (user_id,))
+    db.execute("INSERT INTO cases (id, user_id, case_number, status) VALUES ('C0', ?, 'C0', 'open')",
+               (user_id,))
+    stop = threading.Event()
+
+    def bulk_editor():
+        # Long write transactions interleaved with the autocommit writers
+        while not stop.is_set():
+            with db.transaction():
+                db.query("SELECT * FROM cases WHERE id = 'C0'")
+                db.execute("UPDATE cases SET status = ? WHERE id = 'C0'",
+                           ('review' if time.time() % 2 else 'open',))
+
+    def reader():
+        while not stop.is_set():
+            with db.read_only():
+                db.query("SELECT status, COUNT(*) FROM audit_trail GROUP BY status")
+
+    background = [threading.Thread(target=bulk_editor), threading.Thread(target=reader)]
+    for t in background:
+        t.start()
+
+    def work(i):
+        for n in range(rows):
+            db.execute("INSERT INTO audit_trail (id, user_id, action, entity_type, entity_id) "
+                       "VALUES (?, ?, 'STRESS', 'CASE', ?)", (str(uuid.uuid4()), user_id, f"{i}-{n}"))
+
+    started = time.perf_counter()
+    errors = run_writers(writers, work)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for t in background:
+        t.join()
+
+    count = db.query("SELECT COUNT(*) FROM audit_trail WHERE action = 'STRESS'")[0][0]
+    stats = db.writer.stats()
+    db.close_all()
+    print(f"Rows: {count}/{writers * rows}, errors: {len(errors)}, {elapsed:.2f}s, "
+          f"{stats['commits']} commits (largest group {stats['max_group']})")
+    assert not errors, errors[:3]
+    assert count == writers * rows
+    assert stats['commits'] < writers * rows  # writes were group-committed
+    print("✅ No lost writes")
+
+
+def test_v6_concurrent_writers(writers=WRITERS, rows=ROWS_PER_WRITER):
+    """aml_system_v6_enhanced.DatabaseManager: execute_update never returns False"""
+    print_header(f"TEST 2: DatabaseManager.execute_update, {writers} writers x {rows} rows")
+    from aml_system_v6_enhanced import DatabaseManager
+
+    db = DatabaseManager(temp_path('aml_system.db'))
+    failures = []
+
+    def work(i):
+        for n in range(rows):
+            ok = db.execute_update(
+                "INSERT INTO entities (entity_id, name, entity_type) VALUES (?, ?, 'account')",
+                (str(uuid.uuid4()), f"Writer {i} row {n}"))
+            if not ok:
+                failures.append((i, n))
+
+    errors = run_writers(writers, work)
+    count = db.execute_query("SELECT COUNT(*) FROM entities")[0][0]
+    print(f"Rows: {count}/{writers * rows}, execute_update failures: {len(failures)}")
+    assert not errors and not failures
+    assert count == writers * rows
+    print("✅ No lost writes")
+
+
+def test_failed_write_is_isolated():
+    """A failing statement in a commit group only fails its own future"""
+    print_header("TEST 3: Failed write isolation")
+    from sqlite_writer import SingleWriter
+
+    path = temp_path('isolation.db')
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY)")
+    conn.commit()
+    conn.close()
+
+    writer = SingleWriter(lambda: sqlite3.connect(path, check_same_thread=False))
+    futures = [writer.submit([("INSERT INTO t (id) VALUES (?)", (i % 50,))]) for i in range(100)]
+    ok = sum(1 for f in futures if f.exception() is None)
+    writer.close()
+
+    count = sqlite3.connect(path).execute("SELECT COUNT(*) FROM t").fetchone()[0]
+    print(f"Accepted {ok}, rejected {100 - ok}, stored {count}")
+    assert ok == count == 50
+    print("✅ Duplicates rejected individually, the rest committed")
+
+
+def test_request_threads_share_connections():
+    """Teardown hands each request's connection back, open transaction rolled back"""
+    print_header("TEST 4: One thread per request")
+    import aml_system
+    from flask import Flask
+
+    db = aml_system.Database(temp_path('aml_multi_user.db'), idle_connections=4)
+    app = Flask(__name__)
+    db.init_app(app)
+
+    def request(i):
+        with app.app_context():
+            db.query("SELECT COUNT(*) FROM users")
+            db.thread_conn().execute("BEGIN")
+
+    for _ in range(5):
+        errors = run_writers(8, request)
+        assert not errors, errors[:3]
+    opened = len(db._connections)
+    idle = db._idle_conns.qsize()
+    assert opened <= 8 and idle == min(opened, 4), (opened, idle)
+    assert not any(conn.in_transaction for conn in db._connections)
+    db.close_all()
+    print(f"✅ 40 request threads left {opened} connections open, {idle} of them idle")
+
+
+def run_all_tests(writers=WRITERS, rows=ROWS_PER_WRITER):
+    results = []
+    for test in (lambda: test_v9_concurrent_writers(writers, rows),
+                 lambda: test_v6_concurrent_writers(writers, rows),
+                 test_failed_write_is_isolated, test_request_threads_share_connections):
+        try:
+            test()
+            results.append(True)
+        except AssertionError as e:
+            print(f"❌ Failed: {e}")
+            results.append(False)
+    print_header(f"RESULTS: {sum(results)}/{len(results)} passed")
+    return all(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Single-writer stress test")
+    parser.add_argument('--writers', type=int, default=WRITERS)
+    parser.add_argument('--rows', type=int, default=ROWS_PER_WRITER)
+    args = parser.parse_args()
+    sys.exit(0 if run_all_tests(args.writers, args.rows) else 1)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Equivalence Test - Bounded k-hop subgraph
+Checks the frontier expansion against a breadth-first search over every
+network_edges row (same nodes, hops and edges under amount and time-window
+filters), that fan-out, node and edge budgets cut it off early, and that
+streams left open do not hold the connection pool.
+No server needed.
+
+Usage:
+    python test_subgraph.py
+"""
+
+import sys
+import random
+from collections import deque
+
+
+def print_header(title):
+    print(f"\n{'='*60}")
+    print(f"  {title}")
+    print(f"{'='*60}\n")
+
+
+def reference(edges, entity_id, limits):
+    """Hop of every reachable node and the qualifying edges of nodes inside the hop limit"""
+    def keep(edge):
+        _, _, amount, _, first, last = edge
+        return amount >= limits.min_amount \
+            and (limits.since is None or (last is not None and last >= limits.since)) \
+            and (limits.until is None or (first is not None and first <= limits.until))
+
+    kept = [edge for edge in edges if keep(edge)]
+    hop_of, queue = {entity_id: 0}, deque([entity_id])
+    while queue:
+        node = queue.popleft()
+        if hop_of[node] == limits.hops:
+            continue
+        for source, destination, *_ in kept:
+            for near, far, direction in ((source, destination, 'out'), (destination, source, 'in')):
+                if near == node and limits.direction in (direction, 'both') and far not in hop_of:
+                    hop_of[far] = hop_of[node] + 1
+                    queue.append(far)
+    inner = {node for node, hop in hop_of.items() if hop < limits.hops}
+    chosen = {(s, d) for s, d, *_ in kept
+              if (limits.direction != 'in' and s in inner) or (limits.direction != 'out' and d in inner)}
+    return hop_of, chosen
+
+
+def extract(analyzer, entity_id, limits):
+    items = list(analyzer.expand_subgraph(entity_id, limits))
+    nodes = {item['entity_id']: item['hop'] for item in items if item['type'] == 'node'}
+    edges = [(item['source'], item['destination']) for item in items if item['type'] == 'edge']
+    assert items[-1]['type'] == 'summary' and len(edges) == len(set(edges))
+    return nodes, set(edges), items[-1]
+
+
+def test_matches_breadth_first_search():
+    """Without fan-out capping the expansion equals a BFS over all edges"""
+    print_header("TEST 1: Frontier expansion vs full BFS")
+    from subgraph import SubgraphLimits
+    from aml_system_v6_enhanced import NetworkAnalyzer
+    from test_structuring_batch import seeded_database
+
+    db, entity_ids = seeded_database(400)
+    edges = [tuple(row) for row in db.execute_query(
+        "SELECT source_entity, destination_entity, total_amount, transaction_count, "
+        "first_seen, last_seen FROM network_edges")]
+    seen = sorted(ts for edge in edges for ts in edge[4:])
+    analyzer = NetworkAnalyzer(db)
+    rng = random.Random(8)
+    for trial in range(60):
+        limits = SubgraphLimits(
+            hops=rng.randint(0, 4), direction=rng.choice(('out', 'in', 'both')), fan_out=10**6,
+            min_amount=rng.choice([0, 20000, 60000, 120000]),
+            since=rng.choice([None, seen[len(seen) // 2]]), until=rng.choice([None, seen[-len(seen) // 4]]))
+        entity_id = rng.choice(entity_ids)
+        nodes, chosen, summary = extract(analyzer, entity_id, limits)
+        assert (nodes, chosen) == reference(edges, entity_id, limits), (trial, limits)
+        assert summary['truncated'] is None and summary['fan_out_capped'] == 0
+    print(f"✅ 60 expansions over {len(edges)} edges identical to the reference")
+
+
+def test_budgets_cut_off():
+    """fan_out keeps each node's heaviest edges; node and edge budgets stop early"""
+    print_header("TEST 2: Fan-out, node and edge budgets")
+    from subgraph import SubgraphLimits
+    from aml_system_v6_enhanced import NetworkAnalyzer
+    from test_structuring_batch import seeded_database
+
+    db, entity_ids = seeded_database(400)
+    analyzer = NetworkAnalyzer(db)
+    amounts = {(s, d): a for s, d, a in db.execute_query(
+        "SELECT source_entity, destination_entity, total_amount FROM network_edges")}
+    heaviest = sorted((a for (s, _), a in amounts.items() if s == 'E0'), reverse=True)
+
+    _, chosen, summary = extract(analyzer, 'E0', SubgraphLimits(hops=1, direction='out', fan_out=3))
+    assert sorted((amounts[edge] for edge in chosen), reverse=True) == heaviest[:3]
+    assert summary['fan_out_capped'] == 1
+
+    nodes, _, summary = extract(analyzer, 'E0', SubgraphLimits(hops=3, max_nodes=7))
+    assert len(nodes) == 7 and summary['truncated'] == 'max_nodes'
+    _, chosen, summary = extract(analyzer, 'E0', SubgraphLimits(hops=3, max_edges=5))
+    assert len(chosen) == 5 and summary['truncated'] == 'max_edges'
+
+    limits = SubgraphLimits.from_args({'hops': '3', 'max_nodes': '900000', 'since': '2024-01-01'},
+                                      max_nodes=1000, deadline=5)
+    assert (limits.hops, limits.max_nodes, limits.deadline) == (3, 1000, 5)
+    for bad in ({'hops': '9'}, {'fan_out': 'x'}, {'direction': 'sideways'}, {'since': 'yesterday'}):
+        try:
+            SubgraphLimits.from_args(bad)
+            assert False, bad
+        except ValueError:
+            pass
+    print("✅ Heaviest edges kept, budgets truncate with a reason, bad limits rejected")
+
+
+def test_open_streams_leave_pool():
+    """More half-read streams than the pool has connections, and the pool still serves queries"""
+    print_header("TEST 3: Open streams vs the connection pool")
+    from subgraph import SubgraphLimits
+    from aml_system_v6_enhanced import NetworkAnalyzer
+    from test_structuring_batch import seeded_database
+
+    db, entity_ids = seeded_database(400)
+    db.connection_pool.timeout = 1
+    analyzer = NetworkAnalyzer(db)
+    streams = [analyzer.expand_subgraph(entity_id, SubgraphLimits(hops=2))
+               for entity_id in entity_ids[:db.connection_pool.max_size + 2]]
+    for stream in streams:
+        assert next(stream)['type'] == 'node'
+    assert db.pool_stats()['in_use'] == 0, db.pool_stats()
+    assert db.execute_query("SELECT COUNT(*) FROM entities")[0][0] == len(entity_ids)
+    for stream in streams:
+        assert list(stream)[-1]['type'] == 'summary'
+    print(f"✅ {len(streams)} open streams, none on the {db.connection_pool.max_size}-connection pool")
+
+
+def run_all_tests():
+    results = []
+    for test in (test_matches_breadth_first_search, test_budgets_cut_off, test_open_streams_leave_pool):
+        try:
+            test()
+            results.append(True)
+        except AssertionError as e:
+            print(f"❌ Failed: {e}")
+            results.append(False)
+    print_header(f"RESULTS: {sum(results)}/{len(results)} passed")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run_all_tests() else 1)
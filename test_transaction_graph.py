@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Equivalence Test - CSR transaction graph
+Checks TransactionGraph against the dict-of-lists walk NetworkAnalyzer used
+before (same chains, same centrality, same neighbours), that repeated
+build_network calls on one analyzer no longer accumulate edges, and that the
+memory-mapped snapshot plus its delta overlay equals network_edges, and
+that network reads give the same answers from the transactions while the
+network_edges backfill migration is still pending, and equal the
+transactions after that backfill runs a few entities per chunk, and that
+entity ids containing "->" get separate edges, keyed the same on insert,
+on rebuild and by the migration that re-keys older rows.
+No server needed.
+
+Usage:
+    python test_transaction_graph.py
+"""
+
+import os
+import sys
+import random
+import tempfile
+from collections import defaultdict, deque
+
+import numpy as np
+
+
+def print_header(title):
+    print(f"\n{'='*60}")
+    print(f"  {title}")
+    print(f"{'='*60}\n")
+
+
+def random_edges(rng):
+    ids = [f"E{i}" for i in range(rng.randint(2, 40))]
+    pairs = {(rng.choice(ids), rng.choice(ids)) for _ in range(rng.randint(1, 150))}
+    edges = [(s, d, round(rng.uniform(0, 90000), 2), rng.randint(1, 9)) for s, d in pairs]
+    rng.shuffle(edges)
+    return edges
+
+
+def reference(edges, min_chain_length=3):
+    """Centrality and chains the way the dict-of-lists NetworkAnalyzer computed them"""
+    graph, degree = defaultdict(list), defaultdict(int)
+    for source, dest, amount, count in edges:
+        graph[source].append((dest, amount, count))
+        degree[source] += 1
+        degree[dest] += 1
+    centrality = {node: degree[node] * (1 + np.log1p(sum(a for _, a, _ in graph[node])))
+                  for node in degree}
+    chains, visited = [], set()
+    for start in list(graph):
+        if start in visited:
+            continue
+        queue = deque([(start, [start])])
+        while queue:
+            current, path = queue.popleft()
+            if len(path) > min_chain_length:
+                chains.append(path)
+                visited.update(path)
+                continue
+            for following, _, _ in graph.get(current, []):
+                if following not in visited:
+                    queue.append((following, path + [following]))
+    return centrality, chains
+
+
+def test_matches_reference():
+    """Chains, centrality and adjacency equal the dict-of-lists results"""
+    print_header("TEST 1: CSR graph vs dict-of-lists")
+    from transaction_graph import TransactionGraph
+
+    rng = random.Random(5)
+    for trial in range(100):
+        edges = random_edges(rng)
+        graph = TransactionGraph.from_edges(*zip(*edges))
+        centrality, chains = reference(edges)
+        assert graph.find_chains() == chains, trial
+        actual = graph.weighted_degree_centrality()
+        assert actual.keys() == centrality.keys()
+        assert all(abs(actual[k] - centrality[k]) <= 1e-9 * max(1, centrality[k]) for k in actual)
+        for node, entity_id in enumerate(graph.ids):
+            assert sorted(graph.ids[i] for i in graph.successors(node)) == \
+                sorted(d for s, d, _, _ in edges if s == entity_id)
+            assert sorted(graph.ids[i] for i in graph.predecessors(node)) == \
+                sorted(s for s, d, _, _ in edges if d == entity_id)
+    print("✅ 100 random graphs identical to the reference")
+
+
+def test_builds_do_not_accumulate():
+    """The analyzer returns a fresh graph per call instead of growing a shared one"""
+    print_header("TEST 2: build_network is per analysis")
+    import network_edges
+    from aml_system_v6_enhanced import DatabaseManager, NetworkAnalyzer
+
+    db = DatabaseManager(os.path.join(tempfile.mkdtemp(prefix='aml_graph_'), 'aml_system.db'))
+    edges = random_edges(random.Random(9))
+    with db.write_transaction() as conn:
+        conn.execute("INSERT INTO aml_cases (case_id, case_number, title, case_type) "
+                     "VALUES ('C', 'CASE-GRAPH', 'Graph', 'other')")
+        conn.executemany("INSERT INTO entities (entity_id, name, entity_type) VALUES (?, ?, 'account')",
+                         [(e, e) for e in {e for s, d, _, _ in edges for e in (s, d)}])
+        conn.executemany("INSERT INTO transactions (transaction_id, case_id, source_entity, "
+                         "destination_entity, amount, transaction_ts) VALUES (?, 'C', ?, ?, ?, 0)",
+                         [(f"T{i}", s, d, a) for i, (s, d, a, _) in enumerate(edges)])
+        network_edges.rebuild(conn)
+
+    analyzer = NetworkAnalyzer(db)
+    entity_ids = sorted({s for s, _, _, _ in edges})
+    first = analyzer.build_network(entity_ids)
+    second = analyzer.build_network(entity_ids)
+    assert first.edge_count == second.edge_count == len(edges)
+    assert analyzer.calculate_centrality(first) == analyzer.calculate_centrality(second)
+    assert not first.amount.flags.writeable
+    print(f"✅ {len(edges)} edges on every build, arrays read-only")
+
+
+def edge_totals(graph):
+    ids, sources = list(graph.ids), graph.edge_sources()
+    return {(ids[s], ids[d]): (round(float(a), 6), int(c), float(f), float(l))
+            for s, d, a, c, f, l in zip(sources, graph.targets, graph.amount, graph.count,
+                                        graph.first_seen, graph.last_seen)}
+
+
+def test_snapshot_with_overlay():
+    """Snapshot + transactions after its watermark equals the live network_edges"""
+    print_header("TEST 3: Mapped snapshot plus delta overlay")
+    import graph_snapshot
+    from transaction_graph import TransactionGraph
+    from aml_system_v6_enhanced import CaseManager, EntityManager, NetworkAnalyzer
+    from test_structuring_batch import seeded_database
+
+    db, entity_ids = seeded_database(1000)
+    path = os.path.join(tempfile.mkdtemp(prefix='aml_graph_'), 'network.snap')
+    header = graph_snapshot.build(db, path)
+    analyzer = NetworkAnalyzer(db, path)
+    assert edge_totals(analyzer.build_network(entity_ids)) == \
+        edge_totals(TransactionGraph.from_db(db, entity_ids, dates=True))
+
+    rng = random.Random(3)
+    case_id = db.execute_query("SELECT case_id FROM aml_cases")[0][0]
+    result = CaseManager(db, EntityManager(db), None, None, None).add_transactions_bulk(
+        case_id, [{'source_entity': rng.choice(entity_ids), 'destination_entity': rng.choice(entity_ids),
+                   'amount': round(rng.uniform(10, 90000), 2)} for _ in range(300)])
+    assert result['success'], result
+    snapshot = graph_snapshot.GraphSnapshot(path)
+    assert snapshot.watermark == header['watermark']
+    assert snapshot.pending_transactions(db) == 300
+    assert edge_totals(snapshot.graph_for(db)) == edge_totals(TransactionGraph.from_db(db, dates=True))
+    for entity_id in entity_ids[:10]:
+        assert edge_totals(analyzer.build_network([entity_id])) == \
+            edge_totals(TransactionGraph.from_db(db, [entity_id], dates=True)), entity_id
+    print(f"✅ {snapshot.graph.edge_count} snapshot edges + 300 overlaid transactions match network_edges")
+
+
+def test_reads_while_backfill_pending():
+    """Until migration 8 has filled network_edges, edges are aggregated from the transactions"""
+    print_header("TEST 4: Reads while the network_edges backfill is pending")
+    from subgraph import SubgraphLimits
+    from aml_system_v6_enhanced import NetworkAnalyzer, PatternDetector
+    from test_entity_stats import backfill_pending
+    from test_structuring_batch import seeded_database
+
+    db, entity_ids = seeded_database(1000)
+    analyzer, detector = NetworkAnalyzer(db), PatternDetector(db)
+    limits = SubgraphLimits(hops=2, min_amount=20000)
+
+    def reads():
+        fans = {e: detector.detect_fan_in_fan_out(e) for e in entity_ids}
+        graphs = [edge_totals(analyzer.build_network(entity_ids[i:i + 3])) for i in range(0, 12, 3)]
+        expansions = [{(item.get('source'), item.get('destination'), item.get('entity_id'), item.get('hop'))
+                       for item in analyzer.expand_subgraph(e, limits) if item['type'] != 'summary'}
+                      for e in entity_ids[:5]]
+        return fans, graphs + [edge_totals(analyzer.whole_network())], expansions
+
+    fans, graphs, expansions = reads()
+    backfill_pending(db, 8, 'network_edges')
+    pending_fans, pending_graphs, pending_expansions = reads()
+    assert pending_expansions == expansions
+    for before, after in zip(graphs, pending_graphs):
+        assert before.keys() == after.keys()
+        for key, (amount, *rest) in before.items():
+            assert abs(after[key][0] - amount) < 1e-6 * max(1.0, amount) and after[key][1:] == tuple(rest), key
+    assert any(fans.values())
+    for entity_id, patterns in fans.items():
+        assert pending_fans[entity_id].keys() == patterns.keys(), entity_id
+        for name, details in patterns.items():
+            after = pending_fans[entity_id][name]
+            assert after['count'] == details['count'] and after['risk_score'] == details['risk_score']
+            assert abs(after['total_amount'] - details['total_amount']) < 1e-6 * details['total_amount']
+    print(f"✅ Fan-in/out, {len(graphs)} graphs and {len(expansions)} subgraphs identical with network_edges empty")
+
+
+def test_chunked_backfill():
+    """Migration 8 replaces the edges inserts folded into before and while it ran"""
+    print_header("TEST 5: Chunked network_edges backfill")
+    import network_edges
+    from test_entity_stats import rerun_backfill
+    from test_structuring_batch import seeded_database
+
+    db, entity_ids = seeded_database(1000)
+    rerun_backfill(db, entity_ids, 8, 'network_edges')
+    with db.connection() as conn:
+        report = network_edges.check(conn, sample=None)
+    assert report['checked'] and not report['mismatched'], report['mismatches'][:5]
+    print(f"✅ {report['checked']} edges identical to the transactions after the chunked backfill")
+
+
+def test_edge_ids_unambiguous():
+    """Pairs whose ids would join to the same "a->b->c" keep their own edge"""
+    print_header("TEST 6: Edge ids of entity ids containing '->'")
+    import network_edges
+    from migrations import MigrationRunner, V6_MIGRATIONS
+    from aml_system_v6_enhanced import CaseManager, EntityManager
+    from test_structuring_batch import seeded_database
+
+    db, _ = seeded_database(30)
+    case_mgr = CaseManager(db, EntityManager(db), None, None, None)
+    case_id = db.execute_query("SELECT case_id FROM aml_cases")[0][0]
+    with db.connection() as conn:
+        conn.executemany("INSERT INTO entities (entity_id, name, entity_type) VALUES (?, ?, 'account')",
+                         [(e, e) for e in ('a->b', 'c', 'a', 'b->c')])
+        conn.commit()
+    for source, destination in (('a->b', 'c'), ('a', 'b->c')):
+        success, message = case_mgr.add_transaction_to_case(
+            case_id, {'source_entity': source, 'destination_entity': destination, 'amount': 10.0})
+        assert success, message
+
+    query = "SELECT edge_id, source_entity, destination_entity FROM network_edges ORDER BY rowid"
+    inserted = db.execute_query(query)
+    assert all(row[0] == network_edges.edge_id(row[1], row[2]) for row in inserted)
+    assert {(r[1], r[2]) for r in inserted} >= {('a->b', 'c'), ('a', 'b->c')}
+    with db.write_transaction() as conn:
+        network_edges.rebuild(conn)
+    assert sorted(map(tuple, db.execute_query(query))) == sorted(map(tuple, inserted))
+
+    # Rows keyed "source->destination" before migration 17
+    with db.write_transaction() as conn:
+        conn.execute("UPDATE network_edges SET edge_id = source_entity || '->' || destination_entity "
+                     "WHERE source_entity NOT IN ('a->b', 'a')")
+        conn.execute("UPDATE schema_version SET status = 'running', heartbeat_at = 0 WHERE version = 17")
+    MigrationRunner(db.db_path, 'v6', [m for m in V6_MIGRATIONS if m.version == 17], chunk_size=7).run()
+    rekeyed = db.execute_query(query)
+    assert len(rekeyed) == len(inserted) and all(r[0] == network_edges.edge_id(r[1], r[2]) for r in rekeyed)
+    with db.connection() as conn:
+        report = network_edges.check(conn, sample=None)
+    assert not report['mismatched'], report['mismatches'][:5]
+    print(f"✅ {len(rekeyed)} edges keyed by their pair on insert, rebuild and migration 17")
+
+
+def run_all_tests():
+    results = []
+    for test in (test_matches_reference, test_builds_do_not_accumulate, test_snapshot_with_overlay,
+                 test_reads_while_backfill_pending, test_chunked_backfill, test_edge_ids_unambiguous):
+        try:
+            test()
+            results.append(True)
+        except AssertionError as e:
+            print(f"❌ Failed: {e}")
+            results.append(False)
+    print_header(f"RESULTS: {sum(results)}/{len(results)} passed")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run_all_tests() else 1)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Equivalence Test - Transaction velocity ring buffers
+Checks check()/current() against a brute-force recount over every recorded
+transaction on random streams (backdated rows and self-transfers included,
+and buffers that overflow their capacity), that a check() ahead of the
+recorded transactions leaves the windows alone, and that rebuild() reloads
+the buffers from the transactions table off the transaction_ts index.
+No server needed.
+
+Usage:
+    python test_velocity.py
+"""
+
+import sys
+import time
+import random
+from collections import defaultdict
+
+WINDOWS = "60:4:1000,600:8:5000,3600:15:20000"
+
+
+def print_header(title):
+    print(f"\n{'='*60}")
+    print(f"  {title}")
+    print(f"{'='*60}\n")
+
+
+def recount(history, windows, amount, ts):
+    """Breaches of one entity recounted from all of its transactions"""
+    breaches = {}
+    for window in windows:
+        inside = [a for t, a in history if ts - window.seconds <= t <= ts]
+        count, total = len(inside) + 1, sum(inside) + amount
+        if count > window.max_count or round(total, 2) > window.max_amount:
+            breaches[window.name] = (count, round(total, 2))
+    return breaches
+
+
+def run_stream(rng, monitor, entities, steps, backdate):
+    """Feed one random stream; returns the number of checks compared"""
+    history = defaultdict(list)
+    ts = 1_700_000_000
+    checks = 0
+    for _ in range(steps):
+        ts += rng.choice([1, 5, 20, 90, 400])
+        when = ts - rng.randint(1, 900) if backdate and rng.random() < 0.15 else ts
+        source, destination = rng.choice(entities), rng.choice(entities)
+        amount = round(rng.uniform(10, 900), 2)
+
+        expected = recount(history[source], monitor.windows, amount, when)
+        actual = {b['window']: (b['count'], b['amount']) for b in monitor.check(source, amount, when)}
+        assert actual.keys() == expected.keys(), (when, actual, expected)
+        if len(history[source]) < monitor.capacity:
+            for name, (count, total) in expected.items():
+                assert actual[name][0] == count and abs(actual[name][1] - total) < 0.011, (name, actual, expected)
+        checks += 1
+
+        monitor.record(source, destination, amount, when)
+        for entity_id in {source, destination}:
+            history[entity_id].append((when, amount))
+
+    for entity_id, entries in history.items():
+        if len(entries) > monitor.capacity:
+            continue
+        latest = max(t for t, _ in entries)
+        for window in monitor.current(entity_id, now=latest)['windows']:
+            inside = [a for t, a in entries if latest - window['seconds'] <= t <= latest]
+            assert window['count'] == len(inside), (entity_id, window)
+            assert abs(window['amount'] - round(sum(inside), 2)) < 0.011, (entity_id, window)
+    return checks
+
+
+def test_matches_brute_force():
+    """check() and current() equal a recount over every recorded transaction"""
+    print_header("TEST 1: Ring buffers vs brute-force recount")
+    from velocity import VelocityMonitor, parse_windows
+
+    rng = random.Random(18)
+    checks = 0
+    for stream in range(300):
+        monitor = VelocityMonitor(parse_windows(WINDOWS), capacity=32)
+        if stream % 3 == 0:
+            # One busy entity: the buffer wraps and keeps only the newest entries
+            checks += run_stream(rng, monitor, ['A'], 120, backdate=False)
+        else:
+            checks += run_stream(rng, monitor, ['A', 'B', 'C'], 40, backdate=True)
+    print(f"✅ {checks} checks over 300 streams identical to the recount")
+
+
+def test_future_check_leaves_windows():
+    """check() past every window, then in-order records, still count every entry"""
+    print_header("TEST 2: check() with a future timestamp")
+    from velocity import VelocityMonitor, parse_windows
+
+    monitor = VelocityMonitor(parse_windows(WINDOWS), capacity=32)
+    ts = 1_700_000_000
+    history = []
+    for n in range(3):
+        monitor.record('A', 'B', 300.0, ts + n)
+        history.append((ts + n, 300.0))
+    assert not monitor.check('A', 10.0, ts + 7200)
+
+    expected = recount(history, monitor.windows, 300.0, ts + 10)
+    actual = {b['window']: (b['count'], b['amount']) for b in monitor.check('A', 300.0, ts + 10)}
+    assert actual == expected and expected, (actual, expected)
+    monitor.record('A', 'B', 300.0, ts + 10)
+    for window in monitor.current('A', now=ts + 10)['windows']:
+        assert (window['count'], window['amount']) == (4, 1200.0), window
+    print("✅ Windows unchanged by a check 2h ahead; 4 entries counted after the next record")
+
+
+def test_rebuild_from_database():
+    """rebuild() reloads every entity's windows from transaction_ts"""
+    print_header("TEST 3: Rebuild from the transactions table")
+    from aml_time import window_start
+    from velocity import VelocityMonitor, parse_windows
+    from test_structuring_batch import seeded_database
+
+    db, entity_ids = seeded_database(3000)
+    assert db.migration_applied(3) and db.migration_applied(9) and not db.migration_applied(999)
+    with db.connection() as conn:
+        plan = ' '.join(row[3] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT source_entity, destination_entity, amount, transaction_ts "
+            "FROM transactions WHERE transaction_ts >= ? ORDER BY transaction_ts", (0,)))
+    assert 'idx_transactions_ts' in plan, plan
+
+    monitor = VelocityMonitor(parse_windows("86400:600:1e12,604800:1500:1e12"), capacity=2048)
+    loaded = monitor.rebuild(db)
+    now = time.time()
+    assert loaded == db.execute_query("SELECT COUNT(*) FROM transactions WHERE transaction_ts >= ?",
+                                      (window_start(7, now),))[0][0]
+    for entity_id in entity_ids:
+        for window in monitor.current(entity_id, now=now)['windows']:
+            count, total = db.execute_query("""
+                SELECT COUNT(*), COALESCE(SUM(amount), 0) FROM transactions
+                WHERE (source_entity = ? OR destination_entity = ?) AND transaction_ts BETWEEN ? AND ?
+            """, (entity_id, entity_id, int(now) - window['seconds'], int(now)))[0]
+            assert window['count'] == count and abs(window['amount'] - round(total, 2)) < 0.011, \
+                (entity_id, window, count, total)
+    print(f"✅ {loaded} transactions reloaded; windows of {len(entity_ids)} entities match SQL")
+
+
+def run_all_tests():
+    results = []
+    for test in (test_matches_brute_force, test_future_check_leaves_windows, test_rebuild_from_database):
+        try:
+            test()
+            results.append(True)
+        except AssertionError as e:
+            print(f"❌ Failed: {e}")
+            results.append(False)
+    print_header(f"RESULTS: {sum(results)}/{len(results)} passed")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run_all_tests() else 1)
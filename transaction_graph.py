@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Compact Transaction Graph
+An immutable directed entity graph in compressed sparse row (CSR) form.
+Entity ids are interned to integers 0..n-1 in first-seen order; out-edges
+are grouped by source (out_offsets[i]:out_offsets[i + 1] index the edge
+arrays), in-edges by destination through a permutation of the same edge
+arrays. Each edge is one (source, destination) network_edges pair with its
+total amount and transaction count.
+
+Arrays are read-only once built, so one graph can be shared by concurrent
+requests; build a new graph (or a subgraph()) instead of changing one.
+"""
+
+import logging
+from collections import deque
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EDGE_QUERY = """
+    SELECT source_entity, destination_entity, total_amount, transaction_count,
+           first_seen, last_seen
+    FROM network_edges
+"""
+# The same edges aggregated from the transactions, while network_edges is being backfilled
+TRANSACTION_EDGE_QUERY = """
+    SELECT source_entity, destination_entity, COALESCE(SUM(amount), 0.0), COUNT(*),
+           MIN(transaction_ts), MAX(transaction_ts)
+    FROM transactions
+    WHERE source_entity IS NOT NULL AND destination_entity IS NOT NULL {where}
+    GROUP BY source_entity, destination_entity
+"""
+
+
+def _frozen(array: Optional[np.ndarray]) -> Optional[np.ndarray]:
+    if array is not None:
+        array.flags.writeable = False
+    return array
+
+
+def _dates(values) -> Optional[np.ndarray]:
+    """Epoch seconds as float64, NaN where unknown"""
+    if values is None:
+        return None
+    return np.array([np.nan if v is None else v for v in values], dtype=np.float64) \
+        if isinstance(values, list) else np.asarray(values, dtype=np.float64)
+
+
+class TransactionGraph:
+    """Entities and aggregated transaction edges as NumPy CSR arrays.
+
+    first_seen/last_seen (epoch seconds per edge, NaN when unknown) are
+    present only when the graph was built with dates.
+    """
+
+    def __init__(self, ids: Sequence[str], out_offsets: np.ndarray, targets: np.ndarray,
+                 amount: np.ndarray, count: np.ndarray, in_offsets: np.ndarray,
+                 in_edges: np.ndarray, chain_starts: Optional[np.ndarray] = None,
+                 first_seen: Optional[np.ndarray] = None, last_seen: Optional[np.ndarray] = None,
+                 index: Optional[Mapping[str, int]] = None):
+        self.ids = ids
+        self.index = index if index is not None else {entity_id: i for i, entity_id in enumerate(ids)}
+        self.out_offsets = _frozen(out_offsets)
+        self.targets = _frozen(targets)
+        self.amount = _frozen(amount)
+        self.count = _frozen(count)
+        self.in_offsets = _frozen(in_offsets)
+        self.in_edges = _frozen(in_edges)  # edge positions grouped by destination
+        # Nodes with out-edges in the order they first appeared as a source
+        self.chain_starts = _frozen(chain_starts if chain_starts is not None else
+                                    np.flatnonzero(np.diff(out_offsets)).astype(np.int32))
+        self.first_seen = _frozen(first_seen)
+        self.last_seen = _frozen(last_seen)
+
+    # ---- construction ----
+
+    @classmethod
+    def from_edges(cls, sources: Sequence[str], destinations: Sequence[str],
+                   amounts: Sequence[float], counts: Sequence[int],
+                   first_seen=None, last_seen=None) -> 'TransactionGraph':
+        """Build from parallel edge sequences; duplicate pairs stay separate edges"""
+        index: Dict[str, int] = {}
+        src, dst = [], []
+        for source, destination in zip(sources, destinations):
+            src.append(index.setdefault(source, len(index)))
+            dst.append(index.setdefault(destination, len(index)))
+        return cls._from_codes(list(index), np.array(src, dtype=np.int32),
+                               np.array(dst, dtype=np.int32), np.asarray(amounts, dtype=np.float64),
+                               np.asarray(counts, dtype=np.int32), _dates(first_seen),
+                               _dates(last_seen), index)
+
+    @classmethod
+    def _from_codes(cls, ids: Sequence[str], src: np.ndarray, dst: np.ndarray,
+                    amounts: np.ndarray, counts: np.ndarray, first_seen: Optional[np.ndarray] = None,
+                    last_seen: Optional[np.ndarray] = None,
+                    index: Optional[Mapping[str, int]] = None) -> 'TransactionGraph':
+        n = len(ids)
+        order = np.argsort(src, kind='stable')
+        out_offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n), out=out_offsets[1:])
+        targets = dst[order]
+        in_edges = np.argsort(targets, kind='stable').astype(np.int32)
+        in_offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(targets, minlength=n), out=in_offsets[1:])
+        first_as_source = np.full(n, len(src), dtype=np.int64)
+        np.minimum.at(first_as_source, src, np.arange(len(src)))
+        starts = np.flatnonzero(first_as_source < len(src))
+        starts = starts[np.argsort(first_as_source[starts], kind='stable')].astype(np.int32)
+        return cls(ids, out_offsets, targets, np.nan_to_num(amounts[order]), counts[order],
+                   in_offsets, in_edges, starts,
+                   first_seen[order] if first_seen is not None else None,
+                   last_seen[order] if last_seen is not None else None, index)
+
+    @classmethod
+    def from_db(cls, db, entity_ids: Optional[Iterable[str]] = None, dates: bool = False,
+                chunk_size: int = 100000, from_transactions: bool = False) -> 'TransactionGraph':
+        """Every network_edges edge, or those touching `entity_ids`; with
+        from_transactions=True the same edges aggregated from the transactions
+        """
+        if entity_ids is None:
+            rows = []
+            with db.connection() as conn:
+                cursor = conn.execute(TRANSACTION_EDGE_QUERY.format(where='') if from_transactions
+                                      else EDGE_QUERY + " ORDER BY rowid")
+                while True:
+                    chunk = cursor.fetchmany(chunk_size)
+                    if not chunk:
+                        break
+                    rows.extend(tuple(row) for row in chunk)
+        else:
+            entity_ids = list(entity_ids)
+            edges = {}
+            for start in range(0, len(entity_ids), 500):
+                chunk = tuple(entity_ids[start:start + 500])
+                placeholders = ','.join('?' * len(chunk))
+                for column in ('source_entity', 'destination_entity'):
+                    query = TRANSACTION_EDGE_QUERY.format(where=f"AND {column} IN ({placeholders})") \
+                        if from_transactions else f"{EDGE_QUERY} WHERE {column} IN ({placeholders})"
+                    for row in db.execute_query(query, chunk):
+                        edges[(row[0], row[1])] = tuple(row)
+            rows = list(edges.values())
+        return cls.from_rows(rows, dates)
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[tuple], dates: bool = False) -> 'TransactionGraph':
+        """(source, destination, amount, count, first_seen, last_seen) rows"""
+        if not rows:
+            return cls.from_edges([], [], [], [], [] if dates else None, [] if dates else None)
+        sources, destinations, amounts, counts, firsts, lasts = zip(*rows)
+        amounts = np.array([0.0 if a is None else a for a in amounts], dtype=np.float64)
+        return cls.from_edges(sources, destinations, amounts, counts,
+                              list(firsts) if dates else None, list(lasts) if dates else None)
+
+    def touching(self, entity_ids: Iterable[str]) -> np.ndarray:
+        """Positions of the edges into or out of any of `entity_ids`"""
+        nodes = {self.node(e) for e in entity_ids} - {None}
+        # Out-edges are ranges of the edge arrays, in-edges ranges of in_edges
+        parts = [np.arange(self.out_offsets[i], self.out_offsets[i + 1]) for i in nodes]
+        parts += [self.in_edges[self.in_offsets[i]:self.in_offsets[i + 1]] for i in nodes]
+        return np.unique(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+
+    def edge_rows(self, edges: np.ndarray) -> List[tuple]:
+        """(source, destination, amount, count, first_seen, last_seen) of edge positions"""
+        sources = np.searchsorted(self.out_offsets, edges, side='right') - 1
+        ids, dated = self.ids, self.first_seen is not None
+        return list(zip([ids[i] for i in sources.tolist()],
+                        [ids[i] for i in self.targets[edges].tolist()],
+                        self.amount[edges].tolist(), self.count[edges].tolist(),
+                        self.first_seen[edges].tolist() if dated else [None] * len(edges),
+                        self.last_seen[edges].tolist() if dated else [None] * len(edges)))
+
+    def subgraph(self, entity_ids: Iterable[str]) -> 'TransactionGraph':
+        """The edges touching any of `entity_ids`, as a new graph"""
+        return TransactionGraph.from_rows(self.edge_rows(self.touching(entity_ids)),
+                                          dates=self.first_seen is not None)
+
+    def with_edges(self, rows: Sequence[tuple]) -> 'TransactionGraph':
+        """A new graph with (source, destination, amount, count, first_seen,
+        last_seen) totals added; a pair already present is summed into its
+        edge and its dates widened, new pairs and entities are appended.
+        """
+        if not rows:
+            return self
+        ids = list(self.ids)
+        added: Dict[str, int] = {}
+
+        def code(entity_id):
+            node = self.node(entity_id)
+            return node if node is not None else added.setdefault(entity_id, len(ids) + len(added))
+
+        sources, destinations, amounts, counts, firsts, lasts = zip(*rows)
+        src = np.array([code(e) for e in sources], dtype=np.int64)
+        dst = np.array([code(e) for e in destinations], dtype=np.int64)
+        n = len(ids) + len(added)
+        # Base edges in first-seen-as-source order so chain_starts survives the rebuild
+        rank = np.full(len(ids), len(ids), dtype=np.int64)
+        rank[self.chain_starts] = np.arange(len(self.chain_starts))
+        base_src = self.edge_sources()
+        order = np.argsort(rank[base_src], kind='stable')
+        base_src, base_dst = base_src[order].astype(np.int64), self.targets[order].astype(np.int64)
+        amount, count = self.amount[order], self.count[order].astype(np.int64)
+        dated = self.first_seen is not None
+        first = self.first_seen[order] if dated else None
+        last = self.last_seen[order] if dated else None
+
+        keys = base_src * n + base_dst
+        sorter = np.argsort(keys)
+        position = np.searchsorted(keys, src * n + dst, sorter=sorter)
+        position = np.minimum(position, max(len(keys) - 1, 0))
+        found = (np.take(keys, sorter[position]) == src * n + dst) if len(keys) else \
+            np.zeros(len(rows), dtype=bool)
+        at = sorter[position[found]] if len(keys) else np.zeros(0, dtype=np.int64)
+        new_amounts = np.array([0.0 if a is None else a for a in amounts], dtype=np.float64)
+        new_counts = np.array(counts, dtype=np.int64)
+        amount = amount.copy()
+        count = count.copy()
+        amount[at] += new_amounts[found]
+        count[at] += new_counts[found]
+        if dated:
+            new_first, new_last = _dates(list(firsts)), _dates(list(lasts))
+            first, last = first.copy(), last.copy()
+            first[at] = np.fmin(first[at], new_first[found])
+            last[at] = np.fmax(last[at], new_last[found])
+            first = np.concatenate([first, new_first[~found]])
+            last = np.concatenate([last, new_last[~found]])
+        return TransactionGraph._from_codes(
+            ids + list(added), np.concatenate([base_src, src[~found]]).astype(np.int32),
+            np.concatenate([base_dst, dst[~found]]).astype(np.int32),
+            np.concatenate([amount, new_amounts[~found]]),
+            np.concatenate([count, new_counts[~found]]).astype(np.int32), first, last)
+
+    # ---- structure ----
+
+    @property
+    def node_count(self) -> int:
+        return len(self.ids)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.targets)
+
+    def node(self, entity_id: str) -> Optional[int]:
+        return self.index.get(entity_id)
+
+    def out_degree(self) -> np.ndarray:
+        return np.diff(self.out_offsets)
+
+    def in_degree(self) -> np.ndarray:
+        return np.diff(self.in_offsets)
+
+    def edge_sources(self) -> np.ndarray:
+        """Source node of every edge, expanded from out_offsets (not stored)"""
+        return np.repeat(np.arange(len(self.ids), dtype=np.int32), self.out_degree())
+
+    def out_amount(self) -> np.ndarray:
+        """Total amount each node sent"""
+        return np.bincount(self.edge_sources(), weights=self.amount, minlength=len(self.ids))
+
+    def successors(self, node: int) -> np.ndarray:
+        return self.targets[self.out_offsets[node]:self.out_offsets[node + 1]]
+
+    def predecessors(self, node: int) -> np.ndarray:
+        edges = self.in_edges[self.in_offsets[node]:self.in_offsets[node + 1]]
+        return (np.searchsorted(self.out_offsets, edges, side='right') - 1).astype(np.int32)
+
+    def nbytes(self) -> int:
+        """Bytes held by the CSR arrays (ids and the index dict excluded)"""
+        return sum(a.nbytes for a in (self.out_offsets, self.targets, self.amount, self.count,
+                                      self.in_offsets, self.in_edges, self.chain_starts,
+                                      self.first_seen, self.last_seen) if a is not None)
+
+    # ---- analysis ----
+
+    def weighted_degree_centrality(self) -> Dict[str, float]:
+        """(in + out degree) * (1 + log1p(amount sent)) per entity"""
+        scores = (self.out_degree() + self.in_degree()) * (1 + np.log1p(self.out_amount()))
+        return dict(zip(self.ids, scores.tolist()))
+
+    def find_chains(self, min_chain_length: int = 3) -> List[List[str]]:
+        """Paths of more than min_chain_length nodes, breadth first from each
+        source in turn; nodes on a reported chain are not expanded again.
+        """
+        chains = []
+        visited = bytearray(len(self.ids))
+        offsets, targets = self.out_offsets, self.targets
+        for start in self.chain_starts.tolist():
+            if visited[start]:
+                continue
+            queue = deque([(start, (start,))])
+            while queue:
+                current, path = queue.popleft()
+                if len(path) > min_chain_length:
+                    chains.append([self.ids[i] for i in path])
+                    for i in path:
+                        visited[i] = 1
+                    continue
+                for following in targets[offsets[current]:offsets[current + 1]].tolist():
+                    if not visited[following]:
+                        queue.append((following, path + (following,)))
+        return chains
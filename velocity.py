@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Transaction Velocity Monitoring
+Burst detection: more than N transactions or X amount within M minutes. Each
+active entity gets a fixed-size, time-ordered ring buffer of its recent
+transactions (either side) in memory, with a running count and amount per
+window, so recording a transaction is amortized O(1) and checking one only
+walks the entries that left a window since the last record. Entities that
+stop transacting are evicted; the buffers are rebuilt from the transactions
+table on startup.
+
+Windows are configured as seconds:max_count:max_amount, e.g.
+    AML_VELOCITY_WINDOWS="600:5:50000,3600:10:200000,86400:30:1000000"
+"""
+
+import time
+import logging
+import threading
+from array import array
+from bisect import insort
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from aml_time import window_start
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOWS = "600:5:50000,3600:10:200000,86400:30:1000000"
+
+
+@dataclass(frozen=True)
+class VelocityWindow:
+    """A limit on the transactions of one entity inside a trailing window"""
+    seconds: int
+    max_count: int
+    max_amount: float
+
+    @property
+    def name(self) -> str:
+        for unit, size in (('d', 86400), ('h', 3600), ('m', 60)):
+            if self.seconds % size == 0:
+                return f"{self.seconds // size}{unit}"
+        return f"{self.seconds}s"
+
+
+def parse_windows(spec: str) -> List[VelocityWindow]:
+    """Parse "seconds:max_count:max_amount,..." (raises ValueError)"""
+    windows = []
+    for part in filter(None, (p.strip() for p in spec.split(','))):
+        seconds, max_count, max_amount = part.split(':')
+        windows.append(VelocityWindow(int(seconds), int(max_count), float(max_amount)))
+    if not windows:
+        raise ValueError("no velocity windows")
+    return sorted(windows, key=lambda w: w.seconds)
+
+
+class _Buffer:
+    """Ring buffer of one entity: entry i lives in slot i % capacity.
+
+    starts[w] is the first entry inside window w, measured back from the
+    newest entry; sums[w] is the amount of the entries from there on.
+    """
+    __slots__ = ('ts', 'amount', 'end', 'starts', 'sums', 'touched')
+
+    def __init__(self, capacity: int, windows: int):
+        self.ts = array('q', bytes(8 * capacity))
+        self.amount = array('d', bytes(8 * capacity))
+        self.end = 0
+        self.starts = [0] * windows
+        self.sums = [0.0] * windows
+        self.touched = 0.0
+
+
+class VelocityMonitor:
+    """Per-entity transaction velocity over several trailing windows"""
+
+    def __init__(self, windows: Optional[List[VelocityWindow]] = None, capacity: int = 64,
+                 max_entities: int = 100000, idle_seconds: Optional[float] = None):
+        self.windows = windows or parse_windows(DEFAULT_WINDOWS)
+        if capacity <= max(w.max_count for w in self.windows):
+            raise ValueError(f"capacity {capacity} cannot count past every max_count")
+        self.capacity = capacity
+        self.max_entities = max_entities
+        # Wall-clock seconds without a transaction before an entity is dropped
+        self.idle_seconds = idle_seconds or max(w.seconds for w in self.windows)
+        self._buffers: 'OrderedDict[str, _Buffer]' = OrderedDict()  # least recently active first
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    # ---- ring buffer primitives (caller holds the lock) ----
+
+    def _expire(self, buf: _Buffer, now_ts: int):
+        """Advance every window past the entries older than now_ts - seconds"""
+        cap, ts, amount = self.capacity, buf.ts, buf.amount
+        for i, window in enumerate(self.windows):
+            since = now_ts - window.seconds
+            start = buf.starts[i]
+            while start < buf.end and ts[start % cap] < since:
+                buf.sums[i] -= amount[start % cap]
+                start += 1
+            if start == buf.end:
+                buf.sums[i] = 0.0  # drop the rounding error the running sum picked up
+            buf.starts[i] = start
+
+    def _append(self, buf: _Buffer, ts: int, amount: float):
+        cap = self.capacity
+        if buf.end and ts < buf.ts[(buf.end - 1) % cap]:
+            self._insert_late(buf, ts, amount)
+            return
+        self._expire(buf, ts)
+        oldest = buf.end - cap
+        if oldest >= 0:
+            # The slot is reused: windows still holding that entry drop it
+            for i, start in enumerate(buf.starts):
+                if start <= oldest:
+                    buf.sums[i] -= buf.amount[oldest % cap]
+                    buf.starts[i] = oldest + 1
+        buf.ts[buf.end % cap] = ts
+        buf.amount[buf.end % cap] = amount
+        buf.end += 1
+        for i in range(len(self.windows)):
+            buf.sums[i] += amount
+
+    def _entries(self, buf: _Buffer) -> List[tuple]:
+        cap = self.capacity
+        return [(buf.ts[i % cap], buf.amount[i % cap])
+                for i in range(max(0, buf.end - cap), buf.end)]
+
+    def _insert_late(self, buf: _Buffer, ts: int, amount: float):
+        """A backdated transaction: re-lay the buffer in time order, O(capacity)"""
+        entries = self._entries(buf)
+        insort(entries, (ts, amount))
+        entries = entries[-self.capacity:]
+        buf.end = 0
+        buf.starts = [0] * len(self.windows)
+        buf.sums = [0.0] * len(self.windows)
+        for entry_ts, entry_amount in entries:
+            self._append(buf, entry_ts, entry_amount)
+
+    def _buffer(self, entity_id: str, create: bool) -> Optional[_Buffer]:
+        buf = self._buffers.get(entity_id)
+        if buf is None and create:
+            buf = self._buffers[entity_id] = _Buffer(self.capacity, len(self.windows))
+        if buf is not None:
+            buf.touched = time.monotonic()
+            self._buffers.move_to_end(entity_id)
+        return buf
+
+    def _evict(self):
+        idle_before = time.monotonic() - self.idle_seconds
+        while self._buffers:
+            entity_id, buf = next(iter(self._buffers.items()))
+            if buf.touched >= idle_before and len(self._buffers) <= self.max_entities:
+                break
+            del self._buffers[entity_id]
+            self.evicted += 1
+
+    # ---- public API ----
+
+    def check(self, entity_id: str, amount: float, ts: int) -> List[Dict]:
+        """Windows the entity would exceed with this transaction; does not
+        record it or move the windows, so a check ahead of the stored
+        transactions cannot expire entries later ones still need
+        """
+        breaches = []
+        cap = self.capacity
+        with self._lock:
+            buf = self._buffers.get(entity_id)
+            late = buf is not None and buf.end and ts < buf.ts[(buf.end - 1) % cap]
+            entries = self._entries(buf) if late else None
+            for i, window in enumerate(self.windows):
+                since = ts - window.seconds
+                if buf is None:
+                    count, total = 1, amount
+                elif late:
+                    inside = [a for t, a in entries if since <= t <= ts]
+                    count, total = len(inside) + 1, sum(inside) + amount
+                else:
+                    start, total = buf.starts[i], buf.sums[i]
+                    while start < buf.end and buf.ts[start % cap] < since:
+                        total -= buf.amount[start % cap]
+                        start += 1
+                    if start == buf.end:
+                        total = 0.0
+                    count, total = buf.end - start + 1, total + amount
+                # Amounts compare to the cent, past the running sum's rounding error
+                if count > window.max_count or round(total, 2) > window.max_amount:
+                    breaches.append({'window': window.name, 'seconds': window.seconds,
+                                     'count': count, 'amount': round(total, 2),
+                                     'max_count': window.max_count,
+                                     'max_amount': window.max_amount})
+        return breaches
+
+    def record(self, source: str, destination: str, amount: float, ts: Optional[int]):
+        """Add a stored transaction to both parties' buffers (a self-transfer once)"""
+        if ts is None:
+            return
+        with self._lock:
+            for entity_id in {source, destination} - {None, ''}:
+                self._append(self._buffer(entity_id, create=True), ts, amount or 0.0)
+            self._evict()
+
+    def current(self, entity_id: str, now: Optional[float] = None) -> Dict:
+        """Count and amount per window ending now"""
+        now_ts = int(time.time() if now is None else now)
+        result = {'entity_id': entity_id, 'tracked': False, 'windows': []}
+        with self._lock:
+            buf = self._buffers.get(entity_id)
+            cap = self.capacity
+            for i, window in enumerate(self.windows):
+                count, total = 0, 0.0
+                if buf is not None:
+                    since = now_ts - window.seconds
+                    for n in range(buf.starts[i], buf.end):
+                        if since <= buf.ts[n % cap] <= now_ts:
+                            count += 1
+                            total += buf.amount[n % cap]
+                result['windows'].append({
+                    'window': window.name, 'seconds': window.seconds,
+                    'count': count, 'amount': round(total, 2),
+                    'max_count': window.max_count, 'max_amount': window.max_amount,
+                    'breached': count > window.max_count or round(total, 2) > window.max_amount
+                })
+            result['tracked'] = buf is not None
+        return result
+
+    def stats(self) -> Dict:
+        return {
+            'entities': len(self._buffers),
+            'evicted': self.evicted,
+            'capacity': self.capacity,
+            'max_entities': self.max_entities,
+            'idle_seconds': self.idle_seconds,
+            'windows': [{'window': w.name, 'seconds': w.seconds, 'max_count': w.max_count,
+                         'max_amount': w.max_amount} for w in self.windows]
+        }
+
+    @staticmethod
+    def score(breaches_by_role: Dict[str, List[Dict]]) -> tuple:
+        """(anomaly score, reasons) for the breached windows of each party"""
+        reasons = [f"{role.capitalize()} velocity: {b['count']} transactions / {b['amount']:,.0f} "
+                   f"in {b['window']} (limit {b['max_count']} / {b['max_amount']:,.0f})"
+                   for role, breaches in breaches_by_role.items() for b in breaches]
+        if not reasons:
+            return 0.0, []
+        return min(100.0, 60.0 + 10.0 * (len(reasons) - 1)), reasons
+
+    def rebuild(self, db, chunk_size: int = 50000) -> int:
+        """Reload the buffers from the transactions inside the widest window"""
+        since = window_start(max(w.seconds for w in self.windows) / 86400)
+        count = 0
+        with self._lock:
+            self._buffers.clear()
+        with db.connection() as conn:
+            cursor = conn.execute("""
+                SELECT source_entity, destination_entity, amount, transaction_ts
+                FROM transactions WHERE transaction_ts >= ?
+                ORDER BY transaction_ts
+            """, (since,))
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for source, destination, amount, ts in rows:
+                    self.record(source, destination, amount, ts)
+                count += len(rows)
+        logger.info(f"Velocity buffers rebuilt from {count} transactions "
+                    f"({len(self._buffers)} active entities)")
+        return count